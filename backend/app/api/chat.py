@@ -2,12 +2,30 @@
 Chat API endpoints for interactive repository Q&A.
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import json
 import logging
 
-from ..services.llm_service import get_llm_instance
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from ..services.chat_sessions import (
+    ChatSession,
+    ChatSessionStore,
+    get_chat_session_store,
+)
+from ..services.context_packer import Snippet, pack_snippets
+from ..services.embedding_index import RAG_CONTEXT_TOKENS, retrieve
+from ..services.inference_executor import (
+    InferenceExecutorClosed,
+    InferenceQueueFull,
+    get_inference_executor,
+)
+from ..services.llm_service import LLM_SEED, get_llm_instance
+from ..services.metrics import get_inference_metrics
+from ..services.model_router import get_model_router
+from ..services.speculative import speculative_for
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +37,10 @@ class ChatRequest(BaseModel):
 
     job_id: str
     message: str
-    context: Optional[str] = ""
+    context: str | None = ""
     model_id: str = "llama-3.2-1b"
     model_path: str = "./models/Llama-3.2-1B-Instruct-Q4_K_M.gguf"
+    session_id: str | None = None
 
 
 class ChatResponse(BaseModel):
@@ -29,32 +48,16 @@ class ChatResponse(BaseModel):
 
     response: str
     job_id: str
+    session_id: str | None = None
 
 
-@router.post("/", response_model=ChatResponse)
-async def chat_with_repository(request: ChatRequest):
-    """
-    Chat with the analyzed repository using local LLM.
+CHAT_MAX_TOKENS = 800
+CHAT_STOP = ["\nUSER QUESTION:"]
 
-    Args:
-        request: ChatRequest with message and context
 
-    Returns:
-        ChatResponse with LLM's answer
-    """
-    try:
-        logger.info(f"Chat request for job {request.job_id}: {request.message}")
-
-        # Get LLM instance (path resolution handled in get_llm_instance)
-        llm = get_llm_instance(request.model_path)
-        if not llm:
-            raise HTTPException(
-                status_code=503,
-                detail="LLM service not available. Please check model configuration.",
-            )
-
-        # Build Chain-of-Thought prompt for clean, structured responses
-        prompt = f"""You are an expert code assistant analyzing a software repository.
+def _build_chat_prompt(request: ChatRequest) -> str:
+    """Build the Chain-of-Thought prompt for clean, structured responses."""
+    return f"""You are an expert code assistant analyzing a software repository.
 
 REPOSITORY CONTEXT:
 {request.context}
@@ -78,17 +81,265 @@ Think step-by-step:
 
 Your answer (plain text only, no markdown):"""
 
-        # Generate response
-        response_text = llm.generate(
-            prompt=prompt, max_tokens=800, temperature=0.7, top_p=0.9
+
+def _build_followup_prompt(message: str, context: str = "") -> str:
+    """Text appended to a session transcript for a follow-up question."""
+    code = (
+        f"""
+
+RELEVANT CODE:
+{context}"""
+        if context
+        else ""
+    )
+    return f"""{code}
+
+USER QUESTION:
+{message}
+
+Your answer (plain text only, no markdown):"""
+
+
+def _retrieved_context(llm, request: ChatRequest, seen: str = "") -> str | None:
+    """
+    Code chunks of the job relevant to the question, packed into the RAG
+    token budget, or None when the job has no embedding index. Chunks whose
+    location header already appears in ``seen`` are skipped.
+    """
+    chunks = retrieve(request.job_id, request.message)
+    if not chunks:
+        return None
+    snippets = [
+        Snippet(chunk.render(), score=-rank)
+        for rank, chunk in enumerate(chunks)
+        if chunk.header not in seen
+    ]
+    return pack_snippets(
+        snippets,
+        RAG_CONTEXT_TOKENS,
+        llm.count_tokens,
+        separator="\n\n",
+        count_tokens_many=llm.count_tokens_many,
+    ).text
+
+
+def _fresh_prompt(llm, request: ChatRequest, fallback_context: str = "") -> str:
+    """First-turn prompt, grounded in retrieved code when the job is indexed."""
+    context = _retrieved_context(llm, request)
+    if context is None:
+        context = request.context or fallback_context
+    return _build_chat_prompt(request.model_copy(update={"context": context}))
+
+
+def _run_chat_turn(llm, request: ChatRequest) -> ChatSession:
+    """
+    Answer one chat turn, continuing the request's session when possible.
+
+    Follow-up turns restore the llama state saved after the previous turn,
+    so only the new question is evaluated. A fresh transcript is started
+    for new sessions, a different model, or when the history no longer
+    fits the context window.
+    """
+    store = get_chat_session_store()
+    if request.session_id:
+        # Load under the lock so a concurrent turn's save is never missed
+        with store.session_lock(request.job_id, request.session_id):
+            session = store.load(request.job_id, request.session_id)
+            if session and session.model_path == llm.model_path:
+                return _answer_turn(llm, request, store, session)
+
+    session = store.create(request.job_id, llm.model_path, request.context or "")
+    with store.session_lock(session.job_id, session.session_id):
+        return _answer_turn(llm, request, store, session)
+
+
+def _answer_turn(
+    llm, request: ChatRequest, store: ChatSessionStore, session: ChatSession
+) -> ChatSession:
+    """Generate the next answer of ``session``; the caller holds its lock."""
+    state = None
+    prompt = None
+    if session.transcript:
+        prompt = session.transcript + _build_followup_prompt(
+            request.message,
+            _retrieved_context(llm, request, seen=session.transcript) or "",
+        )
+        if llm.count_tokens(prompt) + CHAT_MAX_TOKENS > llm.n_ctx:
+            logger.info(
+                f"Chat session {session.session_id} outgrew the context "
+                f"window; restarting from the repository context"
+            )
+            prompt = None
+        else:
+            state = store.load_state(session)
+
+    if prompt is None:
+        prompt = _fresh_prompt(llm, request, session.context)
+
+    text, new_state = llm.generate_with_state(
+        prompt,
+        state,
+        max_tokens=CHAT_MAX_TOKENS,
+        temperature=0.7,
+        top_p=0.9,
+        stop=CHAT_STOP,
+        seed=LLM_SEED,
+        speculative=speculative_for("chat"),
+        priority="chat",
+    )
+    # A response-cache hit returns no new state; the previous turn's
+    # saved state is kept and is still a valid prefix of the transcript.
+    session.transcript = prompt + text
+    session.turns.append({"question": request.message, "answer": text.strip()})
+    store.save(session, new_state)
+    return session
+
+
+def _sse_event(data: dict, event: str | None = None) -> str:
+    """Format a Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@router.post("/", response_model=ChatResponse)
+async def chat_with_repository(request: ChatRequest):
+    """
+    Chat with the analyzed repository using local LLM.
+
+    Args:
+        request: ChatRequest with message and context
+
+    Returns:
+        ChatResponse with LLM's answer
+    """
+    executor = get_inference_executor()
+    try:
+        logger.info(f"Chat request for job {request.job_id}: {request.message}")
+
+        # Get LLM instance (path resolution handled in get_llm_instance).
+        # Loading and inference both block, so they run on the inference pool.
+        llm = await executor.run(
+            get_llm_instance, get_model_router().route("chat", request.model_path)
         )
+        if not llm:
+            raise HTTPException(
+                status_code=503,
+                detail="LLM service not available. Please check model configuration.",
+            )
+
+        # Generate response, continuing the server-side session if any
+        session = await executor.run(_run_chat_turn, llm, request)
 
-        logger.info(f"Generated chat response for job {request.job_id}")
+        logger.info(
+            f"Generated chat response for job {request.job_id} "
+            f"(session {session.session_id}, turn {len(session.turns)})"
+        )
 
-        return ChatResponse(response=response_text.strip(), job_id=request.job_id)
+        return ChatResponse(
+            response=session.turns[-1]["answer"],
+            job_id=request.job_id,
+            session_id=session.session_id,
+        )
 
+    except (HTTPException, InferenceQueueFull, InferenceExecutorClosed):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Chat error: {e}", exc_info=True)
         raise HTTPException(
-            status_code=500, detail=f"Failed to generate chat response: {str(e)}"
+            status_code=500, detail=f"Failed to generate chat response: {e!s}"
         )
+
+
+@router.post("/stream")
+async def stream_chat_with_repository(request: ChatRequest, http_request: Request):
+    """
+    Chat with the analyzed repository, streaming tokens as Server-Sent Events.
+
+    Emits ``data: {"token": ...}`` events while the model decodes, then a
+    final ``event: done`` carrying time-to-first-token and tokens/sec.
+    Generation stops as soon as the client disconnects. Streams are single
+    turns: sessions are only continued by the non-streaming endpoint.
+
+    Args:
+        request: ChatRequest with message and context
+        http_request: Raw request, used to detect client disconnects
+
+    Returns:
+        StreamingResponse with media type text/event-stream
+    """
+    logger.info(f"Streaming chat request for job {request.job_id}: {request.message}")
+    if request.session_id:
+        raise HTTPException(
+            status_code=400,
+            detail="Chat sessions are not supported when streaming; use POST /chat/",
+        )
+
+    executor = get_inference_executor()
+    llm = await executor.run(
+        get_llm_instance, get_model_router().route("chat", request.model_path)
+    )
+    if not llm:
+        raise HTTPException(
+            status_code=503,
+            detail="LLM service not available. Please check model configuration.",
+        )
+
+    prompt = await executor.run(_fresh_prompt, llm, request)
+    queue_position = executor.queue_position()
+    timer = get_inference_metrics().timer("chat_stream")
+    # Admission happens here so a saturated queue maps to 429 before streaming
+    tokens = executor.stream(
+        lambda: llm.generate_stream(
+            prompt=prompt,
+            max_tokens=CHAT_MAX_TOKENS,
+            temperature=0.7,
+            top_p=0.9,
+            stop=CHAT_STOP,
+            seed=LLM_SEED,
+            speculative=speculative_for("chat"),
+            priority="chat",
+        )
+    )
+
+    async def event_stream():
+        cancelled = False
+        try:
+            if queue_position:
+                yield _sse_event({"queue_position": queue_position}, event="queued")
+            async for token in tokens:
+                timer.token()
+                if await http_request.is_disconnected():
+                    cancelled = True
+                    logger.info(f"Client disconnected from chat job {request.job_id}")
+                    break
+                yield _sse_event({"token": token})
+
+            if not cancelled:
+                yield _sse_event(
+                    {"job_id": request.job_id, "metrics": timer.summary()},
+                    event="done",
+                )
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            logger.exception("Streaming chat error")
+            yield _sse_event({"error": str(e)}, event="error")
+        finally:
+            # Stops the worker at the next token and releases the model
+            await tokens.aclose()
+            summary = timer.finish(cancelled=cancelled)
+            logger.info(
+                f"Chat stream for job {request.job_id}: "
+                f"ttft={summary['time_to_first_token']} "
+                f"tokens={summary['tokens']} "
+                f"tok/s={summary['tokens_per_second']}"
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
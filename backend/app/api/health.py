@@ -1,7 +1,13 @@
 # backend/app/api/health.py
-from fastapi import APIRouter
+
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from ..services.inference_executor import get_inference_executor
+from ..services.metrics import get_inference_metrics
+from ..services.response_cache import get_response_cache
+from ..services.result_cache import get_result_cache
+
 router = APIRouter()
 
 
@@ -25,3 +31,32 @@ async def health_check():
             "llm_service": "ok",
         },
     }
+
+
+@router.get("/system/metrics")
+async def inference_metrics():
+    """
+    Per-endpoint inference metrics (time-to-first-token, tokens/sec, counters)
+    plus inference executor load and response and analysis cache hit rates.
+    """
+    cache = get_response_cache()
+    results = get_result_cache()
+    return {
+        **get_inference_metrics().snapshot(),
+        "inference_executor": get_inference_executor().stats(),
+        "response_cache": cache.stats() if cache else None,
+        "analysis_cache": results.stats() if results else None,
+    }
+
+
+@router.delete("/system/analysis-cache")
+async def invalidate_analysis_cache(content_id: str | None = None):
+    """
+    Drop cached analysis results so the next job for that content runs the
+    pipeline again: those of one content identity (``git:<url>@<sha>`` or
+    ``archive:<sha256>``), or all of them.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Analysis cache is disabled")
+    return {"invalidated": cache.invalidate(content_id)}
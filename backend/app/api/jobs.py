@@ -2,14 +2,18 @@
 """
 API endpoints for managing analysis jobs.
 """
+
+import hashlib
 import importlib
+import os
+import tarfile
 import tempfile
 import zipfile
-import tarfile
-import os
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from sqlalchemy.orm import Session
+
 from .. import models
 from ..database import get_db
 
@@ -97,6 +101,61 @@ def get_job_graph(*, db: Session = Depends(get_db), job_id: UUID):
     return {"message": "Graph data placeholder", "nodes": [], "edges": []}
 
 
+@router.post("/{job_id}/retry", response_model=models.JobRead)
+def retry_job(*, db: Session = Depends(get_db), job_id: UUID):
+    """
+    Re-run a failed job. Stages the earlier attempt finished are resumed
+    from their checkpoints (clone, scan, parse, generated text); uploads are
+    analyzed again from their extracted archive.
+    """
+    job = db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != models.JobStatus.FAILED:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Only failed jobs can be retried. Current status: {job.status}",
+        )
+    if job.source_type == "upload" and not (
+        job.local_path and os.path.isdir(job.local_path)
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="The uploaded archive is no longer available; upload it again",
+        )
+    job.status = models.JobStatus.QUEUED
+    job.progress = 0
+    job.result = None
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    worker_module = importlib.import_module("backend.app.worker")
+    try:
+        worker_module.analyze_repository_task.delay(
+            str(job.id),
+            job.model_id,
+            job.model_path,
+            local_path=job.local_path,
+            content_id=job.content_id,
+        )
+    except Exception:
+        try:
+            worker_module.analyze_repository_task.run(
+                str(job.id),
+                job.model_id,
+                job.model_path,
+                local_path=job.local_path,
+                content_id=job.content_id,
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to restart analysis task: {e}"
+            )
+
+    return job
+
+
 @router.post("/upload", response_model=models.JobRead, status_code=201)
 async def upload_and_analyze(
     *,
@@ -124,9 +183,14 @@ async def upload_and_analyze(
     try:
         # Save uploaded file
         temp_file = os.path.join(temp_dir, file.filename)
+        # Hash the archive while it streams to disk; identical uploads are
+        # answered from the analysis result cache
+        digest = hashlib.sha256()
         with open(temp_file, "wb") as f:
-            content = await file.read()
-            f.write(content)
+            while chunk := await file.read(1024 * 1024):
+                digest.update(chunk)
+                f.write(chunk)
+        content_id = f"archive:{digest.hexdigest()}"
 
         # Extract the archive
         extract_dir = os.path.join(temp_dir, "extracted")
@@ -145,6 +209,8 @@ async def upload_and_analyze(
             source_type="upload",
             model_id=model_id or "llama-3.2-1b",
             model_path=model_path,
+            local_path=extract_dir,
+            content_id=content_id,
         )
         db.add(db_job)
         db.commit()
@@ -158,6 +224,7 @@ async def upload_and_analyze(
                 db_job.model_id,
                 db_job.model_path,
                 local_path=extract_dir,
+                content_id=content_id,
             )
         except Exception:
             try:
@@ -168,6 +235,7 @@ async def upload_and_analyze(
                         db_job.model_id,
                         db_job.model_path,
                         local_path=extract_dir,
+                        content_id=content_id,
                     )
                 elif hasattr(task, "__wrapped__"):
                     task.__wrapped__(
@@ -175,6 +243,7 @@ async def upload_and_analyze(
                         db_job.model_id,
                         db_job.model_path,
                         local_path=extract_dir,
+                        content_id=content_id,
                     )
                 else:
                     task(
@@ -182,6 +251,7 @@ async def upload_and_analyze(
                         db_job.model_id,
                         db_job.model_path,
                         local_path=extract_dir,
+                        content_id=content_id,
                     )
             except Exception as e:
                 raise HTTPException(
@@ -191,6 +261,4 @@ async def upload_and_analyze(
         return db_job
 
     except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to process upload: {str(e)}"
-        )
+        raise HTTPException(status_code=500, detail=f"Failed to process upload: {e!s}")
@@ -3,10 +3,18 @@ API endpoints for LLM model management and validation.
 """
 
 import os
-from typing import Optional, List
-from fastapi import APIRouter
+import threading
+import time
+import uuid
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 
+from ..services.autotune import autotune, discover_models, get_tuning_store
+from ..services.gguf_inspector import GGUFError, inspect_gguf
+from ..services.llm_service import get_model_registry
+from ..services.model_catalog import MODEL_CATALOG
+from ..services.model_router import TASK_TYPES, get_model_router
 
 router = APIRouter()
 
@@ -18,11 +26,11 @@ class ModelDescriptor(BaseModel):
     name: str
     size: str
     type: str = "local"
-    params: Optional[str] = None
+    params: str | None = None
     cpu_capable: bool = True
     gpu_capable: bool = False
-    download_url: Optional[str] = None
-    description: Optional[str] = None
+    download_url: str | None = None
+    description: str | None = None
     is_custom: bool = False
 
 
@@ -30,7 +38,7 @@ class ModelTestRequest(BaseModel):
     """Request to test a model configuration."""
 
     model_id: str
-    path: Optional[str] = None
+    path: str | None = None
 
 
 class ModelTestResponse(BaseModel):
@@ -38,12 +46,16 @@ class ModelTestResponse(BaseModel):
 
     ok: bool
     valid: bool = False
-    info: Optional[str] = None
-    message: Optional[str] = None
-    model_path: Optional[str] = None
-    size_bytes: Optional[int] = None
-    size_mb: Optional[float] = None
-    error: Optional[str] = None
+    info: str | None = None
+    message: str | None = None
+    model_path: str | None = None
+    size_bytes: int | None = None
+    size_mb: float | None = None
+    architecture: str | None = None
+    context_length: int | None = None
+    quantization: str | None = None
+    tensor_count: int | None = None
+    error: str | None = None
 
 
 class ModelSaveRequest(BaseModel):
@@ -57,11 +69,11 @@ class ModelSaveResponse(BaseModel):
     """Response from model save."""
 
     ok: bool
-    saved_line: Optional[str] = None
-    error: Optional[str] = None
+    saved_line: str | None = None
+    error: str | None = None
 
 
-@router.get("/", response_model=List[ModelDescriptor])
+@router.get("/", response_model=list[ModelDescriptor])
 async def list_models():
     """
     Return list of available models.
@@ -69,50 +81,18 @@ async def list_models():
     """
     return [
         ModelDescriptor(
-            id="llama-3.2-1b",
-            name="Llama 3.2 1B (Recommended)",
-            size="810 MB",
-            type="local",
-            params="1B",
-            cpu_capable=True,
-            gpu_capable=True,
-            download_url="https://huggingface.co/bartowski/Llama-3.2-1B-Instruct-GGUF",
-            description="Fast, lightweight model perfect for code analysis. Q4_K_M quantization (~810MB). Good quality, recommended for most use cases.",
-        ),
-        ModelDescriptor(
-            id="qwen2.5-coder-1.5b",
-            name="Qwen2.5-Coder 1.5B",
-            size="1 GB",
-            type="local",
-            params="1.5B",
-            cpu_capable=True,
-            gpu_capable=True,
-            download_url="https://huggingface.co/Qwen/Qwen2.5-Coder-1.5B-Instruct-GGUF",
-            description="Optimized for code understanding. Download Q4_K_M variant (~1GB).",
-        ),
-        ModelDescriptor(
-            id="phi-3-mini",
-            name="Phi-3 Mini 3.8B",
-            size="2.2 GB",
-            type="local",
-            params="3.8B",
-            cpu_capable=True,
-            gpu_capable=True,
-            download_url="https://huggingface.co/microsoft/Phi-3-mini-4k-instruct-gguf",
-            description="Microsoft's efficient model for code. Download Q4_K_M variant (~2.2GB).",
-        ),
-        ModelDescriptor(
-            id="custom-model",
-            name="Upload Your Own Model",
-            size="Custom",
-            type="local",
-            params="Custom",
-            cpu_capable=True,
-            gpu_capable=True,
-            download_url=None,
-            description="Use any GGUF format model from HuggingFace or your own fine-tuned model.",
-            is_custom=True,
-        ),
+            id=model.id,
+            name=model.name,
+            size=model.size,
+            type=model.type,
+            params=model.params,
+            cpu_capable=model.cpu_capable,
+            gpu_capable=model.gpu_capable,
+            download_url=model.download_url,
+            description=model.description,
+            is_custom=model.is_custom,
+        )
+        for model in MODEL_CATALOG
     ]
 
 
@@ -120,7 +100,8 @@ async def list_models():
 async def test_model(request: ModelTestRequest):
     """
     Test model availability and configuration.
-    Validates that the local model file exists and is a valid GGUF file.
+    Validates that the local model file exists and is a valid GGUF file,
+    reading only its header, and reports the header metadata.
     """
     # Local model validation
     model_path = request.path or os.getenv("LOCAL_MODEL_PATH")
@@ -155,27 +136,194 @@ async def test_model(request: ModelTestRequest):
             error=f"Model file too small ({size_bytes} bytes), expected > 1MB",
         )
 
+    # Check the GGUF header (magic, version, metadata) without loading
+    try:
+        info = inspect_gguf(model_path)
+    except (GGUFError, OSError) as e:
+        return ModelTestResponse(
+            ok=False, valid=False, error=f"Invalid GGUF model file: {e}"
+        )
+
+    header = {
+        "model_path": model_path,
+        "size_bytes": size_bytes,
+        "size_mb": size_mb,
+        "architecture": info.architecture,
+        "context_length": info.context_length,
+        "quantization": info.quantization,
+        "tensor_count": info.tensor_count,
+    }
+
+    if not info.generative:
+        return ModelTestResponse(
+            ok=False,
+            valid=False,
+            error=f"{info.architecture} models cannot generate text",
+            **header,
+        )
+
     # Check for GGUF extension (recommended format)
     if not model_path.lower().endswith(".gguf"):
         return ModelTestResponse(
             ok=True,
             valid=True,
-            model_path=model_path,
-            size_bytes=size_bytes,
-            size_mb=size_mb,
             message=f"Warning: File does not have .gguf extension. Size: {size_mb:.2f}MB",
+            **header,
         )
 
     return ModelTestResponse(
         ok=True,
         valid=True,
-        model_path=model_path,
-        size_bytes=size_bytes,
-        size_mb=size_mb,
-        info=f"Valid GGUF model found: {size_mb:.2f}MB",
+        info=(
+            f"Valid GGUF model found: {size_mb:.2f}MB, {info.architecture} "
+            f"{info.quantization or ''}".rstrip()
+        ),
+        **header,
     )
 
 
+@router.get("/registry")
+async def registry_stats():
+    """
+    Report models resident in this process and registry hit/miss/load-time stats.
+    """
+    return get_model_registry().stats()
+
+
+@router.get("/prefix-cache")
+async def prefix_cache_stats():
+    """
+    Report prompt-prefix KV cache hit rates and prompt-eval time saved
+    for each model resident in this process.
+    """
+    return [
+        {"path": path, **llm.prefix_cache.stats()}
+        for path, llm in get_model_registry().instances()
+        if hasattr(llm, "prefix_cache")
+    ]
+
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """
+    Report per-priority-class queue wait times and load for each model
+    resident in this process.
+    """
+    return [
+        {"path": path, **llm.scheduler.stats()}
+        for path, llm in get_model_registry().instances()
+        if hasattr(llm, "scheduler")
+    ]
+
+
+@router.get("/routes")
+async def model_routes():
+    """
+    Report the configured task -> model routes and the files they resolve to
+    on this host (null means the task uses the job's or request's model).
+    """
+    routing = get_model_router()
+    return {
+        task: {"model": routing.routes.get(task), "path": routing.route(task, None)}
+        for task in TASK_TYPES
+    }
+
+
+class BenchmarkRequest(BaseModel):
+    """Request to benchmark and autotune local models."""
+
+    model_path: str | None = None
+    quick: bool = False
+
+
+# Benchmark runs started through the API, by id. A run loads each model
+# several times and takes minutes, so at most one runs at a time.
+_benchmark_runs: dict[str, dict] = {}
+_benchmark_lock = threading.Lock()
+
+
+def _run_benchmarks(run_id: str, model_paths: list[str], quick: bool) -> None:
+    results = []
+    for model_path in model_paths:
+        try:
+            results.append({"ok": True, **autotune(model_path, quick=quick)})
+            # Drop the resident instance so the next use loads tuned settings
+            get_model_registry().evict(model_path)
+        except Exception as e:
+            results.append({"ok": False, "model_path": model_path, "error": str(e)})
+        _benchmark_runs[run_id]["results"] = list(results)
+    _benchmark_runs[run_id].update(status="completed", finished_at=time.time())
+
+
+@router.post("/benchmark", status_code=202)
+async def benchmark_models(
+    request: BenchmarkRequest, background_tasks: BackgroundTasks
+):
+    """
+    Benchmark prompt-eval and generation throughput across thread counts,
+    batch sizes and mmap/mlock settings, and persist the fastest
+    configuration for this host.
+
+    The run takes several minutes and happens in the background: poll
+    ``GET /benchmark/{benchmark_id}`` for its results. Only models found by
+    discovery can be benchmarked. Live inference keeps running meanwhile,
+    which makes the measurements noisier; on a busy host prefer
+    ``python -m backend.app.services.autotune``.
+    """
+    local_models = discover_models()
+    if request.model_path:
+        model_path = os.path.realpath(request.model_path)
+        if model_path not in local_models:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Not a local model: {request.model_path}",
+            )
+        model_paths = [model_path]
+    else:
+        model_paths = local_models
+    if not model_paths:
+        raise HTTPException(status_code=404, detail="No local models found")
+
+    with _benchmark_lock:
+        if any(run["status"] == "running" for run in _benchmark_runs.values()):
+            raise HTTPException(
+                status_code=409, detail="A benchmark is already running"
+            )
+        run_id = uuid.uuid4().hex
+        _benchmark_runs[run_id] = {
+            "benchmark_id": run_id,
+            "status": "running",
+            "model_paths": model_paths,
+            "quick": request.quick,
+            "started_at": time.time(),
+            "finished_at": None,
+            "results": [],
+        }
+
+    background_tasks.add_task(_run_benchmarks, run_id, model_paths, request.quick)
+    return _benchmark_runs[run_id]
+
+
+@router.get("/benchmark/{benchmark_id}")
+async def benchmark_status(benchmark_id: str):
+    """
+    Report the status of a benchmark run and the results of the models
+    benchmarked so far.
+    """
+    run = _benchmark_runs.get(benchmark_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Benchmark run not found")
+    return run
+
+
+@router.get("/tuning")
+async def tuning_results():
+    """
+    Report the tuned runtime parameters recorded for models on this host.
+    """
+    return get_tuning_store().entries()
+
+
 class ModelValidateRequest(BaseModel):
     """Request to validate a model file."""
 
@@ -230,5 +378,5 @@ async def save_model(request: ModelSaveRequest):
             f.writelines(env_lines)
 
         return ModelSaveResponse(ok=True, saved_line=new_line.strip())
-    except Exception as e:
-        return ModelSaveResponse(ok=False, error=f"Failed to write .env: {str(e)}")
+    except OSError as e:
+        return ModelSaveResponse(ok=False, error=f"Failed to write .env: {e!s}")
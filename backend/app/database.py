@@ -3,7 +3,9 @@ Database connection and session management.
 """
 
 import os
-from sqlmodel import create_engine, SQLModel, Session
+
+from sqlalchemy import inspect, text
+from sqlmodel import Session, SQLModel, create_engine
 
 # Default to a local SQLite database
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./repoinsight.db")
@@ -21,6 +23,28 @@ def create_db_and_tables():
     This should be called once on application startup.
     """
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+
+
+def add_missing_columns():
+    """
+    Add nullable columns introduced after a table was created, which
+    ``create_all`` leaves out of existing tables.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {column.name} {column_type}"
+                    )
+                )
 
 
 def get_db():
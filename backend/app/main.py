@@ -3,11 +3,17 @@ import logging
 import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from .api import health, jobs, models, chat
+from .api import chat, health, jobs, models
 from .database import create_db_and_tables
+from .services.inference_executor import (
+    InferenceExecutorClosed,
+    InferenceQueueFull,
+    shutdown_inference_executor,
+)
 
 # --- Application State ---
 # A simple flag to indicate if the database has been initialized.
@@ -38,6 +44,7 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("--- Shutting down RepoInsight API ---")
+    shutdown_inference_executor()
 
 
 # --- FastAPI App Initialization ---
@@ -61,6 +68,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# --- Inference Backpressure ---
+# The inference executor rejects work once its queue is full; surface that as
+# a retryable error with a queue-position hint instead of a generic 500.
+@app.exception_handler(InferenceQueueFull)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFull):
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": "Inference queue is full. Please retry shortly.",
+            "queue_position": exc.queue_position,
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(InferenceExecutorClosed)
+async def inference_closed_handler(request: Request, exc: InferenceExecutorClosed):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Inference service is shutting down."},
+        headers={"Retry-After": "30"},
+    )
+
+
 # --- API Routers ---
 # Include the routers for different parts of the API.
 app.include_router(health.router, prefix="/api/v1/health", tags=["Health"])
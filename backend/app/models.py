@@ -5,9 +5,8 @@ Core data models for the RepoInsight application.
 import enum
 import uuid
 from datetime import datetime
-from typing import Optional
 
-from sqlmodel import Field, SQLModel, JSON, Column
+from sqlmodel import JSON, Column, Field, SQLModel
 
 
 class JobStatus(str, enum.Enum):
@@ -33,9 +32,13 @@ class Job(SQLModel, table=True):
     source_type: str = Field(default="git")
     repo_url: str
     progress: int = Field(default=0)
-    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
-    model_id: Optional[str] = Field(default="llama-3.2-1b")
-    model_path: Optional[str] = Field(default=None)
+    result: dict | None = Field(default=None, sa_column=Column(JSON))
+    model_id: str | None = Field(default="llama-3.2-1b")
+    model_path: str | None = Field(default=None)
+    # Extracted archive and its identity ("archive:<sha256>") of uploads,
+    # so a retried upload is analyzed from the same files
+    local_path: str | None = Field(default=None)
+    content_id: str | None = Field(default=None)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
@@ -47,8 +50,8 @@ class JobCreate(SQLModel):
 
     repo_url: str
     source_type: str = "git"
-    model_id: Optional[str] = "llama-3.2-1b"
-    model_path: Optional[str] = None
+    model_id: str | None = "llama-3.2-1b"
+    model_path: str | None = None
 
 
 class JobRead(SQLModel):
@@ -60,8 +63,8 @@ class JobRead(SQLModel):
     status: JobStatus
     repo_url: str
     progress: int
-    result: Optional[dict] = None
-    model_id: Optional[str] = "llama-3.2-1b"
-    model_path: Optional[str] = None
+    result: dict | None = None
+    model_id: str | None = "llama-3.2-1b"
+    model_path: str | None = None
     created_at: datetime
     updated_at: datetime
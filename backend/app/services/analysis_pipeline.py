@@ -0,0 +1,1350 @@
+"""
+Stages of a repository analysis and the artifacts passed between them.
+
+    fetch -> scan -> parse -> (describe | assess | summarize) -> persist
+
+fetch, scan and parse are CPU/IO-bound; the three inference stages are
+independent of each other and only need the parsed artifact, so they can run
+concurrently on inference workers. Each stage is a plain function from one
+typed artifact to the next; artifacts serialize to JSON-compatible dicts so
+the worker can pass them between Celery tasks (see backend.app.worker), or
+the stages can be called in sequence in-process.
+
+fetch leaves a checkout on disk that scan and parse read, so workers running
+those stages must share the checkout directory (as they already share the
+upload directory). Inference stages only need the parse artifact.
+
+Stage outputs are checkpointed (see services.checkpoints): ``resume_point``
+tells where a retried job continues, finished inference stages are not run
+again, and descriptions continue after the last checkpointed file.
+
+Re-analyses of a repository are incremental: given an earlier completed job
+of the same repository and models (a ``Baseline``), fetch diffs the two
+commits, descriptions of unchanged files are carried over and only changed
+files are described again. The overview is regenerated only when the
+structure shifted past INCREMENTAL_OVERVIEW_THRESHOLD, and the vulnerability
+analysis only when a file it reads changed.
+"""
+
+import glob
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import types
+import typing
+from collections import Counter
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any
+
+from .checkpoints import PIPELINE_CHECKPOINT_TTL_HOURS, get_checkpoint_store
+from .context_packer import Snippet, file_priority
+from .git_mirror import MirrorError, get_mirror_cache, normalize_url
+from .llm_pool import get_llm_pool
+from .llm_service import LLM_SEED
+from .metrics import get_inference_metrics
+from .model_router import get_model_router
+from .overview_grammar import REQUIRED_OVERVIEW_SECTIONS
+from .repo_scanner import FileEntry, scan_tree
+from .response_cache import model_identity
+from .result_cache import ResultCache, get_result_cache
+from .speculative import speculative_for
+from .stream_validators import GenerationAborted
+
+logger = logging.getLogger(__name__)
+
+# Static instructions for per-file descriptions; passed to LocalLLM as a
+# cacheable prompt prefix so only the file-specific part is evaluated per call.
+FILE_DESCRIPTION_PREFIX = """Analyze the code file below and provide a 1-2 sentence description of its purpose and key functionality.
+
+Provide ONLY a brief, developer-friendly description (max 2 sentences). Focus on what the file does and its role in the codebase.
+
+"""
+
+# Bump when prompts, parsers or the result format change; cached results of
+# older versions are then no longer used (see services.result_cache)
+PIPELINE_VERSION = "2"
+
+CLONE_TIMEOUT_SECONDS = 300
+LS_REMOTE_TIMEOUT_SECONDS = 60
+DIFF_TIMEOUT_SECONDS = 60
+
+# Re-analyze only what changed since an earlier job of the same repository
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "true").lower() == "true"
+# Share of files added or removed since the baseline from which the overview
+# is generated again (a change of languages always regenerates it)
+INCREMENTAL_OVERVIEW_THRESHOLD = float(
+    os.getenv("INCREMENTAL_OVERVIEW_THRESHOLD", "0.2")
+)
+
+# Important extensions for code analysis (prioritized)
+CODE_EXTENSIONS = {
+    ".py",
+    ".js",
+    ".ts",
+    ".jsx",
+    ".tsx",
+    ".java",
+    ".go",
+    ".rs",
+    ".c",
+    ".cpp",
+    ".h",
+    ".cs",
+    ".php",
+    ".rb",
+    ".swift",
+    ".kt",
+}
+CONFIG_EXTENSIONS = {
+    ".json",
+    ".yaml",
+    ".yml",
+    ".toml",
+    ".xml",
+    ".ini",
+    ".env",
+    ".config",
+}
+DOC_EXTENSIONS = {".md", ".txt", ".rst"}
+MANIFEST_FILES = {
+    "package.json",
+    "requirements.txt",
+    "go.mod",
+    "Cargo.toml",
+    "pom.xml",
+}
+
+# Skip these directories for faster processing
+SKIP_DIRS = {
+    ".git",
+    "node_modules",
+    "__pycache__",
+    "venv",
+    "env",
+    ".venv",
+    "dist",
+    "build",
+    "target",
+    ".idea",
+    ".vscode",
+    "coverage",
+}
+
+# Limit file reading to avoid memory issues
+MAX_FILE_SIZE = 50 * 1024  # 50KB max per file
+MAX_FILES_TO_READ = 100  # Read content of max 100 files
+MAX_FILES_TO_DESCRIBE = 10
+# Descriptions generated between two checkpoints of a resumable job
+DESCRIPTION_CHECKPOINT_EVERY = 5
+
+FILE_TYPES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".java": "java",
+    ".go": "go",
+    ".rs": "rust",
+}
+LANGUAGE_NAMES = {
+    ".py": "Python",
+    ".js": "JavaScript",
+    ".jsx": "JavaScript",
+    ".ts": "TypeScript",
+    ".tsx": "TypeScript",
+    ".java": "Java",
+    ".go": "Go",
+    ".rs": "Rust",
+    ".c": "C/C++",
+    ".cpp": "C/C++",
+    ".h": "C/C++",
+    ".cs": "C#",
+    ".php": "PHP",
+    ".rb": "Ruby",
+    ".swift": "Swift",
+    ".kt": "Kotlin",
+}
+IMPORTANT_SUFFIXES = (
+    ".py",
+    ".js",
+    ".ts",
+    ".java",
+    ".go",
+    ".rs",
+    "README.md",
+    "package.json",
+    "requirements.txt",
+)
+DESCRIBED_TYPES = {"python", "javascript", "typescript", "java", "go", "rust", "code"}
+
+VULNERABILITY_UNAVAILABLE = "Vulnerability analysis unavailable for this repository."
+
+
+class FetchError(RuntimeError):
+    """Raised when the repository cannot be cloned."""
+
+
+class Artifact:
+    """Base of stage artifacts: dataclasses that round-trip through dicts."""
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Artifact":
+        hints = typing.get_type_hints(cls)
+        values = {}
+        for item in fields(cls):
+            value = data.get(item.name)
+            kind = hints[item.name]
+            if typing.get_origin(kind) in (typing.Union, types.UnionType):
+                # SomeArtifact | None
+                kind = typing.get_args(kind)[0]
+            if isinstance(kind, type) and issubclass(kind, Artifact) and value:
+                value = kind.from_dict(value)
+            values[item.name] = value
+        return cls(**values)
+
+
+@dataclass
+class Baseline(Artifact):
+    """Earlier completed analysis an incremental re-analysis builds on."""
+
+    job_id: str
+    commit: str
+    # None when the earlier job fell back to the deterministic text
+    overview: str | None = None
+    vulnerability_analysis: str | None = None
+    # Generated descriptions (path -> text)
+    descriptions: dict[str, str] = field(default_factory=dict)
+    file_count: int = 0
+    languages: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_result(cls, job_id: str, result: dict[str, Any]) -> "Baseline":
+        """Extract the reusable parts of a completed job's result."""
+        descriptions = {}
+        languages = set()
+        for node in result.get("nodes") or []:
+            if node.get("type") in ("repository", "directory"):
+                continue
+            language = LANGUAGE_NAMES.get(os.path.splitext(node["id"])[1].lower())
+            if language:
+                languages.add(language)
+            text = node.get("description")
+            if text and text != _fallback_description(node):
+                descriptions[node["id"]] = text
+        vulnerability = result.get("vulnerability_analysis")
+        return cls(
+            job_id,
+            result["commit"],
+            overview=None if result.get("overview_fallback") else result["overview"],
+            vulnerability_analysis=(
+                None if vulnerability == VULNERABILITY_UNAVAILABLE else vulnerability
+            ),
+            descriptions=descriptions,
+            file_count=result.get("files_analyzed", 0),
+            languages=sorted(languages),
+        )
+
+
+@dataclass
+class FileChanges(Artifact):
+    """Files added, modified and removed between two commits."""
+
+    base_commit: str
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+    @property
+    def paths(self) -> set[str]:
+        return set(self.added) | set(self.modified) | set(self.removed)
+
+
+@dataclass
+class JobSpec(Artifact):
+    """What to analyze and with which model."""
+
+    job_id: str
+    model_id: str
+    model_path: str
+    repo_url: str = "unknown"
+    local_path: str | None = None
+    # Identity of the analyzed content: "git:<url>@<commit>" or
+    # "archive:<sha256>" (see resolve_content_id)
+    content_id: str | None = None
+    # Earlier analysis to re-analyze incrementally against (see select_baseline)
+    baseline: Baseline | None = None
+
+
+@dataclass
+class FetchedRepo(Artifact):
+    """A checkout of the repository on local disk."""
+
+    job: JobSpec
+    repo_name: str
+    root: str
+    # Whether the checkout is ours to delete once the job is done
+    cleanup: bool = False
+    # Checked-out commit, when known
+    commit: str | None = None
+    # Remote whose mirror the checkout is a worktree of (see services.git_mirror)
+    mirror_url: str | None = None
+    # Changes since the baseline commit; None analyzes everything
+    changes: FileChanges | None = None
+
+    @property
+    def job_id(self) -> str:
+        return self.job.job_id
+
+
+@dataclass
+class ScannedRepo(Artifact):
+    """File inventory and graph skeleton of a checkout."""
+
+    fetched: FetchedRepo
+    all_files: list[str] = field(default_factory=list)
+    nodes: list[dict[str, Any]] = field(default_factory=list)
+    edges: list[dict[str, Any]] = field(default_factory=list)
+    # Files worth reading, in scan order
+    candidates: list[str] = field(default_factory=list)
+
+    @property
+    def job_id(self) -> str:
+        return self.fetched.job.job_id
+
+
+@dataclass
+class ParsedRepo(Artifact):
+    """Scanned repository plus file contents and derived facts."""
+
+    fetched: FetchedRepo
+    all_files: list[str] = field(default_factory=list)
+    nodes: list[dict[str, Any]] = field(default_factory=list)
+    edges: list[dict[str, Any]] = field(default_factory=list)
+    file_contents: dict[str, str] = field(default_factory=dict)
+    languages: list[str] = field(default_factory=list)
+    top_directories: list[tuple[str, int]] = field(default_factory=list)
+    important_files: list[str] = field(default_factory=list)
+
+    @property
+    def job_id(self) -> str:
+        return self.fetched.job.job_id
+
+
+@dataclass
+class StageOutcome(Artifact):
+    """Result of an inference stage; failures are reported, not raised."""
+
+    stage: str
+    value: Any = None
+    error: str | None = None
+    # Set when a streaming validator stopped the generation
+    aborted_reason: str | None = None
+    aborted_tokens: int = 0
+    seconds: float = 0.0
+    model_path: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @classmethod
+    def from_error(
+        cls, stage: str, error: BaseException, **kwargs: Any
+    ) -> "StageOutcome":
+        if isinstance(error, GenerationAborted):
+            kwargs.update(aborted_reason=error.reason, aborted_tokens=error.tokens)
+        return cls(stage, error=str(error) or type(error).__name__, **kwargs)
+
+    @classmethod
+    def from_result(
+        cls, stage: str, result: Any, model_path: str | None = None
+    ) -> "StageOutcome":
+        """Convert a ``run_concurrently`` StageResult."""
+        if result.ok:
+            return cls(
+                stage, value=result.value, seconds=result.seconds, model_path=model_path
+            )
+        return cls.from_error(
+            stage, result.error, seconds=result.seconds, model_path=model_path
+        )
+
+
+# --- fetch / scan / parse ---------------------------------------------------
+
+
+def fetch_repository(job: JobSpec) -> FetchedRepo:
+    """
+    Use the uploaded checkout, a worktree of the repository's cached mirror,
+    or (without the mirror cache, or if it fails) a shallow clone.
+
+    Raises:
+        FetchError: The clone failed or timed out
+    """
+    if job.local_path and os.path.exists(job.local_path):
+        logger.info(f"[{job.job_id}] Analyzing local upload: {job.local_path}")
+        repo_name = (
+            job.repo_url.split(":")[-1].replace(".zip", "").replace(".tar.gz", "")
+        )
+        # Don't delete uploaded files immediately
+        return FetchedRepo(job, repo_name, job.local_path, cleanup=False)
+
+    repo_name = job.repo_url.split("/")[-1].replace(".git", "")
+    root = tempfile.mkdtemp(prefix=f"repo_{job.job_id}_")
+
+    mirrors = get_mirror_cache()
+    if mirrors is not None:
+        try:
+            commit = mirrors.checkout(job.repo_url, root)
+            logger.info(f"[{job.job_id}] Checked out {commit[:12]} from the mirror")
+            return _with_changes(
+                FetchedRepo(
+                    job,
+                    repo_name,
+                    root,
+                    cleanup=True,
+                    commit=commit,
+                    mirror_url=job.repo_url,
+                )
+            )
+        except MirrorError as e:
+            logger.warning(f"[{job.job_id}] Mirror unavailable, cloning: {e}")
+            shutil.rmtree(root, ignore_errors=True)
+            os.makedirs(root)
+
+    logger.info(f"[{job.job_id}] Cloning repository: {job.repo_url}")
+    try:
+        subprocess.run(
+            ["git", "clone", "--depth", "1", job.repo_url, root],
+            check=True,
+            capture_output=True,
+            timeout=CLONE_TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        shutil.rmtree(root, ignore_errors=True)
+        raise FetchError("Repository clone timed out after 5 minutes")
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(root, ignore_errors=True)
+        detail = e.stderr.decode() if e.stderr else str(e)
+        raise FetchError(f"Failed to clone repository: {detail}")
+    commit = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stdout.strip()
+    return _with_changes(
+        FetchedRepo(job, repo_name, root, cleanup=True, commit=commit or None)
+    )
+
+
+def diff_commits(root: str, base: str, head: str) -> FileChanges | None:
+    """
+    Files changed between two commits of a checkout, or None if the base
+    commit is not in it (e.g. a shallow clone) or git fails. Files in
+    SKIP_DIRS are left out, as the scan leaves them out.
+    """
+    try:
+        output = subprocess.run(
+            ["git", "diff", "--name-status", "--no-renames", "-z", base, head],
+            cwd=root,
+            check=True,
+            capture_output=True,
+            timeout=DIFF_TIMEOUT_SECONDS,
+        ).stdout.decode("utf-8", errors="replace")
+    except (subprocess.SubprocessError, OSError):
+        return None
+    changes = FileChanges(base)
+    entries = output.split("\0")
+    for status, path in zip(entries[0::2], entries[1::2]):
+        if any(part in SKIP_DIRS for part in path.split("/")[:-1]):
+            continue
+        if status == "A":
+            changes.added.append(path)
+        elif status == "D":
+            changes.removed.append(path)
+        else:
+            changes.modified.append(path)
+    return changes
+
+
+def _with_changes(fetched: FetchedRepo) -> FetchedRepo:
+    baseline = fetched.job.baseline
+    if baseline is None or not fetched.commit:
+        return fetched
+    fetched.changes = diff_commits(fetched.root, baseline.commit, fetched.commit)
+    job_id = fetched.job_id
+    if fetched.changes is None:
+        logger.info(
+            f"[{job_id}] Baseline commit {baseline.commit[:12]} is not in the "
+            "checkout, analyzing everything"
+        )
+    else:
+        changes = fetched.changes
+        logger.info(
+            f"[{job_id}] Incremental analysis since job {baseline.job_id}: "
+            f"{len(changes.added)} added, {len(changes.modified)} modified, "
+            f"{len(changes.removed)} removed"
+        )
+    return fetched
+
+
+def _should_read(name: str, ext: str) -> bool:
+    if ext in CODE_EXTENSIONS:
+        return True
+    if ext in CONFIG_EXTENSIONS:
+        return name in MANIFEST_FILES
+    if ext in DOC_EXTENSIONS:
+        return name.lower() == "readme.md"
+    return False
+
+
+def _file_type(ext: str) -> str:
+    if ext in CODE_EXTENSIONS:
+        return FILE_TYPES.get(ext, "code")
+    if ext in CONFIG_EXTENSIONS:
+        return "config"
+    if ext in DOC_EXTENSIONS:
+        return "document"
+    return "file"
+
+
+def scan_repository(fetched: FetchedRepo) -> ScannedRepo:
+    """
+    Inventory the checkout (see services.repo_scanner) and build the graph
+    skeleton: each directory followed by its files, in path order.
+    """
+    repo_name = fetched.repo_name
+    scanned = ScannedRepo(
+        fetched, nodes=[{"id": repo_name, "label": repo_name, "type": "repository"}]
+    )
+    inventory = scan_tree(fetched.root, SKIP_DIRS)
+    logger.info(
+        f"[{fetched.job_id}] Listed {len(inventory.files)} files in "
+        f"{inventory.seconds:.2f}s ({inventory.ignored} ignored)"
+    )
+
+    files_by_dir: dict[str, list[FileEntry]] = {}
+    for entry in inventory.files:
+        files_by_dir.setdefault(entry.path.rpartition("/")[0], []).append(entry)
+
+    for directory in ["", *inventory.directories]:
+        if directory:
+            parent, _, label = directory.rpartition("/")
+            scanned.nodes.append({"id": directory, "label": label, "type": "directory"})
+            scanned.edges.append(
+                {"from": parent or repo_name, "to": directory, "label": "contains"}
+            )
+
+        for rel_path, size in files_by_dir.get(directory, ()):
+            name = rel_path.rpartition("/")[2]
+            scanned.all_files.append(rel_path)
+            ext = os.path.splitext(name)[1].lower()
+            if _should_read(name, ext):
+                scanned.candidates.append(rel_path)
+            scanned.nodes.append(
+                {
+                    "id": rel_path,
+                    "label": name,
+                    "type": _file_type(ext),
+                    "language": ext[1:] if ext else None,
+                    "size": size,
+                }
+            )
+            scanned.edges.append(
+                {"from": directory or repo_name, "to": rel_path, "label": "contains"}
+            )
+
+    return scanned
+
+
+def parse_repository(scanned: ScannedRepo) -> ParsedRepo:
+    """Read the important files and derive languages and key directories."""
+    fetched = scanned.fetched
+    # Sizes come from the scan, so files are not stat'ed again
+    sizes = {node["id"]: node.get("size") or 0 for node in scanned.nodes}
+    file_contents = {}
+    for rel_path in scanned.candidates:
+        # The README is read regardless of how many files were read before it
+        is_readme = os.path.basename(rel_path).lower() == "readme.md"
+        if len(file_contents) >= MAX_FILES_TO_READ and not is_readme:
+            continue
+        if sizes.get(rel_path, 0) > MAX_FILE_SIZE:
+            continue
+        file_path = os.path.join(fetched.root, rel_path)
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read()
+        except OSError as e:
+            logger.debug(f"[{fetched.job.job_id}] Could not read {rel_path}: {e}")
+            continue
+        if content.strip():
+            file_contents[rel_path] = content
+
+    languages = set()
+    dir_counter: Counter = Counter()
+    for rel_path in scanned.all_files:
+        language = LANGUAGE_NAMES.get(os.path.splitext(rel_path)[1].lower())
+        if language:
+            languages.add(language)
+        parts = rel_path.split("/")
+        dir_counter[parts[0] if len(parts) > 1 else "[root]"] += 1
+
+    return ParsedRepo(
+        fetched,
+        all_files=scanned.all_files,
+        nodes=scanned.nodes,
+        edges=scanned.edges,
+        file_contents=file_contents,
+        languages=sorted(languages),
+        top_directories=dir_counter.most_common(5),
+        important_files=[
+            f for f in scanned.all_files if f.endswith(IMPORTANT_SUFFIXES)
+        ],
+    )
+
+
+def read_sources(parsed: ParsedRepo, max_bytes: int) -> Iterator[tuple[str, str]]:
+    """
+    ``(path, content)`` of every file of the scan worth reading, in path
+    order, read from the checkout up to ``max_bytes`` per file.
+
+    Unlike ``parse_repository`` this is not limited to MAX_FILES_TO_READ;
+    the scan has already left out SKIP_DIRS and ignored or vendored files.
+    Files the checkout no longer has fall back to the parsed contents.
+    """
+    sizes = {node["id"]: node.get("size") or 0 for node in parsed.nodes}
+    for rel_path in parsed.all_files:
+        name = rel_path.rpartition("/")[2]
+        if not _should_read(name, os.path.splitext(name)[1].lower()):
+            continue
+        if sizes.get(rel_path, 0) > max_bytes:
+            continue
+        try:
+            with open(
+                os.path.join(parsed.fetched.root, rel_path),
+                "r",
+                encoding="utf-8",
+                errors="ignore",
+            ) as f:
+                content = f.read()
+        except OSError:
+            content = parsed.file_contents.get(rel_path, "")
+        # NUL bytes mean a binary file with a source extension
+        if content.strip() and "\0" not in content:
+            yield rel_path, content
+
+
+def cleanup_checkout(fetched: FetchedRepo) -> None:
+    """Delete a clone made by fetch_repository (uploads are kept)."""
+    if not fetched.cleanup:
+        return
+    mirrors = get_mirror_cache() if fetched.mirror_url else None
+    if mirrors is not None:
+        mirrors.release(fetched.mirror_url, fetched.root)
+    else:
+        shutil.rmtree(fetched.root, ignore_errors=True)
+
+
+def cleanup_job_checkouts(job_id: str) -> None:
+    """Delete any clone of a job, e.g. after a later stage failed."""
+    for root in glob.glob(os.path.join(tempfile.gettempdir(), f"repo_{job_id}_*")):
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# --- inference stages ---------------------------------------------------------
+
+
+def build_context_snippets(
+    header: str, important_files: Sequence[str], file_contents: dict[str, str]
+) -> list[Snippet]:
+    """
+    Prioritized prompt context for the overview and vulnerability prompts.
+
+    The header is always kept; the key-file listing and file contents are
+    packed into the model's context window by score, and the lowest-value
+    ones are truncated or dropped when the window is full.
+    """
+    snippets = [Snippet(header, score=float("inf"), truncatable=False)]
+    if important_files:
+        snippets.append(
+            Snippet(
+                "Key files:\n" + "\n".join(f"- {f}" for f in important_files),
+                score=90.0,
+            )
+        )
+    for file_path, content in file_contents.items():
+        snippets.append(
+            Snippet(f"\n{file_path}:\n{content}", score=file_priority(file_path))
+        )
+    return snippets
+
+
+def description_targets(parsed: ParsedRepo) -> list[dict[str, Any]]:
+    """The code file nodes (with content) whose descriptions are generated."""
+    targets = []
+    for node in parsed.nodes:
+        if node.get("type") in DESCRIBED_TYPES and node["id"] in parsed.file_contents:
+            targets.append(node)
+            if len(targets) >= MAX_FILES_TO_DESCRIBE:
+                break
+    return targets
+
+
+def describe_files(
+    parsed: ParsedRepo,
+    backend: Any,
+    done: dict[str, str] | None = None,
+    on_progress: Callable[[dict[str, str]], None] | None = None,
+) -> dict[str, str]:
+    """
+    Generate a short description per target file.
+
+    Args:
+        parsed: Repository to describe
+        backend: LocalLLM-like backend
+        done: Descriptions generated earlier (path -> text), not regenerated
+        on_progress: Called with all descriptions so far after every
+            DESCRIPTION_CHECKPOINT_EVERY files, e.g. to checkpoint them
+
+    Returns:
+        Path -> description
+    """
+    descriptions = dict(done or {})
+    targets = [
+        node for node in description_targets(parsed) if node["id"] not in descriptions
+    ]
+    group = DESCRIPTION_CHECKPOINT_EVERY if on_progress else len(targets)
+    for start in range(0, len(targets), group or 1):
+        nodes = targets[start : start + group]
+        prompts = [f"""File: {node['label']}
+Type: {node.get('language', 'unknown')}
+
+Code snippet (first 500 chars):
+{parsed.file_contents[node['id']][:500]}
+
+Description:""" for node in nodes]
+        # Short generations are decoded together as parallel sequences; bulk
+        # work yields the model to chat between generations
+        texts = backend.generate_batch(
+            prompts,
+            max_tokens=100,
+            temperature=0.3,
+            prefix=FILE_DESCRIPTION_PREFIX,
+            seed=LLM_SEED,
+            speculative=speculative_for("descriptions"),
+            priority="descriptions",
+        )
+        descriptions.update((node["id"], text) for node, text in zip(nodes, texts))
+        if on_progress:
+            on_progress(descriptions)
+    return descriptions
+
+
+def assess_vulnerabilities(parsed: ParsedRepo, backend: Any) -> str:
+    """Vulnerability analysis of the repository."""
+    context = build_context_snippets(
+        f"Repository: {parsed.fetched.repo_name}\n"
+        f"Languages: {', '.join(parsed.languages)}\n"
+        f"Files analyzed: {len(parsed.all_files)}\n",
+        parsed.important_files,
+        parsed.file_contents,
+    )
+    return backend.analyze_vulnerability(context, seed=LLM_SEED)
+
+
+def summarize_repository(parsed: ParsedRepo, backend: Any) -> str:
+    """
+    Repository overview.
+
+    Raises:
+        GenerationAborted: A streaming validator rejected the overview
+    """
+    repo_structure = {
+        "name": parsed.fetched.repo_name,
+        "files": parsed.all_files,
+        "file_contents": parsed.file_contents,
+        "languages": parsed.languages,
+    }
+    # Snippets are packed by token count to fill the model's context
+    # window, highest-value files first (see services.context_packer)
+    context = build_context_snippets(
+        f"Repository: {parsed.fetched.repo_name}\n"
+        f"Files: {len(parsed.all_files)} | Languages: {', '.join(parsed.languages) or 'Unknown'}\n",
+        parsed.important_files,
+        parsed.file_contents,
+    )
+    # A fixed seed makes re-analyses of identical inputs deterministic, so
+    # they are answered from the shared response cache
+    return backend.explain_repository(repo_structure, context=context, seed=LLM_SEED)
+
+
+# Inference stage -> (model router task type, stage function)
+INFERENCE_STAGES = {
+    "overview": ("overview", summarize_repository),
+    "vulnerability": ("vulnerability", assess_vulnerabilities),
+    "descriptions": ("description", describe_files),
+}
+
+
+def stage_model_path(stage: str, default_path: str) -> str:
+    """Model an inference stage runs on (see services.model_router)."""
+    return get_model_router().route(INFERENCE_STAGES[stage][0], default_path)
+
+
+def route_stage_pools(
+    job_id: str, model_path: str
+) -> tuple[dict[str, Any], dict[str, str]]:
+    """
+    Pools for stages routed to a model other than the job's.
+
+    Stages whose task type is routed to another model (e.g. a small model
+    for bulk descriptions) get a pool of that model; everything else,
+    including routes whose model is unavailable, uses the job's.
+
+    Returns:
+        (stage -> LLMPool for routed stages, stage -> model path of every stage)
+    """
+    pools: dict[str, Any] = {}
+    routed_pools: dict[str, Any] = {}
+    paths = {}
+    for stage, (task, _) in INFERENCE_STAGES.items():
+        routed_path = stage_model_path(stage, model_path)
+        paths[stage] = model_path
+        if routed_path == model_path:
+            continue
+        if routed_path not in routed_pools:
+            routed_pools[routed_path] = get_llm_pool(routed_path)
+        if routed_pools[routed_path]:
+            pools[stage] = routed_pools[routed_path]
+            paths[stage] = routed_path
+            logger.info(f"[{job_id}] Routing {task} to {routed_path}")
+        else:
+            logger.warning(
+                f"[{job_id}] Could not load {routed_path} for {task}, using the job model"
+            )
+    return pools, paths
+
+
+# --- checkpoints --------------------------------------------------------------
+
+DESCRIPTION_PROGRESS = "descriptions-progress"
+
+
+def save_checkpoint(stage: str, artifact: Artifact) -> None:
+    """Checkpoint the output of a stage (see services.checkpoints)."""
+    store = get_checkpoint_store()
+    if store is None:
+        return
+    try:
+        store.save(artifact.job_id, stage, artifact.to_dict())
+    except OSError as e:
+        logger.warning(f"[{artifact.job_id}] Could not checkpoint {stage}: {e}")
+
+
+def resume_point(job: JobSpec) -> tuple[str, Artifact]:
+    """
+    Where a job continues after an earlier attempt.
+
+    The parse checkpoint is self-contained; fetch and scan checkpoints are
+    only usable while the checkout they describe still exists.
+
+    Returns:
+        The first stage without a usable checkpoint ("fetch", "scan",
+        "parse", or "infer" for the inference stages) and its input artifact
+    """
+    store = get_checkpoint_store()
+    if store is None:
+        return "fetch", job
+    for stage, next_stage, kind in (
+        ("parse", "infer", ParsedRepo),
+        ("scan", "parse", ScannedRepo),
+        ("fetch", "scan", FetchedRepo),
+    ):
+        data = store.load(job.job_id, stage)
+        if not data:
+            continue
+        artifact = kind.from_dict(data)
+        fetched = artifact if isinstance(artifact, FetchedRepo) else artifact.fetched
+        if stage != "parse" and not os.path.isdir(fetched.root):
+            continue
+        # The current request decides the model
+        fetched.job = job
+        return next_stage, artifact
+    return "fetch", job
+
+
+def load_stage_outcome(job_id: str, stage: str) -> StageOutcome | None:
+    """The checkpointed outcome of a finished inference stage, if any."""
+    store = get_checkpoint_store()
+    data = store.load(job_id, stage) if store else None
+    return StageOutcome.from_dict(data) if data else None
+
+
+def save_stage_outcome(job_id: str, outcome: StageOutcome) -> None:
+    """Checkpoint a successful inference stage; failures are run again."""
+    store = get_checkpoint_store()
+    if store is None or not outcome.ok:
+        return
+    try:
+        store.save(job_id, outcome.stage, outcome.to_dict())
+    except OSError as e:
+        logger.warning(f"[{job_id}] Could not checkpoint {outcome.stage}: {e}")
+
+
+def run_inference_stage(stage: str, parsed: ParsedRepo, backend: Any) -> Any:
+    """
+    Run an inference stage; descriptions continue from their checkpoint and
+    the unchanged files' descriptions of an incremental re-analysis.
+    """
+    if stage != "descriptions":
+        return INFERENCE_STAGES[stage][1](parsed, backend)
+
+    # Only files changed since the baseline are described again
+    carried = carried_descriptions(parsed)
+    store = get_checkpoint_store()
+    if store is None:
+        return describe_files(parsed, backend, done=carried)
+    done = store.load(parsed.job_id, DESCRIPTION_PROGRESS)
+    if done:
+        logger.info(f"[{parsed.job_id}] Resuming after {len(done)} descriptions")
+    return describe_files(
+        parsed,
+        backend,
+        done={**carried, **(done or {})},
+        on_progress=lambda descriptions: store.save(
+            parsed.job_id, DESCRIPTION_PROGRESS, descriptions
+        ),
+    )
+
+
+def clear_checkpoints(job_id: str) -> None:
+    """Delete a completed job's checkpoints and prune abandoned ones."""
+    store = get_checkpoint_store()
+    if store is None:
+        return
+    store.clear(job_id)
+    pruned = store.prune(PIPELINE_CHECKPOINT_TTL_HOURS * 3600)
+    if pruned:
+        logger.info(f"Pruned checkpoints of {pruned} abandoned job(s)")
+
+
+# --- result cache ---------------------------------------------------------------
+
+
+def remote_head(url: str) -> str | None:
+    """Commit SHA of a remote's HEAD without cloning, or None if unreachable."""
+    try:
+        output = subprocess.run(
+            ["git", "ls-remote", url, "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=LS_REMOTE_TIMEOUT_SECONDS,
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+    sha = output.split()[0] if output.strip() else ""
+    return sha if re.fullmatch(r"[0-9a-f]{40,64}", sha) else None
+
+
+def git_content_id(url: str, commit: str) -> str:
+    return f"git:{normalize_url(url)}@{commit}"
+
+
+def resolve_content_id(job: JobSpec) -> str | None:
+    """
+    Identity of the content a job will analyze: the uploaded archive's hash
+    (set by the API), or the remote's current HEAD commit.
+    """
+    if job.content_id or job.local_path:
+        return job.content_id
+    commit = remote_head(job.repo_url)
+    return git_content_id(job.repo_url, commit) if commit else None
+
+
+def _checkout_content_id(fetched: FetchedRepo) -> str | None:
+    # The checkout may be newer than the HEAD resolved before the job started
+    if fetched.commit and not fetched.job.local_path:
+        return git_content_id(fetched.job.repo_url, fetched.commit)
+    return fetched.job.content_id
+
+
+def result_cache_key(job: JobSpec, content_id: str) -> str:
+    """Result cache key of a job: content, every stage's model, version."""
+    models = set()
+    for stage in INFERENCE_STAGES:
+        path = stage_model_path(stage, job.model_path)
+        try:
+            models.add(model_identity(path))
+        except OSError:
+            models.add(os.path.basename(path))
+    return ResultCache.make_key(content_id, sorted(models), PIPELINE_VERSION)
+
+
+def cached_result(job: JobSpec) -> dict[str, Any] | None:
+    """
+    The stored result of an earlier job over the same content and models,
+    with a ``cache`` entry linking to that job, or None.
+    """
+    cache = get_result_cache()
+    if cache is None or not job.content_id:
+        return None
+    hit = cache.get(result_cache_key(job, job.content_id))
+    if hit is None:
+        return None
+    source_job, result = hit
+    result["cache"] = {
+        "hit": True,
+        "source_job": source_job,
+        "content_id": job.content_id,
+    }
+    return result
+
+
+def store_result(parsed: ParsedRepo, result: dict[str, Any]) -> None:
+    """Cache a job's result under the content it actually analyzed."""
+    cache = get_result_cache()
+    content_id = _checkout_content_id(parsed.fetched)
+    if cache is None or not content_id:
+        return
+    job = parsed.fetched.job
+    cache.put(result_cache_key(job, content_id), content_id, job.job_id, result)
+
+
+# --- incremental re-analysis ---------------------------------------------------
+
+
+def select_baseline(
+    job: JobSpec, previous: Sequence[tuple[str, dict[str, Any] | None]]
+) -> Baseline | None:
+    """
+    Baseline of an incremental re-analysis.
+
+    Args:
+        job: Job about to run
+        previous: Completed jobs of the same repository as (job id, result),
+            newest first
+
+    Returns:
+        The newest earlier analysis made by this pipeline version with the
+        same models from a known commit, or None to analyze everything
+    """
+    if not INCREMENTAL_ANALYSIS or job.local_path:
+        return None
+    routes = {
+        task: os.path.basename(stage_model_path(stage, job.model_path))
+        for stage, (task, _) in INFERENCE_STAGES.items()
+    }
+    for job_id, result in previous:
+        if (
+            result
+            and result.get("commit")
+            and result.get("pipeline_version") == PIPELINE_VERSION
+            and result.get("model_path") == job.model_path
+            and result.get("model_routes") == routes
+        ):
+            return Baseline.from_result(job_id, result)
+    return None
+
+
+def _incremental(fetched: FetchedRepo) -> tuple[Baseline, FileChanges] | None:
+    baseline, changes = fetched.job.baseline, fetched.changes
+    # Changes checkpointed against another baseline are not usable
+    if baseline is None or changes is None or changes.base_commit != baseline.commit:
+        return None
+    return baseline, changes
+
+
+def structure_shifted(parsed: ParsedRepo) -> bool:
+    """Whether the repository changed enough since the baseline for a new overview."""
+    incremental = _incremental(parsed.fetched)
+    if incremental is None:
+        return True
+    baseline, changes = incremental
+    # Added files the scan leaves out (vendored, ignored) are not structure
+    listed = set(parsed.all_files)
+    churn = sum(path in listed for path in changes.added) + len(changes.removed)
+    if churn / max(baseline.file_count, 1) >= INCREMENTAL_OVERVIEW_THRESHOLD:
+        return True
+    return sorted(parsed.languages) != sorted(baseline.languages)
+
+
+def carried_descriptions(parsed: ParsedRepo) -> dict[str, str]:
+    """Baseline descriptions of files that did not change since."""
+    incremental = _incremental(parsed.fetched)
+    if incremental is None:
+        return {}
+    baseline, changes = incremental
+    changed = changes.paths
+    return {
+        path: text
+        for path, text in baseline.descriptions.items()
+        if path not in changed and path in parsed.file_contents
+    }
+
+
+def carried_over(stage: str, parsed: ParsedRepo) -> Any | None:
+    """
+    The baseline's value of an inference stage when the stage does not need
+    to run again, else None.
+    """
+    incremental = _incremental(parsed.fetched)
+    if incremental is None:
+        return None
+    baseline, changes = incremental
+    if stage == "overview":
+        if baseline.overview and not structure_shifted(parsed):
+            return baseline.overview
+    elif stage == "vulnerability":
+        # The assessment reads file contents, so any change to a read file
+        # (or one that was read before it was removed) invalidates it
+        read = any(
+            _should_read(os.path.basename(path), os.path.splitext(path)[1].lower())
+            for path in changes.paths
+        )
+        if baseline.vulnerability_analysis and not read:
+            return baseline.vulnerability_analysis
+    elif stage == "descriptions":
+        carried = carried_descriptions(parsed)
+        targets = [node["id"] for node in description_targets(parsed)]
+        if all(path in carried for path in targets):
+            return {path: carried[path] for path in targets}
+    return None
+
+
+def carried_outcome(
+    stage: str, parsed: ParsedRepo, model_path: str
+) -> StageOutcome | None:
+    """Outcome of an inference stage carried over from the baseline, if any."""
+    value = carried_over(stage, parsed)
+    if value is None:
+        return None
+    logger.info(
+        f"[{parsed.job_id}] {stage} carried over from job "
+        f"{parsed.fetched.job.baseline.job_id}"
+    )
+    return StageOutcome(stage, value=value, model_path=model_path)
+
+
+# --- assembling the result ----------------------------------------------------
+
+
+def build_fallback_overview(
+    repo_name: str,
+    file_count: int,
+    languages: Sequence[str],
+    directories: Sequence[tuple[str, int]],
+    key_files: Sequence[str],
+) -> str:
+    """Return deterministic, structured overview when LLM output is unusable."""
+
+    language_summary = (
+        ", ".join(sorted(languages)) if languages else "multiple languages"
+    )
+    dir_names = ", ".join(name for name, _ in directories) if directories else "root"
+
+    component_lines = (
+        "\n".join(
+            f"{idx + 1}. {name} – approx {count} files"
+            for idx, (name, count) in enumerate(directories[:3])
+        )
+        if directories
+        else "1. Root – mixture of application files and assets"
+    )
+
+    key_file_lines = (
+        "\n".join(f"- {path}" for path in key_files[:5])
+        if key_files
+        else "- Inspect README.md, package.json, or main application entry points"
+    )
+
+    return f"""**Project Snapshot**
+- Purpose: Automated fallback summary for {repo_name}. Review README or docs for exact domain details.
+- Primary technologies: {language_summary}
+- Entry points: {directories[0][0] if directories else 'Project root'}
+
+**Architecture Map**
+- Structure: {repo_name} contains {file_count} tracked files with top-level folders {dir_names or 'root files only'}.
+- Key modules & responsibilities:
+{component_lines}
+- Data / control flow: Inspect API routes or Next.js pages to trace requests through the system.
+
+**Component Deep Dive**
+{component_lines}
+
+Key files worth reviewing:
+{key_file_lines}
+
+**Technology Stack**
+- Frameworks & libraries: Derived from package manifests (e.g., Next.js/React, Prisma, auth libraries).
+- Tooling / build pipeline: Node.js scripts plus lint/test tooling defined in package.json.
+- External integrations: Refer to API clients or .env usage for upstream services (e.g., authentication, email, analytics).
+
+**Operational Considerations**
+- Performance or scalability notes: Review data-heavy routes and Prisma queries for pagination/caching opportunities.
+- Security / compliance notes: Harden authentication flows, secrets management, and environment separation.
+- Testing & observability state: Confirm unit/integration coverage and logging around critical workflows.
+
+**Recommended Next Actions**
+1. Audit README/package.json to confirm project purpose and run instructions.
+2. Trace primary user flows through top directories ({dir_names or 'root'}) to map dependencies.
+3. Document deployment/runtime requirements (env vars, build commands, infrastructure)."""
+
+
+def has_placeholder_tokens(text: str) -> bool:
+    """Detect unfinished template markers in LLM output."""
+    if not text or not text.strip():
+        return True
+
+    placeholder_tokens = [
+        "<SECTION_NAME>",
+        "<SUBSECTION_NAME>",
+        "<DETAILED_DESCRIPTION>",
+    ]
+    if any(token in text for token in placeholder_tokens):
+        return True
+
+    # Generic catch-all for ALL CAPS tags often left by unfinished templates
+    return bool(re.search(r"<[A-Z_\s]+>", text))
+
+
+def missing_required_sections(text: str) -> bool:
+    """Ensure structured overview headings are present."""
+    if not text:
+        return True
+    return any(section not in text for section in REQUIRED_OVERVIEW_SECTIONS)
+
+
+def _choose_overview(parsed: ParsedRepo, outcome: StageOutcome | None) -> str:
+    # Overview outcomes are counted so the fallback rate is visible in the
+    # inference metrics
+    metrics = get_inference_metrics()
+    job_id = parsed.job_id
+    if (
+        outcome
+        and outcome.ok
+        and not (
+            has_placeholder_tokens(outcome.value)
+            or missing_required_sections(outcome.value)
+        )
+    ):
+        metrics.increment("overview", "generated")
+        logger.info(f"[{job_id}] Generated overview in LLM")
+        return outcome.value
+
+    if outcome is None or not outcome.ok:
+        if outcome and outcome.aborted_reason:
+            # Stopped mid-stream, so only the tokens up to the problem were spent
+            logger.warning(
+                f"[{job_id}] Overview aborted after {outcome.aborted_tokens} "
+                f"tokens ({outcome.aborted_reason}). Using fallback."
+            )
+            metrics.increment("overview", "fallback_aborted")
+        else:
+            logger.warning(
+                f"[{job_id}] LLM generation failed (using fallback): "
+                f"{outcome.error if outcome else 'no result'}"
+            )
+            metrics.increment("overview", "fallback_error")
+    else:
+        logger.warning(
+            f"[{job_id}] Overview contained placeholder tokens. Using fallback."
+        )
+        metrics.increment("overview", "fallback_invalid")
+
+    return build_fallback_overview(
+        parsed.fetched.repo_name,
+        len(parsed.all_files),
+        parsed.languages,
+        parsed.top_directories,
+        parsed.important_files[:10],
+    )
+
+
+def _fallback_description(node: dict[str, Any]) -> str:
+    if node.get("language") == "py":
+        return "Python module containing business logic and functions"
+    if node.get("language") in ["js", "jsx", "ts", "tsx"]:
+        return "JavaScript/TypeScript component or utility module"
+    return f"{node.get('language', 'Code')} file"
+
+
+def assemble_result(
+    parsed: ParsedRepo, outcomes: Sequence[StageOutcome]
+) -> dict[str, Any]:
+    """
+    Build the job result from the parsed repository and inference outcomes,
+    substituting deterministic fallbacks for failed or unusable generations.
+    """
+    job = parsed.fetched.job
+    by_stage = {outcome.stage: outcome for outcome in outcomes}
+
+    overview = by_stage.get("overview")
+    repo_overview = _choose_overview(parsed, overview)
+
+    descriptions = by_stage.get("descriptions")
+    if descriptions and not descriptions.ok:
+        logger.warning(
+            f"[{job.job_id}] File description generation failed: {descriptions.error}"
+        )
+    generated = descriptions.value if descriptions and descriptions.ok else {}
+    targets = description_targets(parsed)
+    for node in targets:
+        text = (generated or {}).get(node["id"])
+        node["description"] = text.strip() if text else _fallback_description(node)
+    logger.info(f"[{job.job_id}] Generated descriptions for {len(targets)} files")
+
+    vulnerability = by_stage.get("vulnerability")
+    if vulnerability and vulnerability.ok:
+        vulnerability_analysis = vulnerability.value
+    else:
+        logger.warning(
+            f"[{job.job_id}] Vulnerability analysis failed: "
+            f"{vulnerability.error if vulnerability else 'no result'}"
+        )
+        vulnerability_analysis = VULNERABILITY_UNAVAILABLE
+
+    model_routes = {}
+    for stage, (task, _) in INFERENCE_STAGES.items():
+        outcome = by_stage.get(stage)
+        model_routes[task] = os.path.basename(
+            (outcome.model_path if outcome else None) or job.model_path
+        )
+
+    incremental = _incremental(parsed.fetched)
+    if incremental:
+        baseline, changes = incremental
+        incremental = {
+            "base_job": baseline.job_id,
+            "base_commit": baseline.commit,
+            "added": len(changes.added),
+            "modified": len(changes.modified),
+            "removed": len(changes.removed),
+        }
+
+    return {
+        "model_checked": True,
+        "model_id": job.model_id,
+        "model_path": job.model_path,
+        "model_routes": model_routes,
+        "pipeline_version": PIPELINE_VERSION,
+        "overview": repo_overview,
+        "overview_fallback": not (overview and repo_overview == overview.value),
+        "vulnerability_analysis": vulnerability_analysis,
+        "repository": parsed.fetched.repo_name,
+        "commit": parsed.fetched.commit,
+        "content_id": _checkout_content_id(parsed.fetched),
+        "incremental": incremental,
+        "files_analyzed": len(parsed.all_files),
+        "nodes": parsed.nodes,
+        "edges": parsed.edges,
+    }
@@ -0,0 +1,370 @@
+"""
+On-host benchmarking and autotuning of llama.cpp runtime parameters.
+
+The best thread count, batch size and memory-mapping settings depend on the
+host and the model, so they are measured rather than hard-coded. Each model
+is benchmarked for prompt-eval and generation throughput across candidate
+configurations, and the fastest one is persisted per host and model file.
+``get_llm_instance`` loads models with the tuned parameters automatically.
+
+Run on the host that serves inference:
+
+    python -m backend.app.services.autotune [model.gguf ...] [--quick]
+"""
+
+import argparse
+import gc
+import glob
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from .response_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+LLM_TUNING_PATH = os.getenv("LLM_TUNING_PATH", "./data/llm_tuning.json")
+# Whether get_llm_instance applies persisted tuning results
+LLM_AUTOTUNE = os.getenv("LLM_AUTOTUNE", "true").lower() == "true"
+
+# Configurations are scored by the time a representative analysis call would
+# take: a packed repository context followed by a medium-length answer.
+WORKLOAD_PROMPT_TOKENS = 1500
+WORKLOAD_OUTPUT_TOKENS = 300
+
+BENCHMARK_PROMPT_TOKENS = 256
+BENCHMARK_OUTPUT_TOKENS = 64
+BENCHMARK_N_CTX = 1024
+
+DEFAULT_CONFIG = {
+    "n_threads": 4,
+    "n_batch": 512,
+    "use_mmap": True,
+    "use_mlock": False,
+    "n_gpu_layers": 0,
+}
+
+BATCH_SIZES = [128, 256, 512, 1024]
+MEMORY_MODES = [
+    {"use_mmap": True, "use_mlock": False},
+    {"use_mmap": True, "use_mlock": True},
+    {"use_mmap": False, "use_mlock": False},
+]
+
+_BENCHMARK_TEXT = (
+    "def handle_request(request, session):\n"
+    "    user = session.get(User, request.user_id)\n"
+    "    if user is None:\n"
+    "        raise HTTPException(status_code=404, detail='User not found')\n"
+    "    return {'id': user.id, 'name': user.name, 'roles': list(user.roles)}\n\n"
+)
+
+
+def host_key() -> str:
+    """Identify the host hardware a tuning result applies to."""
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}"
+
+
+def thread_candidates(cpu_count: int | None = None) -> list[int]:
+    """Thread counts worth trying on a host with ``cpu_count`` logical CPUs."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    candidates = {
+        max(1, cpu_count // 4),
+        max(1, cpu_count // 2),
+        max(1, cpu_count * 3 // 4),
+        cpu_count,
+        min(DEFAULT_CONFIG["n_threads"], cpu_count),
+    }
+    return sorted(candidates)
+
+
+def _gpu_offload_supported() -> bool:
+    try:
+        import llama_cpp
+
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except (ImportError, OSError, AttributeError):
+        return False
+
+
+@dataclass
+class BenchmarkResult:
+    """Throughput measured for one model configuration."""
+
+    config: dict[str, Any]
+    load_seconds: float = 0.0
+    prompt_tokens_per_second: float = 0.0
+    generation_tokens_per_second: float = 0.0
+    error: str | None = None
+
+    @property
+    def workload_seconds(self) -> float:
+        """Estimated duration of a representative analysis call."""
+        if (
+            self.error
+            or self.prompt_tokens_per_second <= 0
+            or self.generation_tokens_per_second <= 0
+        ):
+            return float("inf")
+        return (
+            WORKLOAD_PROMPT_TOKENS / self.prompt_tokens_per_second
+            + WORKLOAD_OUTPUT_TOKENS / self.generation_tokens_per_second
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        result = asdict(self)
+        seconds = self.workload_seconds
+        result["workload_seconds"] = None if seconds == float("inf") else seconds
+        return result
+
+
+def _default_loader() -> Callable[..., Any]:
+    from .llm_service import LLAMA_CPP_AVAILABLE, Llama
+
+    if not LLAMA_CPP_AVAILABLE:
+        raise ImportError(
+            "llama-cpp-python not installed. Run: pip install llama-cpp-python"
+        )
+    return Llama
+
+
+def benchmark_config(
+    model_path: str,
+    config: dict[str, Any],
+    loader: Callable[..., Any] | None = None,
+    prompt_tokens: int = BENCHMARK_PROMPT_TOKENS,
+    output_tokens: int = BENCHMARK_OUTPUT_TOKENS,
+) -> BenchmarkResult:
+    """
+    Load a model with ``config`` and measure its throughput.
+
+    Args:
+        model_path: Path to the GGUF model file
+        config: Llama keyword arguments to benchmark
+        loader: Llama-compatible constructor (default: llama_cpp.Llama)
+        prompt_tokens: Tokens evaluated for the prompt-eval measurement
+        output_tokens: Tokens generated for the generation measurement
+
+    Returns:
+        BenchmarkResult; failures are recorded in ``error`` instead of raised
+    """
+    result = BenchmarkResult(config=dict(config))
+    llm = None
+    try:
+        loader = loader or _default_loader()
+        start = time.perf_counter()
+        llm = loader(
+            model_path=model_path, n_ctx=BENCHMARK_N_CTX, verbose=False, **config
+        )
+        result.load_seconds = time.perf_counter() - start
+
+        text = _BENCHMARK_TEXT * (prompt_tokens // 16 + 1)
+        tokens = llm.tokenize(text.encode("utf-8"))[:prompt_tokens]
+
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(tokens)
+        result.prompt_tokens_per_second = len(tokens) / (time.perf_counter() - start)
+
+        # The prompt is already in the KV cache, so generate() only
+        # evaluates the sampled tokens from here on.
+        generated = 0
+        start = time.perf_counter()
+        for _ in llm.generate(tokens, temp=0.0):
+            generated += 1
+            if generated >= output_tokens:
+                break
+        result.generation_tokens_per_second = generated / (time.perf_counter() - start)
+    except (ValueError, RuntimeError, OSError, MemoryError) as e:
+        logger.warning(f"Benchmark failed for {model_path} with {config}: {e}")
+        result.error = str(e)
+    finally:
+        del llm
+        gc.collect()
+
+    logger.info(
+        f"Benchmark {os.path.basename(model_path)} {config}: "
+        f"pp={result.prompt_tokens_per_second:.1f} tok/s "
+        f"tg={result.generation_tokens_per_second:.1f} tok/s"
+    )
+    return result
+
+
+class TuningStore:
+    """JSON file of the best configuration per host and model file."""
+
+    def __init__(self, path: str = LLM_TUNING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, model_path: str) -> dict[str, Any] | None:
+        """Tuned Llama parameters for ``model_path`` on this host, if any."""
+        try:
+            key = model_identity(model_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._read().get(host_key(), {}).get(key)
+        return dict(entry["params"]) if entry else None
+
+    def entries(self) -> dict[str, Any]:
+        """All tuning results recorded for this host."""
+        with self._lock:
+            return self._read().get(host_key(), {})
+
+    def record(
+        self, model_path: str, params: dict[str, Any], results: list[dict[str, Any]]
+    ) -> None:
+        """Persist the winning parameters and the measurements behind them."""
+        with self._lock:
+            data = self._read()
+            data.setdefault(host_key(), {})[model_identity(model_path)] = {
+                "model_path": model_path,
+                "params": params,
+                "results": results,
+                "tuned_at": time.time(),
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Write to a temp file first so readers never see a torn file
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def autotune(
+    model_path: str,
+    loader: Callable[..., Any] | None = None,
+    store: Optional["TuningStore"] = None,
+    quick: bool = False,
+) -> dict[str, Any]:
+    """
+    Find and persist the fastest configuration for a model on this host.
+
+    Parameters are searched one at a time (threads, then batch size, then
+    memory mode, then GPU offload when available), each sweep starting from
+    the best configuration so far. This needs a handful of model loads
+    instead of the full cross product.
+
+    Args:
+        model_path: Path to the GGUF model file
+        loader: Llama-compatible constructor (default: llama_cpp.Llama)
+        store: Where to persist the result (default: process-wide store)
+        quick: Only tune the thread count
+
+    Returns:
+        Dict with the best parameters and every measurement taken
+    """
+    store = store or get_tuning_store()
+    results: list[BenchmarkResult] = []
+    best: BenchmarkResult | None = None
+
+    def sweep(variants: list[dict[str, Any]]) -> None:
+        nonlocal best
+        base = best.config if best else DEFAULT_CONFIG
+        for variant in variants:
+            config = {**base, **variant}
+            if any(r.config == config for r in results):
+                continue
+            result = benchmark_config(model_path, config, loader=loader)
+            results.append(result)
+            if best is None or result.workload_seconds < best.workload_seconds:
+                best = result
+
+    sweep([{"n_threads": n} for n in thread_candidates()])
+    if not quick:
+        sweep([{"n_batch": n} for n in BATCH_SIZES])
+        sweep(MEMORY_MODES)
+        if _gpu_offload_supported():
+            sweep([{"n_gpu_layers": -1}])
+
+    if best is None or best.error:
+        raise RuntimeError(f"Every benchmark configuration failed for {model_path}")
+
+    measurements = [r.to_dict() for r in results]
+    store.record(model_path, best.config, measurements)
+    logger.info(f"Tuned {model_path}: {best.config}")
+    return {"model_path": model_path, "params": best.config, "results": measurements}
+
+
+def discover_models() -> list[str]:
+    """
+    GGUF files available on this host: LOCAL_MODEL_PATH plus the files in
+    the project's model directories.
+    """
+    project_root = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    )
+    paths = []
+    configured = os.getenv("LOCAL_MODEL_PATH")
+    if configured and os.path.isfile(configured):
+        paths.append(os.path.realpath(configured))
+    for directory in ["models", os.path.join("backend", "models")]:
+        for path in sorted(glob.glob(os.path.join(project_root, directory, "*.gguf"))):
+            if os.path.realpath(path) not in paths:
+                paths.append(os.path.realpath(path))
+    return paths
+
+
+def tuned_params(model_path: str) -> dict[str, Any]:
+    """Llama parameters to load ``model_path`` with on this host."""
+    if not LLM_AUTOTUNE:
+        return {}
+    return get_tuning_store().get(model_path) or {}
+
+
+_store: TuningStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_tuning_store() -> TuningStore:
+    """Return the process-wide tuning store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TuningStore()
+        return _store
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark local models and persist the fastest settings."
+    )
+    parser.add_argument(
+        "models", nargs="*", help="GGUF files (default: all discovered models)"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Only tune the thread count"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    model_paths = args.models or discover_models()
+    if not model_paths:
+        parser.error("No models given and none found in the models directories")
+
+    failed = 0
+    for model_path in model_paths:
+        try:
+            outcome = autotune(model_path, quick=args.quick)
+            print(json.dumps({"model_path": model_path, "params": outcome["params"]}))
+        except (ValueError, RuntimeError, OSError, MemoryError) as e:
+            logger.error(f"Autotuning failed for {model_path}: {e}")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+"""
+Multi-sequence batched decoding on a llama.cpp model.
+
+Generating many short completions one after another leaves the CPU
+underused: each decode step evaluates a single token, which is bound by
+memory bandwidth rather than compute. Decoding several sequences in one
+llama.cpp batch evaluates one token per sequence for each pass over the
+weights, so aggregate tokens/sec grows with the number of sequences. Every
+sequence has its own KV-cache sequence id, sampler and stop handling, and a
+prompt prefix shared by all sequences is evaluated once and copied.
+"""
+
+import logging
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sequences decoded together in one batch
+LLM_BATCH_MAX_SEQUENCES = int(os.getenv("LLM_BATCH_MAX_SEQUENCES", "8"))
+# KV-cache positions reserved per sequence (prompt + generated tokens)
+LLM_BATCH_SEQUENCE_CTX = int(os.getenv("LLM_BATCH_SEQUENCE_CTX", "1024"))
+
+# (token, position, sequence id, whether logits are needed)
+BatchItem = tuple[int, int, int, bool]
+
+
+# Sampler settings llama-cpp-python applies to every completion call unless
+# told otherwise; batched sequences use the same ones
+LLAMA_TOP_K = 40
+LLAMA_MIN_P = 0.05
+
+
+def sample_token(
+    logits: np.ndarray,
+    temperature: float,
+    top_p: float,
+    rng: np.random.Generator,
+    top_k: int = LLAMA_TOP_K,
+    min_p: float = LLAMA_MIN_P,
+) -> int:
+    """
+    Sample one token from a row of logits like llama.cpp's sampler chain.
+
+    Greedy at zero temperature. Otherwise the candidates are narrowed by
+    top-k, top-p and min-p on the unscaled distribution, in that order,
+    and the token is drawn from the survivors after temperature scaling.
+    """
+    if temperature <= 0:
+        return int(np.argmax(logits))
+
+    logits = logits.astype(np.float64)
+    order = np.argsort(-logits, kind="stable")
+    if 0 < top_k < len(order):
+        order = order[:top_k]
+
+    probs = np.exp(logits[order] - logits[order[0]])
+    probs /= probs.sum()
+    if top_p < 1.0:
+        # Keep the smallest head whose mass reaches top_p (at least one)
+        cutoff = int(np.searchsorted(np.cumsum(probs), top_p)) + 1
+        order, probs = order[:cutoff], probs[:cutoff]
+    if min_p > 0.0:
+        # Probabilities are sorted, so the kept tokens are again a head
+        keep = max(1, int(np.count_nonzero(probs >= min_p * probs[0])))
+        order = order[:keep]
+
+    scaled = logits[order] / temperature
+    weights = np.exp(scaled - scaled.max())
+    return int(rng.choice(order, p=weights / weights.sum()))
+
+
+class LlamaBatchEngine:
+    """
+    A dedicated multi-sequence llama.cpp context on an already loaded model.
+
+    ``Llama`` creates its context for a single sequence, so batched decoding
+    uses a second context sharing the model weights. Only the KV cache for
+    ``n_seq_max`` sequences is allocated in addition.
+    """
+
+    def __init__(
+        self,
+        llama: Any,
+        n_seq_max: int = LLM_BATCH_MAX_SEQUENCES,
+        seq_ctx: int = LLM_BATCH_SEQUENCE_CTX,
+    ):
+        import llama_cpp
+        from llama_cpp import _internals
+
+        self._llama_cpp = llama_cpp
+        self.llama = llama
+        self.n_seq_max = n_seq_max
+        self.seq_ctx = seq_ctx
+        self.n_batch = llama.n_batch
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_seq_max * seq_ctx
+        params.n_batch = self.n_batch
+        params.n_ubatch = min(self.n_batch, llama.context_params.n_ubatch)
+        params.n_seq_max = n_seq_max
+        params.n_threads = llama.context_params.n_threads
+        params.n_threads_batch = llama.context_params.n_threads_batch
+        if hasattr(params, "kv_unified"):
+            # One shared cache lets a shared prefix be copied between sequences
+            params.kv_unified = True
+
+        self._ctx = _internals.LlamaContext(
+            model=llama._model, params=params, verbose=False
+        )
+        self._batch = _internals.LlamaBatch(
+            n_tokens=self.n_batch, embd=0, n_seq_max=n_seq_max, verbose=False
+        )
+        self._n_vocab = llama.n_vocab()
+
+    def decode(self, items: Sequence[BatchItem]) -> list[np.ndarray | None]:
+        """Decode up to n_batch tokens; returns copied logits where requested."""
+        batch = self._batch.batch
+        batch.n_tokens = len(items)
+        for i, (token, pos, seq_id, logits) in enumerate(items):
+            batch.token[i] = token
+            batch.pos[i] = pos
+            batch.seq_id[i][0] = seq_id
+            batch.n_seq_id[i] = 1
+            batch.logits[i] = logits
+        self._ctx.decode(self._batch)
+
+        rows: list[np.ndarray | None] = []
+        for i, (_, _, _, logits) in enumerate(items):
+            if logits:
+                pointer = self._ctx.get_logits_ith(i)
+                rows.append(
+                    np.ctypeslib.as_array(pointer, shape=(self._n_vocab,)).copy()
+                )
+            else:
+                rows.append(None)
+        return rows
+
+    def copy_sequence(self, src: int, dst: int, length: int) -> None:
+        self._ctx.kv_cache_seq_cp(src, dst, 0, length)
+
+    def remove_sequence(self, seq_id: int) -> None:
+        self._ctx.kv_cache_seq_rm(seq_id, 0, -1)
+
+    def clear(self) -> None:
+        self._ctx.kv_cache_clear()
+
+    def is_eog(self, token: int) -> bool:
+        return token == self.llama.token_eos() or bool(
+            self._llama_cpp.llama_token_is_eog(self.llama._model.vocab, token)
+        )
+
+    def piece(self, token: int) -> bytes:
+        return self.llama.detokenize([token])
+
+    def close(self) -> None:
+        self._batch.close()
+        self._ctx.close()
+
+
+@dataclass
+class _Sequence:
+    index: int
+    seq_id: int
+    prompt: list[int]
+    rng: np.random.Generator
+    n_past: int = 0
+    generated: list[int] = field(default_factory=list)
+    text: bytearray = field(default_factory=bytearray)
+    result: str | None = None
+
+
+def _finish(seq: _Sequence, stop: Sequence[str]) -> bool:
+    """Apply per-sequence stop strings; True once the sequence is complete."""
+    text = seq.text.decode("utf-8", errors="ignore")
+    cut = min((text.find(s) for s in stop if s and s in text), default=-1)
+    if cut >= 0:
+        seq.result = text[:cut]
+        return True
+    return False
+
+
+def decode_batch(
+    engine: Any,
+    prompts: Sequence[list[int]],
+    max_tokens: int,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    stop: Sequence[str] | None = None,
+    seed: int | None = None,
+    prefix: list[int] | None = None,
+) -> list[str]:
+    """
+    Generate completions for several tokenized prompts in shared batches.
+
+    Args:
+        engine: LlamaBatchEngine (or a compatible stand-in)
+        prompts: Token lists, at most ``engine.n_seq_max`` of them
+        max_tokens: Maximum tokens generated per sequence
+        temperature: Sampling temperature
+        top_p: Nucleus sampling parameter
+        stop: Stop strings, checked per sequence
+        seed: Base seed; sequence ``i`` samples with ``seed + i``
+        prefix: Tokens shared by every prompt, evaluated once and copied
+
+    Returns:
+        Generated text per prompt, in input order
+    """
+    if len(prompts) > engine.n_seq_max:
+        raise ValueError(f"At most {engine.n_seq_max} sequences per batch")
+    stop = list(stop or [])
+    prefix = list(prefix or [])
+    sequences = [
+        _Sequence(
+            index=i,
+            seq_id=i,
+            prompt=list(tokens),
+            rng=np.random.default_rng(None if seed is None else seed + i),
+        )
+        for i, tokens in enumerate(prompts)
+    ]
+    engine.clear()
+
+    # Shared prefix: evaluate once in sequence 0, then copy its KV cells
+    if prefix:
+        for start in range(0, len(prefix), engine.n_batch):
+            chunk = prefix[start : start + engine.n_batch]
+            engine.decode([(t, start + i, 0, False) for i, t in enumerate(chunk)])
+        for seq in sequences:
+            if seq.seq_id != 0:
+                engine.copy_sequence(0, seq.seq_id, len(prefix))
+            seq.n_past = len(prefix)
+
+    # Prefill every prompt, packing tokens from all sequences into batches;
+    # the first token of each sequence is sampled from its last prompt token
+    pending: list[tuple[BatchItem, _Sequence]] = []
+    for seq in sequences:
+        for i, token in enumerate(seq.prompt):
+            last = i == len(seq.prompt) - 1
+            pending.append(((token, seq.n_past + i, seq.seq_id, last), seq))
+        seq.n_past += len(seq.prompt)
+
+    next_tokens = {}
+    for start in range(0, len(pending), engine.n_batch):
+        chunk = pending[start : start + engine.n_batch]
+        rows = engine.decode([item for item, _ in chunk])
+        for (item, seq), row in zip(chunk, rows):
+            if row is not None:
+                next_tokens[seq.index] = sample_token(row, temperature, top_p, seq.rng)
+
+    active = list(sequences)
+    while active:
+        still_active = []
+        for seq in active:
+            token = next_tokens[seq.index]
+            if engine.is_eog(token):
+                seq.result = seq.text.decode("utf-8", errors="ignore")
+            else:
+                seq.generated.append(token)
+                seq.text.extend(engine.piece(token))
+                if not _finish(seq, stop):
+                    if len(seq.generated) >= max_tokens:
+                        seq.result = seq.text.decode("utf-8", errors="ignore")
+                    else:
+                        still_active.append(seq)
+            if seq.result is not None:
+                engine.remove_sequence(seq.seq_id)
+        active = still_active
+        if not active:
+            break
+
+        # One decode step advances every unfinished sequence by one token
+        rows = engine.decode(
+            [(next_tokens[s.index], s.n_past, s.seq_id, True) for s in active]
+        )
+        for seq, row in zip(active, rows):
+            seq.n_past += 1
+            next_tokens[seq.index] = sample_token(row, temperature, top_p, seq.rng)
+
+    engine.clear()
+    return [seq.result for seq in sequences]
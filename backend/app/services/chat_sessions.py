@@ -0,0 +1,229 @@
+"""
+Server-side chat sessions with persisted llama state.
+
+Each session belongs to a job and keeps the full prompt transcript plus the
+llama KV state saved after the last turn. The next turn restores that state,
+so llama.cpp only evaluates the new question instead of re-reading the whole
+repository context. Sessions expire after a TTL and the store is kept under
+a disk quota by evicting the least recently used sessions.
+"""
+
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_DIR = os.getenv("CHAT_SESSION_DIR", "./data/chat_sessions")
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600"))
+CHAT_SESSION_MAX_MB = int(os.getenv("CHAT_SESSION_MAX_MB", "2048"))
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+TRANSCRIPT_FILE = "session.json"
+STATE_FILE = "state.pkl"
+
+
+@dataclass
+class ChatSession:
+    """Transcript and metadata for one multi-turn conversation."""
+
+    job_id: str
+    session_id: str
+    model_path: str
+    context: str = ""
+    transcript: str = ""
+    turns: list[dict[str, str]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class ChatSessionStore:
+    """Disk-backed store of chat sessions keyed by job and session id."""
+
+    def __init__(
+        self,
+        root: str = CHAT_SESSION_DIR,
+        ttl_seconds: int = CHAT_SESSION_TTL_SECONDS,
+        max_bytes: int = CHAT_SESSION_MAX_MB * 1024 * 1024,
+    ):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._session_locks: dict[str, threading.Lock] = {}
+
+    def _session_dir(self, job_id: str, session_id: str) -> str:
+        if not _SAFE_ID.match(job_id) or not _SAFE_ID.match(session_id):
+            raise ValueError("Invalid job or session id")
+        return os.path.join(self.root, job_id, session_id)
+
+    def session_lock(self, job_id: str, session_id: str) -> threading.Lock:
+        """Lock serializing turns of one session within this process."""
+        with self._lock:
+            return self._session_locks.setdefault(
+                f"{job_id}/{session_id}", threading.Lock()
+            )
+
+    def create(self, job_id: str, model_path: str, context: str = "") -> ChatSession:
+        """Start a new, not yet persisted session for ``job_id``."""
+        if not _SAFE_ID.match(job_id):
+            raise ValueError("Invalid job id")
+        return ChatSession(
+            job_id=job_id,
+            session_id=uuid.uuid4().hex,
+            model_path=model_path,
+            context=context,
+        )
+
+    def load(self, job_id: str, session_id: str) -> ChatSession | None:
+        """
+        Load a session, or None if it does not exist or has expired.
+        """
+        session_dir = self._session_dir(job_id, session_id)
+        try:
+            with open(os.path.join(session_dir, TRANSCRIPT_FILE), "r") as f:
+                session = ChatSession(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+        if time.time() - session.updated_at > self.ttl_seconds:
+            logger.info(f"Chat session {job_id}/{session_id} expired")
+            self.delete(job_id, session_id)
+            return None
+        return session
+
+    def load_state(self, session: ChatSession) -> Any | None:
+        """Return the llama state saved after the session's last turn."""
+        path = os.path.join(
+            self._session_dir(session.job_id, session.session_id), STATE_FILE
+        )
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Could not load chat state from {path}: {e}")
+            return None
+
+    def save(self, session: ChatSession, state: Any | None) -> None:
+        """Persist transcript and llama state, then apply TTL and quota."""
+        session_dir = self._session_dir(session.job_id, session.session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        session.updated_at = time.time()
+
+        # Write to temp files first so a crash never leaves a torn session
+        if state is not None:
+            state_path = os.path.join(session_dir, STATE_FILE)
+            with open(state_path + ".tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(state_path + ".tmp", state_path)
+
+        transcript_path = os.path.join(session_dir, TRANSCRIPT_FILE)
+        with open(transcript_path + ".tmp", "w") as f:
+            json.dump(session.to_dict(), f)
+        os.replace(transcript_path + ".tmp", transcript_path)
+
+        self.evict(keep=session_dir)
+
+    def delete(self, job_id: str, session_id: str) -> None:
+        shutil.rmtree(self._session_dir(job_id, session_id), ignore_errors=True)
+
+    def delete_job(self, job_id: str) -> None:
+        """Drop every session belonging to a job."""
+        if _SAFE_ID.match(job_id):
+            shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+
+    def _scan(self) -> list[dict[str, Any]]:
+        sessions = []
+        if not os.path.isdir(self.root):
+            return sessions
+        for job_id in os.listdir(self.root):
+            job_dir = os.path.join(self.root, job_id)
+            if not os.path.isdir(job_dir):
+                continue
+            for session_id in os.listdir(job_dir):
+                session_dir = os.path.join(job_dir, session_id)
+                try:
+                    files = [
+                        os.path.join(session_dir, f) for f in os.listdir(session_dir)
+                    ]
+                    sessions.append(
+                        {
+                            "dir": session_dir,
+                            "bytes": sum(os.path.getsize(f) for f in files),
+                            "updated_at": max(
+                                (os.path.getmtime(f) for f in files), default=0.0
+                            ),
+                        }
+                    )
+                except OSError:
+                    continue
+        return sessions
+
+    def evict(self, keep: str | None = None) -> int:
+        """
+        Remove expired sessions, then the least recently used ones until the
+        store fits its disk quota.
+
+        Args:
+            keep: Session directory that must survive (the one just written)
+
+        Returns:
+            Number of sessions removed
+        """
+        now = time.time()
+        removed = 0
+        live = []
+        for info in self._scan():
+            if now - info["updated_at"] > self.ttl_seconds and info["dir"] != keep:
+                shutil.rmtree(info["dir"], ignore_errors=True)
+                removed += 1
+            else:
+                live.append(info)
+
+        total = sum(info["bytes"] for info in live)
+        for info in sorted(live, key=lambda i: i["updated_at"]):
+            if total <= self.max_bytes:
+                break
+            if info["dir"] == keep:
+                continue
+            shutil.rmtree(info["dir"], ignore_errors=True)
+            total -= info["bytes"]
+            removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} chat session(s)")
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        sessions = self._scan()
+        return {
+            "sessions": len(sessions),
+            "bytes": sum(info["bytes"] for info in sessions),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_store: ChatSessionStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_chat_session_store() -> ChatSessionStore:
+    """Return the process-wide chat session store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatSessionStore()
+        return _store
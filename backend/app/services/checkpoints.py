@@ -0,0 +1,123 @@
+"""
+On-disk checkpoints of analysis stage outputs.
+
+Every pipeline stage (see services.analysis_pipeline) stores its output
+under ``<PIPELINE_CHECKPOINT_DIR>/<job_id>/<stage>.json`` when it finishes,
+so a job that is retried, re-queued or resubmitted after a crashed worker
+resumes after its last completed stage instead of starting over with the
+clone. A job's checkpoints are deleted once it completes; those of jobs
+that never complete are pruned after PIPELINE_CHECKPOINT_TTL_HOURS.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Directory of job checkpoints ("" disables checkpointing)
+PIPELINE_CHECKPOINT_DIR = os.getenv("PIPELINE_CHECKPOINT_DIR", "./data/checkpoints")
+# Checkpoints of jobs that never completed are deleted after this many hours
+PIPELINE_CHECKPOINT_TTL_HOURS = float(os.getenv("PIPELINE_CHECKPOINT_TTL_HOURS", "72"))
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CheckpointStore:
+    """JSON checkpoints of stage outputs, one directory per job."""
+
+    def __init__(self, root: str = PIPELINE_CHECKPOINT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> str:
+        if not _SAFE_NAME.match(job_id):
+            raise ValueError("Invalid job id")
+        return os.path.join(self.root, job_id)
+
+    def _path(self, job_id: str, stage: str) -> str:
+        if not _SAFE_NAME.match(stage):
+            raise ValueError("Invalid stage name")
+        return os.path.join(self._job_dir(job_id), f"{stage}.json")
+
+    def save(self, job_id: str, stage: str, data: Any) -> None:
+        """
+        Store the output of a stage, replacing any previous checkpoint.
+
+        The file is written next to its destination and renamed into place,
+        so a crash mid-write leaves the previous checkpoint (or none).
+        """
+        path = self._path(job_id, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str, stage: str) -> Any | None:
+        """The stored output of a stage, or None if there is no usable one."""
+        path = self._path(job_id, stage)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            return None
+
+    def stages(self, job_id: str) -> list[str]:
+        """Stages of a job that have a checkpoint."""
+        try:
+            names = os.listdir(self._job_dir(job_id))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def clear(self, job_id: str) -> None:
+        """Delete every checkpoint of a job."""
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def prune(self, max_age_seconds: float) -> int:
+        """
+        Delete the checkpoints of jobs not updated for ``max_age_seconds``.
+
+        Returns:
+            Number of jobs whose checkpoints were deleted
+        """
+        cutoff = time.time() - max_age_seconds
+        pruned = 0
+        for name in os.listdir(self.root):
+            job_dir = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(job_dir) < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    pruned += 1
+            except OSError:
+                continue
+        return pruned
+
+
+_store: CheckpointStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore | None:
+    """
+    Return the process-wide checkpoint store, or None if it cannot be
+    created or has been disabled with PIPELINE_CHECKPOINT_DIR="".
+    """
+    global _store
+    with _store_lock:
+        if _store is None and PIPELINE_CHECKPOINT_DIR:
+            try:
+                _store = CheckpointStore()
+            except OSError as e:
+                logger.warning(f"Pipeline checkpoints disabled: {e}")
+                return None
+        return _store
@@ -0,0 +1,195 @@
+"""
+Split source files into retrieval chunks along code structure.
+
+Chunks follow definition boundaries (functions, classes, methods, markdown
+sections) rather than fixed windows, so a retrieved chunk is a complete unit
+a question can be answered from. Python is split with the ``ast`` module;
+other languages use declaration patterns at the start of a line. Units
+longer than CHUNK_MAX_LINES are split into windows and tiny units are merged
+into their neighbour.
+"""
+
+import ast
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+CHUNK_MAX_LINES = int(os.getenv("CHUNK_MAX_LINES", "60"))
+# Segments shorter than this are merged into the following one
+CHUNK_MIN_LINES = 4
+
+_JS_PATTERN = (
+    r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\*?|class)\s+(\w+)"
+    r"|^(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:\(|function|\w+\s*=>)"
+)
+
+# Extension -> pattern of lines that start a new unit; group 1 (or the first
+# matching group) is the symbol name
+DECLARATION_PATTERNS: dict[str, "re.Pattern[str]"] = {
+    ext: re.compile(pattern, re.MULTILINE)
+    for exts, pattern in [
+        ((".js", ".jsx", ".ts", ".tsx"), _JS_PATTERN),
+        ((".go",), r"^func\s+(?:\([^)]*\)\s*)?(\w+)|^type\s+(\w+)"),
+        (
+            (".rs",),
+            (
+                r"^\s{0,4}(?:pub(?:\([\w:]+\))?\s+)?(?:async\s+)?"
+                r"(?:fn|struct|enum|trait|impl|mod)\s+(\w+)"
+            ),
+        ),
+        (
+            (".java", ".cs", ".kt", ".swift", ".php"),
+            (
+                r"^\s{0,4}(?:(?:public|private|protected|internal|static|final"
+                r"|abstract|override|open|func|fun|function)\s+)+"
+                r"[\w<>\[\],.? ]*?(\w+)\s*[({<]"
+            ),
+        ),
+        ((".rb",), r"^\s{0,2}(?:def|class|module)\s+([\w.?!]+)"),
+        ((".c", ".cpp", ".h"), r"^[A-Za-z_][\w\s\*&:<>,]*?\b(\w+)\s*\([^;]*$"),
+        ((".md", ".rst"), r"^#{1,6}\s+(.+)$"),
+    ]
+    for ext in exts
+}
+
+
+@dataclass
+class CodeChunk:
+    """A retrievable piece of a file with its location."""
+
+    path: str
+    start_line: int
+    end_line: int
+    text: str
+    symbol: str | None = None
+
+    @property
+    def header(self) -> str:
+        symbol = f" ({self.symbol})" if self.symbol else ""
+        return f"# {self.path}:{self.start_line}-{self.end_line}{symbol}"
+
+    def render(self) -> str:
+        """Chunk text prefixed with its location, as placed in prompts."""
+        return f"{self.header}\n{self.text}"
+
+
+# (first line, last line, symbol), 1-based and inclusive
+Segment = tuple[int, int, str | None]
+
+
+def _python_segments(content: str, max_lines: int) -> list[Segment] | None:
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+
+    def definitions(body, owner: str = "") -> list[Segment]:
+        found = []
+        for node in body:
+            if not isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                continue
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            name = f"{owner}{node.name}"
+            if (
+                isinstance(node, ast.ClassDef)
+                and node.end_lineno - start + 1 > max_lines
+            ):
+                # Large classes are split into their methods
+                methods = definitions(node.body, owner=f"{name}.")
+                if methods:
+                    found.append((start, methods[0][0] - 1, name))
+                    found.extend(methods)
+                    continue
+            found.append((start, node.end_lineno, name))
+        return found
+
+    return definitions(tree.body)
+
+
+def _pattern_segments(content: str, pattern: "re.Pattern[str]") -> list[Segment]:
+    segments = []
+    for match in pattern.finditer(content):
+        line = content.count("\n", 0, match.start()) + 1
+        symbol = next((g for g in match.groups() if g), None)
+        segments.append((line, line, symbol))
+    # Each declaration extends to the line before the next one
+    total = content.count("\n") + 1
+    return [
+        (start, (segments[i + 1][0] - 1) if i + 1 < len(segments) else total, symbol)
+        for i, (start, _, symbol) in enumerate(segments)
+    ]
+
+
+def _fill_gaps(segments: list[Segment], total: int) -> list[Segment]:
+    """Cover lines between definitions (imports, module code) too."""
+    covered = []
+    line = 1
+    for start, end, symbol in sorted(segments):
+        if start > line:
+            covered.append((line, start - 1, None))
+        if end >= start and end >= line:
+            covered.append((max(start, line), end, symbol))
+            line = end + 1
+    if line <= total:
+        covered.append((line, total, None))
+    return covered
+
+
+def _merge_small(segments: list[Segment], max_lines: int) -> list[Segment]:
+    merged: list[Segment] = []
+    carry: Segment | None = None
+    for start, end, symbol in segments:
+        if carry and end - carry[0] + 1 <= max_lines:
+            start, symbol = carry[0], symbol or carry[2]
+        elif carry:
+            merged.append(carry)
+        carry = None
+        if end - start + 1 < CHUNK_MIN_LINES:
+            carry = (start, end, symbol)
+        else:
+            merged.append((start, end, symbol))
+    if carry:
+        if merged and carry[1] - merged[-1][0] + 1 <= max_lines:
+            start, _, symbol = merged.pop()
+            carry = (start, carry[1], symbol or carry[2])
+        merged.append(carry)
+    return merged
+
+
+def chunk_file(
+    path: str, content: str, max_lines: int = CHUNK_MAX_LINES
+) -> list[CodeChunk]:
+    """
+    Split a file into chunks along its definitions.
+
+    Args:
+        path: Repository-relative path, recorded in every chunk
+        content: File text
+        max_lines: Longest chunk; longer units are split into windows
+
+    Returns:
+        Non-empty chunks covering the file in order
+    """
+    lines = content.split("\n")
+    total = len(lines)
+    ext = os.path.splitext(path)[1].lower()
+
+    segments = _python_segments(content, max_lines) if ext == ".py" else None
+    if segments is None:
+        pattern = DECLARATION_PATTERNS.get(ext)
+        segments = _pattern_segments(content, pattern) if pattern else []
+    segments = _merge_small(_fill_gaps(segments, total), max_lines)
+
+    chunks = []
+    for start, end, symbol in segments:
+        for window in range(start, end + 1, max_lines):
+            window_end = min(end, window + max_lines - 1)
+            text = "\n".join(lines[window - 1 : window_end]).strip("\n")
+            if text.strip():
+                chunks.append(CodeChunk(path, window, window_end, text, symbol))
+    return chunks
@@ -0,0 +1,249 @@
+"""
+Token-aware packing of prompt context.
+
+Analysis prompts used to be assembled from fixed character slices, which
+either left most of the context window unused or overflowed it. The packer
+measures snippets with the loaded model's tokenizer and greedily fills a
+token budget with the highest-value snippets, truncating the last one that
+only partly fits, so a prompt uses the window fully without overflowing it.
+
+Backends whose tokenizer sits behind a socket or HTTP call (the model
+daemon, llama.cpp servers) also take a batch counter, so the snippets of a
+prompt are measured in one round trip instead of one per snippet.
+"""
+
+import logging
+import os
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Tokens kept free besides max_tokens, covering tokenizer boundary effects
+# when snippets are joined and the BOS token added by llama.cpp
+CONTEXT_SAFETY_MARGIN = int(os.getenv("CONTEXT_SAFETY_MARGIN", "32"))
+
+# Snippets are only truncated into a gap at least this large
+MIN_TRUNCATED_TOKENS = 24
+
+TRUNCATION_MARKER = "\n..."
+
+# Candidate cut points measured per round trip when truncating with a batch
+# counter (a plain counter bisects, one point at a time)
+TRUNCATION_PROBES = 8
+
+TokenCounter = Callable[[str], int]
+BatchTokenCounter = Callable[[list[str]], list[int]]
+
+ENTRY_POINT_NAMES = {
+    "main.py",
+    "app.py",
+    "__main__.py",
+    "manage.py",
+    "server.py",
+    "index.js",
+    "index.ts",
+    "main.go",
+    "main.rs",
+    "lib.rs",
+}
+
+MANIFEST_NAMES = {
+    "package.json",
+    "requirements.txt",
+    "pyproject.toml",
+    "go.mod",
+    "cargo.toml",
+    "pom.xml",
+}
+
+
+@dataclass
+class Snippet:
+    """A piece of prompt context with a packing priority."""
+
+    text: str
+    score: float = 0.0
+    # Whether the snippet may be cut down to fit the remaining budget
+    truncatable: bool = True
+
+
+@dataclass
+class PackedContext:
+    """Result of packing snippets into a token budget."""
+
+    text: str
+    tokens: int
+    budget: int
+    included: int = 0
+    truncated: int = 0
+    dropped: list[str] = field(default_factory=list)
+
+
+def file_priority(rel_path: str) -> float:
+    """
+    Heuristic value of a file's content for a repository overview.
+
+    READMEs and manifests describe the project directly, entry points show
+    how it runs, and shallow files tend to matter more than deeply nested ones.
+    """
+    name = os.path.basename(rel_path).lower()
+    depth = rel_path.count("/")
+    if name.startswith("readme"):
+        score = 100.0
+    elif name in MANIFEST_NAMES:
+        score = 80.0
+    elif name in ENTRY_POINT_NAMES:
+        score = 70.0
+    else:
+        score = 40.0
+    if "test" in rel_path.lower():
+        score -= 20.0
+    return score - 5.0 * depth
+
+
+def context_budget(
+    n_ctx: int,
+    template_tokens: int,
+    max_tokens: int,
+    margin: int = CONTEXT_SAFETY_MARGIN,
+) -> int:
+    """Tokens left for variable context once the template and output are reserved."""
+    return max(0, n_ctx - template_tokens - max_tokens - margin)
+
+
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    count_tokens: TokenCounter,
+    count_tokens_many: BatchTokenCounter | None = None,
+) -> str | None:
+    """
+    Cut ``text`` to the longest prefix that fits ``max_tokens`` together
+    with the truncation marker, preferring to end on a line boundary.
+
+    Args:
+        text: Text to cut
+        max_tokens: Token budget, marker included
+        count_tokens: Tokenizer-backed token counter
+        count_tokens_many: Batch counter; when given, TRUNCATION_PROBES cut
+            points are measured per call instead of one
+
+    Returns:
+        The truncated text, or None if not even the marker fits
+    """
+    if count_tokens(TRUNCATION_MARKER) >= max_tokens:
+        return None
+    probes = TRUNCATION_PROBES if count_tokens_many else 1
+
+    def measure(texts: list[str]) -> list[int]:
+        if count_tokens_many is not None:
+            return count_tokens_many(texts)
+        return [count_tokens(text) for text in texts]
+
+    # Search on the character length; token counts grow with it. Each round
+    # measures evenly spaced cut points and keeps the gap between the last
+    # that fits and the first that does not. No tokenizer averages anywhere
+    # near 16 characters per token, which bounds the search for very long
+    # inputs.
+    low, high = 0, min(len(text), max_tokens * 16)
+    while low < high:
+        span = high - low
+        cuts = sorted({low - (-span * j // (probes + 1)) for j in range(1, probes + 1)})
+        counts = measure([text[:cut] + TRUNCATION_MARKER for cut in cuts])
+        for cut, tokens in zip(cuts, counts):
+            if tokens <= max_tokens:
+                low = cut
+            else:
+                high = cut - 1
+                break
+
+    cut = text[:low]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut.rstrip() + TRUNCATION_MARKER if cut.strip() else None
+
+
+def pack_snippets(
+    snippets: Sequence[Snippet],
+    budget: int,
+    count_tokens: TokenCounter,
+    separator: str = "\n",
+    count_tokens_many: BatchTokenCounter | None = None,
+) -> PackedContext:
+    """
+    Greedily fill ``budget`` tokens with the highest-scoring snippets.
+
+    Snippets are considered in descending score order; one that does not fit
+    is truncated into the remaining space when allowed, otherwise skipped in
+    favour of smaller ones. Included snippets keep their original order so
+    the prompt reads naturally.
+
+    Args:
+        snippets: Candidate context pieces
+        budget: Maximum number of tokens for the packed text
+        count_tokens: Tokenizer-backed token counter
+        separator: Text placed between snippets
+        count_tokens_many: Batch counter measuring all snippets in one call
+
+    Returns:
+        PackedContext with the joined text and packing statistics
+    """
+    if count_tokens_many is not None:
+        counts = count_tokens_many([separator, *(snippet.text for snippet in snippets)])
+        separator_tokens = counts[0] if separator else 0
+        costs = counts[1:]
+    else:
+        separator_tokens = count_tokens(separator) if separator else 0
+        costs = [count_tokens(snippet.text) for snippet in snippets]
+    order = sorted(range(len(snippets)), key=lambda i: -snippets[i].score)
+
+    chosen = {}
+    truncated = set()
+    used = 0
+    for index in order:
+        snippet = snippets[index]
+        joint = separator_tokens if chosen else 0
+        cost = costs[index]
+        if used + joint + cost <= budget:
+            chosen[index] = snippet.text
+            used += joint + cost
+            continue
+        room = budget - used - joint
+        if snippet.truncatable and room >= MIN_TRUNCATED_TOKENS:
+            text = truncate_to_tokens(
+                snippet.text, room, count_tokens, count_tokens_many
+            )
+            if text:
+                chosen[index] = text
+                truncated.add(index)
+                used += joint + count_tokens(text)
+
+    # Joining can merge tokens across boundaries; drop the least valuable
+    # snippets until the measured total really fits.
+    text = separator.join(chosen[i] for i in sorted(chosen))
+    tokens = count_tokens(text) if text else 0
+    while tokens > budget and chosen:
+        weakest = min(chosen, key=lambda i: snippets[i].score)
+        del chosen[weakest]
+        truncated.discard(weakest)
+        text = separator.join(chosen[i] for i in sorted(chosen))
+        tokens = count_tokens(text) if text else 0
+
+    dropped = [
+        snippets[i].text.split("\n", 1)[0]
+        for i in range(len(snippets))
+        if i not in chosen
+    ]
+    if dropped:
+        logger.debug(f"Context packer dropped {len(dropped)} snippet(s)")
+
+    return PackedContext(
+        text=text,
+        tokens=tokens,
+        budget=budget,
+        included=len(chosen),
+        truncated=len(truncated),
+        dropped=dropped,
+    )
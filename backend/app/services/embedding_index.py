@@ -0,0 +1,305 @@
+"""
+Per-job embedding index for retrieval-augmented chat.
+
+When a job completes, the worker chunks the source files of the checkout (see
+services.code_chunker), embeds the chunks with a local GGUF embedding model
+in llama.cpp embedding mode, and stores the unit-length vectors as a
+float32 matrix on disk. Chat embeds the question and takes the top-k chunks
+by cosine similarity from a memory-mapped view of that matrix, so prompts
+carry only the code relevant to the question, whatever the repository size.
+
+Layout per job: ``<EMBEDDING_INDEX_DIR>/<job_id>/{vectors.f32, chunks.json,
+meta.json}``. Retrieval is disabled when EMBEDDING_MODEL_PATH is unset.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import asdict
+
+import numpy as np
+
+from .code_chunker import CodeChunk, chunk_file
+from .response_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+# GGUF embedding model (e.g. nomic-embed-text, bge-small); unset disables RAG
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH") or None
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", "./data/embeddings")
+# Tokens per embedded chunk; longer chunks are truncated for embedding
+EMBEDDING_CONTEXT_SIZE = int(os.getenv("EMBEDDING_CONTEXT_SIZE", "1024"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+# Chunks retrieved for a chat question, and the prompt tokens they may use
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "6"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+# Largest source file chunked into the index (the analysis reads at most 50KB)
+RAG_INDEX_MAX_FILE_BYTES = int(os.getenv("RAG_INDEX_MAX_FILE_BYTES", str(512 * 1024)))
+
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.json"
+META_FILE = "meta.json"
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+Embed = Callable[[list[str]], np.ndarray]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalEmbedder:
+    """GGUF embedding model run through llama.cpp in embedding mode."""
+
+    def __init__(
+        self,
+        model_path: str,
+        n_ctx: int = EMBEDDING_CONTEXT_SIZE,
+        n_threads: int | None = None,
+    ):
+        from llama_cpp import Llama
+
+        logger.info(f"Loading embedding model from {model_path}...")
+        self.model_path = model_path
+        self.model_identity = model_identity(model_path)
+        self._lock = threading.Lock()
+        self.llm = Llama(
+            model_path=model_path,
+            embedding=True,
+            n_ctx=n_ctx,
+            # A whole chunk must fit one batch to be pooled into one vector
+            n_batch=n_ctx,
+            n_ubatch=n_ctx,
+            n_threads=n_threads or os.cpu_count() or 4,
+            verbose=False,
+        )
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Unit-length float32 embeddings, one row per text."""
+        with self._lock:
+            vectors = self.llm.embed(texts, normalize=False, truncate=True)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+class EmbeddingIndexStore:
+    """On-disk embedding matrices keyed by job id."""
+
+    def __init__(self, root: str = EMBEDDING_INDEX_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # job id -> (meta.json mtime, vectors, chunks)
+        self._open: dict[str, tuple[float, np.ndarray, list[CodeChunk]]] = {}
+
+    def _job_dir(self, job_id: str) -> str:
+        if not _SAFE_ID.match(job_id):
+            raise ValueError("Invalid job id")
+        return os.path.join(self.root, job_id)
+
+    def exists(self, job_id: str) -> bool:
+        return os.path.exists(os.path.join(self._job_dir(job_id), META_FILE))
+
+    def build(
+        self,
+        job_id: str,
+        chunks: Sequence[CodeChunk],
+        embed: Embed,
+        model: str = "",
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ) -> int:
+        """
+        Embed ``chunks`` and persist them as the job's index.
+
+        The index is written to a temporary directory and swapped in, so
+        readers see either the previous index or the complete new one.
+
+        Args:
+            job_id: Job the index belongs to
+            chunks: Chunks to index
+            embed: Texts -> unit-length embedding rows
+            model: Identity of the embedding model, recorded in the metadata
+            batch_size: Chunks embedded per call
+
+        Returns:
+            Number of indexed chunks
+        """
+        job_dir = self._job_dir(job_id)
+        tmp_dir = f"{job_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        vectors = None
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start : start + batch_size]
+            rows = embed([chunk.render() for chunk in batch])
+            if vectors is None:
+                vectors = np.memmap(
+                    os.path.join(tmp_dir, VECTORS_FILE),
+                    dtype=np.float32,
+                    mode="w+",
+                    shape=(len(chunks), rows.shape[1]),
+                )
+            vectors[start : start + len(batch)] = rows
+        dim = 0
+        if vectors is not None:
+            dim = vectors.shape[1]
+            vectors.flush()
+            del vectors
+
+        with open(os.path.join(tmp_dir, CHUNKS_FILE), "w") as f:
+            json.dump([asdict(chunk) for chunk in chunks], f)
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump({"count": len(chunks), "dim": dim, "model": model}, f)
+
+        with self._lock:
+            self._open.pop(job_id, None)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            os.replace(tmp_dir, job_dir)
+        return len(chunks)
+
+    def copy(self, source_job_id: str, job_id: str) -> bool:
+        """
+        Give ``job_id`` a copy of another job's index, e.g. when its result
+        was served from the analysis cache.
+
+        Returns:
+            False if the source job has no index
+        """
+        if not self.exists(source_job_id):
+            return False
+        job_dir = self._job_dir(job_id)
+        tmp_dir = f"{job_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.copytree(self._job_dir(source_job_id), tmp_dir)
+        with self._lock:
+            self._open.pop(job_id, None)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            os.replace(tmp_dir, job_dir)
+        return True
+
+    def _load(self, job_id: str) -> tuple[np.ndarray, list[CodeChunk]] | None:
+        job_dir = self._job_dir(job_id)
+        meta_path = os.path.join(job_dir, META_FILE)
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._open.get(job_id)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(os.path.join(job_dir, CHUNKS_FILE), "r") as f:
+                chunks = [CodeChunk(**item) for item in json.load(f)]
+            if meta["count"] and meta["dim"]:
+                vectors = np.memmap(
+                    os.path.join(job_dir, VECTORS_FILE),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(meta["count"], meta["dim"]),
+                )
+            else:
+                vectors = np.zeros((0, 0), dtype=np.float32)
+            self._open[job_id] = (mtime, vectors, chunks)
+            return vectors, chunks
+
+    def search(
+        self, job_id: str, query: np.ndarray, k: int = RAG_TOP_K
+    ) -> list[tuple[float, CodeChunk]]:
+        """
+        Top-k chunks by cosine similarity to a unit-length query vector.
+
+        Returns:
+            (score, chunk) pairs, best first; empty if the job has no index
+        """
+        loaded = self._load(job_id)
+        if loaded is None:
+            return []
+        vectors, chunks = loaded
+        if not len(chunks) or k <= 0 or vectors.shape[1] != query.shape[-1]:
+            return []
+        scores = vectors @ query.reshape(-1)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), chunks[i]) for i in top]
+
+
+_embedder: LocalEmbedder | None = None
+_embedder_failed = False
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> LocalEmbedder | None:
+    """
+    Return the process-wide embedding model (a proxy to the model daemon's
+    when one is configured), or None if unavailable.
+    """
+    global _embedder, _embedder_failed
+    if not EMBEDDING_MODEL_PATH:
+        return None
+    from .model_daemon import RemoteEmbedder, daemon_client_enabled
+
+    if daemon_client_enabled():
+        return RemoteEmbedder(EMBEDDING_MODEL_PATH)
+    with _embedder_lock:
+        if _embedder is None and not _embedder_failed:
+            try:
+                _embedder = LocalEmbedder(EMBEDDING_MODEL_PATH)
+            except (ImportError, ValueError, RuntimeError, OSError) as e:
+                logger.warning(f"Embedding model unavailable, RAG disabled: {e}")
+                _embedder_failed = True
+        return _embedder
+
+
+_store: EmbeddingIndexStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_index_store() -> EmbeddingIndexStore:
+    """Return the process-wide embedding index store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingIndexStore()
+        return _store
+
+
+def build_job_index(job_id: str, sources: Iterable[tuple[str, str]]) -> int | None:
+    """
+    Chunk and embed a job's files; returns the chunk count, or None when
+    retrieval is disabled.
+
+    Args:
+        job_id: Job the index belongs to
+        sources: ``(path, content)`` of the files to index, e.g. from
+            ``analysis_pipeline.read_sources``
+    """
+    embedder = get_embedder()
+    if embedder is None:
+        return None
+    chunks = [chunk for path, content in sources for chunk in chunk_file(path, content)]
+    return get_embedding_index_store().build(
+        job_id, chunks, embedder.embed, model=embedder.model_identity
+    )
+
+
+def retrieve(job_id: str, query: str, k: int = RAG_TOP_K) -> list[CodeChunk]:
+    """Chunks of ``job_id`` most relevant to ``query`` (empty without an index)."""
+    store = get_embedding_index_store()
+    try:
+        if not store.exists(job_id):
+            return []
+    except ValueError:
+        return []
+    embedder = get_embedder()
+    if embedder is None:
+        return []
+    query_vector = embedder.embed([query])[0]
+    return [chunk for _, chunk in store.search(job_id, query_vector, k)]
@@ -0,0 +1,271 @@
+"""
+GGUF header inspection.
+
+Reads the header and metadata of a GGUF model file without loading the
+model: magic, format version, tensor count, architecture, trained context
+length and quantization type. Parsing stops as soon as those keys have been
+seen, which in practice is within the first few KB, so validating a model
+takes milliseconds instead of a full llama.cpp load. Results are cached by
+(path, mtime, size).
+
+Format reference: https://github.com/ggml-org/ggml/blob/master/docs/gguf.md
+"""
+
+import logging
+import os
+import struct
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, BinaryIO
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+SUPPORTED_VERSIONS = (1, 2, 3)
+
+# Sanity bounds; anything larger means a corrupt or non-GGUF file
+MAX_TENSORS = 1 << 24
+MAX_METADATA_KEYS = 1 << 20
+MAX_STRING_BYTES = 1 << 24
+MAX_ARRAY_ITEMS = 1 << 28
+
+# Metadata value types -> struct format of scalar values
+_SCALAR_FORMATS = {
+    0: "<B",  # UINT8
+    1: "<b",  # INT8
+    2: "<H",  # UINT16
+    3: "<h",  # INT16
+    4: "<I",  # UINT32
+    5: "<i",  # INT32
+    6: "<f",  # FLOAT32
+    7: "<?",  # BOOL
+    10: "<Q",  # UINT64
+    11: "<q",  # INT64
+    12: "<d",  # FLOAT64
+}
+_STRING = 8
+_ARRAY = 9
+
+# general.file_type values (llama_ftype) -> quantization name
+FILE_TYPES = {
+    0: "F32",
+    1: "F16",
+    2: "Q4_0",
+    3: "Q4_1",
+    7: "Q8_0",
+    8: "Q5_0",
+    9: "Q5_1",
+    10: "Q2_K",
+    11: "Q3_K_S",
+    12: "Q3_K_M",
+    13: "Q3_K_L",
+    14: "Q4_K_S",
+    15: "Q4_K_M",
+    16: "Q5_K_S",
+    17: "Q5_K_M",
+    18: "Q6_K",
+    19: "IQ2_XXS",
+    20: "IQ2_XS",
+    21: "Q2_K_S",
+    22: "IQ3_XS",
+    23: "IQ3_XXS",
+    24: "IQ1_S",
+    25: "IQ4_NL",
+    26: "IQ3_S",
+    27: "IQ3_M",
+    28: "IQ2_S",
+    29: "IQ2_M",
+    30: "IQ4_XS",
+    31: "IQ1_M",
+    32: "BF16",
+    36: "TQ1_0",
+    37: "TQ2_0",
+}
+
+# Architectures that load but cannot generate text (encoders, projectors)
+NON_GENERATIVE_ARCHITECTURES = frozenset(
+    {"bert", "nomic-bert", "nomic-bert-moe", "jina-bert-v2", "t5encoder", "clip"}
+)
+
+
+class GGUFError(ValueError):
+    """Raised when a file is not a readable GGUF model."""
+
+
+@dataclass(frozen=True)
+class GGUFInfo:
+    """Header facts of a GGUF model file."""
+
+    version: int
+    tensor_count: int
+    metadata_count: int
+    architecture: str | None = None
+    name: str | None = None
+    context_length: int | None = None
+    embedding_length: int | None = None
+    block_count: int | None = None
+    head_count: int | None = None
+    head_count_kv: int | None = None
+    file_type: int | None = None
+
+    @property
+    def quantization(self) -> str | None:
+        if self.file_type is None:
+            return None
+        return FILE_TYPES.get(self.file_type, f"type {self.file_type}")
+
+    @property
+    def generative(self) -> bool:
+        return self.architecture not in NON_GENERATIVE_ARCHITECTURES
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "quantization": self.quantization}
+
+
+class _Reader:
+    def __init__(self, f: BinaryIO, version: int = 3):
+        self.f = f
+        self.version = version
+
+    def read(self, size: int) -> bytes:
+        data = self.f.read(size)
+        if len(data) != size:
+            raise GGUFError("Truncated GGUF header")
+        return data
+
+    def unpack(self, fmt: str) -> Any:
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def count(self) -> int:
+        # Version 1 used 32-bit counts and string lengths
+        return self.unpack("<I" if self.version == 1 else "<Q")
+
+    def string(self) -> str:
+        length = self.count()
+        if length > MAX_STRING_BYTES:
+            raise GGUFError(f"Implausible string length {length}")
+        return self.read(length).decode("utf-8", errors="replace")
+
+    def value(self, value_type: int) -> Any:
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            self.skip_array()
+            return None
+        fmt = _SCALAR_FORMATS.get(value_type)
+        if fmt is None:
+            raise GGUFError(f"Unknown metadata value type {value_type}")
+        return self.unpack(fmt)
+
+    def skip_array(self) -> None:
+        item_type = self.unpack("<I")
+        count = self.count()
+        if count > MAX_ARRAY_ITEMS:
+            raise GGUFError(f"Implausible array length {count}")
+        if item_type in _SCALAR_FORMATS:
+            self.f.seek(count * struct.calcsize(_SCALAR_FORMATS[item_type]), 1)
+        else:
+            # Strings (e.g. the tokenizer vocabulary) or nested arrays
+            for _ in range(count):
+                self.value(item_type)
+
+
+def read_gguf_header(f: BinaryIO) -> GGUFInfo:
+    """
+    Parse the header of an open GGUF file.
+
+    Raises:
+        GGUFError: Bad magic, unsupported version or corrupt metadata
+    """
+    if f.read(4) != GGUF_MAGIC:
+        raise GGUFError("Not a GGUF file (bad magic)")
+    reader = _Reader(f)
+    version = reader.unpack("<I")
+    if version not in SUPPORTED_VERSIONS:
+        raise GGUFError(f"Unsupported GGUF version {version}")
+    reader.version = version
+    tensor_count = reader.count()
+    metadata_count = reader.count()
+    if tensor_count > MAX_TENSORS or metadata_count > MAX_METADATA_KEYS:
+        raise GGUFError("Implausible tensor or metadata count")
+
+    fields: dict[str, Any] = {}
+    wanted = {"general.architecture", "general.name", "general.file_type"}
+    for _ in range(metadata_count):
+        key = reader.string()
+        value = reader.value(reader.unpack("<I"))
+        if key == "general.architecture":
+            arch = value
+            wanted |= {
+                f"{arch}.context_length",
+                f"{arch}.embedding_length",
+                f"{arch}.block_count",
+                f"{arch}.attention.head_count",
+                f"{arch}.attention.head_count_kv",
+            }
+        if key in wanted:
+            fields[key.rsplit(".", 1)[-1]] = value
+            wanted.discard(key)
+            if not wanted:
+                break
+
+    if "architecture" not in fields:
+        raise GGUFError("GGUF metadata has no general.architecture")
+    return GGUFInfo(
+        version=version,
+        tensor_count=tensor_count,
+        metadata_count=metadata_count,
+        architecture=fields.get("architecture"),
+        name=fields.get("name"),
+        context_length=fields.get("context_length"),
+        embedding_length=fields.get("embedding_length"),
+        block_count=fields.get("block_count"),
+        head_count=fields.get("head_count"),
+        head_count_kv=fields.get("head_count_kv"),
+        file_type=fields.get("file_type"),
+    )
+
+
+@lru_cache(maxsize=64)
+def _inspect(path: str, mtime: float, size: int) -> GGUFInfo:
+    with open(path, "rb") as f:
+        return read_gguf_header(f)
+
+
+def inspect_gguf(path: str) -> GGUFInfo:
+    """
+    Header facts of a GGUF file, cached until the file changes.
+
+    Raises:
+        GGUFError: The file is not a readable GGUF model
+        OSError: The file cannot be read
+    """
+    stat = os.stat(path)
+    return _inspect(os.path.abspath(path), stat.st_mtime, stat.st_size)
+
+
+def model_context_length(path: str) -> int | None:
+    """Context length the model was trained with, or None if unknown."""
+    try:
+        return inspect_gguf(path).context_length
+    except (GGUFError, OSError) as e:
+        logger.warning(f"Could not read GGUF header of {path}: {e}")
+        return None
+
+
+def kv_cache_bytes(path: str, n_ctx: int) -> int:
+    """
+    Size of the f16 K and V caches llama.cpp allocates for ``n_ctx``
+    positions of a model, or 0 if its header lacks the shape.
+    """
+    try:
+        info = inspect_gguf(path)
+    except (GGUFError, OSError):
+        return 0
+    if not info.block_count or not info.embedding_length:
+        return 0
+    # Grouped-query attention keeps fewer K/V heads than query heads
+    kv_width = info.embedding_length
+    if info.head_count and info.head_count_kv:
+        kv_width = kv_width * info.head_count_kv // info.head_count
+    return 2 * info.block_count * n_ctx * kv_width * 2
@@ -0,0 +1,341 @@
+"""
+Persistent bare-mirror cache of remote repositories.
+
+Instead of a fresh ``git clone --depth 1`` per job, every remote is kept as
+one bare clone under GIT_MIRROR_DIR, keyed by its normalized URL. A job
+updates the mirror with ``git fetch`` and gets a detached worktree of the
+default branch, which only writes the checked-out files; re-analyzing a
+repository downloads just the new objects.
+
+Mirrors track branches and tags only (not ``git clone --mirror``, whose
+``refs/*`` refspec also fetches every pull request ref of a forge), and are
+partial clones (GIT_MIRROR_FILTER): file contents are downloaded when a
+worktree checks them out, so history costs only commits and trees.
+
+Per-repo locks (a lock file, so they also hold across prefork workers)
+serialize fetches and worktree changes. Jobs that were waiting on the lock
+while another job fetched reuse that fetch instead of fetching again. Mirrors
+without live worktrees are evicted least recently used first when the cache
+exceeds GIT_MIRROR_MAX_BYTES or GIT_MIRROR_MAX_REPOS.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only hold within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Directory of the mirrors ("" disables the cache: shallow clone per job)
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "./data/git-mirrors")
+# Eviction limits of the cache
+GIT_MIRROR_MAX_BYTES = int(os.getenv("GIT_MIRROR_MAX_BYTES", str(10 * 1024**3)))
+GIT_MIRROR_MAX_REPOS = int(os.getenv("GIT_MIRROR_MAX_REPOS", "100"))
+# Partial clone filter of new mirrors ("" clones every blob of the history)
+GIT_MIRROR_FILTER = os.getenv("GIT_MIRROR_FILTER", "blob:none")
+# Refs a mirror fetches
+MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+# Seconds a clone or fetch may take
+GIT_FETCH_TIMEOUT_SECONDS = int(os.getenv("GIT_FETCH_TIMEOUT_SECONDS", "300"))
+
+# Stamps kept inside each mirror
+_FETCHED = "repoinsight-fetched"
+_USED = "repoinsight-used"
+
+
+class MirrorError(RuntimeError):
+    """Raised when a mirror cannot be created, updated or checked out."""
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a remote URL, so that spellings of the same
+    repository share one mirror.
+
+    Credentials, a trailing ``.git`` or slash and the case of the host are
+    ignored, and scp-style ``git@host:owner/repo`` becomes ``ssh://``.
+    """
+    url = url.strip()
+    scp = re.match(r"^([\w.-]+@)?([\w.-]+):(?!//)(.+)$", url)
+    if scp and not re.match(r"^[A-Za-z]:[\\/]", url):
+        url = f"ssh://{scp.group(1) or ''}{scp.group(2)}/{scp.group(3)}"
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/")
+    path = path.removesuffix(".git")
+    return urlunsplit((parts.scheme.lower(), host, path, "", ""))
+
+
+def mirror_key(url: str) -> str:
+    """Directory name of a remote's mirror: readable slug plus URL hash."""
+    normalized = normalize_url(url)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", normalized.split("://", 1)[-1]).strip("-")
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    return f"{slug[-60:]}-{digest}"
+
+
+def _git(
+    *args: str, cwd: str | None = None, timeout: int = GIT_FETCH_TIMEOUT_SECONDS
+) -> str:
+    try:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=cwd,
+            check=True,
+            capture_output=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise MirrorError(f"git {args[0]} timed out after {timeout}s")
+    except subprocess.CalledProcessError as e:
+        detail = e.stderr.decode(errors="replace").strip() if e.stderr else str(e)
+        raise MirrorError(f"git {args[0]} failed: {detail}")
+    return result.stdout.decode(errors="replace").strip()
+
+
+def _track_branches_and_tags(mirror: str) -> None:
+    """
+    Make ``origin`` fetch only MIRROR_REFSPECS into ``mirror``, dropping
+    other refs (pull requests, notes) a ``--mirror`` clone had fetched.
+    """
+    _git(
+        "config", "--replace-all", "remote.origin.fetch", MIRROR_REFSPECS[0], cwd=mirror
+    )
+    for refspec in MIRROR_REFSPECS[1:]:
+        _git("config", "--add", "remote.origin.fetch", refspec, cwd=mirror)
+    try:
+        _git("config", "--unset", "remote.origin.mirror", cwd=mirror)
+    except MirrorError:
+        # Not a --mirror clone
+        return
+    refs = _git("for-each-ref", "--format=%(refname)", cwd=mirror).splitlines()
+    for ref in refs:
+        if not ref.startswith(("refs/heads/", "refs/tags/")):
+            _git("update-ref", "-d", ref, cwd=mirror)
+
+
+def _touch(path: str) -> None:
+    with open(path, "a"):
+        pass
+    os.utime(path)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _has_worktrees(mirror: str) -> bool:
+    try:
+        return bool(os.listdir(os.path.join(mirror, "worktrees")))
+    except OSError:
+        return False
+
+
+class MirrorCache:
+    """Bare mirrors of remotes with per-job worktrees."""
+
+    def __init__(
+        self,
+        root: str = GIT_MIRROR_DIR,
+        max_bytes: int = GIT_MIRROR_MAX_BYTES,
+        max_repos: int = GIT_MIRROR_MAX_REPOS,
+    ):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_repos = max_repos
+        os.makedirs(self.root, exist_ok=True)
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stats = {"clones": 0, "fetches": 0, "shared_fetches": 0, "evictions": 0}
+
+    def mirror_path(self, url: str) -> str:
+        return os.path.join(self.root, f"{mirror_key(url)}.git")
+
+    @contextmanager
+    def _locked(self, key: str, blocking: bool = True) -> Iterator[bool]:
+        """Hold the lock of one mirror; yields False if not acquired."""
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(key, threading.Lock())
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            with open(os.path.join(self.root, f"{key}.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    try:
+                        flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+                        fcntl.flock(lock_file, flags)
+                    except BlockingIOError:
+                        yield False
+                        return
+                try:
+                    yield True
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+    def _update(self, url: str, mirror: str, requested: float) -> None:
+        """Clone or fetch a mirror; the caller holds its lock."""
+        if os.path.isdir(mirror):
+            if _mtime(os.path.join(mirror, _FETCHED)) >= requested:
+                # Another job fetched while this one waited for the lock
+                self._stats["shared_fetches"] += 1
+                return
+            logger.info(f"Fetching into mirror {mirror}")
+            if _git("config", "--get-all", "remote.origin.fetch", cwd=mirror) != (
+                "\n".join(MIRROR_REFSPECS)
+            ):
+                _track_branches_and_tags(mirror)
+            _git("fetch", "--prune", "origin", cwd=mirror)
+            self._stats["fetches"] += 1
+        else:
+            logger.info(f"Creating mirror of {normalize_url(url)}")
+            tmp = f"{mirror}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            options = [f"--filter={GIT_MIRROR_FILTER}"] if GIT_MIRROR_FILTER else []
+            try:
+                _git("clone", "--bare", "--quiet", *options, url, tmp)
+                _track_branches_and_tags(tmp)
+            except MirrorError:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            os.replace(tmp, mirror)
+            self._stats["clones"] += 1
+        _touch(os.path.join(mirror, _FETCHED))
+
+    def checkout(self, url: str, dest: str) -> str:
+        """
+        Update the mirror of ``url`` and check out its default branch at
+        ``dest`` as a detached worktree.
+
+        Args:
+            url: Remote to analyze
+            dest: Directory to create (must not exist or be empty)
+
+        Returns:
+            SHA of the checked-out commit
+
+        Raises:
+            MirrorError: The remote cannot be fetched or checked out
+        """
+        key = mirror_key(url)
+        mirror = self.mirror_path(url)
+        requested = time.time()
+        with self._locked(key):
+            self._update(url, mirror, requested)
+            _git("worktree", "prune", cwd=mirror)
+            _git("worktree", "add", "--detach", "--quiet", dest, "HEAD", cwd=mirror)
+            _touch(os.path.join(mirror, _USED))
+        self.evict(keep=key)
+        return _git("rev-parse", "HEAD", cwd=dest)
+
+    def release(self, url: str, dest: str) -> None:
+        """Remove a job's worktree (its files and the mirror's record of it)."""
+        mirror = self.mirror_path(url)
+        with self._locked(mirror_key(url)):
+            shutil.rmtree(dest, ignore_errors=True)
+            if os.path.isdir(mirror):
+                try:
+                    _git("worktree", "prune", cwd=mirror)
+                except MirrorError as e:
+                    logger.warning(f"Could not prune worktrees of {mirror}: {e}")
+
+    def _mirrors(self) -> list[tuple[float, str]]:
+        mirrors = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                mirrors.append((_mtime(os.path.join(path, _USED)), name[:-4]))
+        return sorted(mirrors)
+
+    def evict(self, keep: str | None = None) -> list[str]:
+        """
+        Delete least recently used mirrors until the cache is within its
+        limits. Mirrors with live worktrees, locked mirrors and ``keep`` are
+        skipped.
+
+        Returns:
+            Keys of the evicted mirrors
+        """
+        mirrors = self._mirrors()
+        sizes = {
+            key: _dir_size(os.path.join(self.root, f"{key}.git")) for _, key in mirrors
+        }
+        total = sum(sizes.values())
+        count = len(mirrors)
+        evicted = []
+        for _, key in mirrors:
+            if total <= self.max_bytes and count <= self.max_repos:
+                break
+            if key == keep:
+                continue
+            mirror = os.path.join(self.root, f"{key}.git")
+            with self._locked(key, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                try:
+                    _git("worktree", "prune", cwd=mirror)
+                except MirrorError:
+                    pass
+                if _has_worktrees(mirror):
+                    continue
+                shutil.rmtree(mirror, ignore_errors=True)
+            total -= sizes[key]
+            count -= 1
+            evicted.append(key)
+            self._stats["evictions"] += 1
+            logger.info(f"Evicted git mirror {key} ({sizes[key]} bytes)")
+        return evicted
+
+    def stats(self) -> dict[str, int]:
+        return {**self._stats, "mirrors": len(self._mirrors())}
+
+
+_cache: MirrorCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_mirror_cache() -> MirrorCache | None:
+    """
+    Return the process-wide mirror cache, or None if it cannot be created
+    or has been disabled with GIT_MIRROR_DIR="".
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and GIT_MIRROR_DIR:
+            try:
+                _cache = MirrorCache()
+            except OSError as e:
+                logger.warning(f"Git mirror cache disabled: {e}")
+                return None
+        return _cache
@@ -0,0 +1,211 @@
+"""
+Bounded executor that runs blocking LLM inference off the asyncio event loop.
+
+Async endpoints await the executor instead of calling ``LocalLLM`` directly,
+so a long completion no longer freezes health probes, job polling or uploads.
+Admission is bounded: once every worker is busy and the wait queue is full,
+new work is rejected with ``InferenceQueueFull`` rather than piling up.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "8"))
+
+_STREAM_END = object()
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the executor cannot accept more work."""
+
+    def __init__(self, queue_position: int, retry_after: int = 5):
+        super().__init__(
+            f"Inference queue is full (would be position {queue_position})"
+        )
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+
+class InferenceExecutorClosed(Exception):
+    """Raised when work is submitted after the executor has been shut down."""
+
+
+class InferenceExecutor:
+    """
+    Thread pool with a bounded admission queue for blocking inference calls.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 8):
+        """
+        Args:
+            max_workers: Number of inference calls running at once
+            max_queue: Number of calls allowed to wait for a free worker
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._closed = False
+        self._stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def queue_position(self) -> int:
+        """Position a new request would take in the wait queue (0 = runs now)."""
+        with self._lock:
+            return max(0, self._outstanding - self.max_workers + 1)
+
+    def _admit(self) -> int:
+        with self._lock:
+            if self._closed:
+                raise InferenceExecutorClosed("Inference executor is shut down")
+            position = max(0, self._outstanding - self.max_workers + 1)
+            if position > self.max_queue:
+                self._stats["rejected"] += 1
+                raise InferenceQueueFull(queue_position=position)
+            self._outstanding += 1
+            self._stats["accepted"] += 1
+            return position
+
+    def _release(self, failed: bool) -> None:
+        with self._lock:
+            self._outstanding -= 1
+            self._stats["failed" if failed else "completed"] += 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the inference pool and await its result.
+
+        Raises:
+            InferenceQueueFull: All workers busy and the wait queue is full
+            InferenceExecutorClosed: The executor has been shut down
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+
+        def call():
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self._release(failed)
+
+        return await loop.run_in_executor(self._pool, call)
+
+    def stream(self, factory: Callable[[], Iterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Drive a blocking iterator on the pool and yield its items asynchronously.
+
+        Admission happens immediately so callers can map a full queue to an
+        HTTP error before a streaming response starts. The iterator is created
+        and consumed on a single worker thread; when the consumer stops early
+        (client disconnect, cancellation) the worker closes it at the next
+        item boundary, which stops generation.
+
+        Args:
+            factory: Zero-argument callable returning the blocking iterator
+
+        Raises:
+            InferenceQueueFull: All workers busy and the wait queue is full
+            InferenceExecutorClosed: The executor has been shut down
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def put(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def produce():
+            failed = True
+            iterator = None
+            try:
+                iterator = factory()
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    put(item)
+                failed = False
+            except BaseException as e:  # noqa: BLE001 - re-raised by the consumer
+                put(e)
+            finally:
+                if iterator is not None and hasattr(iterator, "close"):
+                    iterator.close()
+                self._release(failed)
+                put(_STREAM_END)
+
+        future = loop.run_in_executor(self._pool, produce)
+        # Surface worker errors without blocking on them
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        items = self._drain(queue, stop)
+        # A consumer that is dropped before iterating still stops the worker
+        weakref.finalize(items, stop.set)
+        return items
+
+    @staticmethod
+    async def _drain(queue: asyncio.Queue, stop: threading.Event) -> AsyncIterator:
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def stats(self) -> dict[str, Any]:
+        """Return admission counters and current load."""
+        with self._lock:
+            return {
+                **self._stats,
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": min(self._outstanding, self.max_workers),
+                "queued": max(0, self._outstanding - self.max_workers),
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting work and release the worker threads."""
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor: InferenceExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Return the process-wide inference executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor._closed:
+            _executor = InferenceExecutor(
+                max_workers=INFERENCE_WORKERS, max_queue=INFERENCE_QUEUE_DEPTH
+            )
+        return _executor
+
+
+def shutdown_inference_executor() -> None:
+    """Shut down the process-wide executor (called on API shutdown)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
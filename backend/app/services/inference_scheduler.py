@@ -0,0 +1,155 @@
+"""
+Priority scheduling of inference calls on a shared model.
+
+A model instance runs a limited number of generations at once (one for an
+in-process llama.cpp context, the slot count for llama.cpp servers). When
+bulk work such as file descriptions keeps it busy, an interactive chat
+request must not wait for the whole batch. Callers therefore acquire a slot
+through an InferenceScheduler with a priority class; a freed slot always
+goes to the highest-priority waiter, and bulk callers release their slot
+after every generation, so they are preempted at generation boundaries.
+
+Classes, highest priority first: ``chat`` (interactive), ``overview``
+(synthesis steps of an analysis) and ``descriptions`` (bulk). Per-class
+concurrency caps keep a class from taking every slot:
+
+    INFERENCE_CLASS_CAPS=descriptions=2
+"""
+
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ("chat", "overview", "descriptions")
+
+# class=max concurrent generations pairs, e.g. "descriptions=2"
+INFERENCE_CLASS_CAPS = os.getenv("INFERENCE_CLASS_CAPS", "")
+
+# Recent waits per class kept for percentiles
+WAIT_SAMPLES = 256
+
+
+def parse_caps(spec: str) -> dict[str, int]:
+    """Parse ``class=limit`` pairs separated by commas."""
+    caps = {}
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+        name, _, limit = pair.partition("=")
+        name = name.strip()
+        try:
+            value = int(limit)
+        except ValueError:
+            value = 0
+        if name not in PRIORITY_CLASSES or value < 1:
+            logger.warning(f"Ignoring invalid inference class cap: {pair.strip()!r}")
+            continue
+        caps[name] = value
+    return caps
+
+
+class InferenceScheduler:
+    """Hands out a model's generation slots by priority class."""
+
+    def __init__(self, capacity: int = 1, caps: dict[str, int] | None = None):
+        """
+        Args:
+            capacity: Generations allowed to run at once
+            caps: Priority class -> maximum concurrent generations of that class
+        """
+        self.capacity = max(1, capacity)
+        self.caps = dict(parse_caps(INFERENCE_CLASS_CAPS) if caps is None else caps)
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        # (class rank, ticket, class), ordered by priority then arrival
+        self._waiting: list[tuple[int, int, str]] = []
+        self._running = {name: 0 for name in PRIORITY_CLASSES}
+        self._waits: dict[str, deque[float]] = {
+            name: deque(maxlen=WAIT_SAMPLES) for name in PRIORITY_CLASSES
+        }
+        self._counts = {name: 0 for name in PRIORITY_CLASSES}
+        self._max_wait = {name: 0.0 for name in PRIORITY_CLASSES}
+
+    def _has_room(self, priority: str) -> bool:
+        if sum(self._running.values()) >= self.capacity:
+            return False
+        cap = self.caps.get(priority)
+        return cap is None or self._running[priority] < cap
+
+    def _is_next(self, entry: tuple[int, int, str]) -> bool:
+        # A waiter ahead of us only blocks us if it could run itself; a class
+        # at its cap lets lower classes through
+        for waiting in self._waiting:
+            if waiting == entry:
+                return self._has_room(entry[2])
+            if self._has_room(waiting[2]):
+                return False
+        return False
+
+    @contextmanager
+    def slot(self, priority: str = "overview") -> Iterator[None]:
+        """
+        Hold a generation slot for the duration of the block.
+
+        Args:
+            priority: One of PRIORITY_CLASSES
+
+        Raises:
+            ValueError: Unknown priority class
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        entry = (PRIORITY_CLASSES.index(priority), next(self._tickets), priority)
+        started = time.perf_counter()
+        with self._cond:
+            bisect.insort(self._waiting, entry)
+            try:
+                while not self._is_next(entry):
+                    self._cond.wait()
+            finally:
+                self._waiting.remove(entry)
+                # Waiters behind us may fit the remaining slots
+                self._cond.notify_all()
+            self._running[priority] += 1
+            waited = time.perf_counter() - started
+            self._waits[priority].append(waited)
+            self._counts[priority] += 1
+            self._max_wait[priority] = max(self._max_wait[priority], waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        """Per-class queue wait times and current load."""
+        with self._cond:
+            classes = {}
+            for name in PRIORITY_CLASSES:
+                waits = sorted(self._waits[name])
+                classes[name] = {
+                    "generations": self._counts[name],
+                    "running": self._running[name],
+                    "queued": sum(1 for w in self._waiting if w[2] == name),
+                    "cap": self.caps.get(name),
+                    "mean_wait_ms": (
+                        round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0
+                    ),
+                    "p95_wait_ms": (
+                        round(waits[int(0.95 * (len(waits) - 1))] * 1000, 2)
+                        if waits
+                        else 0.0
+                    ),
+                    "max_wait_ms": round(self._max_wait[name] * 1000, 2),
+                }
+            return {"capacity": self.capacity, "classes": classes}
@@ -1,41 +1,396 @@
 # backend/app/services/llm_client.py
-import requests
+"""
+Async client for one or more llama.cpp HTTP server replicas.
+
+Connections are pooled and kept alive across calls. Requests go to the
+healthy replica with the fewest outstanding requests, except that calls
+sharing a ``cache_key`` (typically a static prompt prefix) stick to the same
+replica and slot so the server can reuse the prefix already in its KV cache
+(``cache_prompt``). A background health check ejects replicas that fail or
+answer too slowly and readmits them once they recover.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import time
+from collections.abc import AsyncIterator
+from typing import Any, Self
+
+import httpx
+
+logger = logging.getLogger(__name__)
 
 LLM_SERVER_URL = os.getenv("LLM_SERVER_URL", "http://llm:8080")
+# Comma-separated replica URLs; defaults to the single LLM_SERVER_URL
+LLM_SERVER_URLS = os.getenv("LLM_SERVER_URLS", LLM_SERVER_URL)
+LLM_CLIENT_TIMEOUT_SECONDS = float(os.getenv("LLM_CLIENT_TIMEOUT_SECONDS", "120"))
+LLM_CLIENT_MAX_CONNECTIONS = int(os.getenv("LLM_CLIENT_MAX_CONNECTIONS", "32"))
+# Parallel slots each server runs (llama-server -np); 0 lets the server pick
+LLM_SERVER_SLOTS = int(os.getenv("LLM_SERVER_SLOTS", "0"))
+LLM_HEALTH_INTERVAL_SECONDS = float(os.getenv("LLM_HEALTH_INTERVAL_SECONDS", "10"))
+# Replicas whose /health takes longer than this are ejected
+LLM_HEALTH_MAX_LATENCY_SECONDS = float(
+    os.getenv("LLM_HEALTH_MAX_LATENCY_SECONDS", "2.0")
+)
+
+# Consecutive request failures before a replica is ejected without waiting
+# for the next health check
+MAX_CONSECUTIVE_FAILURES = 3
+# How many more outstanding requests than the least-loaded replica an
+# affinity replica may have before the request is balanced elsewhere
+AFFINITY_SLACK = 2
+
+
+class LLMServerUnavailable(Exception):
+    """Raised when no replica could serve a request."""
+
+
+class Replica:
+    """Load and health bookkeeping for one llama.cpp server."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_latency: float | None = None
+        self.requests = 0
+        self.failures = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "health_latency": self.last_latency,
+        }
 
 
 class LLMClient:
-    def __init__(self, server_url: str = LLM_SERVER_URL):
-        self.server_url = server_url
+    """
+    Load-balancing async client for llama.cpp ``/completion`` endpoints.
+
+    The underlying httpx client is bound to the event loop it is first used
+    on, so create one LLMClient per loop and close it with ``aclose()``.
+    """
+
+    def __init__(
+        self,
+        server_urls: list[str] | None = None,
+        timeout: float = LLM_CLIENT_TIMEOUT_SECONDS,
+        max_connections: int = LLM_CLIENT_MAX_CONNECTIONS,
+        slots_per_server: int = LLM_SERVER_SLOTS,
+        health_interval: float = LLM_HEALTH_INTERVAL_SECONDS,
+        max_health_latency: float = LLM_HEALTH_MAX_LATENCY_SECONDS,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        urls = server_urls or [
+            url.strip() for url in LLM_SERVER_URLS.split(",") if url.strip()
+        ]
+        if not urls:
+            raise ValueError("At least one LLM server URL is required")
+        self.replicas = [Replica(url) for url in urls]
+        self.slots_per_server = slots_per_server
+        self.health_interval = health_interval
+        self.max_health_latency = max_health_latency
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+        )
+        self._health_task: asyncio.Task | None = None
+
+    # --- Routing ---
+
+    @staticmethod
+    def _affinity_hash(cache_key: str, url: str) -> int:
+        digest = hashlib.sha256(f"{cache_key}|{url}".encode()).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def _pick(self, cache_key: str | None = None, exclude=()) -> Replica:
+        """
+        Choose the replica for a request.
+
+        Without a cache key this is the healthy replica with the fewest
+        outstanding requests. With one, rendezvous hashing maps the key to
+        a stable replica, so repeated prefixes land where they are cached,
+        unless that replica is noticeably busier than the least-loaded one.
+        """
+        candidates = [
+            r for r in self.replicas if r.healthy and r.url not in exclude
+        ] or [r for r in self.replicas if r.url not in exclude]
+        if not candidates:
+            raise LLMServerUnavailable("No LLM server replicas available")
+
+        least_loaded = min(candidates, key=lambda r: r.outstanding)
+        if cache_key is None:
+            return least_loaded
+
+        preferred = max(candidates, key=lambda r: self._affinity_hash(cache_key, r.url))
+        if preferred.outstanding - least_loaded.outstanding > AFFINITY_SLACK:
+            return least_loaded
+        return preferred
+
+    def _slot_for(self, cache_key: str | None) -> int:
+        if cache_key is None or self.slots_per_server <= 0:
+            return -1
+        return self._affinity_hash(cache_key, "slot") % self.slots_per_server
+
+    def _record_failure(self, replica: Replica, error: Exception) -> None:
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= MAX_CONSECUTIVE_FAILURES and replica.healthy:
+            logger.warning(f"Ejecting LLM server {replica.url}: {error}")
+            replica.healthy = False
+
+    def _payload(
+        self,
+        prompt: str,
+        n_predict: int,
+        temperature: float,
+        stop: list[str] | None,
+        cache_key: str | None,
+        stream: bool,
+        extra: dict[str, Any],
+    ) -> dict[str, Any]:
+        return {
+            "prompt": prompt,
+            "n_predict": n_predict,
+            "temperature": temperature,
+            "stop": stop or [],
+            "stream": stream,
+            # Let the server reuse the longest matching prefix in the slot's KV cache
+            "cache_prompt": True,
+            "id_slot": self._slot_for(cache_key),
+            **extra,
+        }
+
+    # --- Requests ---
+
+    async def complete(
+        self,
+        prompt: str,
+        n_predict: int = 256,
+        temperature: float = 0.2,
+        stop: list[str] | None = None,
+        cache_key: str | None = None,
+        **params: Any,
+    ) -> str:
+        """
+        Run a non-streaming completion, retrying once on another replica.
+
+        Args:
+            prompt: Full prompt text
+            n_predict: Maximum tokens to generate
+            temperature: Sampling temperature
+            stop: Stop sequences
+            cache_key: Requests with the same key share a replica and slot
+            **params: Extra llama.cpp /completion parameters
+
+        Returns:
+            Generated text
+        """
+        self._ensure_health_checks()
+        payload = self._payload(
+            prompt, n_predict, temperature, stop, cache_key, False, params
+        )
+        tried: list[str] = []
+        last_error: Exception | None = None
+        for _ in range(min(2, len(self.replicas))):
+            replica = self._pick(cache_key, exclude=tried)
+            tried.append(replica.url)
+            replica.outstanding += 1
+            replica.requests += 1
+            try:
+                response = await self._client.post(
+                    f"{replica.url}/completion", json=payload
+                )
+                response.raise_for_status()
+                replica.consecutive_failures = 0
+                return response.json().get("content", "")
+            except httpx.HTTPError as e:
+                self._record_failure(replica, e)
+                last_error = e
+            finally:
+                replica.outstanding -= 1
+        raise LLMServerUnavailable(f"LLM completion failed: {last_error}")
 
-    def get_explanation(self, prompt: str) -> str:
+    async def stream(
+        self,
+        prompt: str,
+        n_predict: int = 256,
+        temperature: float = 0.2,
+        stop: list[str] | None = None,
+        cache_key: str | None = None,
+        **params: Any,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion as text chunks from the server's SSE response.
+
+        Takes the same arguments as ``complete``. Streams are not retried
+        once the first chunk has been yielded.
+        """
+        self._ensure_health_checks()
+        payload = self._payload(
+            prompt, n_predict, temperature, stop, cache_key, True, params
+        )
+        replica = self._pick(cache_key)
+        replica.outstanding += 1
+        replica.requests += 1
+        try:
+            async with self._client.stream(
+                "POST", f"{replica.url}/completion", json=payload
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: ") :])
+                    if event.get("content"):
+                        yield event["content"]
+                    if event.get("stop"):
+                        break
+            replica.consecutive_failures = 0
+        except httpx.HTTPError as e:
+            self._record_failure(replica, e)
+            raise LLMServerUnavailable(f"LLM stream failed: {e}") from e
+        finally:
+            replica.outstanding -= 1
+
+    async def tokenize(self, text: str) -> list[int]:
+        """Tokenize ``text`` with the servers' model via /tokenize."""
+        replica = self._pick()
+        response = await self._client.post(
+            f"{replica.url}/tokenize", json={"content": text}
+        )
+        response.raise_for_status()
+        return response.json().get("tokens", [])
+
+    async def tokenize_many(self, texts: list[str]) -> list[list[int]]:
+        """
+        Tokenize several texts concurrently over the pooled connections.
+
+        /tokenize takes one text per request; issuing them together costs
+        one round trip of latency for the whole batch.
+        """
+        return list(await asyncio.gather(*(self.tokenize(text) for text in texts)))
+
+    async def props(self) -> dict[str, Any]:
+        """Server properties (/props): loaded model, default settings."""
+        replica = self._pick()
+        response = await self._client.get(f"{replica.url}/props")
+        response.raise_for_status()
+        return response.json()
+
+    async def context_size(self) -> int:
+        """Context window of one server slot, as reported by /props."""
+        settings = (await self.props()).get("default_generation_settings", {})
+        return int(settings.get("n_ctx", 0))
+
+    async def get_explanation(self, prompt: str) -> str:
         """
         Sends a prompt to the local LLM server and gets an explanation.
         """
         try:
-            response = requests.post(
-                f"{self.server_url}/completion",
-                json={
-                    "prompt": prompt,
-                    "n_predict": 256,  # Max tokens to generate
-                    "temperature": 0.2,
-                    "stop": ["\nUser:", "\nSystem:"],  # Stop sequences
-                },
-                timeout=60,  # 60-second timeout
+            return await self.complete(
+                prompt, n_predict=256, temperature=0.2, stop=["\nUser:", "\nSystem:"]
             )
-            response.raise_for_status()
-            # The actual content is in the 'content' key of the JSON response
-            return response.json().get("content", "Error: No content in response.")
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling LLM service: {e}")
+        except LLMServerUnavailable as e:
+            logger.error(f"Error calling LLM service: {e}")
             return "Error: Could not connect to the explanation service."
 
+    # --- Health checks ---
+
+    async def check_health(self) -> dict[str, bool]:
+        """
+        Probe every replica's /health endpoint once.
+
+        Replicas that error, report not ready, or answer slower than
+        ``max_health_latency`` are ejected; healthy ones are readmitted.
+        """
+
+        async def probe(replica: Replica) -> None:
+            start = time.perf_counter()
+            try:
+                response = await self._client.get(
+                    f"{replica.url}/health", timeout=self.max_health_latency * 2
+                )
+                replica.last_latency = time.perf_counter() - start
+                healthy = (
+                    response.status_code == 200
+                    and replica.last_latency <= self.max_health_latency
+                )
+            except httpx.HTTPError:
+                replica.last_latency = None
+                healthy = False
+
+            if healthy and not replica.healthy:
+                logger.info(f"LLM server {replica.url} is healthy again")
+                replica.consecutive_failures = 0
+            elif not healthy and replica.healthy:
+                logger.warning(
+                    f"Ejecting LLM server {replica.url} "
+                    f"(health latency {replica.last_latency})"
+                )
+            replica.healthy = healthy
+
+        await asyncio.gather(*(probe(replica) for replica in self.replicas))
+        return {replica.url: replica.healthy for replica in self.replicas}
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except httpx.HTTPError as e:
+                logger.warning(f"LLM health check failed: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    def _ensure_health_checks(self) -> None:
+        # Started lazily so the task runs on the loop the client is used on
+        if self.health_interval > 0 and (
+            self._health_task is None or self._health_task.done()
+        ):
+            self._health_task = asyncio.get_running_loop().create_task(
+                self._health_loop()
+            )
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [replica.stats() for replica in self.replicas]
+
+    async def aclose(self) -> None:
+        """Stop health checks and close pooled connections."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await self._client.aclose()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
 
 # Example usage (for testing)
 if __name__ == "__main__":
-    client = LLMClient()
-    test_prompt = "User: Explain what a Python list is in one sentence."
-    explanation = client.get_explanation(test_prompt)
-    print(f"Prompt: {test_prompt}")
-    print(f"Explanation: {explanation}")
+
+    async def main():
+        async with LLMClient() as client:
+            test_prompt = "User: Explain what a Python list is in one sentence."
+            explanation = await client.get_explanation(test_prompt)
+            print(f"Prompt: {test_prompt}")
+            print(f"Explanation: {explanation}")
+
+    asyncio.run(main())
@@ -0,0 +1,439 @@
+"""
+Concurrent dispatch of independent LLM generations.
+
+A LocalLLM serializes its own calls, so running several prompts at once
+needs several inference backends: independent in-process copies of the
+model, or llama.cpp server slots reached through LLMClient. An LLMPool hands
+those backends out to worker threads, and ``run_concurrently`` fans a set of
+independent stages out over the pool and gathers their results, so a batch
+of generations takes about as long as the slowest one instead of the sum.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any
+
+from .inference_scheduler import InferenceScheduler
+from .llm_client import LLM_CLIENT_MAX_CONNECTIONS, LLMClient
+from .llm_service import LocalLLM, get_llm_instance
+from .prefix_cache import PrefixCache
+from .response_cache import get_response_cache, model_identity
+from .stream_validators import Validator
+
+logger = logging.getLogger(__name__)
+
+# Generations a job may run at once (1 = one after another)
+LLM_PARALLEL_STAGES = int(os.getenv("LLM_PARALLEL_STAGES", "1"))
+# "local": in-process model replicas, "server": llama.cpp server slots
+LLM_BACKEND = os.getenv("LLM_BACKEND", "local")
+# Seconds before ServerLLM re-reads which model the servers are serving
+SERVER_IDENTITY_TTL_SECONDS = 60
+
+
+class LLMPool:
+    """Fixed set of inference backends checked out one caller at a time."""
+
+    def __init__(self, backends: list[Any]):
+        if not backends:
+            raise ValueError("An LLM pool needs at least one backend")
+        self.backends = list(backends)
+        self._available: queue.Queue[Any] = queue.Queue()
+        for backend in self.backends:
+            self._available.put(backend)
+
+    @property
+    def size(self) -> int:
+        return len(self.backends)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Borrow a backend, blocking until one is free."""
+        backend = self._available.get()
+        try:
+            yield backend
+        finally:
+            self._available.put(backend)
+
+
+@dataclass
+class StageResult:
+    """Outcome of one stage run by ``run_concurrently``."""
+
+    value: Any = None
+    error: BaseException | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_concurrently(
+    pool: LLMPool,
+    stages: dict[str, Callable[[Any], Any]],
+    stage_pools: dict[str, LLMPool] | None = None,
+) -> dict[str, StageResult]:
+    """
+    Run independent stages on the pool and gather their results.
+
+    Stages are started in insertion order, so put the longest generation
+    first. A failing stage does not affect the others; its exception is
+    returned in the StageResult for the caller's fallback handling. The
+    size of ``pool`` bounds how many stages run at once, including stages
+    routed to other pools.
+
+    Args:
+        pool: Backends to run the stages on
+        stages: Stage name -> callable taking a backend
+        stage_pools: Stage name -> pool overriding ``pool`` for that stage
+            (e.g. a different model, see services.model_router)
+
+    Returns:
+        Stage name -> StageResult, in the same order as ``stages``
+    """
+    stage_pools = stage_pools or {}
+
+    def run(name: str, stage: Callable[[Any], Any]) -> StageResult:
+        start = time.perf_counter()
+        with stage_pools.get(name, pool).acquire() as backend:
+            try:
+                value = stage(backend)
+                return StageResult(value=value, seconds=time.perf_counter() - start)
+            except Exception as e:  # noqa: BLE001 - reported per stage
+                return StageResult(error=e, seconds=time.perf_counter() - start)
+
+    if pool.size == 1:
+        return {name: run(name, stage) for name, stage in stages.items()}
+
+    with ThreadPoolExecutor(
+        max_workers=pool.size, thread_name_prefix="llm-stage"
+    ) as executor:
+        futures = {
+            name: executor.submit(run, name, stage) for name, stage in stages.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+class ServerLLM(LocalLLM):
+    """
+    LocalLLM interface backed by llama.cpp server replicas.
+
+    Prompt construction, context packing and response caching are inherited.
+    Generation and tokenization go through one LLMClient running on a private
+    event loop thread, so any number of threads can call the same instance;
+    the servers' slots provide the actual parallelism.
+    """
+
+    def __init__(self, server_urls: list[str] | None = None, **client_options):
+        """
+        Args:
+            server_urls: Server replicas (default: LLM_SERVER_URLS)
+            **client_options: Extra LLMClient arguments
+        """
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="llm-client", daemon=True
+        ).start()
+        self.client = LLMClient(server_urls, **client_options)
+        self.model_path = "server"
+        self._identity: str | None = None
+        self._identity_checked = 0.0
+        # Prefix reuse happens server-side through cache_prompt and slot affinity
+        self.prefix_cache = PrefixCache(max_entries=0)
+        # One scheduler slot per server slot (connection-bound when the
+        # servers pick their own slot count)
+        self.scheduler = InferenceScheduler(
+            capacity=len(self.client.replicas)
+            * (self.client.slots_per_server or LLM_CLIENT_MAX_CONNECTIONS)
+        )
+        self._n_ctx: int | None = None
+
+    def _run(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @property
+    def n_ctx(self) -> int:
+        if self._n_ctx is None:
+            self._n_ctx = self._run(self.client.context_size())
+        return self._n_ctx
+
+    @property
+    def model_identity(self) -> str:
+        """
+        Identity of the model the servers serve, keying the response cache.
+
+        Taken from the model file reported by /props (like
+        ``response_cache.model_identity`` when the file is visible here) and
+        re-read every SERVER_IDENTITY_TTL_SECONDS, so a server restarted
+        with another GGUF behind the same URL stops hitting the old model's
+        cached responses.
+        """
+        now = time.monotonic()
+        if (
+            self._identity is None
+            or now - self._identity_checked > SERVER_IDENTITY_TTL_SECONDS
+        ):
+            served = self._run(self.client.props()).get("model_path")
+            if not served:
+                # Older servers do not report the model; fall back to the URLs
+                identity = ",".join(r.url for r in self.client.replicas)
+            elif os.path.isfile(served):
+                identity = model_identity(served)
+            else:
+                identity = os.path.basename(served)
+            self._identity, self._identity_checked = "server:" + identity, now
+        return self._identity
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._run(self.client.tokenize(text)))
+
+    def count_tokens_many(self, texts: list[str]) -> list[int]:
+        return [len(tokens) for tokens in self._run(self.client.tokenize_many(texts))]
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        prefix: str | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        grammar: str | None = None,
+        validators: Sequence[Validator] | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
+    ) -> str:
+        """
+        Generate text on a server replica (see ``LocalLLM.generate``).
+
+        ``speculative`` is accepted for interface compatibility; llama.cpp
+        servers configure drafting at startup (--model-draft, --draft-max).
+        """
+        if validators:
+            return self._generate_validated(
+                validators,
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop,
+                prefix=prefix,
+                seed=seed,
+                cache=cache,
+                grammar=grammar,
+                priority=priority,
+            )
+
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        full_prompt = (prefix or "") + prompt
+        cache_key = self._response_cache_key(
+            full_prompt,
+            {**sampling, "grammar": grammar} if grammar else sampling,
+            cache,
+        )
+        if cache_key:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                return cached
+
+        params = {"top_p": top_p}
+        if seed is not None:
+            params["seed"] = seed
+        if grammar:
+            params["grammar"] = grammar
+        with self.scheduler.slot(priority):
+            text = self._run(
+                self.client.complete(
+                    full_prompt,
+                    n_predict=max_tokens,
+                    temperature=temperature,
+                    stop=stop,
+                    # Calls sharing a static prefix reuse one slot's KV cache
+                    cache_key=PrefixCache.key_for(prefix) if prefix else None,
+                    **params,
+                )
+            ).strip()
+
+        if cache_key:
+            get_response_cache().put(cache_key, text)
+        return text
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        prefix: str | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        grammar: str | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
+    ) -> Iterator[str]:
+        """
+        Stream text from a server replica (see ``LocalLLM.generate_stream``).
+
+        Chunks are relayed from the client's event loop through a queue;
+        closing the iterator early cancels the server request. A response
+        cache hit is yielded as a single chunk.
+        """
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        cache_key = self._response_cache_key(
+            (prefix or "") + prompt,
+            {**sampling, "grammar": grammar} if grammar else sampling,
+            cache,
+        )
+        if cache_key:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks: queue.Queue[Any] = queue.Queue()
+        done = object()
+        params = {"top_p": top_p}
+        if seed is not None:
+            params["seed"] = seed
+        if grammar:
+            params["grammar"] = grammar
+
+        async def pump() -> None:
+            try:
+                async for chunk in self.client.stream(
+                    (prefix or "") + prompt,
+                    n_predict=max_tokens,
+                    temperature=temperature,
+                    stop=stop,
+                    cache_key=PrefixCache.key_for(prefix) if prefix else None,
+                    **params,
+                ):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(done)
+
+        generated = []
+        with self.scheduler.slot(priority):
+            future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+            try:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is done:
+                        break
+                    generated.append(chunk)
+                    yield chunk
+                future.result()
+            finally:
+                future.cancel()
+
+        # Only reached when the stream ran to completion (not on close)
+        if cache_key:
+            get_response_cache().put(cache_key, "".join(generated).strip())
+
+    def generate_batch(self, prompts: list[str], **kwargs: Any) -> list[str]:
+        """Fan the prompts out to the server slots concurrently."""
+        if not prompts:
+            return []
+        kwargs.setdefault("priority", "descriptions")
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            return list(
+                executor.map(lambda prompt: self.generate(prompt, **kwargs), prompts)
+            )
+
+    def generate_with_state(
+        self,
+        prompt: str,
+        state: Any | None = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
+    ) -> tuple[str, Any]:
+        """
+        Generate from the full transcript (see ``LocalLLM.generate_with_state``).
+
+        Servers do not expose llama state, so ``state`` is ignored and None
+        is returned; the server's own prompt cache still skips the part of
+        the transcript its slot already evaluated.
+        """
+        text = self.generate(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            seed=seed,
+            cache=cache,
+            speculative=speculative,
+            priority=priority,
+        )
+        return text, None
+
+    def close(self) -> None:
+        self._run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_server_llm: ServerLLM | None = None
+_server_llm_lock = threading.Lock()
+
+
+def get_server_llm() -> ServerLLM:
+    """Return the process-wide llama.cpp server backend."""
+    global _server_llm
+    with _server_llm_lock:
+        if _server_llm is None:
+            _server_llm = ServerLLM()
+        return _server_llm
+
+
+def get_llm_pool(
+    model_path: str | None = None,
+    size: int = LLM_PARALLEL_STAGES,
+    backend: str = LLM_BACKEND,
+) -> LLMPool | None:
+    """
+    Build the pool of backends a job dispatches its generations to.
+
+    In "server" mode every slot is the shared ServerLLM. In "local" mode the
+    pool holds ``size`` registry replicas of the model; they split the CPU
+    threads between them so concurrent replicas do not oversubscribe the
+    host. With memory-mapped weights the replicas share the model pages and
+    only duplicate their KV caches.
+
+    Returns:
+        LLMPool, or None if the model could not be loaded
+    """
+    size = max(1, size)
+    if backend == "server":
+        return LLMPool([get_server_llm()] * size)
+
+    if size == 1:
+        llm = get_llm_instance(model_path)
+        return LLMPool([llm]) if llm else None
+
+    llms = []
+    threads = max(1, (os.cpu_count() or size) // size)
+    for replica in range(size):
+        llm = get_llm_instance(model_path, replica=replica, n_threads=threads)
+        if llm is None:
+            break
+        llms.append(llm)
+    if len(llms) < size:
+        logger.warning(f"Loaded {len(llms)} of {size} model replicas")
+    return LLMPool(llms) if llms else None
@@ -2,21 +2,156 @@
 Local LLM service using llama.cpp for inference.
 """
 
-import os
 import logging
-from typing import Optional, Dict, Any
+import os
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from .autotune import tuned_params
+from .batch_decoder import LLM_BATCH_MAX_SEQUENCES, LlamaBatchEngine, decode_batch
+from .context_packer import (
+    CONTEXT_SAFETY_MARGIN,
+    Snippet,
+    context_budget,
+    pack_snippets,
+)
+from .gguf_inspector import kv_cache_bytes, model_context_length
+from .inference_scheduler import InferenceScheduler
+from .model_registry import ModelRegistry
+from .overview_grammar import LLM_OVERVIEW_GRAMMAR, build_overview_grammar
+from .prefix_cache import PrefixCache
+from .response_cache import get_response_cache, is_deterministic, model_identity
+from .speculative import LLM_DRAFT_MODEL_PATH, LLM_SPECULATIVE, build_drafter
+from .stream_validators import (
+    LLM_STREAM_VALIDATION,
+    GenerationAborted,
+    Validator,
+    overview_validators,
+)
 
 logger = logging.getLogger(__name__)
 
 # Lazy import to avoid startup errors if llama-cpp-python not installed
 try:
-    from llama_cpp import Llama
+    from llama_cpp import Llama, LlamaGrammar
 
     LLAMA_CPP_AVAILABLE = True
 except ImportError:
     logger.warning("llama-cpp-python not installed. Local LLM features disabled.")
     LLAMA_CPP_AVAILABLE = False
     Llama = None
+    LlamaGrammar = None
+
+# Context window requested when loading a model. Analysis prompts are packed
+# to fill whatever window the loaded model actually has.
+LLM_CONTEXT_SIZE = int(os.getenv("LLM_CONTEXT_SIZE", "4096"))
+
+# Marks where packed context goes inside a prompt template
+CONTEXT_SLOT = "{context}"
+
+# Fixed sampling seed used by analysis and chat call sites. A fixed seed makes
+# generations reproducible, which is what lets the response cache serve them.
+LLM_SEED = int(os.getenv("LLM_SEED", "42"))
+
+# Number of static-prefix state snapshots kept per loaded model (0 disables)
+LLM_PREFIX_CACHE_SIZE = int(os.getenv("LLM_PREFIX_CACHE_SIZE", "8"))
+
+# Static instruction blocks placed ahead of the variable part of each prompt.
+# Keeping them byte-identical across calls lets LocalLLM restore their
+# evaluated llama state from the prefix cache instead of re-evaluating them.
+REPOSITORY_BRIEF_PREFIX = """You are a senior developer advocate tasked with generating a high-signal repository brief for engineers preparing to debug or extend the codebase. Use disciplined chain-of-thought reasoning before responding.
+
+THINKING STAGES (do NOT skip):
+1. Inventory: enumerate project type, entry points, notable directories, data stores, deployment targets.
+2. Architecture reasoning: map tiers/modules, describe data/control flow, note coupling boundaries.
+3. Technology evaluation: identify languages, frameworks, key dependencies, and why they are used.
+4. Risk scan: highlight operational risks, debt, or debugging hotspots backed by evidence from context.
+5. Recommendation shaping: derive next-step guidance for developers.
+
+OUTPUT FORMAT (markdown, keep sections in this order):
+
+**Project Snapshot**
+- Purpose:
+- Primary technologies: (use the detected languages below)
+- Entry points:
+
+**Architecture Map**
+- Structure:
+- Key modules & responsibilities:
+- Data / control flow:
+
+**Component Deep Dive**
+1. Component name – responsibility, important files, dependencies
+2. Component name – responsibility, important files, dependencies
+3. Component name – responsibility, important files, dependencies
+
+**Technology Stack**
+- Frameworks & libraries:
+- Tooling / build pipeline:
+- External integrations:
+
+**Operational Considerations**
+- Performance or scalability notes:
+- Security / compliance notes:
+- Testing & observability state:
+
+**Recommended Next Actions**
+1. Action item with rationale
+2. Action item with rationale
+3. Action item with rationale
+
+"""
+
+REPOSITORY_SKETCH_PREFIX = """You are a repository analyst. Analyze the codebase described below step-by-step.
+
+Think through this systematically:
+
+STEP 1: What type of project is this based on the file names and structure?
+STEP 2: What frameworks or technologies can you identify from the files?
+STEP 3: How is the code organized (directories, naming patterns)?
+STEP 4: What is the likely purpose of this application?
+
+Then provide your analysis:
+1. Project Type: (web app, API, library, etc.)
+2. Architecture: How the code is structured
+3. Key Technologies: Frameworks and tools used
+4. Purpose: What problem this solves
+5. Organization: How files and modules are arranged
+
+"""
+
+VULNERABILITY_ANALYSIS_PREFIX = """You are a security expert analyzing code for vulnerabilities.
+
+SECURITY ANALYSIS TASK:
+Perform a thorough security assessment and identify potential vulnerabilities in the codebase below.
+
+Analyze for:
+- Authentication/Authorization issues
+- Input validation concerns
+- Data exposure risks
+- Dependency vulnerabilities
+- Code injection risks (SQL, XSS, Command injection)
+- Insecure configurations
+- Missing security headers
+- Sensitive data handling
+- Cryptographic weaknesses
+- API security issues
+
+For EACH identified vulnerability, provide:
+- Severity: CRITICAL / HIGH / MEDIUM / LOW
+- Issue: Specific vulnerability name
+- Description: What the problem is
+- Location: Where it appears (file/component name)
+- Impact: Potential security impact
+- Recommendation: How to fix it
+
+If NO vulnerabilities found, state: "No immediate security concerns identified in this analysis."
+
+IMPORTANT: Be specific and technical. Focus on actual security risks, not general code quality.
+
+"""
 
 
 class LocalLLM:
@@ -24,14 +159,35 @@ class LocalLLM:
     Wrapper for local LLM inference using llama.cpp.
     """
 
-    def __init__(self, model_path: str, n_ctx: int = 2048, n_threads: int = 4):
+    def __init__(
+        self,
+        model_path: str,
+        n_ctx: int = LLM_CONTEXT_SIZE,
+        n_threads: int = 4,
+        n_batch: int = 512,
+        n_gpu_layers: int = 0,
+        use_mmap: bool = True,
+        use_mlock: bool = False,
+        speculative: bool = LLM_SPECULATIVE,
+        draft_model_path: str | None = LLM_DRAFT_MODEL_PATH,
+    ):
         """
         Initialize the local LLM.
 
+        Runtime parameters default to conservative values; get_llm_instance
+        passes the ones measured by the on-host autotuner instead.
+
         Args:
             model_path: Path to the GGUF model file
-            n_ctx: Context window size (default: 2048 tokens)
+            n_ctx: Context window size (default: LLM_CONTEXT_SIZE tokens)
             n_threads: Number of CPU threads to use
+            n_batch: Prompt tokens evaluated per batch
+            n_gpu_layers: Layers offloaded to the GPU (0 = CPU only, -1 = all)
+            use_mmap: Memory-map the model file instead of reading it
+            use_mlock: Lock the model in RAM so it is never paged out
+            speculative: Load with speculative decoding support, which calls
+                can then enable per call (see services.speculative)
+            draft_model_path: Small GGUF drafter (default: prompt lookup)
         """
         if not LLAMA_CPP_AVAILABLE:
             raise ImportError(
@@ -43,16 +199,35 @@ class LocalLLM:
 
         logger.info(f"Loading model from {model_path}...")
         self.model_path = model_path
+        # llama.cpp contexts are not thread-safe; instances are shared via the
+        # model registry so inference calls take the instance's single slot,
+        # handed out by priority class (see services.inference_scheduler).
+        self.scheduler = InferenceScheduler(capacity=1)
+        self.prefix_cache = PrefixCache(max_entries=LLM_PREFIX_CACHE_SIZE)
+        self.model_identity: str | None = None
+        # Multi-sequence context for generate_batch, created on first use
+        # (False once it turned out to be unavailable)
+        self._batch_engine: Any = None
+        self.drafter = None
 
         try:
             self.llm = Llama(
                 model_path=model_path,
                 n_ctx=n_ctx,
                 n_threads=n_threads,
-                n_gpu_layers=0,  # Use CPU only for now
+                n_batch=n_batch,
+                n_gpu_layers=n_gpu_layers,
+                use_mmap=use_mmap,
+                use_mlock=use_mlock,
+                # Draft verification needs the logits of every position
+                logits_all=speculative,
                 verbose=False,
             )
             logger.info(f"Model loaded successfully: {model_path}")
+            if speculative:
+                self.drafter = build_drafter(
+                    draft_model_path, n_ctx=n_ctx, n_threads=n_threads
+                )
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
@@ -63,7 +238,14 @@ class LocalLLM:
         max_tokens: int = 512,
         temperature: float = 0.7,
         top_p: float = 0.9,
-        stop: Optional[list] = None,
+        stop: list | None = None,
+        prefix: str | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        grammar: str | None = None,
+        validators: Sequence[Validator] | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
     ) -> str:
         """
         Generate text from the model.
@@ -74,28 +256,509 @@ class LocalLLM:
             temperature: Sampling temperature (0.0-1.0)
             top_p: Nucleus sampling parameter
             stop: Stop sequences
+            prefix: Static text placed before ``prompt`` whose evaluated
+                state is cached and restored across calls
+            seed: Fixed sampling seed (makes the output reproducible)
+            cache: Consult the persistent response cache. Defaults to True
+                for deterministic settings (temperature 0 or a fixed seed).
+            grammar: GBNF grammar the output must match (constrained decoding)
+            validators: Streaming validators checked after every decoded
+                chunk; generation stops as soon as one rejects the output
+            speculative: Draft and verify several tokens per pass when the
+                model was loaded with speculative support
+            priority: Scheduling class of the call (chat, overview or
+                descriptions); higher classes get the model first
 
         Returns:
             Generated text string
+
+        Raises:
+            GenerationAborted: A validator rejected the partial output
         """
-        try:
-            response = self.llm(
+        if validators:
+            return self._generate_validated(
+                validators,
                 prompt,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
-                stop=stop or [],
-                echo=False,
+                stop=stop,
+                prefix=prefix,
+                seed=seed,
+                cache=cache,
+                grammar=grammar,
+                speculative=speculative,
+                priority=priority,
             )
 
-            return response["choices"][0]["text"].strip()
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        cache_key = self._response_cache_key(
+            (prefix or "") + prompt,
+            {**sampling, "grammar": grammar} if grammar else sampling,
+            cache,
+        )
+        if cache_key:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                return cached
+
+        try:
+            with self.scheduler.slot(priority):
+                prompt = self._prepare_prompt(prompt, prefix)
+                if grammar:
+                    sampling["grammar"] = LlamaGrammar.from_string(
+                        grammar, verbose=False
+                    )
+                with self._speculation(speculative) as drafter:
+                    response = self.llm(prompt, echo=False, **sampling)
+                    if drafter:
+                        drafter.finish(response["usage"]["completion_tokens"])
+
+            text = response["choices"][0]["text"].strip()
+            if cache_key:
+                get_response_cache().put(cache_key, text)
+            return text
 
         except Exception as e:
             logger.error(f"Generation failed: {e}")
             raise
 
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        prefix: str | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        grammar: str | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
+    ) -> Iterator[str]:
+        """
+        Generate text from the model, yielding chunks as they are decoded.
+
+        The model slot is held until the iterator is exhausted or closed;
+        closing it early (e.g. on client disconnect) stops generation. A
+        response cache hit is yielded as a single chunk.
+
+        Args:
+            prompt: Input prompt text
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0.0-1.0)
+            top_p: Nucleus sampling parameter
+            stop: Stop sequences
+            prefix: Static prompt prefix (see ``generate``)
+            seed: Fixed sampling seed (see ``generate``)
+            cache: Consult the response cache (see ``generate``)
+            grammar: GBNF grammar the output must match (see ``generate``)
+            speculative: Use speculative decoding (see ``generate``)
+            priority: Scheduling class (see ``generate``)
+
+        Yields:
+            Generated text chunks (roughly one token each)
+        """
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        cache_key = self._response_cache_key(
+            (prefix or "") + prompt,
+            {**sampling, "grammar": grammar} if grammar else sampling,
+            cache,
+        )
+        if cache_key:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        with self.scheduler.slot(priority):
+            prompt = self._prepare_prompt(prompt, prefix)
+            if grammar:
+                sampling["grammar"] = LlamaGrammar.from_string(grammar, verbose=False)
+            with self._speculation(speculative) as drafter:
+                stream = self.llm(prompt, echo=False, stream=True, **sampling)
+                generated = 0
+                try:
+                    for chunk in stream:
+                        generated += 1
+                        text = chunk["choices"][0]["text"]
+                        if text:
+                            chunks.append(text)
+                            yield text
+                finally:
+                    stream.close()
+                    if drafter:
+                        drafter.finish(generated)
+
+        # Only reached when the stream ran to completion (not on close)
+        if cache_key:
+            get_response_cache().put(cache_key, "".join(chunks).strip())
+
+    def _generate_validated(
+        self, validators: Sequence[Validator], prompt: str, **kwargs: Any
+    ) -> str:
+        """
+        Stream a generation through ``validators``, aborting on rejection.
+
+        Closing the stream stops decoding, so a rejected generation costs
+        only the tokens decoded up to the point it went wrong. Only complete
+        generations reach the response cache.
+        """
+        text = ""
+        tokens = 0
+        stream = self.generate_stream(prompt, **kwargs)
+        try:
+            for chunk in stream:
+                text += chunk
+                tokens += 1
+                for validator in validators:
+                    reason = validator(text, tokens)
+                    if reason:
+                        logger.warning(
+                            f"Generation aborted after {tokens} tokens: {reason}"
+                        )
+                        raise GenerationAborted(reason, text, tokens)
+        finally:
+            stream.close()
+        return text.strip()
+
+    def generate_batch(
+        self,
+        prompts: list[str],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        prefix: str | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        speculative: bool = False,
+        priority: str = "descriptions",
+    ) -> list[str]:
+        """
+        Generate completions for several prompts as parallel sequences.
+
+        Prompts are decoded together in llama.cpp batches (see
+        services.batch_decoder), so many short generations finish in about
+        the time of the longest one. A shared ``prefix`` is evaluated once
+        for all of them. Prompts too long for a batch sequence, or all of
+        them when batched decoding is unavailable, are generated one by one.
+        The model slot is released after every batch or prompt, so
+        higher-priority calls get in between.
+
+        Args:
+            prompts: Input prompt texts
+            max_tokens: Maximum tokens to generate per prompt
+            temperature: Sampling temperature (0.0-1.0)
+            top_p: Nucleus sampling parameter
+            stop: Stop sequences, applied to each prompt separately
+            prefix: Static text placed before every prompt
+            seed: Fixed sampling seed (see ``generate``)
+            cache: Consult the response cache (see ``generate``)
+            speculative: Use speculative decoding for prompts generated one
+                by one (batched sequences already share each pass)
+            priority: Scheduling class (see ``generate``)
+
+        Returns:
+            Generated text per prompt, in input order
+        """
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        # Greedy output is the same either way, but batched sequences draw
+        # from their own random streams, so sampled results are kept apart
+        # from those of generate()
+        key_sampling = {**sampling, "decoder": "batch"} if temperature > 0 else sampling
+        results: list[str | None] = [None] * len(prompts)
+        keys = [
+            self._response_cache_key((prefix or "") + prompt, key_sampling, cache)
+            for prompt in prompts
+        ]
+        for i, key in enumerate(keys):
+            if key:
+                results[i] = get_response_cache().get(key)
+        todo = [i for i, result in enumerate(results) if result is None]
+
+        with self.scheduler.slot(priority):
+            engine = self._get_batch_engine() if len(todo) > 1 else None
+            prefix_tokens = (
+                self.llm.tokenize(prefix.encode("utf-8")) if engine and prefix else []
+            )
+            sequential = list(todo)
+            batched = []
+            if engine:
+                sequential = []
+                for i in todo:
+                    tokens = self.llm.tokenize(
+                        prompts[i].encode("utf-8"), add_bos=not prefix_tokens
+                    )
+                    if len(prefix_tokens) + len(tokens) + max_tokens <= engine.seq_ctx:
+                        batched.append((i, tokens))
+                    else:
+                        sequential.append(i)
+
+        group_size = engine.n_seq_max if engine else 1
+        for start in range(0, len(batched), group_size):
+            group = batched[start : start + group_size]
+            try:
+                with self.scheduler.slot(priority):
+                    texts = decode_batch(
+                        engine,
+                        [tokens for _, tokens in group],
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        stop=stop,
+                        seed=seed,
+                        prefix=prefix_tokens,
+                    )
+            except (RuntimeError, ValueError) as e:
+                logger.warning(f"Batched decoding failed, falling back: {e}")
+                sequential.extend(i for i, _ in group)
+                continue
+            for (i, _), text in zip(group, texts):
+                results[i] = text.strip()
+
+        for i in sorted(sequential):
+            with self.scheduler.slot(priority):
+                prompt = self._prepare_prompt(prompts[i], prefix)
+                with self._speculation(speculative) as drafter:
+                    response = self.llm(prompt, echo=False, **sampling)
+                    if drafter:
+                        drafter.finish(response["usage"]["completion_tokens"])
+            results[i] = response["choices"][0]["text"].strip()
+
+        for i in todo:
+            if keys[i]:
+                get_response_cache().put(keys[i], results[i])
+        return results
+
+    def _get_batch_engine(self) -> LlamaBatchEngine | None:
+        """Multi-sequence context for generate_batch. Model slot held."""
+        if self._batch_engine is None:
+            if LLM_BATCH_MAX_SEQUENCES <= 1:
+                self._batch_engine = False
+            else:
+                try:
+                    self._batch_engine = LlamaBatchEngine(self.llm)
+                except (RuntimeError, ValueError, AttributeError) as e:
+                    logger.warning(f"Batched decoding unavailable: {e}")
+                    self._batch_engine = False
+        return self._batch_engine or None
+
+    @contextmanager
+    def _speculation(self, speculative: bool) -> Iterator[Any | None]:
+        """
+        Attach the drafter to the llama.cpp model for one call when requested
+        and supported; yields the call's DraftCall (or None). Model slot held.
+        """
+        drafter = self.drafter if speculative else None
+        if drafter is None:
+            yield None
+            return
+        call = drafter.start()
+        self.llm.draft_model = call
+        try:
+            yield call
+        finally:
+            self.llm.draft_model = None
+
+    def generate_with_state(
+        self,
+        prompt: str,
+        state: Any | None = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop: list | None = None,
+        seed: int | None = None,
+        cache: bool | None = None,
+        speculative: bool = False,
+        priority: str = "overview",
+    ) -> tuple[str, Any]:
+        """
+        Generate from a previously saved llama state and snapshot the result.
+
+        Restoring ``state`` first lets llama.cpp skip every prompt token that
+        was already evaluated in an earlier turn, so a conversation only pays
+        for the new text.
+
+        Args:
+            prompt: Full prompt (earlier turns followed by the new text)
+            state: State returned by a previous call, or None to start fresh
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0.0-1.0)
+            top_p: Nucleus sampling parameter
+            stop: Stop sequences
+            seed: Fixed sampling seed (see ``generate``)
+            cache: Consult the response cache (see ``generate``)
+            speculative: Use speculative decoding (see ``generate``)
+            priority: Scheduling class (see ``generate``)
+
+        Returns:
+            Tuple of (raw generated text, state after generation). The state
+            is None when the answer came from the response cache, in which
+            case the caller's previous state remains a valid prefix.
+        """
+        sampling = self._sampling_params(max_tokens, temperature, top_p, stop, seed)
+        cache_key = self._response_cache_key(prompt, sampling, cache)
+        if cache_key:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                return cached, None
+
+        with self.scheduler.slot(priority):
+            if state is not None:
+                try:
+                    self.llm.load_state(state)
+                except (RuntimeError, ValueError, TypeError) as e:
+                    logger.warning(f"Could not restore saved state: {e}")
+                    self.llm.reset()
+            with self._speculation(speculative) as drafter:
+                response = self.llm(prompt, echo=False, **sampling)
+                if drafter:
+                    drafter.finish(response["usage"]["completion_tokens"])
+            text = response["choices"][0]["text"]
+            new_state = self.llm.save_state()
+
+        if cache_key:
+            get_response_cache().put(cache_key, text)
+        return text, new_state
+
+    @staticmethod
+    def _sampling_params(
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: list | None,
+        seed: int | None,
+    ) -> dict[str, Any]:
+        """Keyword arguments for a llama.cpp completion call."""
+        params = {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "stop": stop or [],
+        }
+        if seed is not None:
+            params["seed"] = seed
+        return params
+
+    def _response_cache_key(
+        self, prompt: str, sampling: dict[str, Any], cache: bool | None
+    ) -> str | None:
+        """Response cache key for a call, or None if it should not be cached."""
+        if cache is None:
+            cache = is_deterministic(sampling["temperature"], sampling.get("seed"))
+        if not cache:
+            return None
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return None
+        if self.model_identity is None:
+            self.model_identity = model_identity(self.model_path)
+        return response_cache.make_key(self.model_identity, prompt, sampling)
+
+    @property
+    def n_ctx(self) -> int:
+        """Context window size of the loaded model."""
+        return self.llm.n_ctx()
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens ``text`` occupies with this model's tokenizer."""
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def count_tokens_many(self, texts: list[str]) -> list[int]:
+        """
+        Token counts of several texts. Backends whose tokenizer is remote
+        answer these in one round trip; locally it is a plain loop.
+        """
+        return [self.count_tokens(text) for text in texts]
+
+    def fit_context(
+        self,
+        template: str,
+        context: str | Sequence[Snippet],
+        max_tokens: int,
+        prefix: str = "",
+    ) -> tuple[str, int]:
+        """
+        Pack ``context`` into ``template`` so prompt and output fit n_ctx.
+
+        Args:
+            template: Prompt with CONTEXT_SLOT where the context goes
+            context: Plain text or prioritized snippets
+            max_tokens: Requested output tokens
+            prefix: Static prefix sent ahead of the prompt
+
+        Returns:
+            Tuple of (prompt, max_tokens). The output reservation is capped
+            at half of the space left after the template, so a small window
+            still leaves room for context.
+        """
+        snippets = [Snippet(context)] if isinstance(context, str) else context
+        template_tokens = self.count_tokens(prefix + template.replace(CONTEXT_SLOT, ""))
+        available = self.n_ctx - template_tokens - CONTEXT_SAFETY_MARGIN
+        max_tokens = max(1, min(max_tokens, available // 2))
+
+        packed = pack_snippets(
+            snippets,
+            context_budget(self.n_ctx, template_tokens, max_tokens),
+            self.count_tokens,
+            count_tokens_many=self.count_tokens_many,
+        )
+        logger.info(
+            f"Packed {packed.included}/{len(snippets)} context snippets "
+            f"({packed.truncated} truncated) into {packed.tokens}/{packed.budget} "
+            f"tokens, reserving {max_tokens} for output"
+        )
+        return template.replace(CONTEXT_SLOT, packed.text), max_tokens
+
+    def _prepare_prompt(self, prompt: str, prefix: str | None) -> str:
+        """
+        Position the KV cache after ``prefix`` and return the full prompt.
+
+        On a cache hit the saved state is restored, so llama.cpp matches the
+        prefix tokens already in its KV cache and only evaluates the suffix.
+        On a miss the prefix is evaluated once and snapshotted. Must be
+        called with the instance lock held.
+        """
+        if not prefix:
+            return prompt
+
+        full_prompt = prefix + prompt
+        if self.prefix_cache.max_entries <= 0:
+            return full_prompt
+
+        try:
+            entry = self.prefix_cache.get(prefix)
+            if entry is None:
+                tokens = self.llm.tokenize(prefix.encode("utf-8"))
+                self.llm.reset()
+                start = time.perf_counter()
+                self.llm.eval(tokens)
+                eval_seconds = time.perf_counter() - start
+                self.prefix_cache.put(
+                    prefix, self.llm.save_state(), tokens, eval_seconds
+                )
+            else:
+                self.llm.load_state(entry.state)
+                self.prefix_cache.record_reuse(
+                    entry, self.llm.tokenize(full_prompt.encode("utf-8"))
+                )
+        except (RuntimeError, ValueError) as e:
+            # The cache is an optimization; fall back to a full evaluation
+            logger.warning(f"Prefix cache unavailable, evaluating full prompt: {e}")
+            self.llm.reset()
+
+        return full_prompt
+
     def analyze_code(
-        self, code_snippet: str, context: str = "", language: str = "unknown"
+        self,
+        code_snippet: str,
+        context: str = "",
+        language: str = "unknown",
+        seed: int | None = None,
     ) -> str:
         """
         Analyze a code snippet with language-specific insights.
@@ -104,6 +767,7 @@ class LocalLLM:
             code_snippet: The code to analyze
             context: Additional context (file path, purpose, etc.)
             language: Programming language (for specialized analysis)
+            seed: Fixed sampling seed (makes the result cacheable)
 
         Returns:
             Analysis text
@@ -131,15 +795,9 @@ class LocalLLM:
             "Analyze language-specific patterns, common frameworks, and best practices for this programming language.",
         )
 
-        prompt = f"""You are a code analysis expert specializing in {language.upper()} development. Analyze the following code with deep understanding of {language} idioms and best practices.
-
-Context: {context if context else "General code analysis"}
-Language: {language.upper()}
-
-Code:
-```{language}
-{code_snippet}
-```
+        # Static instructions come first so their evaluated state can be
+        # reused across calls for the same language (see _prepare_prompt).
+        prefix = f"""You are a code analysis expert specializing in {language.upper()} development. Analyze the code below with deep understanding of {language} idioms and best practices.
 
 LANGUAGE-SPECIFIC ANALYSIS FOCUS:
 {specific_instructions}
@@ -152,154 +810,134 @@ Provide a detailed analysis covering:
 5. Potential Issues: Security concerns, performance issues, or improvements
 6. Best Practices: Adherence to {language} conventions and standards
 
+"""
+        prompt = f"""Context: {context if context else "General code analysis"}
+Language: {language.upper()}
+
+Code:
+```{language}
+{code_snippet}
+```
+
 Analysis:"""
 
-        return self.generate(prompt, max_tokens=500, temperature=0.3)
+        return self.generate(
+            prompt, max_tokens=500, temperature=0.3, prefix=prefix, seed=seed
+        )
 
     def explain_repository(
-        self, repo_structure: Dict[str, Any], context: str = ""
+        self,
+        repo_structure: dict[str, Any],
+        context: str | Sequence[Snippet] = "",
+        seed: int | None = None,
+        constrained: bool = LLM_OVERVIEW_GRAMMAR,
+        validate: bool = LLM_STREAM_VALIDATION,
     ) -> str:
         """
         Generate comprehensive repository explanation using Chain-of-Thought reasoning.
 
         Args:
             repo_structure: Dictionary with repository information
-            context: Additional detailed context about files and content
+            context: Additional detailed context about files and content, as
+                text or prioritized snippets packed to fit the context window
+            seed: Fixed sampling seed (makes the result cacheable)
+            constrained: Decode the brief under the overview grammar, which
+                enforces the required sections and per-section length caps
+            validate: Check the brief while it streams and stop as soon as
+                it is clearly unusable (placeholders, loops, a section far
+                over its budget)
 
         Returns:
             Repository explanation
+
+        Raises:
+            GenerationAborted: ``validate`` rejected the brief mid-generation
         """
         if context:
-            detected_languages = self._detect_languages_from_context(context)
+            context_text = (
+                context
+                if isinstance(context, str)
+                else "\n".join(snippet.text for snippet in context)
+            )
+            detected_languages = self._detect_languages_from_context(context_text)
             lang_summary = (
                 ", ".join(detected_languages)
                 if detected_languages
                 else "Multiple languages"
             )
 
-            prompt = f"""You are a senior developer advocate tasked with generating a high-signal repository brief for engineers preparing to debug or extend the codebase. Use disciplined chain-of-thought reasoning before responding.
+            prefix = REPOSITORY_BRIEF_PREFIX
+            prompt = f"""Detected languages: {lang_summary}
 
 <REPOSITORY_CONTEXT>
-{context}
+{CONTEXT_SLOT}
 </REPOSITORY_CONTEXT>
 
-THINKING STAGES (do NOT skip):
-1. Inventory: enumerate project type, entry points, notable directories, data stores, deployment targets.
-2. Architecture reasoning: map tiers/modules, describe data/control flow, note coupling boundaries.
-3. Technology evaluation: identify languages, frameworks, key dependencies, and why they are used.
-4. Risk scan: highlight operational risks, debt, or debugging hotspots backed by evidence from context.
-5. Recommendation shaping: derive next-step guidance for developers.
-
-OUTPUT FORMAT (markdown, keep sections in this order):
-
-**Project Snapshot**
-- Purpose:
-- Primary technologies: {lang_summary}
-- Entry points:
-
-**Architecture Map**
-- Structure:
-- Key modules & responsibilities:
-- Data / control flow:
-
-**Component Deep Dive**
-1. Component name – responsibility, important files, dependencies
-2. Component name – responsibility, important files, dependencies
-3. Component name – responsibility, important files, dependencies
-
-**Technology Stack**
-- Frameworks & libraries:
-- Tooling / build pipeline:
-- External integrations:
-
-**Operational Considerations**
-- Performance or scalability notes:
-- Security / compliance notes:
-- Testing & observability state:
-
-**Recommended Next Actions**
-1. Action item with rationale
-2. Action item with rationale
-3. Action item with rationale
+Respond with concise, information-dense sentences so engineers can act immediately.
 
-Respond with concise, information-dense sentences so engineers can act immediately."""
-            max_tokens = 1500
+"""
+            prompt, max_tokens = self.fit_context(
+                prompt, context, max_tokens=1500, prefix=prefix
+            )
+            if constrained or validate:
+                return self.generate(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=0.5,
+                    prefix=prefix,
+                    seed=seed,
+                    grammar=build_overview_grammar(max_tokens) if constrained else None,
+                    validators=overview_validators(max_tokens) if validate else None,
+                )
         else:
             # Fallback with simpler CoT for limited context
             files_list = "\n".join(repo_structure.get("files", [])[:20])
 
-            prompt = f"""You are a repository analyst. Analyze this codebase step-by-step.
-
-Repository: {repo_structure.get("name", "Unknown")}
+            prefix = REPOSITORY_SKETCH_PREFIX
+            prompt = f"""Repository: {repo_structure.get("name", "Unknown")}
 Files (sample):
 {files_list}
 
 Main languages: {", ".join(repo_structure.get("languages", ["Unknown"]))}
 
-Think through this systematically:
-
-STEP 1: What type of project is this based on the file names and structure?
-STEP 2: What frameworks or technologies can you identify from the files?
-STEP 3: How is the code organized (directories, naming patterns)?
-STEP 4: What is the likely purpose of this application?
-
-Now provide your analysis:
-1. Project Type: (web app, API, library, etc.)
-2. Architecture: How the code is structured
-3. Key Technologies: Frameworks and tools used
-4. Purpose: What problem this solves
-5. Organization: How files and modules are arranged
-
 Analysis:"""
             max_tokens = 400
 
-        return self.generate(prompt, max_tokens=max_tokens, temperature=0.5)
+        return self.generate(
+            prompt, max_tokens=max_tokens, temperature=0.5, prefix=prefix, seed=seed
+        )
 
-    def analyze_vulnerability(self, context: str) -> str:
+    def analyze_vulnerability(
+        self, context: str | Sequence[Snippet], seed: int | None = None
+    ) -> str:
         """
         Generate vulnerability analysis for a repository.
 
         Args:
-            context: Repository context or component information
+            context: Repository context or component information, as text or
+                prioritized snippets packed to fit the context window
+            seed: Fixed sampling seed (makes the result cacheable)
 
         Returns:
             Vulnerability analysis text
         """
-        prompt = f"""You are a security expert analyzing code for vulnerabilities.
-
-CODEBASE CONTEXT:
-{context}
-
-SECURITY ANALYSIS TASK:
-Perform a thorough security assessment and identify potential vulnerabilities in this codebase.
-
-Analyze for:
-- Authentication/Authorization issues
-- Input validation concerns
-- Data exposure risks
-- Dependency vulnerabilities
-- Code injection risks (SQL, XSS, Command injection)
-- Insecure configurations
-- Missing security headers
-- Sensitive data handling
-- Cryptographic weaknesses
-- API security issues
-
-For EACH identified vulnerability, provide:
-- Severity: CRITICAL / HIGH / MEDIUM / LOW
-- Issue: Specific vulnerability name
-- Description: What the problem is
-- Location: Where it appears (file/component name)
-- Impact: Potential security impact
-- Recommendation: How to fix it
-
-If NO vulnerabilities found, state: "No immediate security concerns identified in this analysis."
-
-IMPORTANT: Be specific and technical. Focus on actual security risks, not general code quality.
-
-Security Analysis:"""
+        prompt, max_tokens = self.fit_context(
+            f"""CODEBASE CONTEXT:
+{CONTEXT_SLOT}
+
+Security Analysis:""",
+            context,
+            max_tokens=600,
+            prefix=VULNERABILITY_ANALYSIS_PREFIX,
+        )
 
-        return self.generate(prompt, max_tokens=600, temperature=0.5)
+        return self.generate(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=0.5,
+            prefix=VULNERABILITY_ANALYSIS_PREFIX,
+            seed=seed,
+        )
 
     def _detect_languages_from_context(self, context: str) -> list:
         """
@@ -353,17 +991,41 @@ Security Analysis:"""
         return detected[:5]  # Return top 5 detected languages
 
 
-def get_llm_instance(model_path: Optional[str] = None) -> Optional[LocalLLM]:
+# Memory budget for models kept resident by the registry (0 = unbounded)
+LLM_REGISTRY_MAX_MB = int(os.getenv("LLM_REGISTRY_MAX_MB", "6144"))
+
+_model_registry = ModelRegistry(
+    loader=LocalLLM,
+    max_bytes=LLM_REGISTRY_MAX_MB * 1024 * 1024 if LLM_REGISTRY_MAX_MB > 0 else None,
+    context_size_of=lambda path, llm: kv_cache_bytes(path, llm.n_ctx),
+)
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide registry of loaded models."""
+    return _model_registry
+
+
+def get_llm_instance(
+    model_path: str | None = None, replica: int = 0, **load_params: Any
+) -> LocalLLM | None:
     """
-    Get or create LLM instance.
+    Get the shared LLM instance for a model, loading it on first use.
 
     Args:
         model_path: Path to model file (uses env var if not provided)
+        replica: Index of an independent copy of the model (see LLMPool)
+        **load_params: LocalLLM parameters overriding the tuned ones
+            (applied by the daemon's own tuning in daemon mode)
 
     Returns:
-        LocalLLM instance or None if unavailable
+        LocalLLM instance (a RemoteLLM proxy when LLM_DAEMON_SOCKET is set)
+        or None if unavailable
     """
-    if not LLAMA_CPP_AVAILABLE:
+    from .model_daemon import daemon_client_enabled, get_remote_llm
+
+    use_daemon = daemon_client_enabled()
+    if not LLAMA_CPP_AVAILABLE and not use_daemon:
         logger.warning("llama-cpp-python not available")
         return None
 
@@ -395,8 +1057,18 @@ def get_llm_instance(model_path: Optional[str] = None) -> Optional[LocalLLM]:
                 logger.info(f"Resolved model path: {resolved_path}")
                 break
 
+    if use_daemon:
+        # The daemon holds the model; this process only needs a proxy
+        return get_remote_llm(os.path.abspath(resolved_path), replica)
+
     try:
-        return LocalLLM(resolved_path)
+        # Parameters measured by the autotuner for this host, if any
+        params = {**tuned_params(resolved_path), **load_params}
+        # A window beyond the trained context length only degrades output
+        trained_ctx = model_context_length(resolved_path)
+        if trained_ctx and params.get("n_ctx", LLM_CONTEXT_SIZE) > trained_ctx:
+            params["n_ctx"] = trained_ctx
+        return _model_registry.get(resolved_path, replica=replica, **params)
     except Exception as e:
         logger.error(f"Failed to initialize LLM: {e}")
         return None
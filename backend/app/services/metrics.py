@@ -0,0 +1,132 @@
+"""
+In-process inference metrics (time-to-first-token, throughput, counters).
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any
+
+# Number of recent generations kept per endpoint for percentile estimates
+METRICS_WINDOW = 200
+
+
+def _percentile(values, pct: float) -> float | None:
+    """Nearest-rank percentile of a small sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class GenerationTimer:
+    """
+    Measures a single streamed generation.
+
+    Call ``token()`` for every chunk produced and ``finish()`` once the
+    stream ends; the timer reports itself to the metrics recorder.
+    """
+
+    def __init__(self, recorder: "InferenceMetrics", endpoint: str):
+        self._recorder = recorder
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.first_token_at: float | None = None
+        self.tokens = 0
+        self.finished = False
+
+    def token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def summary(self) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        ttft = (
+            self.first_token_at - self.started
+            if self.first_token_at is not None
+            else None
+        )
+        decode_seconds = elapsed - ttft if ttft is not None else 0.0
+        return {
+            "time_to_first_token": ttft,
+            "tokens": self.tokens,
+            "total_seconds": elapsed,
+            "tokens_per_second": (
+                (self.tokens - 1) / decode_seconds
+                if self.tokens > 1 and decode_seconds > 0
+                else None
+            ),
+        }
+
+    def finish(self, cancelled: bool = False) -> dict[str, Any]:
+        summary = self.summary()
+        if not self.finished:
+            self.finished = True
+            self._recorder.record_generation(self.endpoint, summary, cancelled)
+        return summary
+
+
+class InferenceMetrics:
+    """Thread-safe rolling metrics keyed by endpoint or task name."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters: dict[str, dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self._ttft: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=self._window)
+        )
+        self._tps: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=self._window)
+        )
+
+    def timer(self, endpoint: str) -> GenerationTimer:
+        """Start timing a generation for ``endpoint``."""
+        return GenerationTimer(self, endpoint)
+
+    def record_generation(
+        self, endpoint: str, summary: dict[str, Any], cancelled: bool = False
+    ) -> None:
+        with self._lock:
+            counters = self._counters[endpoint]
+            counters["generations"] += 1
+            counters["tokens"] += summary["tokens"]
+            if cancelled:
+                counters["cancelled"] += 1
+            if summary["time_to_first_token"] is not None:
+                self._ttft[endpoint].append(summary["time_to_first_token"])
+            if summary["tokens_per_second"] is not None:
+                self._tps[endpoint].append(summary["tokens_per_second"])
+
+    def increment(self, name: str, counter: str, amount: float = 1) -> None:
+        """Bump a free-form counter, e.g. ``increment("overview", "fallback")``."""
+        with self._lock:
+            self._counters[name][counter] += amount
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return counters plus TTFT / tokens-per-second percentiles."""
+        with self._lock:
+            result = {}
+            for name in set(self._counters) | set(self._ttft):
+                ttft = list(self._ttft.get(name, ()))
+                tps = list(self._tps.get(name, ()))
+                entry: dict[str, Any] = dict(self._counters.get(name, {}))
+                if ttft:
+                    entry["ttft_p50"] = _percentile(ttft, 50)
+                    entry["ttft_p95"] = _percentile(ttft, 95)
+                if tps:
+                    entry["tokens_per_second_avg"] = sum(tps) / len(tps)
+                result[name] = entry
+            return result
+
+
+_metrics = InferenceMetrics()
+
+
+def get_inference_metrics() -> InferenceMetrics:
+    """Return the process-wide metrics recorder."""
+    return _metrics
@@ -0,0 +1,97 @@
+"""
+Catalog of the models the application knows how to use.
+
+The catalog backs the models listing endpoint and lets other components
+(e.g. the model router) refer to models by catalog id and find the matching
+GGUF file on this host.
+"""
+
+import fnmatch
+import os
+from dataclasses import dataclass
+
+from .autotune import discover_models
+
+
+@dataclass(frozen=True)
+class CatalogModel:
+    """A model offered in the UI, and how to recognize its GGUF file."""
+
+    id: str
+    name: str
+    size: str
+    params: str | None = None
+    download_url: str | None = None
+    description: str | None = None
+    # Case-insensitive filename pattern of the model's GGUF files
+    file_pattern: str | None = None
+    type: str = "local"
+    cpu_capable: bool = True
+    gpu_capable: bool = True
+    is_custom: bool = False
+
+
+MODEL_CATALOG: list[CatalogModel] = [
+    CatalogModel(
+        id="llama-3.2-1b",
+        name="Llama 3.2 1B (Recommended)",
+        size="810 MB",
+        params="1B",
+        download_url="https://huggingface.co/bartowski/Llama-3.2-1B-Instruct-GGUF",
+        description="Fast, lightweight model perfect for code analysis. Q4_K_M quantization (~810MB). Good quality, recommended for most use cases.",
+        file_pattern="*llama-3.2-1b*.gguf",
+    ),
+    CatalogModel(
+        id="qwen2.5-coder-1.5b",
+        name="Qwen2.5-Coder 1.5B",
+        size="1 GB",
+        params="1.5B",
+        download_url="https://huggingface.co/Qwen/Qwen2.5-Coder-1.5B-Instruct-GGUF",
+        description="Optimized for code understanding. Download Q4_K_M variant (~1GB).",
+        file_pattern="*qwen2.5-coder-1.5b*.gguf",
+    ),
+    CatalogModel(
+        id="phi-3-mini",
+        name="Phi-3 Mini 3.8B",
+        size="2.2 GB",
+        params="3.8B",
+        download_url="https://huggingface.co/microsoft/Phi-3-mini-4k-instruct-gguf",
+        description="Microsoft's efficient model for code. Download Q4_K_M variant (~2.2GB).",
+        file_pattern="*phi-3-mini*.gguf",
+    ),
+    CatalogModel(
+        id="custom-model",
+        name="Upload Your Own Model",
+        size="Custom",
+        params="Custom",
+        description="Use any GGUF format model from HuggingFace or your own fine-tuned model.",
+        is_custom=True,
+    ),
+]
+
+
+def get_catalog_model(model_id: str) -> CatalogModel | None:
+    """Catalog entry for ``model_id``, if any."""
+    return next((model for model in MODEL_CATALOG if model.id == model_id), None)
+
+
+def find_model_file(model_id: str, candidates: list[str] | None = None) -> str | None:
+    """
+    Locate the GGUF file of a catalog model on this host.
+
+    Args:
+        model_id: Catalog id
+        candidates: GGUF paths to search (default: discovered models)
+
+    Returns:
+        Path of the first matching file, or None
+    """
+    model = get_catalog_model(model_id)
+    if model is None or not model.file_pattern:
+        return None
+    if candidates is None:
+        candidates = discover_models()
+    for path in candidates:
+        if fnmatch.fnmatch(os.path.basename(path).lower(), model.file_pattern):
+            return path
+    return None
@@ -0,0 +1,425 @@
+"""
+Shared model daemon.
+
+Every API process and prefork Celery child that calls ``get_llm_instance``
+loads its own copy of the model, so memory grows with the process count.
+In daemon mode one process holds the models (through the regular model
+registry, with priority scheduling per instance) and serves generation,
+streaming, batch and embedding requests over a Unix domain socket. When
+LLM_DAEMON_SOCKET is set, ``get_llm_instance`` and ``get_embedder`` return
+RemoteLLM / RemoteEmbedder proxies instead of loading anything, and the
+rest of the code is unchanged.
+
+Protocol: one request per connection. Frames are a 4-byte big-endian
+length followed by a UTF-8 JSON object. The client sends
+``{"op", "model", "replica", "args"}``; the daemon answers with
+``{"result"}`` or ``{"error", "kind"}``, and a stream with ``{"chunk"}``
+frames ending in ``{"done": true}``. Closing the connection mid-stream
+stops the generation.
+
+    python -m backend.app.services.model_daemon --socket /run/llm.sock
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from types import GeneratorType
+from typing import Any
+
+import numpy as np
+
+from .autotune import discover_models
+from .llm_service import LocalLLM
+from .prefix_cache import PrefixCache
+from .response_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+# Unix socket of the daemon; unset means every process loads its own models
+LLM_DAEMON_SOCKET = os.getenv("LLM_DAEMON_SOCKET") or None
+# Seconds a daemon request may take (long generations included)
+LLM_DAEMON_TIMEOUT_SECONDS = float(os.getenv("LLM_DAEMON_TIMEOUT_SECONDS", "600"))
+# Chat sessions whose llama state the daemon keeps in memory (LRU)
+LLM_DAEMON_CHAT_STATES = int(os.getenv("LLM_DAEMON_CHAT_STATES", "8"))
+
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+
+# Set in the daemon process so its own get_llm_instance calls load locally
+_serving = False
+
+
+class DaemonError(RuntimeError):
+    """Raised when the daemon is unreachable or a request fails in it."""
+
+    def __init__(self, message: str, kind: str = "DaemonError"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def daemon_client_enabled() -> bool:
+    """Whether this process should use the daemon instead of loading models."""
+    return bool(LLM_DAEMON_SOCKET) and not _serving
+
+
+def send_frame(sock: socket.socket, payload: dict[str, Any]) -> None:
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        part = sock.recv(size - len(buf))
+        if not part:
+            raise ConnectionError("Connection closed mid-frame")
+        buf += part
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the limit")
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# --- Daemon -----------------------------------------------------------------
+
+
+def _resolve_model(path: str) -> str:
+    """Map a client's model path to a file visible to the daemon."""
+    if os.path.isfile(path):
+        return path
+    # Containers may mount the models directory elsewhere; match by name
+    name = os.path.basename(path)
+    for candidate in discover_models():
+        if os.path.basename(candidate) == name:
+            return candidate
+    raise FileNotFoundError(f"Model not available to the daemon: {path}")
+
+
+# Failures of a request that are sent back to its client; anything else is a
+# daemon bug and is logged by socketserver
+_REQUEST_ERRORS = (OSError, ValueError, RuntimeError, LookupError, TypeError)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = recv_frame(self.request)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Dropping malformed daemon request: {e}")
+            return
+        try:
+            result = self.server.dispatch(request)
+            if isinstance(result, GeneratorType):
+                self._stream(result)
+            else:
+                send_frame(self.request, {"result": result})
+        except (BrokenPipeError, ConnectionError):
+            pass
+        except _REQUEST_ERRORS as e:
+            try:
+                send_frame(self.request, {"error": str(e), "kind": type(e).__name__})
+            except OSError:
+                pass
+
+    def _stream(self, chunks: Iterator[str]) -> None:
+        try:
+            for chunk in chunks:
+                send_frame(self.request, {"chunk": chunk})
+            send_frame(self.request, {"done": True})
+        finally:
+            # Stops decoding when the client went away
+            chunks.close()
+
+
+class ModelDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves the models of this process to other processes."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, chat_states: int = LLM_DAEMON_CHAT_STATES):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+        # llama state after each session's last turn, by opaque handle
+        self.chat_states = chat_states
+        self._chat_states: OrderedDict[str, Any] = OrderedDict()
+        self._chat_states_lock = threading.Lock()
+
+    def _chat_turn(self, llm: LocalLLM, args: dict[str, Any]) -> list[Any]:
+        """
+        Run a chat turn from the state behind the client's handle and keep
+        the new state under a fresh handle, which replaces the old one.
+        Unknown or evicted handles start from the transcript alone.
+        """
+        handle = args.pop("state", None)
+        with self._chat_states_lock:
+            state = self._chat_states.get(handle) if handle else None
+        text, new_state = llm.generate_with_state(state=state, **args)
+        if new_state is None or self.chat_states <= 0:
+            # A response-cache hit: the previous state is still a prefix
+            return [text, None]
+
+        new_handle = uuid.uuid4().hex
+        with self._chat_states_lock:
+            self._chat_states.pop(handle, None)
+            self._chat_states[new_handle] = new_state
+            while len(self._chat_states) > self.chat_states:
+                self._chat_states.popitem(last=False)
+        return [text, new_handle]
+
+    def _model(self, request: dict[str, Any]) -> LocalLLM:
+        from .llm_service import get_llm_instance
+
+        llm = get_llm_instance(
+            _resolve_model(request["model"]), replica=request.get("replica", 0)
+        )
+        if llm is None:
+            raise RuntimeError(f"Failed to load model {request['model']}")
+        return llm
+
+    def dispatch(self, request: dict[str, Any]) -> Any:
+        op = request.get("op")
+        args = request.get("args") or {}
+
+        if op == "embed":
+            from .embedding_index import get_embedder
+
+            embedder = get_embedder()
+            if embedder is None:
+                raise RuntimeError("No embedding model configured in the daemon")
+            return embedder.embed(args["texts"]).tolist()
+
+        llm = self._model(request)
+        if op == "n_ctx":
+            return llm.n_ctx
+        if op == "count_tokens":
+            return llm.count_tokens(args["text"])
+        if op == "count_tokens_many":
+            return llm.count_tokens_many(args["texts"])
+        if op == "generate":
+            return llm.generate(**args)
+        if op == "generate_batch":
+            return llm.generate_batch(**args)
+        if op == "generate_chat":
+            return self._chat_turn(llm, args)
+        if op == "stream":
+            return llm.generate_stream(**args)
+        if op == "scheduler":
+            return llm.scheduler.stats()
+        raise ValueError(f"Unknown daemon operation: {op}")
+
+
+# --- Client -----------------------------------------------------------------
+
+
+class DaemonClient:
+    """Sends requests to the model daemon, one connection per request."""
+
+    def __init__(
+        self,
+        socket_path: str = LLM_DAEMON_SOCKET,
+        timeout: float = LLM_DAEMON_TIMEOUT_SECONDS,
+    ):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connect(self, request: dict[str, Any]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            send_frame(sock, request)
+        except OSError as e:
+            sock.close()
+            raise DaemonError(f"Model daemon unreachable at {self.socket_path}: {e}")
+        return sock
+
+    @staticmethod
+    def _check(reply: dict[str, Any]) -> dict[str, Any]:
+        if "error" in reply:
+            raise DaemonError(reply["error"], reply.get("kind", "DaemonError"))
+        return reply
+
+    def call(self, op: str, model: str | None = None, replica: int = 0, **args):
+        request = {"op": op, "model": model, "replica": replica, "args": args}
+        with self._connect(request) as sock:
+            try:
+                return self._check(recv_frame(sock))["result"]
+            except OSError as e:
+                raise DaemonError(f"Model daemon request failed: {e}")
+
+    def stream(self, model: str, replica: int = 0, **args) -> Iterator[str]:
+        sock = self._connect(
+            {"op": "stream", "model": model, "replica": replica, "args": args}
+        )
+        with sock:
+            while True:
+                reply = self._check(recv_frame(sock))
+                if reply.get("done"):
+                    return
+                yield reply["chunk"]
+
+
+class _RemoteScheduler:
+    """Reports the daemon-side scheduler stats of a RemoteLLM."""
+
+    def __init__(self, llm: "RemoteLLM"):
+        self._llm = llm
+
+    def stats(self) -> dict[str, Any]:
+        return self._llm._call("scheduler")
+
+
+class RemoteLLM(LocalLLM):
+    """
+    LocalLLM interface backed by a model held in the daemon.
+
+    Prompt construction and context packing are inherited; generation,
+    tokenization and response caching happen in the daemon. Streaming
+    validators run here on the relayed stream (see ``_generate_validated``).
+    """
+
+    def __init__(
+        self, model_path: str, replica: int = 0, client: DaemonClient | None = None
+    ):
+        self.model_path = model_path
+        self.replica = replica
+        self.client = client or DaemonClient()
+        # Prefix reuse, priority scheduling and response caching happen in
+        # the daemon's instance
+        self.model_identity = None
+        self.prefix_cache = PrefixCache(max_entries=0)
+        self.scheduler = _RemoteScheduler(self)
+        self._n_ctx: int | None = None
+
+    def _call(self, op: str, **args: Any) -> Any:
+        return self.client.call(op, self.model_path, self.replica, **args)
+
+    @property
+    def n_ctx(self) -> int:
+        if self._n_ctx is None:
+            self._n_ctx = self._call("n_ctx")
+        return self._n_ctx
+
+    def count_tokens(self, text: str) -> int:
+        return self._call("count_tokens", text=text)
+
+    def count_tokens_many(self, texts: list[str]) -> list[int]:
+        return self._call("count_tokens_many", texts=texts)
+
+    def generate(self, prompt: str, validators=None, **kwargs: Any) -> str:
+        """Generate text in the daemon (see ``LocalLLM.generate``)."""
+        if validators:
+            return self._generate_validated(validators, prompt, **kwargs)
+        return self._call("generate", prompt=prompt, **kwargs)
+
+    def generate_stream(self, prompt: str, **kwargs: Any) -> Iterator[str]:
+        """Relay a daemon-side stream; closing it stops the generation."""
+        return self.client.stream(
+            self.model_path, self.replica, prompt=prompt, **kwargs
+        )
+
+    def generate_batch(self, prompts: list[str], **kwargs: Any) -> list[str]:
+        return self._call("generate_batch", prompts=prompts, **kwargs)
+
+    def generate_with_state(
+        self, prompt: str, state: Any | None = None, **kwargs: Any
+    ) -> tuple[str, Any]:
+        """
+        Generate a chat turn. The llama state stays in the daemon; the state
+        passed and returned here is a handle to it (None for a fresh turn or
+        a response cache hit). Handles of other backends are ignored.
+        """
+        handle = state if isinstance(state, str) else None
+        text, new_handle = self._call(
+            "generate_chat", prompt=prompt, state=handle, **kwargs
+        )
+        return text, new_handle
+
+
+class RemoteEmbedder:
+    """LocalEmbedder interface backed by the daemon's embedding model."""
+
+    def __init__(self, model_path: str, client: DaemonClient | None = None):
+        self.model_path = model_path
+        try:
+            self.model_identity = model_identity(model_path)
+        except OSError:
+            # The file may only be mounted in the daemon's container
+            self.model_identity = os.path.basename(model_path)
+        self.client = client or DaemonClient()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.client.call("embed", texts=texts), dtype=np.float32)
+
+
+_remote: dict[tuple[str, int], RemoteLLM] = {}
+_remote_lock = threading.Lock()
+
+
+def get_remote_llm(model_path: str, replica: int = 0) -> RemoteLLM:
+    """Return the shared proxy for a model held in the daemon."""
+    with _remote_lock:
+        key = (model_path, replica)
+        if key not in _remote:
+            _remote[key] = RemoteLLM(model_path, replica)
+        return _remote[key]
+
+
+def start_serving(preload: Sequence[str] = ()) -> None:
+    """
+    Make this process load models itself and load ``preload`` up front.
+
+    ``llm_service`` and ``embedding_index`` consult the package module, which
+    is not this one when the daemon runs under ``python -m``, so the flag is
+    set there.
+    """
+    from . import model_daemon
+    from .embedding_index import get_embedder
+    from .llm_service import get_llm_instance
+
+    model_daemon._serving = True
+    for model_path in preload:
+        if get_llm_instance(model_path) is None:
+            logger.error(f"Could not preload {model_path}")
+    get_embedder()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve local models over a socket.")
+    parser.add_argument("--socket", default=LLM_DAEMON_SOCKET or "/tmp/llm.sock")
+    parser.add_argument(
+        "--preload", nargs="*", default=[], help="GGUF files to load at startup"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    start_serving(args.preload)
+    server = ModelDaemon(args.socket)
+    logger.info(f"Model daemon listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,255 @@
+"""
+Process-wide registry of loaded LLM instances.
+
+Loading a GGUF model takes seconds and maps the full weights into memory, so
+callers share one instance per (resolved path, file mtime, load parameters)
+instead of constructing a new model on every request.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+RegistryKey = tuple[str, int, tuple[tuple[str, Hashable], ...]]
+
+
+class _PendingLoad:
+    """A model load in flight that concurrent callers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.instance: Any = None
+        self.error: BaseException | None = None
+
+
+class _Entry:
+    """A loaded instance plus the bookkeeping needed for eviction."""
+
+    def __init__(
+        self,
+        instance: Any,
+        size_bytes: int,
+        load_seconds: float,
+        context_bytes: int = 0,
+    ):
+        self.instance = instance
+        self.size_bytes = size_bytes
+        self.context_bytes = context_bytes
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+        self.hits = 0
+
+
+class ModelRegistry:
+    """
+    Thread-safe LRU cache of loaded models with single-flight loading.
+
+    Concurrent requests for the same key block on a single load instead of
+    loading the weights twice. When the summed footprint of resident models
+    exceeds ``max_bytes`` the least recently used entries are dropped. The
+    weights are approximated by the file size, which is what llama.cpp maps,
+    and counted once per file: replicas and other instances of the same file
+    share the mapped pages and only add their own context (KV cache).
+
+    Evicting an entry only drops the registry's reference; callers still
+    holding the instance keep it alive until they release it.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[..., Any],
+        max_bytes: int | None = None,
+        size_of: Callable[[str], int] | None = None,
+        context_size_of: Callable[[str, Any], int] | None = None,
+    ):
+        """
+        Args:
+            loader: Callable invoked as ``loader(path, **load_params)``
+            max_bytes: Memory budget for resident models (None = unbounded)
+            size_of: Weight footprint of a model path (default: file size)
+            context_size_of: Memory of one loaded instance beyond the shared
+                weights, called as ``context_size_of(path, instance)``
+                (default: not counted)
+        """
+        self._loader = loader
+        self._max_bytes = max_bytes
+        self._size_of = size_of or os.path.getsize
+        self._context_size_of = context_size_of
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[RegistryKey, _Entry] = OrderedDict()
+        self._pending: dict[RegistryKey, _PendingLoad] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_failures": 0,
+            "evictions": 0,
+            "total_load_seconds": 0.0,
+        }
+
+    @staticmethod
+    def make_key(model_path: str, **load_params) -> RegistryKey:
+        """Build the cache key for a model file and its load parameters."""
+        real_path = os.path.realpath(model_path)
+        mtime_ns = os.stat(real_path).st_mtime_ns
+        params = tuple(sorted(load_params.items()))
+        return (real_path, mtime_ns, params)
+
+    def get(self, model_path: str, replica: int = 0, **load_params) -> Any:
+        """
+        Return a shared instance for the model, loading it if necessary.
+
+        Args:
+            model_path: Path to the model file
+            replica: Index of an independent copy of the model. Instances
+                serialize their own calls, so callers that run inference
+                concurrently ask for several replicas. Not passed to the loader.
+            **load_params: Keyword arguments forwarded to the loader
+
+        Returns:
+            Loaded model instance
+
+        Raises:
+            Whatever the loader raises; waiting callers see the same error.
+        """
+        key = self.make_key(model_path, **load_params)
+        if replica:
+            key = (key[0], key[1], key[2] + (("replica", replica),))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.last_used = time.time()
+                entry.hits += 1
+                self._stats["hits"] += 1
+                return entry.instance
+
+            pending = self._pending.get(key)
+            is_loader = pending is None
+            if is_loader:
+                pending = _PendingLoad()
+                self._pending[key] = pending
+                self._stats["misses"] += 1
+            else:
+                # Another caller is already loading this model
+                self._stats["hits"] += 1
+
+        if not is_loader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.instance
+
+        start = time.perf_counter()
+        try:
+            instance = self._loader(key[0], **load_params)
+        except BaseException as e:
+            with self._lock:
+                self._stats["load_failures"] += 1
+                del self._pending[key]
+            pending.error = e
+            pending.done.set()
+            raise
+
+        load_seconds = time.perf_counter() - start
+        try:
+            size_bytes = self._size_of(key[0])
+        except OSError:
+            size_bytes = 0
+        context_bytes = 0
+        if self._context_size_of is not None:
+            context_bytes = self._context_size_of(key[0], instance)
+
+        with self._lock:
+            self._entries[key] = _Entry(
+                instance, size_bytes, load_seconds, context_bytes
+            )
+            self._stats["loads"] += 1
+            self._stats["total_load_seconds"] += load_seconds
+            del self._pending[key]
+            self._evict_over_budget(keep=key)
+
+        pending.instance = instance
+        pending.done.set()
+        logger.info(
+            f"Loaded model {key[0]} in {load_seconds:.2f}s "
+            f"({size_bytes / (1024 * 1024):.0f} MB)"
+        )
+        return instance
+
+    def _resident_bytes(self) -> int:
+        """Weights once per model file plus every instance's context. Lock held."""
+        weights = {(key[0], key[1]): e.size_bytes for key, e in self._entries.items()}
+        contexts = sum(entry.context_bytes for entry in self._entries.values())
+        return sum(weights.values()) + contexts
+
+    def _evict_over_budget(self, keep: RegistryKey) -> None:
+        """Drop least recently used entries until the budget is met. Lock held."""
+        if self._max_bytes is None:
+            return
+
+        for key in list(self._entries.keys()):
+            if self._resident_bytes() <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+            del self._entries[key]
+            self._stats["evictions"] += 1
+            logger.info(f"Evicted model {key[0]} from registry (LRU)")
+
+    def evict(self, model_path: str | None = None) -> int:
+        """
+        Drop resident models.
+
+        Args:
+            model_path: Only evict entries for this file (default: all)
+
+        Returns:
+            Number of entries evicted
+        """
+        real_path = os.path.realpath(model_path) if model_path else None
+        with self._lock:
+            keys = [
+                key for key in self._entries if real_path is None or key[0] == real_path
+            ]
+            for key in keys:
+                del self._entries[key]
+            self._stats["evictions"] += len(keys)
+        return len(keys)
+
+    def instances(self) -> list[tuple[str, Any]]:
+        """Return (resolved path, instance) pairs for resident models."""
+        with self._lock:
+            return [(key[0], entry.instance) for key, entry in self._entries.items()]
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit/miss/load-time counters and the resident model list."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            models = [
+                {
+                    "path": key[0],
+                    "params": dict(key[2]),
+                    "size_bytes": entry.size_bytes,
+                    "context_bytes": entry.context_bytes,
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "hits": entry.hits,
+                    "last_used": entry.last_used,
+                }
+                for key, entry in self._entries.items()
+            ]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "resident_bytes": self._resident_bytes(),
+                "max_bytes": self._max_bytes,
+                "loading": len(self._pending),
+                "models": models,
+            }
@@ -0,0 +1,109 @@
+"""
+Task-based model routing.
+
+Analysis jobs mix very different generations: a batch of short, throwaway
+file descriptions and a few long synthesis steps (overview, vulnerability
+analysis, chat answers). The router maps each task type to a model, so a
+small model can serve bulk work while a larger one is reserved for
+synthesis. Routes name catalog models (or GGUF paths) and fall back to the
+job's or request's model when unset or unavailable on this host. Routed
+models are loaded through the shared model registry, so every job and
+request reuses the same loaded instances.
+
+    LLM_MODEL_ROUTES=description=llama-3.2-1b,overview=phi-3-mini
+"""
+
+import logging
+import os
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from .model_catalog import find_model_file
+
+logger = logging.getLogger(__name__)
+
+TASK_TYPES = ("description", "overview", "vulnerability", "chat")
+
+# task=model pairs; a model is a catalog id or a path to a GGUF file
+LLM_MODEL_ROUTES = os.getenv("LLM_MODEL_ROUTES", "")
+
+
+def parse_routes(spec: str) -> dict[str, str]:
+    """Parse ``task=model`` pairs separated by commas."""
+    routes = {}
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+        task, _, model = pair.partition("=")
+        task, model = task.strip(), model.strip()
+        if task not in TASK_TYPES or not model:
+            logger.warning(f"Ignoring invalid model route: {pair.strip()!r}")
+            continue
+        routes[task] = model
+    return routes
+
+
+class ModelRouter:
+    """Resolves the model file to use for each task type."""
+
+    def __init__(
+        self,
+        routes: dict[str, str] | None = None,
+        locate: Callable[[str], str | None] = find_model_file,
+    ):
+        """
+        Args:
+            routes: Task type -> catalog id or GGUF path
+            locate: Finds the GGUF file of a catalog id on this host
+        """
+        self.routes = dict(routes or {})
+        self._locate = locate
+        self._lock = threading.Lock()
+        self._resolved: dict[str, str | None] = {}
+
+    def _resolve(self, model: str) -> str | None:
+        with self._lock:
+            if model not in self._resolved:
+                if model.endswith(".gguf"):
+                    path = model if os.path.isfile(model) else None
+                else:
+                    path = self._locate(model)
+                if path is None:
+                    logger.warning(f"Routed model {model} not found on this host")
+                self._resolved[model] = path
+            return self._resolved[model]
+
+    def route(self, task: str, default_path: str | None) -> str | None:
+        """
+        Model file for ``task``.
+
+        Args:
+            task: One of TASK_TYPES
+            default_path: The job's or request's model, used when the task
+                has no route or its model is not available
+
+        Returns:
+            Path of the model to load (``default_path`` as the fallback)
+        """
+        model = self.routes.get(task)
+        if not model:
+            return default_path
+        return self._resolve(model) or default_path
+
+    def plan(self, tasks: list[str], default_path: str | None) -> dict[str, Any]:
+        """Task -> resolved model path, e.g. for logging or job results."""
+        return {task: self.route(task, default_path) for task in tasks}
+
+
+_router: ModelRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide model router configured by LLM_MODEL_ROUTES."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(parse_routes(LLM_MODEL_ROUTES))
+        return _router
@@ -0,0 +1,99 @@
+"""
+Grammar-constrained decoding for the repository overview.
+
+The overview prompt asks for six markdown sections in a fixed order. Left
+unconstrained, the model sometimes drifts (skips or renames a section,
+echoes template placeholders, or spends its whole budget on one section),
+and the worker then discards the generation for a static fallback. A
+llama.cpp GBNF grammar makes the structure part of sampling instead: the
+section headers are emitted verbatim and in order, body lines cannot
+contain placeholder markers, and every section has a line budget, so the
+output always parses and no section can starve the ones after it.
+"""
+
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+# Constrain the overview generation with OVERVIEW_GRAMMAR (when supported)
+LLM_OVERVIEW_GRAMMAR = os.getenv("LLM_OVERVIEW_GRAMMAR", "true").lower() == "true"
+
+# Section token caps are enforced as character budgets. Generated prose
+# averages close to 4 characters per token; 3 keeps the grammar's longest
+# possible output within the token budget for denser text as well.
+CHARS_PER_TOKEN = 3
+# Longest body line the grammar admits
+LINE_CHARS = 160
+# Tokens reserved per section for its header and separating blank line
+HEADER_TOKENS = 10
+
+
+@dataclass(frozen=True)
+class OverviewSection:
+    """A required overview section and its share of the output budget."""
+
+    header: str
+    share: float
+
+
+OVERVIEW_SECTIONS = (
+    OverviewSection("**Project Snapshot**", 0.13),
+    OverviewSection("**Architecture Map**", 0.20),
+    OverviewSection("**Component Deep Dive**", 0.22),
+    OverviewSection("**Technology Stack**", 0.14),
+    OverviewSection("**Operational Considerations**", 0.15),
+    OverviewSection("**Recommended Next Actions**", 0.16),
+)
+
+REQUIRED_OVERVIEW_SECTIONS = [section.header for section in OVERVIEW_SECTIONS]
+
+
+def _rule_name(header: str) -> str:
+    return "-".join(header.strip("*").lower().split())
+
+
+def section_token_caps(
+    max_tokens: int, sections: Sequence[OverviewSection] = OVERVIEW_SECTIONS
+) -> list[int]:
+    """Body tokens each section may use out of ``max_tokens``."""
+    body_tokens = max(0, max_tokens - HEADER_TOKENS * len(sections))
+    return [max(1, int(body_tokens * section.share)) for section in sections]
+
+
+def section_line_caps(
+    max_tokens: int, sections: Sequence[OverviewSection] = OVERVIEW_SECTIONS
+) -> list[int]:
+    """
+    Maximum body lines per section so the whole overview fits ``max_tokens``.
+
+    Every section keeps at least one line, even in a very small budget.
+    """
+    return [
+        max(1, cap * CHARS_PER_TOKEN // LINE_CHARS)
+        for cap in section_token_caps(max_tokens, sections)
+    ]
+
+
+def build_overview_grammar(
+    max_tokens: int, sections: Sequence[OverviewSection] = OVERVIEW_SECTIONS
+) -> str:
+    """
+    GBNF grammar for an overview generated within ``max_tokens``.
+
+    Body lines may not start with ``*`` (so they cannot fake a header) and
+    may not contain ``<`` (so template placeholders cannot appear).
+
+    Args:
+        max_tokens: Output tokens the generation is allowed
+        sections: Required sections, in output order
+
+    Returns:
+        Grammar text for ``LlamaGrammar.from_string`` or llama-server
+    """
+    caps = section_line_caps(max_tokens, sections)
+    names = [_rule_name(section.header) for section in sections]
+    rules = ["root ::= " + ' "\\n" '.join(names)]
+    for name, section, cap in zip(names, sections, caps):
+        rules.append(f'{name} ::= "{section.header}\\n" line{{1,{cap}}}')
+    rules.append(f'line ::= [^\\n<*] [^\\n<]{{0,{LINE_CHARS - 1}}} "\\n"')
+    return "\n".join(rules) + "\n"
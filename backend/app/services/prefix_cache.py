@@ -0,0 +1,116 @@
+"""
+Snapshot cache of llama.cpp state for static prompt prefixes.
+
+The analysis prompts start with long, fixed instruction blocks. Evaluating
+such a prefix once and saving the llama state lets later calls restore the
+snapshot and only evaluate the variable suffix, because llama.cpp reuses the
+longest matching token prefix already in its KV cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+
+class PrefixEntry:
+    """A saved llama state positioned right after a prompt prefix."""
+
+    def __init__(self, state: Any, tokens: list[int], eval_seconds: float):
+        self.state = state
+        self.tokens = tokens
+        self.eval_seconds = eval_seconds
+        self.hits = 0
+
+    @property
+    def seconds_per_token(self) -> float:
+        return self.eval_seconds / len(self.tokens) if self.tokens else 0.0
+
+
+class PrefixCache:
+    """
+    Small LRU of prefix snapshots with hit-rate and time-saved accounting.
+
+    Snapshots hold a copy of the KV cache for the prefix tokens, so the
+    number of entries is kept deliberately small.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, PrefixEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "tokens_reused": 0,
+            "prompt_eval_seconds_saved": 0.0,
+            "prefix_eval_seconds": 0.0,
+        }
+
+    @staticmethod
+    def key_for(prefix: str) -> str:
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def get(self, prefix: str) -> PrefixEntry | None:
+        """Return the snapshot for ``prefix``, counting a hit or miss."""
+        key = self.key_for(prefix)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self._stats["hits"] += 1
+            return entry
+
+    def put(
+        self, prefix: str, state: Any, tokens: list[int], eval_seconds: float
+    ) -> PrefixEntry:
+        """Store a snapshot, evicting the least recently used one if full."""
+        entry = PrefixEntry(state, list(tokens), eval_seconds)
+        with self._lock:
+            self._entries[self.key_for(prefix)] = entry
+            self._entries.move_to_end(self.key_for(prefix))
+            self._stats["prefix_eval_seconds"] += eval_seconds
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def record_reuse(self, entry: PrefixEntry, prompt_tokens: list[int]) -> int:
+        """
+        Account for the prefix tokens a prompt actually reused.
+
+        Args:
+            entry: Snapshot that was restored
+            prompt_tokens: Tokenization of the full prompt
+
+        Returns:
+            Number of leading tokens shared with the snapshot
+        """
+        reused = 0
+        for cached, new in zip(entry.tokens, prompt_tokens):
+            if cached != new:
+                break
+            reused += 1
+        with self._lock:
+            self._stats["tokens_reused"] += reused
+            self._stats["prompt_eval_seconds_saved"] += reused * entry.seconds_per_token
+        return reused
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "cached_prefix_tokens": sum(
+                    len(e.tokens) for e in self._entries.values()
+                ),
+            }
@@ -0,0 +1,391 @@
+"""
+Fast file inventory of a repository checkout.
+
+Directories are listed with ``os.scandir``, whose entries already carry the
+file type, so only regular files cost a ``stat`` (once, for their size).
+Subdirectories are listed in parallel on a thread pool; ``scandir`` releases
+the GIL while the kernel lists a directory, which is where large or cold
+trees spend their time.
+
+The scan honours the repository's ``.gitignore`` files (at every level,
+including negation, directory-only and anchored patterns and ``**``) and
+``.gitattributes``: files marked ``linguist-vendored``,
+``linguist-generated`` or ``export-ignore`` are left out like vendored code.
+Directories in the caller's skip list are never entered. Measure with:
+
+    python -m backend.app.services.repo_scanner --files 200000 [root]
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections.abc import Collection
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Threads listing directories in parallel (1 scans sequentially). Threads
+# pay off on cold caches and network filesystems; on a warm cache a single
+# core is faster without them
+REPO_SCAN_WORKERS = int(
+    os.getenv("REPO_SCAN_WORKERS", str(min(8, os.cpu_count() or 1)))
+)
+# Leave out files ignored by .gitignore or marked vendored in .gitattributes
+REPO_SCAN_GITIGNORE = os.getenv("REPO_SCAN_GITIGNORE", "true").lower() == "true"
+
+# Attributes that mark files as not part of the project's own code
+EXCLUDING_ATTRIBUTES = {"linguist-vendored", "linguist-generated", "export-ignore"}
+
+
+class FileEntry(NamedTuple):
+    path: str  # relative to the root, "/"-separated
+    size: int
+
+
+@dataclass
+class Inventory:
+    """Files and directories of a tree, sorted by path."""
+
+    files: list[FileEntry] = field(default_factory=list)
+    # Directories below the root (the root itself is "")
+    directories: list[str] = field(default_factory=list)
+    # Entries left out by .gitignore or .gitattributes
+    ignored: int = 0
+    seconds: float = 0.0
+
+
+def _glob_regex(pattern: str) -> str:
+    """Regex for a gitignore-style glob matched against a "/"-separated path."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1 : end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class _Rule(NamedTuple):
+    regex: "re.Pattern[str]"
+    # Directory of the file declaring the rule ("" for the root)
+    base: str
+    # Matched against the path below base instead of the name alone
+    anchored: bool
+    dir_only: bool
+    # gitignore: whether the rule re-includes; gitattributes: attribute value
+    value: bool
+    attribute: str | None = None
+
+    def matches(self, path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return False
+            path = path[len(self.base) + 1 :]
+        return bool(self.regex.fullmatch(path if self.anchored else name))
+
+
+def _parse_pattern(pattern: str) -> tuple[str, bool, bool]:
+    """Regex, anchored and directory-only flags of one pattern."""
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    return _glob_regex(pattern.lstrip("/")), anchored, dir_only
+
+
+def parse_gitignore(text: str, base: str = "") -> list[_Rule]:
+    """Rules of a ``.gitignore`` file in directory ``base``."""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate or line.startswith("\\"):
+            line = line[1:]
+        regex, anchored, dir_only = _parse_pattern(line)
+        if regex:
+            rules.append(_Rule(re.compile(regex), base, anchored, dir_only, negate))
+    return rules
+
+
+def parse_gitattributes(text: str, base: str = "") -> list[_Rule]:
+    """Rules of a ``.gitattributes`` file for the EXCLUDING_ATTRIBUTES."""
+    rules = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or parts[0].startswith("#"):
+            continue
+        regex, anchored, _ = _parse_pattern(parts[0])
+        for attribute in parts[1:]:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name not in EXCLUDING_ATTRIBUTES:
+                continue
+            enabled = not attribute.startswith(("-", "!")) and value != "false"
+            rules.append(_Rule(re.compile(regex), base, anchored, False, enabled, name))
+    return rules
+
+
+class PathFilter:
+    """The ignore and attribute rules in effect for one directory."""
+
+    def __init__(
+        self, ignore: tuple[_Rule, ...] = (), attributes: tuple[_Rule, ...] = ()
+    ):
+        self.ignore = ignore
+        self.attributes = attributes
+
+    def extend(self, base: str, gitignore: str, gitattributes: str) -> "PathFilter":
+        """Rules for ``base`` given its own .gitignore and .gitattributes."""
+        return PathFilter(
+            self.ignore + tuple(parse_gitignore(gitignore, base)),
+            self.attributes + tuple(parse_gitattributes(gitattributes, base)),
+        )
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        name = path.rsplit("/", 1)[-1]
+        ignored = False
+        # The last matching pattern decides
+        for rule in self.ignore:
+            if rule.matches(path, name, is_dir):
+                ignored = not rule.value
+        if ignored or is_dir:
+            return ignored
+        attributes: dict[str, bool] = {}
+        for rule in self.attributes:
+            if rule.matches(path, name, False):
+                attributes[rule.attribute] = rule.value
+        return any(attributes.values())
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _list_directory(
+    root: str, rel_dir: str, rules: PathFilter, skip_dirs: Collection[str], git: bool
+) -> tuple[list[tuple[str, PathFilter]], list[FileEntry], int]:
+    """Subdirectories (with their rules), files and ignored count of one directory."""
+    path = os.path.join(root, rel_dir) if rel_dir else root
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.debug(f"Could not list {path}: {e}")
+        return [], [], 0
+
+    if git:
+        names = {entry.name for entry in entries}
+        if ".gitignore" in names or ".gitattributes" in names:
+            rules = rules.extend(
+                rel_dir,
+                _read(os.path.join(path, ".gitignore")),
+                _read(os.path.join(path, ".gitattributes")),
+            )
+
+    subdirs, files, ignored = [], [], 0
+    for entry in entries:
+        # A worktree's .git is a file pointing at the repository
+        if entry.name == ".git":
+            continue
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if not is_dir and entry.is_dir():
+                continue  # symlinked directory, not followed
+        except OSError:
+            continue
+        if is_dir and entry.name in skip_dirs:
+            continue
+        if git and rules.excluded(rel_path, is_dir):
+            ignored += 1
+            continue
+        if is_dir:
+            subdirs.append((rel_path, rules))
+            continue
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            size = 0
+        files.append(FileEntry(rel_path, size))
+    return subdirs, files, ignored
+
+
+def scan_tree(
+    root: str,
+    skip_dirs: Collection[str] = (),
+    workers: int = REPO_SCAN_WORKERS,
+    respect_gitignore: bool = REPO_SCAN_GITIGNORE,
+) -> Inventory:
+    """
+    List every file below ``root``.
+
+    Args:
+        root: Directory to scan
+        skip_dirs: Directory names never entered (e.g. node_modules)
+        workers: Threads listing directories in parallel
+        respect_gitignore: Leave out files excluded by .gitignore and
+            .gitattributes
+
+    Returns:
+        Inventory sorted by path, independent of the number of workers
+    """
+    start = time.perf_counter()
+    root = os.path.abspath(root)
+    inventory = Inventory()
+
+    def visit(rel_dir: str, rules: PathFilter):
+        return _list_directory(root, rel_dir, rules, skip_dirs, respect_gitignore)
+
+    def collect(result) -> list[tuple[str, PathFilter]]:
+        subdirs, files, ignored = result
+        inventory.directories.extend(rel_dir for rel_dir, _ in subdirs)
+        inventory.files.extend(files)
+        inventory.ignored += ignored
+        return subdirs
+
+    if workers <= 1:
+        pending = [("", PathFilter())]
+        while pending:
+            pending.extend(collect(visit(*pending.pop())))
+    else:
+        with ThreadPoolExecutor(workers, thread_name_prefix="scan") as pool:
+            futures = {pool.submit(visit, "", PathFilter())}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for subdir in collect(future.result()):
+                        futures.add(pool.submit(visit, *subdir))
+
+    inventory.files.sort()
+    inventory.directories.sort()
+    inventory.seconds = time.perf_counter() - start
+    return inventory
+
+
+# --- benchmark ----------------------------------------------------------------
+
+
+def make_synthetic_tree(
+    root: str, files: int, per_dir: int = 50, fanout: int = 10
+) -> None:
+    """Create ``files`` small files, ``per_dir`` per nested leaf directory."""
+    directories = -(-files // per_dir)
+    for index in range(directories):
+        parts = []
+        value = index
+        while True:
+            parts.append(f"d{value % fanout}")
+            value //= fanout
+            if not value:
+                break
+        directory = os.path.join(root, *reversed(parts), f"leaf{index}")
+        os.makedirs(directory, exist_ok=True)
+        for number in range(min(per_dir, files - index * per_dir)):
+            with open(os.path.join(directory, f"f{number}.py"), "w") as f:
+                f.write("x = 1\n")
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("*.log\nbuild/\n")
+
+
+def _walk_baseline(root: str, skip_dirs: Collection[str]) -> int:
+    """The os.walk loop the scanner replaced, for comparison."""
+    count = 0
+    for current, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        for name in files:
+            path = os.path.join(current, name)
+            os.path.relpath(path, root).replace("\\", "/")
+            os.path.getsize(path)
+            count += 1
+    return count
+
+
+def benchmark_scan(
+    root: str, workers: list[int], skip_dirs: Collection[str] = ()
+) -> list[dict[str, object]]:
+    """Files/sec of the os.walk loop and of the scanner at each thread count."""
+    reports = []
+    start = time.perf_counter()
+    count = _walk_baseline(root, skip_dirs)
+    seconds = time.perf_counter() - start
+    reports.append(
+        {"scanner": "os.walk", "files": count, "files_per_second": count / seconds}
+    )
+    for threads in workers:
+        inventory = scan_tree(root, skip_dirs, workers=threads)
+        reports.append(
+            {
+                "scanner": "scandir",
+                "workers": threads,
+                "files": len(inventory.files),
+                "files_per_second": len(inventory.files) / inventory.seconds,
+            }
+        )
+    return reports
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure repository scan throughput (files/sec)."
+    )
+    parser.add_argument("root", nargs="?", help="Tree to scan (default: synthetic)")
+    parser.add_argument(
+        "--files", type=int, default=200_000, help="Files of the synthetic tree"
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from .analysis_pipeline import SKIP_DIRS
+
+    root = args.root
+    if root is None:
+        root = tempfile.mkdtemp(prefix="scan_benchmark_")
+        logger.info(f"Creating {args.files} files in {root}")
+        make_synthetic_tree(root, args.files)
+    try:
+        for report in benchmark_scan(root, args.workers, SKIP_DIRS):
+            print(json.dumps(report))
+    finally:
+        if args.root is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+"""
+Persistent, content-addressed cache of LLM responses.
+
+Responses are keyed by a hash of the model file identity, the full prompt and
+the sampling parameters, and stored in a SQLite database that the API and the
+Celery workers share. Only deterministic generations (temperature 0 or a fixed
+seed) are cached by default, since replaying a sampled answer would change
+behaviour. Entries expire after a TTL and the table is bounded by evicting the
+least recently used rows.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any
+
+from .sqlite_cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+LLM_RESPONSE_CACHE_PATH = os.getenv(
+    "LLM_RESPONSE_CACHE_PATH", "./data/llm_response_cache.db"
+)
+LLM_RESPONSE_CACHE_TTL_SECONDS = int(
+    os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))
+)
+LLM_RESPONSE_CACHE_MAX_ENTRIES = int(
+    os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "50000")
+)
+
+
+def model_identity(model_path: str) -> str:
+    """
+    Identify a model file independently of where it is mounted.
+
+    The API and worker containers may see the same GGUF under different
+    directories, so the identity uses the file name, size and mtime.
+    """
+    stat = os.stat(model_path)
+    return f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def is_deterministic(temperature: float, seed: int | None) -> bool:
+    """Whether sampling settings reproduce the same output for the same prompt."""
+    return temperature == 0 or seed is not None
+
+
+class ResponseCache(SQLiteCache):
+    """SQLite-backed response cache safe to share across threads and processes."""
+
+    table = "responses"
+    columns = ("response",)
+    label = "Response cache"
+
+    def __init__(
+        self,
+        path: str = LLM_RESPONSE_CACHE_PATH,
+        ttl_seconds: int = LLM_RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path, ttl_seconds, max_entries)
+
+    @staticmethod
+    def make_key(identity: str, prompt: str, params: dict[str, Any]) -> str:
+        """Hash the model identity, prompt and sampling parameters."""
+        payload = json.dumps(
+            {"model": identity, "prompt": prompt, "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _decode(self, values: tuple[Any, ...]) -> str:
+        return values[0]
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response and trim the table to ``max_entries``."""
+        self._put(key, response)
+
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """
+    Return the process-wide response cache, or None if it cannot be opened
+    or has been disabled with LLM_RESPONSE_CACHE_PATH="".
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and LLM_RESPONSE_CACHE_PATH:
+            try:
+                _cache = ResponseCache()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"LLM response cache disabled: {e}")
+                return None
+        return _cache
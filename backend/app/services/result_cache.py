@@ -0,0 +1,114 @@
+"""
+Persistent cache of complete analysis results.
+
+Results are keyed by the identity of the analyzed content (the commit SHA of
+a remote, or the SHA-256 of an uploaded archive), the identities of the
+models that produced them, and the pipeline version. A job whose key is
+already cached completes immediately with the stored result instead of
+running the pipeline again.
+
+Bumping ANALYSIS_CACHE_VERSION (or PIPELINE_VERSION in
+services.analysis_pipeline, when prompts or parsers change) makes every
+older entry unreachable; entries also expire after a TTL, and the table is
+bounded by evicting the least recently used rows.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import Sequence
+from typing import Any
+
+from .sqlite_cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "./data/analysis_cache.db")
+ANALYSIS_CACHE_TTL_SECONDS = int(
+    os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(30 * 24 * 3600))
+)
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+# Operator-controlled part of the cache version; change it to invalidate
+ANALYSIS_CACHE_VERSION = os.getenv("ANALYSIS_CACHE_VERSION", "")
+
+
+class ResultCache(SQLiteCache):
+    """SQLite-backed analysis result cache shared by the API and workers."""
+
+    table = "results"
+    columns = ("content_id", "job_id", "result")
+    indexed = ("content_id",)
+    label = "Analysis cache"
+
+    def __init__(
+        self,
+        path: str = ANALYSIS_CACHE_PATH,
+        ttl_seconds: int = ANALYSIS_CACHE_TTL_SECONDS,
+        max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path, ttl_seconds, max_entries)
+
+    @staticmethod
+    def make_key(content_id: str, models: Sequence[str], version: str) -> str:
+        """Hash the content identity, model identities and pipeline version."""
+        payload = json.dumps(
+            {
+                "content": content_id,
+                "models": sorted(models),
+                "version": version,
+                "salt": ANALYSIS_CACHE_VERSION,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _decode(self, values: tuple[Any, ...]) -> tuple[str, dict[str, Any]]:
+        _, job_id, result = values
+        return job_id, json.loads(result)
+
+    def get(self, key: str) -> tuple[str, dict[str, Any]] | None:
+        """
+        Return the cached (job id, result) for ``key`` if present and not
+        expired.
+        """
+        return super().get(key)
+
+    def put(
+        self, key: str, content_id: str, job_id: str, result: dict[str, Any]
+    ) -> None:
+        """Store a job's result and trim the table to ``max_entries``."""
+        self._put(key, content_id, job_id, json.dumps(result))
+
+    def invalidate(self, content_id: str | None = None) -> int:
+        """
+        Delete the cached results of one content identity, or all of them.
+
+        Returns:
+            Number of deleted entries
+        """
+        if content_id is None:
+            return self.clear()
+        return self._delete_where("content_id", content_id)
+
+
+_cache: ResultCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache | None:
+    """
+    Return the process-wide result cache, or None if it cannot be opened or
+    has been disabled with ANALYSIS_CACHE_PATH="".
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and ANALYSIS_CACHE_PATH:
+            try:
+                _cache = ResultCache()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Analysis result cache disabled: {e}")
+                return None
+        return _cache
@@ -0,0 +1,335 @@
+"""
+Speculative decoding for code-grounded generations.
+
+File descriptions and answers about code mostly repeat identifiers, paths
+and phrases that already appear in the prompt. Speculative decoding lets a
+cheap drafter propose the next few tokens and has the model verify them in
+a single evaluation pass; every accepted draft token is a token generated
+without a pass of its own. Two drafters are supported: prompt-lookup
+(continuations of the latest n-gram found earlier in the context, free to
+compute) and an optional small draft GGUF sharing the model's vocabulary.
+
+Models must be loaded with speculative support (LLM_SPECULATIVE), which
+keeps logits for every evaluated position. Call sites then opt in per call;
+LLM_SPECULATIVE_SITES lists the sites that do. Measure the effect with:
+
+    python -m backend.app.services.speculative --model model.gguf [repo ...]
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import numpy as np
+
+from .metrics import get_inference_metrics
+
+logger = logging.getLogger(__name__)
+
+# Load models with speculative decoding support (keeps logits for every
+# position, which costs n_ctx * n_vocab floats of memory)
+LLM_SPECULATIVE = os.getenv("LLM_SPECULATIVE", "false").lower() == "true"
+# Optional small GGUF used as drafter instead of prompt lookup
+LLM_DRAFT_MODEL_PATH = os.getenv("LLM_DRAFT_MODEL_PATH") or None
+# Tokens proposed per draft
+LLM_DRAFT_TOKENS = int(os.getenv("LLM_DRAFT_TOKENS", "10"))
+# Longest n-gram matched by prompt lookup
+LLM_LOOKUP_NGRAM = int(os.getenv("LLM_LOOKUP_NGRAM", "3"))
+# Call sites that request speculative decoding
+LLM_SPECULATIVE_SITES = {
+    site.strip()
+    for site in os.getenv("LLM_SPECULATIVE_SITES", "descriptions,chat").split(",")
+    if site.strip()
+}
+
+BENCHMARK_MAX_TOKENS = 100
+BENCHMARK_FILES = 8
+BENCHMARK_EXTENSIONS = (".py", ".js", ".ts", ".tsx", ".go", ".rs", ".java")
+BENCHMARK_SKIP_DIRS = {"node_modules", "__pycache__", "venv"}
+
+# Prompt used by the benchmark, mirroring the worker's file descriptions
+_DESCRIPTION_PROMPT = """Analyze the code file below and provide a 1-2 sentence description of its purpose and key functionality.
+
+File: {path}
+
+Code snippet (first 1500 chars):
+{code}
+
+Description:"""
+
+
+def speculative_for(site: str) -> bool:
+    """Whether call site ``site`` (e.g. "chat") requests speculative decoding."""
+    return site in LLM_SPECULATIVE_SITES
+
+
+def prompt_lookup(
+    input_ids: np.ndarray,
+    max_ngram: int = LLM_LOOKUP_NGRAM,
+    num_pred_tokens: int = LLM_DRAFT_TOKENS,
+) -> np.ndarray:
+    """
+    Draft the tokens that followed the latest occurrence of the context's
+    trailing n-gram, trying the longest n-gram first.
+    """
+    length = len(input_ids)
+    for size in range(min(max_ngram, length - 1), 0, -1):
+        windows = np.lib.stride_tricks.sliding_window_view(input_ids[:-1], size)
+        matches = np.nonzero(np.all(windows == input_ids[-size:], axis=1))[0]
+        # The most recent match is the most likely continuation
+        for start in matches[::-1] + size:
+            if start < length:
+                return np.asarray(
+                    input_ids[start : start + num_pred_tokens], dtype=np.intc
+                )
+    return np.array([], dtype=np.intc)
+
+
+class PromptLookupDraft:
+    """llama.cpp draft model proposing continuations copied from the context."""
+
+    def __init__(
+        self, max_ngram: int = LLM_LOOKUP_NGRAM, num_pred_tokens: int = LLM_DRAFT_TOKENS
+    ):
+        self.max_ngram = max_ngram
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        return prompt_lookup(input_ids, self.max_ngram, self.num_pred_tokens)
+
+
+class DraftModel:
+    """llama.cpp draft model running a small GGUF greedily."""
+
+    def __init__(self, llama: Any, num_pred_tokens: int = LLM_DRAFT_TOKENS):
+        self.llama = llama
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        drafted: list[int] = []
+        try:
+            # Llama.generate reuses the KV cache for the shared prefix, so
+            # each draft only evaluates the tokens accepted since the last
+            for token in self.llama.generate(input_ids.tolist(), temp=0.0):
+                drafted.append(token)
+                if len(drafted) >= self.num_pred_tokens:
+                    break
+        except (RuntimeError, ValueError) as e:
+            logger.debug(f"Draft model failed, continuing without a draft: {e}")
+        return np.array(drafted, dtype=np.intc)
+
+
+@dataclass
+class DraftStats:
+    """Cumulative speculative decoding statistics."""
+
+    generations: int = 0
+    generated: int = 0
+    drafted: int = 0
+    accepted: int = 0
+    passes: int = 0
+
+    @property
+    def acceptance_rate(self) -> float | None:
+        return self.accepted / self.drafted if self.drafted else None
+
+    @property
+    def tokens_per_pass(self) -> float | None:
+        return self.generated / self.passes if self.passes else None
+
+    def to_dict(self) -> dict[str, Any]:
+        result = asdict(self)
+        result["acceptance_rate"] = self.acceptance_rate
+        result["tokens_per_pass"] = self.tokens_per_pass
+        return result
+
+
+class SpeculativeDrafter:
+    """
+    Drafter wrapper that accounts for accepted draft tokens.
+
+    llama.cpp does not report acceptance, but every evaluation pass after
+    the prompt is preceded by exactly one draft, and each pass yields one
+    sampled token plus the draft tokens it accepted. Accepted tokens are
+    therefore ``generated - (drafts + 1)``. Each generation counts its
+    drafts in its own DraftCall, so concurrent generations never mix their
+    counts; only the totals in ``stats`` are shared.
+    """
+
+    def __init__(self, draft: Any):
+        self.draft = draft
+        self.stats = DraftStats()
+        self._lock = threading.Lock()
+
+    def start(self) -> "DraftCall":
+        """Begin a generation; attach the returned call as the draft model."""
+        return DraftCall(self)
+
+    def _record(self, drafts: int, drafted: int, generated: int) -> int:
+        passes = min(generated, drafts + 1)
+        accepted = max(0, min(drafted, generated - passes))
+        with self._lock:
+            self.stats.generations += 1
+            self.stats.generated += generated
+            self.stats.drafted += drafted
+            self.stats.accepted += accepted
+            self.stats.passes += passes
+
+        metrics = get_inference_metrics()
+        metrics.increment("speculative", "drafted", drafted)
+        metrics.increment("speculative", "accepted", accepted)
+        return accepted
+
+
+class DraftCall:
+    """The drafts proposed during one generation of a SpeculativeDrafter."""
+
+    def __init__(self, drafter: SpeculativeDrafter):
+        self.drafter = drafter
+        self.drafts = 0
+        self.drafted = 0
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        tokens = self.drafter.draft(input_ids, **kwargs)
+        self.drafts += 1
+        self.drafted += len(tokens)
+        return tokens
+
+    def finish(self, generated: int) -> int:
+        """Record the finished generation; returns the accepted draft tokens."""
+        return self.drafter._record(self.drafts, self.drafted, generated)
+
+
+def build_drafter(
+    draft_model_path: str | None = None,
+    n_ctx: int = 4096,
+    n_threads: int = 4,
+) -> SpeculativeDrafter:
+    """Drafter from a small GGUF when given, prompt lookup otherwise."""
+    if draft_model_path:
+        from llama_cpp import Llama
+
+        logger.info(f"Loading draft model from {draft_model_path}...")
+        draft = Llama(
+            model_path=draft_model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            verbose=False,
+        )
+        return SpeculativeDrafter(DraftModel(draft))
+    return SpeculativeDrafter(PromptLookupDraft())
+
+
+def sample_prompts(repo_path: str, limit: int = BENCHMARK_FILES) -> list[str]:
+    """File description prompts for the first ``limit`` source files of a repo."""
+    prompts = []
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith(".") and d not in BENCHMARK_SKIP_DIRS
+        )
+        for name in sorted(files):
+            if not name.endswith(BENCHMARK_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    code = f.read(1500)
+            except OSError:
+                continue
+            if code.strip():
+                rel_path = os.path.relpath(path, repo_path)
+                prompts.append(_DESCRIPTION_PROMPT.format(path=rel_path, code=code))
+            if len(prompts) >= limit:
+                return prompts
+    return prompts
+
+
+def benchmark_speculative(
+    llm: Any, prompts: list[str], max_tokens: int = BENCHMARK_MAX_TOKENS
+) -> dict[str, Any]:
+    """
+    Generate every prompt with and without speculation and compare.
+
+    Generation is greedy, so both runs produce the same text and the
+    comparison measures decoding speed only.
+
+    Args:
+        llm: LocalLLM loaded with speculative support
+        prompts: Prompts to generate
+        max_tokens: Maximum tokens per generation
+
+    Returns:
+        Tokens/sec of both modes, the speedup and draft acceptance
+    """
+    drafter = llm.drafter
+    if drafter is None:
+        raise ValueError("Model was not loaded with speculative decoding support")
+
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    before = DraftStats(**asdict(drafter.stats))
+    for prompt in prompts:
+        for speculative in (False, True):
+            start = time.perf_counter()
+            text = llm.generate(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=0.0,
+                cache=False,
+                speculative=speculative,
+            )
+            totals[speculative][0] += llm.count_tokens(text)
+            totals[speculative][1] += time.perf_counter() - start
+
+    after = drafter.stats
+    drafted = after.drafted - before.drafted
+    accepted = after.accepted - before.accepted
+    baseline = totals[False][0] / totals[False][1] if totals[False][1] else 0.0
+    speculative = totals[True][0] / totals[True][1] if totals[True][1] else 0.0
+    return {
+        "prompts": len(prompts),
+        "baseline_tokens_per_second": baseline,
+        "speculative_tokens_per_second": speculative,
+        "speedup": speculative / baseline if baseline else None,
+        "drafted": drafted,
+        "accepted": accepted,
+        "acceptance_rate": accepted / drafted if drafted else None,
+        "tokens_per_pass": (
+            (after.generated - before.generated) / (after.passes - before.passes)
+            if after.passes > before.passes
+            else None
+        ),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure speculative decoding speedup on sample repositories."
+    )
+    parser.add_argument("repos", nargs="*", default=["."], help="Sample repositories")
+    parser.add_argument("--model", required=True, help="GGUF model to benchmark")
+    parser.add_argument("--draft-model", help="Small GGUF drafter (default: lookup)")
+    parser.add_argument("--files", type=int, default=BENCHMARK_FILES)
+    parser.add_argument("--max-tokens", type=int, default=BENCHMARK_MAX_TOKENS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from .llm_service import LocalLLM
+
+    llm = LocalLLM(args.model, speculative=True, draft_model_path=args.draft_model)
+    for repo in args.repos:
+        prompts = sample_prompts(repo, args.files)
+        if not prompts:
+            logger.warning(f"No source files found in {repo}")
+            continue
+        report = benchmark_speculative(llm, prompts, args.max_tokens)
+        print(json.dumps({"repo": repo, **report}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
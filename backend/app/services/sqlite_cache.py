@@ -0,0 +1,168 @@
+"""
+SQLite key-value store with TTL expiry and LRU eviction.
+
+Base of the persistent caches (LLM responses, analysis results). Each cache
+is one table keyed by a hash, with its own value columns; the database file
+is shared by the API and the Celery workers, so every call opens a
+short-lived connection and the journal runs in WAL mode. Entries expire
+after a TTL and the table is bounded by evicting the least recently used
+rows.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCache:
+    """
+    One SQLite table of ``key -> columns`` entries, safe to share across
+    threads and processes.
+
+    Subclasses name the table and its value columns (all TEXT), and turn
+    stored rows back into values in ``_decode``.
+    """
+
+    table = ""
+    columns: Sequence[str] = ()
+    # Value columns that get an index, for deleting by them
+    indexed: Sequence[str] = ()
+    label = "Cache"
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self._schema())
+
+    def _schema(self) -> str:
+        columns = "".join(f"    {column} TEXT NOT NULL,\n" for column in self.columns)
+        schema = (
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n"
+            f"    key TEXT PRIMARY KEY,\n{columns}"
+            f"    created_at REAL NOT NULL,\n    last_access REAL NOT NULL\n);\n"
+        )
+        for column in ("last_access", *self.indexed):
+            schema += (
+                f"CREATE INDEX IF NOT EXISTS {self.table}_{column} "
+                f"ON {self.table} ({column});\n"
+            )
+        return schema
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per call keeps this safe across threads;
+        # the timeout covers writers in other processes holding the lock.
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _decode(self, values: tuple[Any, ...]) -> Any:
+        """Value returned by ``get`` for a row's value columns."""
+        return values
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for ``key`` if present and not expired."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    f"SELECT {', '.join(self.columns)}, created_at "
+                    f"FROM {self.table} WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row and now - row[-1] <= self.ttl_seconds:
+                    value = self._decode(row[:-1])
+                    conn.execute(
+                        f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                        (now, key),
+                    )
+                    with self._lock:
+                        self._stats["hits"] += 1
+                    return value
+                if row:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"{self.label} read failed: {e}")
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _put(self, key: str, *values: str) -> None:
+        """Store the value columns of ``key`` and trim to ``max_entries``."""
+        now = time.time()
+        names = ", ".join(("key", *self.columns, "created_at", "last_access"))
+        marks = ", ".join("?" * (len(self.columns) + 3))
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} ({names}) VALUES ({marks})",
+                    (key, *values, now, now),
+                )
+                evicted = self._evict(conn, now)
+            with self._lock:
+                self._stats["writes"] += 1
+                self._stats["evictions"] += evicted
+        except sqlite3.Error as e:
+            logger.warning(f"{self.label} write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        evicted = conn.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ?",
+            (now - self.ttl_seconds,),
+        ).rowcount
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            evicted += conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                f"{self.table} ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        return evicted
+
+    def _delete_where(self, column: str, value: str) -> int:
+        """Delete the entries whose indexed ``column`` equals ``value``."""
+        if column not in self.indexed:
+            raise ValueError(f"{self.table} is not indexed by {column}")
+        with self._connect() as conn:
+            return conn.execute(
+                f"DELETE FROM {self.table} WHERE {column} = ?", (value,)
+            ).rowcount
+
+    def clear(self) -> int:
+        """Delete every entry; returns the number deleted."""
+        with self._connect() as conn:
+            return conn.execute(f"DELETE FROM {self.table}").rowcount
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        try:
+            with self._connect() as conn:
+                (stats["entries"],) = conn.execute(
+                    f"SELECT COUNT(*) FROM {self.table}"
+                ).fetchone()
+        except sqlite3.Error:
+            stats["entries"] = None
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
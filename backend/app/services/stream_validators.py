@@ -0,0 +1,114 @@
+"""
+Early-abort validation of streamed LLM output.
+
+Some generations are clearly unusable long before they finish: the model
+echoes template placeholders, loops on the same phrase, or spends far more
+than a section's share of the budget on one section. A streaming validator
+inspects the partial output after every decoded chunk and names the problem
+as soon as it appears; ``LocalLLM.generate`` then stops decoding and raises
+GenerationAborted, so the caller can switch to its fallback without paying
+for the remaining tokens.
+
+A validator is a callable ``(text, tokens) -> Optional[str]`` receiving the
+output so far and the number of chunks (roughly tokens) decoded; it returns
+a reason to abort, or None to continue.
+"""
+
+import os
+import re
+from collections.abc import Callable, Sequence
+
+from .overview_grammar import REQUIRED_OVERVIEW_SECTIONS, section_token_caps
+
+# Validate the overview while it streams and abort unusable generations
+LLM_STREAM_VALIDATION = os.getenv("LLM_STREAM_VALIDATION", "true").lower() == "true"
+
+Validator = Callable[[str, int], str | None]
+
+# Unfinished template markers such as <SECTION_NAME>
+PLACEHOLDER_PATTERN = re.compile(r"<[A-Z_\s]+>")
+# Only the tail is scanned on every chunk; earlier text was already checked
+PLACEHOLDER_WINDOW = 64
+
+# Output whose last REPETITION_WINDOW characters repeat with a period of at
+# most REPETITION_MAX_PERIOD characters is looping
+REPETITION_WINDOW = 240
+REPETITION_MAX_PERIOD = 60
+# Identical consecutive non-blank lines tolerated before aborting
+REPEATED_LINES = 3
+
+
+class GenerationAborted(Exception):
+    """A streaming validator rejected a generation before it finished."""
+
+    def __init__(self, reason: str, text: str = "", tokens: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.text = text
+        self.tokens = tokens
+
+
+def placeholder_validator(text: str, tokens: int) -> str | None:
+    """Abort on template placeholders such as ``<SECTION_NAME>``."""
+    match = PLACEHOLDER_PATTERN.search(text[-PLACEHOLDER_WINDOW:])
+    return f"template placeholder {match.group(0)}" if match else None
+
+
+def repetition_validator(text: str, tokens: int) -> str | None:
+    """Abort when the output loops on a short phrase or a repeated line."""
+    if len(text) >= REPETITION_WINDOW:
+        tail = text[-REPETITION_WINDOW:]
+        for period in range(1, REPETITION_MAX_PERIOD + 1):
+            if tail[period:] == tail[:-period]:
+                return f"repeating a {period}-character pattern"
+
+    # Only complete lines are compared
+    lines = [line.strip() for line in text.split("\n")[:-1] if line.strip()]
+    last = lines[-REPEATED_LINES:]
+    if len(last) == REPEATED_LINES and len(set(last)) == 1:
+        return f"line repeated {REPEATED_LINES} times: {last[0][:40]!r}"
+    return None
+
+
+class SectionBudget:
+    """
+    Abort when one markdown section outgrows its token budget.
+
+    Tokens are counted from the chunk in which a section's header first
+    appears; text before the first header is not limited.
+    """
+
+    def __init__(self, headers: Sequence[str], caps: Sequence[int]):
+        self.headers = list(headers)
+        self.caps = list(caps)
+        self._section: int | None = None
+        self._started_at = 0
+        self._offset = 0
+
+    def __call__(self, text: str, tokens: int) -> str | None:
+        first = 0 if self._section is None else self._section + 1
+        for index in range(first, len(self.headers)):
+            position = text.find(self.headers[index], self._offset)
+            if position >= 0:
+                self._section = index
+                self._started_at = tokens
+                self._offset = position
+        if self._section is None:
+            return None
+
+        used = tokens - self._started_at
+        if used > self.caps[self._section]:
+            return (
+                f"section {self.headers[self._section]} exceeded its "
+                f"{self.caps[self._section]}-token budget"
+            )
+        return None
+
+
+def overview_validators(max_tokens: int) -> list[Validator]:
+    """Validators for a repository overview generated within ``max_tokens``."""
+    return [
+        placeholder_validator,
+        repetition_validator,
+        SectionBudget(REQUIRED_OVERVIEW_SECTIONS, section_token_caps(max_tokens)),
+    ]
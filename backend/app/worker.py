@@ -1,28 +1,57 @@
 # backend/app/worker.py
+import logging
 import os
-import re
+import time
 import uuid
-import logging
-from collections import Counter
 from contextlib import contextmanager
 
-from sqlmodel import create_engine, Session
-
-from celery import Celery
+from celery import Celery, chain, chord
+from celery.exceptions import SoftTimeLimitExceeded
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, create_engine
+
+from backend.app.services.analysis_pipeline import (
+    CLONE_TIMEOUT_SECONDS,
+    INFERENCE_STAGES,
+    Baseline,
+    FetchedRepo,
+    FetchError,
+    JobSpec,
+    ParsedRepo,
+    ScannedRepo,
+    StageOutcome,
+    assemble_result,
+    cached_result,
+    carried_outcome,
+    cleanup_checkout,
+    cleanup_job_checkouts,
+    clear_checkpoints,
+    fetch_repository,
+    load_stage_outcome,
+    parse_repository,
+    read_sources,
+    resolve_content_id,
+    resume_point,
+    route_stage_pools,
+    run_inference_stage,
+    save_checkpoint,
+    save_stage_outcome,
+    scan_repository,
+    select_baseline,
+    stage_model_path,
+    store_result,
+)
+from backend.app.services.gguf_inspector import GGUFError, inspect_gguf
+from backend.app.services.git_mirror import (
+    GIT_FETCH_TIMEOUT_SECONDS,
+    get_mirror_cache,
+)
+from backend.app.services.stream_validators import GenerationAborted
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("repoinsight.worker")
 
-REQUIRED_OVERVIEW_SECTIONS = [
-    "**Project Snapshot**",
-    "**Architecture Map**",
-    "**Component Deep Dive**",
-    "**Technology Stack**",
-    "**Operational Considerations**",
-    "**Recommended Next Actions**",
-]
-
 # --- Celery Setup (env defaults to Redis for dev, fallback to database on Windows) ---
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
@@ -46,6 +75,32 @@ celery_app = Celery(
     include=["backend.app.worker"],
 )
 
+# --- Pipeline routing ---
+# Queues of the analysis stages. Both default to Celery's default queue, so a
+# single worker runs everything; point them at separate queues to run
+# clone/scan/parse on CPU workers and the LLM stages on inference workers
+PIPELINE_CPU_QUEUE = os.getenv("PIPELINE_CPU_QUEUE", "celery")
+PIPELINE_INFERENCE_QUEUE = os.getenv("PIPELINE_INFERENCE_QUEUE", "celery")
+# Retries of a failing stage, and the time limit of one inference stage
+PIPELINE_MAX_RETRIES = int(os.getenv("PIPELINE_MAX_RETRIES", "2"))
+PIPELINE_STAGE_TIME_LIMIT = int(os.getenv("PIPELINE_STAGE_TIME_LIMIT", "1800"))
+# Earlier completed jobs of a repository considered as incremental baseline
+BASELINE_CANDIDATES = 20
+
+celery_app.conf.task_routes = {
+    "backend.app.worker.analyze_repository_task": {"queue": PIPELINE_CPU_QUEUE},
+    "backend.app.worker.fetch_stage": {"queue": PIPELINE_CPU_QUEUE},
+    "backend.app.worker.scan_stage": {"queue": PIPELINE_CPU_QUEUE},
+    "backend.app.worker.parse_stage": {"queue": PIPELINE_CPU_QUEUE},
+    "backend.app.worker.summarize_stage": {"queue": PIPELINE_INFERENCE_QUEUE},
+    "backend.app.worker.assess_stage": {"queue": PIPELINE_INFERENCE_QUEUE},
+    "backend.app.worker.describe_stage": {"queue": PIPELINE_INFERENCE_QUEUE},
+    "backend.app.worker.persist_stage": {"queue": PIPELINE_INFERENCE_QUEUE},
+}
+# The chord's errback also covers its header tasks (and silences Celery's
+# pending-deprecation warning for the old body-only behaviour)
+celery_app.conf.task_allow_error_cb_on_chord_header = True
+
 # --- Database Setup (use sqlmodel for compatibility) ---
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./repoinsight.db")
@@ -67,110 +122,282 @@ def get_db():
         db.close()
 
 
-def _build_fallback_overview(
-    repo_name: str,
-    file_count: int,
-    languages: set[str],
-    directories: list[tuple[str, int]],
-    key_files: list[str],
-) -> str:
-    """Return deterministic, structured overview when LLM output is unusable."""
+def _update_job(job_id: str, status, progress: int, result: dict | None = None):
+    """Set a job's status, progress and (optionally) result."""
+    from backend.app.models import Job
 
-    language_summary = (
-        ", ".join(sorted(languages)) if languages else "multiple languages"
+    try:
+        with get_db() as db:
+            job = db.get(Job, uuid.UUID(job_id))
+            if not job:
+                logger.error("[%s] Job not found in database.", job_id)
+                return
+            job.status = status
+            job.progress = progress
+            if result is not None:
+                job.result = result
+            # update timestamp if you have such a column (use SQLModel defaults)
+            db.add(job)
+            db.commit()
+            logger.info(
+                "[%s] Updated status=%s progress=%s", job_id, status.value, progress
+            )
+    except Exception as e:
+        logger.exception("[%s] Failed to update job status: %s", job_id, e)
+
+
+def _persist_result(parsed: ParsedRepo, outcomes: list) -> dict:
+    """Assemble the job result, index the code for chat and complete the job."""
+    from backend.app.models import JobStatus
+    from backend.app.services.embedding_index import (
+        RAG_INDEX_MAX_FILE_BYTES,
+        build_job_index,
     )
-    dir_names = ", ".join(name for name, _ in directories) if directories else "root"
+    from backend.app.services.response_cache import get_response_cache
+
+    job_id = parsed.job_id
+    graph_json = assemble_result(parsed, outcomes)
 
-    component_lines = (
-        "\n".join(
-            f"{idx + 1}. {name} – approx {count} files"
-            for idx, (name, count) in enumerate(directories[:3])
+    response_cache = get_response_cache()
+    if response_cache:
+        logger.info("[%s] Response cache stats: %s", job_id, response_cache.stats())
+    mirrors = get_mirror_cache()
+    if mirrors:
+        logger.info("[%s] Git mirror stats: %s", job_id, mirrors.stats())
+
+    # Embedding index for retrieval-augmented chat over the job's code, read
+    # from the checkout before it is cleaned up; chat falls back to
+    # client-supplied context without it
+    try:
+        indexed = build_job_index(
+            job_id, read_sources(parsed, RAG_INDEX_MAX_FILE_BYTES)
         )
-        if directories
-        else "1. Root – mixture of application files and assets"
+        if indexed is not None:
+            graph_json["retrieval_chunks"] = indexed
+            logger.info("[%s] Indexed %d chunks for retrieval", job_id, indexed)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning("[%s] Could not build the retrieval index: %s", job_id, e)
+
+    store_result(parsed, graph_json)
+
+    # Save result and mark completed
+    _update_job(job_id, JobStatus.COMPLETED, 100, result=graph_json)
+    logger.info(
+        "[%s] Analysis completed with %d nodes and %d edges.",
+        job_id,
+        len(parsed.nodes),
+        len(parsed.edges),
     )
 
-    key_file_lines = (
-        "\n".join(f"- {path}" for path in key_files[:5])
-        if key_files
-        else "- Inspect README.md, package.json, or main application entry points"
+    # Clean up temporary directory if it was created for git clone, and the
+    # stage checkpoints a retry would have resumed from
+    cleanup_checkout(parsed.fetched)
+    clear_checkpoints(job_id)
+    return {"job_id": job_id, "status": "completed"}
+
+
+# --- Pipeline stages ---
+# fetch/scan/parse run on the CPU queue and read the checkout, so those
+# workers must share its filesystem; the inference stages and persist run on
+# the inference queue and only receive the parse artifact. Artifacts travel
+# between tasks as dicts (see services.analysis_pipeline) and are checkpointed
+# when a stage finishes, so a retried job resumes after its last stage.
+
+_IO_RETRY = {
+    "autoretry_for": (OSError, FetchError),
+    "retry_backoff": True,
+    "retry_backoff_max": 60,
+    "max_retries": PIPELINE_MAX_RETRIES,
+}
+
+
+@celery_app.task(
+    **_IO_RETRY,
+    # A failing mirror update may be followed by a direct clone
+    soft_time_limit=CLONE_TIMEOUT_SECONDS + GIT_FETCH_TIMEOUT_SECONDS + 30,
+    time_limit=CLONE_TIMEOUT_SECONDS + GIT_FETCH_TIMEOUT_SECONDS + 60,
+)
+def fetch_stage(job: dict) -> dict:
+    """Clone the repository (or pick up the upload) of a job."""
+    fetched = fetch_repository(JobSpec.from_dict(job))
+    save_checkpoint("fetch", fetched)
+    return fetched.to_dict()
+
+
+@celery_app.task(**_IO_RETRY, soft_time_limit=300, time_limit=330)
+def scan_stage(fetched: dict) -> dict:
+    """Inventory the checkout."""
+    scanned = scan_repository(FetchedRepo.from_dict(fetched))
+    logger.info("[%s] Scanned %d files", scanned.job_id, len(scanned.all_files))
+    save_checkpoint("scan", scanned)
+    return scanned.to_dict()
+
+
+@celery_app.task(bind=True, **_IO_RETRY, soft_time_limit=300, time_limit=330)
+def parse_stage(self, scanned: dict):
+    """Read file contents, then fan out to the inference stages."""
+    from backend.app.models import JobStatus
+
+    parsed = parse_repository(ScannedRepo.from_dict(scanned))
+    logger.info(
+        "[%s] Analyzed %d files (%d with content) in repository",
+        parsed.job_id,
+        len(parsed.all_files),
+        len(parsed.file_contents),
+    )
+    save_checkpoint("parse", parsed)
+    _update_job(parsed.job_id, JobStatus.EXPLAINING, 65)
+    # The chord inherits this task's errback; its result becomes this task's
+    return self.replace(_inference_chord(parsed.to_dict()))
+
+
+def _inference_chord(parsed: dict):
+    """The inference stages of a parsed repository, followed by persist."""
+    return chord(
+        [
+            summarize_stage.s(parsed),
+            assess_stage.s(parsed),
+            describe_stage.s(parsed),
+        ],
+        persist_stage.s(parsed),
     )
 
-    return f"""**Project Snapshot**
-- Purpose: Automated fallback summary for {repo_name}. Review README or docs for exact domain details.
-- Primary technologies: {language_summary}
-- Entry points: {directories[0][0] if directories else 'Project root'}
 
-**Architecture Map**
-- Structure: {repo_name} contains {file_count} tracked files with top-level folders {dir_names or 'root files only'}.
-- Key modules & responsibilities:
-{component_lines}
-- Data / control flow: Inspect API routes or Next.js pages to trace requests through the system.
+def _run_inference_stage(task, stage: str, artifact: dict) -> dict:
+    """
+    Run an inference stage, retrying transient failures.
 
-**Component Deep Dive**
-{component_lines}
+    Failures are returned as an error outcome once retries are used up, so
+    persist still completes the job with fallbacks; aborted or timed-out
+    generations are not retried.
+    """
+    from backend.app.services.llm_pool import get_llm_pool
+
+    parsed = ParsedRepo.from_dict(artifact)
+    finished = load_stage_outcome(parsed.job_id, stage)
+    if finished:
+        logger.info("[%s] %s stage resumed from its checkpoint", parsed.job_id, stage)
+        return finished.to_dict()
+
+    job_path = parsed.fetched.job.model_path
+    # Unchanged since the incremental baseline: no model needed
+    carried = carried_outcome(stage, parsed, stage_model_path(stage, job_path))
+    if carried:
+        return carried.to_dict()
+
+    model_path = stage_model_path(stage, job_path)
+    pool = get_llm_pool(model_path)
+    if not pool and model_path != job_path:
+        logger.warning(
+            "[%s] Could not load %s for %s, using the job model",
+            parsed.job_id,
+            model_path,
+            stage,
+        )
+        model_path = job_path
+        pool = get_llm_pool(model_path)
 
-Key files worth reviewing:
-{key_file_lines}
+    start = time.perf_counter()
+    try:
+        if not pool:
+            raise RuntimeError("Failed to initialize LLM model")
+        with pool.acquire() as backend:
+            value = run_inference_stage(stage, parsed, backend)
+            logger.info(
+                "[%s] Scheduler queue waits: %s",
+                parsed.job_id,
+                backend.scheduler.stats(),
+            )
+    except (GenerationAborted, SoftTimeLimitExceeded) as e:
+        outcome = StageOutcome.from_error(stage, e, model_path=model_path)
+    except Exception as e:  # noqa: BLE001 - any failure retries, then falls back
+        if task.request.retries < task.max_retries:
+            logger.warning(
+                "[%s] %s stage failed, retrying: %s", parsed.job_id, stage, e
+            )
+            raise task.retry(exc=e, countdown=2 ** (task.request.retries + 1))
+        outcome = StageOutcome.from_error(stage, e, model_path=model_path)
+    else:
+        outcome = StageOutcome(stage, value=value, model_path=model_path)
+    outcome.seconds = time.perf_counter() - start
+    save_stage_outcome(parsed.job_id, outcome)
+    logger.info(
+        "[%s] %s stage finished in %.1fs", parsed.job_id, stage, outcome.seconds
+    )
+    return outcome.to_dict()
 
-**Technology Stack**
-- Frameworks & libraries: Derived from package manifests (e.g., Next.js/React, Prisma, auth libraries).
-- Tooling / build pipeline: Node.js scripts plus lint/test tooling defined in package.json.
-- External integrations: Refer to API clients or .env usage for upstream services (e.g., authentication, email, analytics).
 
-**Operational Considerations**
-- Performance or scalability notes: Review data-heavy routes and Prisma queries for pagination/caching opportunities.
-- Security / compliance notes: Harden authentication flows, secrets management, and environment separation.
-- Testing & observability state: Confirm unit/integration coverage and logging around critical workflows.
+_INFERENCE_OPTIONS = {
+    "bind": True,
+    "max_retries": PIPELINE_MAX_RETRIES,
+    "soft_time_limit": PIPELINE_STAGE_TIME_LIMIT,
+    "time_limit": PIPELINE_STAGE_TIME_LIMIT + 60,
+}
 
-**Recommended Next Actions**
-1. Audit README/package.json to confirm project purpose and run instructions.
-2. Trace primary user flows through top directories ({dir_names or 'root'}) to map dependencies.
-3. Document deployment/runtime requirements (env vars, build commands, infrastructure)."""
 
+@celery_app.task(**_INFERENCE_OPTIONS)
+def summarize_stage(self, parsed: dict) -> dict:
+    """Generate the repository overview."""
+    return _run_inference_stage(self, "overview", parsed)
 
-def _has_placeholder_tokens(text: str) -> bool:
-    """Detect unfinished template markers in LLM output."""
-    if not text or not text.strip():
-        return True
 
-    placeholder_tokens = [
-        "<SECTION_NAME>",
-        "<SUBSECTION_NAME>",
-        "<DETAILED_DESCRIPTION>",
-    ]
-    if any(token in text for token in placeholder_tokens):
-        return True
+@celery_app.task(**_INFERENCE_OPTIONS)
+def assess_stage(self, parsed: dict) -> dict:
+    """Generate the vulnerability analysis."""
+    return _run_inference_stage(self, "vulnerability", parsed)
 
-    # Generic catch-all for ALL CAPS tags often left by unfinished templates
-    return bool(re.search(r"<[A-Z_\s]+>", text))
 
+@celery_app.task(**_INFERENCE_OPTIONS)
+def describe_stage(self, parsed: dict) -> dict:
+    """Generate the per-file descriptions."""
+    return _run_inference_stage(self, "descriptions", parsed)
 
-def _missing_required_sections(text: str) -> bool:
-    """Ensure structured overview headings are present."""
-    if not text:
-        return True
-    return any(section not in text for section in REQUIRED_OVERVIEW_SECTIONS)
+
+@celery_app.task(**_IO_RETRY, soft_time_limit=600, time_limit=660)
+def persist_stage(outcomes: list, parsed: dict) -> dict:
+    """Store the result of the inference stages and complete the job."""
+    return _persist_result(
+        ParsedRepo.from_dict(parsed),
+        [StageOutcome.from_dict(outcome) for outcome in outcomes],
+    )
 
 
-# --- The Celery task (lazy imports inside the task) ---
 @celery_app.task()
+def pipeline_failed(request, exc, traceback, job_id: str):
+    """Errback of the pipeline: mark the job failed and remove its clone."""
+    from backend.app.models import JobStatus
+
+    logger.error("[%s] Error during analysis: %s", job_id, exc)
+    _update_job(job_id, JobStatus.FAILED, 0, result={"error": str(exc)})
+    cleanup_job_checkouts(job_id)
+
+
+# --- The Celery task (lazy imports inside the task) ---
+@celery_app.task(bind=True)
 def analyze_repository_task(
+    self,
     job_id: str,
     model_id: str = "llama-3.2-1b",
-    model_path: str = None,
-    local_path: str = None,
+    model_path: str | None = None,
+    local_path: str | None = None,
+    content_id: str | None = None,
 ):
     """
     Analyze a repository and update Job status/result in the DB.
     Validates model configuration before processing.
     Lazy-imports models to avoid circular import issues at module import time.
 
+    On a worker the analysis is dispatched as the staged pipeline
+    (fetch -> scan -> parse -> inference stages -> persist); called directly
+    (e.g. ``task.run`` when no broker is available) it runs in-process.
+
     Args:
         job_id: UUID string of the job
         model_id: Model identifier (default: llama-3.2-1b)
         model_path: Path to local GGUF model file (required)
         local_path: Optional path to already-extracted local repository
+        content_id: Optional identity of an uploaded archive
+            ("archive:<sha256>"), for the result cache
     """
     # Lazy import to avoid circular dependencies at worker startup
     from backend.app.models import Job, JobStatus  # SQLModel models
@@ -179,24 +406,7 @@ def analyze_repository_task(
     logger.info("[%s] Task started with model_id=%s", job_id, model_id)
 
     def update_status(status: JobStatus, progress: int, result: dict | None = None):
-        try:
-            with get_db() as db:
-                job = db.get(Job, job_uuid)
-                if not job:
-                    logger.error("[%s] Job not found in database.", job_id)
-                    return
-                job.status = status
-                job.progress = progress
-                if result is not None:
-                    job.result = result
-                # update timestamp if you have such a column (use SQLModel defaults)
-                db.add(job)
-                db.commit()
-                logger.info(
-                    "[%s] Updated status=%s progress=%s", job_id, status.value, progress
-                )
-        except Exception as e:
-            logger.exception("[%s] Failed to update job status: %s", job_id, e)
+        _update_job(job_id, status, progress, result)
 
     try:
         # Validate model configuration - all models now require a path
@@ -265,481 +475,241 @@ def analyze_repository_task(
             update_status(JobStatus.FAILED, 0, result={"error": error_msg})
             return {"job_id": job_id, "status": "failed", "error": error_msg}
 
-        logger.info(
-            "[%s] Model validated: %s (%s bytes)", job_id, resolved_path, size_bytes
-        )
-
-        # Initialize LLM
-        from backend.app.services.llm_service import get_llm_instance
-
-        logger.info("[%s] Initializing LLM...", job_id)
-        llm = get_llm_instance(resolved_path)
-
-        if not llm:
-            error_msg = "Failed to initialize LLM model"
+        # Catch corrupt or unusable files from their header before a slow load
+        try:
+            model_info = inspect_gguf(resolved_path)
+            error_msg = None
+            if not model_info.generative:
+                error_msg = (
+                    f"Model architecture {model_info.architecture} "
+                    "cannot generate text"
+                )
+        except (GGUFError, OSError) as e:
+            error_msg = f"Invalid model file {resolved_path}: {e}"
+        if error_msg:
             logger.error("[%s] %s", job_id, error_msg)
             update_status(JobStatus.FAILED, 0, result={"error": error_msg})
             return {"job_id": job_id, "status": "failed", "error": error_msg}
 
-        logger.info("[%s] LLM initialized successfully", job_id)
-
-        # Step 1: Get repository info and analyze all files
-        update_status(JobStatus.PARSING, 20)
-        logger.info("[%s] Cloning and analyzing repository...", job_id)
+        logger.info(
+            "[%s] Model validated: %s (%s bytes, %s %s, context %s)",
+            job_id,
+            resolved_path,
+            size_bytes,
+            model_info.architecture,
+            model_info.quantization,
+            model_info.context_length,
+        )
 
         # Get job details for repo URL
         with get_db() as db:
             job = db.get(Job, job_uuid)
             repo_url = job.repo_url if job else "unknown"
+        spec = JobSpec(
+            job_id, model_id, resolved_path, repo_url, local_path, content_id
+        )
 
-        # Check if it's a local upload or needs cloning
-        if local_path and os.path.exists(local_path):
-            logger.info("[%s] Analyzing local upload: %s", job_id, local_path)
-            temp_dir = local_path
-            repo_name = (
-                repo_url.split(":")[-1].replace(".zip", "").replace(".tar.gz", "")
-            )
-            cleanup_temp = False  # Don't delete uploaded files immediately
-        else:
-            # Clone and analyze the actual repository
-            import tempfile
-            import subprocess
-
-            repo_name = repo_url.split("/")[-1].replace(".git", "")
-            temp_dir = tempfile.mkdtemp(prefix=f"repo_{job_id}_")
-            cleanup_temp = True
-
-            try:
-                # Clone the repository
-                logger.info("[%s] Cloning repository: %s", job_id, repo_url)
-                subprocess.run(
-                    ["git", "clone", "--depth", "1", repo_url, temp_dir],
-                    check=True,
-                    capture_output=True,
-                    timeout=300,  # 5 minute timeout
-                )
-            except subprocess.TimeoutExpired:
-                logger.error("[%s] Repository clone timed out", job_id)
-                raise Exception("Repository clone timed out after 5 minutes")
-            except subprocess.CalledProcessError as e:
-                logger.error(
-                    "[%s] Git clone failed: %s",
-                    job_id,
-                    e.stderr.decode() if e.stderr else str(e),
-                )
-                raise Exception(
-                    f"Failed to clone repository: {e.stderr.decode() if e.stderr else str(e)}"
+        # The same content analyzed with the same models completes from the
+        # result cache without running the pipeline
+        spec.content_id = resolve_content_id(spec)
+        cached = cached_result(spec)
+        if cached is not None:
+            return _complete_from_cache(spec, cached)
+        # Otherwise only what changed since the last analysis is redone
+        spec.baseline = _find_baseline(spec)
+
+        if not self.request.called_directly:
+            # A retried job continues after its last checkpointed stage
+            start, artifact = resume_point(spec)
+            if start == "infer":
+                update_status(JobStatus.EXPLAINING, 65)
+                pipeline = _inference_chord(artifact.to_dict())
+            else:
+                update_status(JobStatus.PARSING, 20)
+                stages = [fetch_stage, scan_stage, parse_stage]
+                stages = stages[["fetch", "scan", "parse"].index(start) :]
+                pipeline = chain(
+                    stages[0].s(artifact.to_dict()),
+                    *[stage.s() for stage in stages[1:]],
                 )
+            pipeline.apply_async(link_error=pipeline_failed.s(job_id))
+            logger.info("[%s] Analysis pipeline queued from %s", job_id, start)
+            return {"job_id": job_id, "status": "queued"}
 
-        # Analyze all files in the repository - OPTIMIZED
-        all_files = []
-        file_contents = {}
-        nodes = [{"id": repo_name, "label": repo_name, "type": "repository"}]
-        edges = []
-        directories_added = set()
-
-        # Important extensions for code analysis (prioritized)
-        CODE_EXTENSIONS = {
-            ".py",
-            ".js",
-            ".ts",
-            ".jsx",
-            ".tsx",
-            ".java",
-            ".go",
-            ".rs",
-            ".c",
-            ".cpp",
-            ".h",
-            ".cs",
-            ".php",
-            ".rb",
-            ".swift",
-            ".kt",
-        }
-        CONFIG_EXTENSIONS = {
-            ".json",
-            ".yaml",
-            ".yml",
-            ".toml",
-            ".xml",
-            ".ini",
-            ".env",
-            ".config",
-        }
-        DOC_EXTENSIONS = {".md", ".txt", ".rst"}
-
-        # Skip these directories for faster processing
-        SKIP_DIRS = {
-            ".git",
-            "node_modules",
-            "__pycache__",
-            "venv",
-            "env",
-            ".venv",
-            "dist",
-            "build",
-            "target",
-            ".idea",
-            ".vscode",
-            "coverage",
-        }
+        return _analyze_inline(spec, update_status)
 
-        # Limit file reading to avoid memory issues
-        MAX_FILE_SIZE = 50 * 1024  # 50KB max per file
-        MAX_FILES_TO_READ = 100  # Read content of max 100 files
-        files_read_count = 0
-
-        logger.info("[%s] Starting fast file analysis...", job_id)
-
-        for root, dirs, files in os.walk(temp_dir):
-            # Skip excluded directories (modify dirs in-place to prevent os.walk from descending)
-            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
-
-            rel_root = os.path.relpath(root, temp_dir)
-            if rel_root == ".":
-                rel_root = ""
-
-            # Add directory nodes
-            if rel_root and rel_root not in directories_added:
-                dir_id = rel_root.replace("\\", "/")
-                nodes.append(
-                    {
-                        "id": dir_id,
-                        "label": os.path.basename(dir_id) or dir_id,
-                        "type": "directory",
-                    }
-                )
+    except Exception as e:
+        logger.exception("[%s] Error during analysis: %s", job_id, e)
+        update_status(JobStatus.FAILED, 0, result={"error": str(e)})
+        # Re-raise so Celery marks task as failed if desired
+        raise
 
-                # Add edge from parent
-                parent = os.path.dirname(dir_id).replace("\\", "/") or repo_name
-                edges.append({"from": parent, "to": dir_id, "label": "contains"})
-                directories_added.add(rel_root)
-
-            # Process files
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, temp_dir).replace("\\", "/")
-                all_files.append(rel_path)
-
-                # Determine file type
-                file_ext = os.path.splitext(file)[1].lower()
-                file_type = "file"
-                should_read = False
-
-                if file_ext in CODE_EXTENSIONS:
-                    file_type = "code"
-                    should_read = files_read_count < MAX_FILES_TO_READ
-                    if file_ext == ".py":
-                        file_type = "python"
-                    elif file_ext in {".js", ".jsx"}:
-                        file_type = "javascript"
-                    elif file_ext in {".ts", ".tsx"}:
-                        file_type = "typescript"
-                    elif file_ext == ".java":
-                        file_type = "java"
-                    elif file_ext == ".go":
-                        file_type = "go"
-                    elif file_ext == ".rs":
-                        file_type = "rust"
-                elif file_ext in CONFIG_EXTENSIONS:
-                    file_type = "config"
-                    should_read = files_read_count < MAX_FILES_TO_READ and file in [
-                        "package.json",
-                        "requirements.txt",
-                        "go.mod",
-                        "Cargo.toml",
-                        "pom.xml",
-                    ]
-                elif file_ext in DOC_EXTENSIONS:
-                    file_type = "document"
-                    should_read = file.lower() == "readme.md"
-
-                # Read important file contents (prioritize code files)
-                if should_read:
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        if file_size <= MAX_FILE_SIZE:
-                            with open(
-                                file_path, "r", encoding="utf-8", errors="ignore"
-                            ) as f:
-                                content = f.read()
-                                if content.strip():
-                                    file_contents[rel_path] = content
-                                    files_read_count += 1
-                    except Exception as e:
-                        logger.debug(
-                            "[%s] Could not read file %s: %s", job_id, rel_path, e
-                        )
-
-                # Add file node with metadata
-                file_node = {
-                    "id": rel_path,
-                    "label": file,
-                    "type": file_type,
-                    "language": file_ext[1:] if file_ext else None,
-                    "size": (
-                        os.path.getsize(file_path) if os.path.exists(file_path) else 0
-                    ),
-                }
-                nodes.append(file_node)
-
-                # Add edge from parent directory
-                parent_dir = os.path.dirname(rel_path).replace("\\", "/") or repo_name
-                edges.append({"from": parent_dir, "to": rel_path, "label": "contains"})
 
+def _find_baseline(spec: JobSpec) -> Baseline | None:
+    """The latest completed job of the same repository usable as a baseline."""
+    from sqlmodel import select
+
+    from backend.app.models import Job, JobStatus
+
+    if spec.local_path:
+        return None
+    try:
+        with get_db() as db:
+            jobs = db.exec(
+                select(Job)
+                .where(
+                    Job.repo_url == spec.repo_url,
+                    Job.status == JobStatus.COMPLETED,
+                    Job.id != uuid.UUID(spec.job_id),
+                )
+                .order_by(Job.created_at.desc())
+                .limit(BASELINE_CANDIDATES)
+            ).all()
+            previous = [(str(job.id), job.result) for job in jobs]
+    except (SQLAlchemyError, ValueError) as e:
+        logger.warning("[%s] Could not look up earlier analyses: %s", spec.job_id, e)
+        return None
+    baseline = select_baseline(spec, previous)
+    if baseline:
         logger.info(
-            "[%s] Analyzed %d files (%d with content) in repository",
-            job_id,
-            len(all_files),
-            len(file_contents),
+            "[%s] Re-analyzing incrementally against job %s (%s)",
+            spec.job_id,
+            baseline.job_id,
+            baseline.commit[:12],
         )
+    return baseline
 
-        # Detect languages from file extensions
-        detected_languages = set()
-        for file in all_files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext == ".py":
-                detected_languages.add("Python")
-            elif ext in {".js", ".jsx"}:
-                detected_languages.add("JavaScript")
-            elif ext in {".ts", ".tsx"}:
-                detected_languages.add("TypeScript")
-            elif ext == ".java":
-                detected_languages.add("Java")
-            elif ext == ".go":
-                detected_languages.add("Go")
-            elif ext == ".rs":
-                detected_languages.add("Rust")
-            elif ext in {".c", ".cpp", ".h"}:
-                detected_languages.add("C/C++")
-            elif ext == ".cs":
-                detected_languages.add("C#")
-            elif ext == ".php":
-                detected_languages.add("PHP")
-            elif ext == ".rb":
-                detected_languages.add("Ruby")
-            elif ext == ".swift":
-                detected_languages.add("Swift")
-            elif ext == ".kt":
-                detected_languages.add("Kotlin")
-
-        dir_counter = Counter()
-        for rel_path in all_files:
-            parts = rel_path.split("/")
-            top_dir = parts[0] if len(parts) > 1 else "[root]"
-            if top_dir and top_dir != ".":
-                dir_counter[top_dir] += 1
-
-        top_directories = dir_counter.most_common(5)
-
-        repo_structure = {
-            "name": repo_name,
-            "files": all_files,
-            "file_contents": file_contents,
-            "languages": list(detected_languages),
-        }
 
-        # Step 2: Generate fast repository overview using LLM
-        update_status(JobStatus.BUILDING_GRAPH, 50)
-        logger.info("[%s] Generating quick analysis with LLM...", job_id)
+def _complete_from_cache(spec: JobSpec, result: dict) -> dict:
+    """Complete a job with the cached result of an earlier job."""
+    from backend.app.models import JobStatus
+    from backend.app.services.embedding_index import get_embedding_index_store
 
+    job_id = spec.job_id
+    source_job = result["cache"]["source_job"]
+    logger.info(
+        "[%s] Result cache hit for %s (from job %s)",
+        job_id,
+        spec.content_id,
+        source_job,
+    )
+    # Chat retrieval is keyed by job, so the new job gets the index too
+    if "retrieval_chunks" in result:
         try:
-            # Prepare CONCISE context for faster LLM processing
-            context = f"Repository: {repo_name}\n"
-            context += f"Files: {len(all_files)} | Languages: {', '.join(repo_structure['languages']) or 'Unknown'}\n\n"
-
-            # Show file structure (limited to 30 most important files)
-            important_files = [
-                f
-                for f in all_files
-                if any(
-                    f.endswith(ext)
-                    for ext in [
-                        ".py",
-                        ".js",
-                        ".ts",
-                        ".java",
-                        ".go",
-                        ".rs",
-                        "README.md",
-                        "package.json",
-                        "requirements.txt",
-                    ]
-                )
-            ]
-            context += "Key files:\n" + "\n".join(
-                f"- {f}" for f in important_files[:30]
-            )
-
-            # Include only the most critical file contents (max 3 files, 300 chars each)
-            if file_contents:
-                context += "\n\nSample code:\n"
-                for file_path, content in list(file_contents.items())[:3]:
-                    context += f"\n{file_path}:\n{content[:300]}...\n"
-
-            fallback_overview = _build_fallback_overview(
-                repo_name,
-                len(all_files),
-                detected_languages,
-                top_directories,
-                important_files[:10],
-            )
+            if not get_embedding_index_store().copy(source_job, job_id):
+                del result["retrieval_chunks"]
+        except (OSError, ValueError) as e:
+            logger.warning("[%s] Could not copy the retrieval index: %s", job_id, e)
+            del result["retrieval_chunks"]
+    _update_job(job_id, JobStatus.COMPLETED, 100, result=result)
+    return {"job_id": job_id, "status": "completed", "cached": True}
+
+
+def _analyze_inline(spec: JobSpec, update_status) -> dict:
+    """Run every pipeline stage in this process."""
+    from backend.app.models import JobStatus
+    from backend.app.services.llm_pool import get_llm_pool, run_concurrently
+
+    job_id = spec.job_id
+
+    # Step 1: Get repository info and analyze all files, continuing after the
+    # last checkpointed stage of an earlier attempt
+    update_status(JobStatus.PARSING, 20)
+    start, artifact = resume_point(spec)
+    logger.info("[%s] Cloning and analyzing repository from %s...", job_id, start)
+    if start == "fetch":
+        artifact = fetch_repository(spec)
+        save_checkpoint("fetch", artifact)
+    fetched = artifact if isinstance(artifact, FetchedRepo) else artifact.fetched
+    try:
+        if start in ("fetch", "scan"):
+            artifact = scan_repository(artifact)
+            save_checkpoint("scan", artifact)
+        if start != "infer":
+            artifact = parse_repository(artifact)
+            save_checkpoint("parse", artifact)
+        parsed = artifact
+        logger.info(
+            "[%s] Analyzed %d files (%d with content) in repository",
+            job_id,
+            len(parsed.all_files),
+            len(parsed.file_contents),
+        )
 
-            repo_overview = llm.explain_repository(repo_structure, context=context)
-            if _has_placeholder_tokens(repo_overview) or _missing_required_sections(
-                repo_overview
-            ):
-                logger.warning(
-                    "[%s] Overview contained placeholder tokens. Using fallback.",
-                    job_id,
-                )
-                repo_overview = fallback_overview
-            logger.info("[%s] Generated overview in LLM", job_id)
-        except Exception as e:
-            logger.warning("[%s] LLM generation failed (using fallback): %s", job_id, e)
-            fallback_overview = _build_fallback_overview(
-                repo_name,
-                len(all_files),
-                detected_languages,
-                top_directories,
-                important_files[:10],
+        # Step 2: Run the independent LLM stages concurrently on the available
+        # inference capacity; the overview is the longest generation, so it
+        # is dispatched first
+        update_status(JobStatus.EXPLAINING, 65)
+        # Stages finished by an earlier attempt, or unchanged since the
+        # incremental baseline, are not run
+        finished = {
+            stage: load_stage_outcome(job_id, stage)
+            or carried_outcome(stage, parsed, stage_model_path(stage, spec.model_path))
+            for stage in INFERENCE_STAGES
+        }
+        stages = {
+            stage: (
+                lambda backend, stage=stage: run_inference_stage(stage, parsed, backend)
             )
-            repo_overview = fallback_overview
-
-        # Step 2.5: Generate node descriptions using LLM for key files
-        update_status(JobStatus.BUILDING_GRAPH, 65)
-        logger.info("[%s] Generating file descriptions...", job_id)
-
-        try:
-            # Select up to 10 most important files to describe
-            files_to_describe = []
-            for node in nodes:
-                if node.get("type") in [
-                    "python",
-                    "javascript",
-                    "typescript",
-                    "java",
-                    "go",
-                    "rust",
-                    "code",
-                ]:
-                    file_path = node["id"]
-                    if file_path in file_contents:
-                        files_to_describe.append((node, file_contents[file_path]))
-                    if len(files_to_describe) >= 10:
-                        break
-
-            # Generate descriptions in batch
-            for node, content in files_to_describe:
-                try:
-                    # Create a concise prompt for file description
-                    prompt = f"""Analyze this code file and provide a 1-2 sentence description of its purpose and key functionality.
-
-File: {node['label']}
-Type: {node.get('language', 'unknown')}
-
-Code snippet (first 500 chars):
-{content[:500]}
-
-Provide ONLY a brief, developer-friendly description (max 2 sentences). Focus on what the file does and its role in the codebase."""
-
-                    description = llm.generate(
-                        prompt=prompt, max_tokens=100, temperature=0.3
-                    )
-                    node["description"] = description.strip()
-                    logger.debug(
-                        "[%s] Generated description for %s", job_id, node["label"]
-                    )
-                except Exception as e:
-                    logger.debug(
-                        "[%s] Failed to generate description for %s: %s",
-                        job_id,
-                        node["label"],
-                        e,
-                    )
-                    # Fallback description based on file type
-                    if node.get("language") == "py":
-                        node["description"] = (
-                            "Python module containing business logic and functions"
-                        )
-                    elif node.get("language") in ["js", "jsx", "ts", "tsx"]:
-                        node["description"] = (
-                            "JavaScript/TypeScript component or utility module"
-                        )
-                    else:
-                        node["description"] = f"{node.get('language', 'Code')} file"
+            for stage in INFERENCE_STAGES
+            if not finished[stage]
+        }
+        results = {}
+        stage_paths = {stage: spec.model_path for stage in INFERENCE_STAGES}
+        if stages:
+            # Models are only loaded when a stage actually has to run
+            logger.info("[%s] Initializing LLM...", job_id)
+            llm_pool = get_llm_pool(spec.model_path)
+            if not llm_pool:
+                error_msg = "Failed to initialize LLM model"
+                logger.error("[%s] %s", job_id, error_msg)
+                update_status(JobStatus.FAILED, 0, result={"error": error_msg})
+                return {"job_id": job_id, "status": "failed", "error": error_msg}
+            logger.info("[%s] LLM initialized successfully", job_id)
+            stage_pools, stage_paths = route_stage_pools(job_id, spec.model_path)
 
             logger.info(
-                "[%s] Generated descriptions for %d files",
+                "[%s] Running %d LLM stages on %d backend(s) with model=%s...",
                 job_id,
-                len(files_to_describe),
-            )
-        except Exception as e:
-            logger.warning("[%s] File description generation failed: %s", job_id, e)
-
-        # Step 3: Final LLM analysis
-        update_status(JobStatus.EXPLAINING, 80)
-        logger.info("[%s] Finalizing analysis with model=%s...", job_id, model_id)
-
-        # Generate vulnerability analysis
-        vulnerability_analysis = ""
-        try:
-            logger.info("[%s] Generating vulnerability analysis...", job_id)
-            vuln_context = f"Repository: {repo_name}\n"
-            vuln_context += f"Languages: {', '.join(detected_languages)}\n"
-            vuln_context += f"Files analyzed: {len(all_files)}\n\n"
-            vuln_context += "Key files:\n" + "\n".join(
-                f"- {f}" for f in important_files[:20]
+                len(stages),
+                llm_pool.size,
+                spec.model_id,
             )
-            if file_contents:
-                vuln_context += "\n\nCode samples:\n"
-                for file_path, content in list(file_contents.items())[:5]:
-                    vuln_context += f"\n{file_path}:\n{content[:400]}...\n"
-
-            vulnerability_analysis = llm.analyze_vulnerability(vuln_context)
-            logger.info("[%s] Generated vulnerability analysis", job_id)
-        except Exception as e:
-            logger.warning("[%s] Vulnerability analysis failed: %s", job_id, e)
-            vulnerability_analysis = (
-                "Vulnerability analysis unavailable for this repository."
+            stage_start = time.perf_counter()
+            results = run_concurrently(llm_pool, stages, stage_pools)
+            logger.info(
+                "[%s] LLM stages finished in %.1fs (sum of stage times %.1fs)",
+                job_id,
+                time.perf_counter() - stage_start,
+                sum(result.seconds for result in results.values()),
             )
 
-        # Produce result with real LLM output and actual file structure
-        graph_json = {
-            "model_checked": True,
-            "model_id": model_id,
-            "model_path": resolved_path,
-            "overview": repo_overview,
-            "vulnerability_analysis": vulnerability_analysis,
-            "repository": repo_name,
-            "files_analyzed": len(all_files),
-            "nodes": nodes,
-            "edges": edges,
-        }
-
-        # Save result and mark completed
-        update_status(JobStatus.COMPLETED, 100, result=graph_json)
-        logger.info(
-            "[%s] Analysis completed with %d nodes and %d edges.",
-            job_id,
-            len(nodes),
-            len(edges),
-        )
-
-        # Clean up temporary directory if it was created for git clone
-        if cleanup_temp:
-            try:
-                import shutil
-
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception as e:
-                logger.warning("[%s] Could not clean up temp dir: %s", job_id, e)
-
-        return {"job_id": job_id, "status": "completed"}
+            all_backends = set(llm_pool.backends)
+            for pool in stage_pools.values():
+                all_backends.update(pool.backends)
+            for backend in all_backends:
+                logger.info(
+                    "[%s] Prefix cache stats: %s",
+                    job_id,
+                    backend.prefix_cache.stats(),
+                )
+                logger.info(
+                    "[%s] Scheduler queue waits: %s", job_id, backend.scheduler.stats()
+                )
+        else:
+            logger.info("[%s] No LLM stage left to run; no model loaded", job_id)
+
+        outcomes = []
+        for stage in INFERENCE_STAGES:
+            outcome = finished[stage]
+            if outcome is None:
+                outcome = StageOutcome.from_result(
+                    stage, results[stage], stage_paths[stage]
+                )
+                save_stage_outcome(job_id, outcome)
+            outcomes.append(outcome)
 
-    except Exception as e:
-        logger.exception("[%s] Error during analysis: %s", job_id, e)
-        update_status(JobStatus.FAILED, 0, result={"error": str(e)})
-        # Re-raise so Celery marks task as failed if desired
-        raise
+        # Step 3: Fallbacks, result and retrieval index
+        return _persist_result(parsed, outcomes)
+    finally:
+        cleanup_checkout(fetched)
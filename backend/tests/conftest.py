@@ -3,10 +3,13 @@
 Pytest configuration file for backend tests.
 This file is automatically loaded by pytest before running tests.
 """
-import sys
+
 import os
+import sys
 from unittest.mock import MagicMock
 
+import pytest
+
 # Set environment variable to use in-memory database for tests
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
 
@@ -16,3 +19,30 @@ mock_worker = MagicMock()
 mock_worker.analyze_repository_task = MagicMock()
 mock_worker.celery_app = MagicMock()
 sys.modules["backend.app.worker"] = mock_worker
+
+
+@pytest.fixture
+def fake_local_llm():
+    """
+    Factory of LocalLLM instances around a fake llama.cpp object, built
+    without loading a model. Attributes match LocalLLM.__init__, so tests
+    only pass what they exercise.
+    """
+    from backend.app.services.inference_scheduler import InferenceScheduler
+    from backend.app.services.llm_service import LocalLLM
+    from backend.app.services.prefix_cache import PrefixCache
+
+    def build(llama, model_path="fake.gguf", prefix_cache_size=0, **attributes):
+        llm = LocalLLM.__new__(LocalLLM)
+        llm.model_path = model_path
+        llm.scheduler = InferenceScheduler()
+        llm.prefix_cache = PrefixCache(max_entries=prefix_cache_size)
+        llm.model_identity = None
+        llm._batch_engine = None
+        llm.drafter = None
+        llm.llm = llama
+        for name, value in attributes.items():
+            setattr(llm, name, value)
+        return llm
+
+    return build
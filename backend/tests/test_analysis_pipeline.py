@@ -0,0 +1,135 @@
+"""
+Tests for the repository analysis stages and their artifacts.
+"""
+
+import json
+
+import pytest
+
+from backend.app.services import analysis_pipeline
+from backend.app.services.analysis_pipeline import (
+    VULNERABILITY_UNAVAILABLE,
+    FetchError,
+    JobSpec,
+    ParsedRepo,
+    StageOutcome,
+    assemble_result,
+    fetch_repository,
+    parse_repository,
+    read_sources,
+    scan_repository,
+)
+from backend.app.services.stream_validators import GenerationAborted
+
+
+@pytest.fixture
+def parsed(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.py").write_text("def main():\n    return 1\n")
+    (tmp_path / "src" / "view.ts").write_text("export const view = 1;\n")
+    (tmp_path / "README.md").write_text("# Demo\n")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "dep.js").write_text("module.exports = 1;\n")
+
+    job = JobSpec(
+        "job-1", "tiny", "/models/tiny.gguf", "upload:demo.zip", str(tmp_path)
+    )
+    return parse_repository(scan_repository(fetch_repository(job)))
+
+
+def test_scan_and_parse_a_checkout(parsed):
+    assert parsed.fetched.repo_name == "demo"
+    assert not parsed.fetched.cleanup
+    assert sorted(parsed.all_files) == [
+        "README.md",
+        "logo.png",
+        "src/app.py",
+        "src/view.ts",
+    ]
+    assert sorted(parsed.file_contents) == ["README.md", "src/app.py", "src/view.ts"]
+    assert parsed.languages == ["Python", "TypeScript"]
+    assert dict(parsed.top_directories) == {"[root]": 2, "src": 2}
+
+    types = {node["id"]: node["type"] for node in parsed.nodes}
+    assert types["demo"] == "repository"
+    assert types["src"] == "directory"
+    assert types["src/app.py"] == "python"
+    assert types["logo.png"] == "file"
+    assert {"from": "src", "to": "src/app.py", "label": "contains"} in parsed.edges
+
+
+def test_read_sources_covers_files_the_parse_left_out(parsed, monkeypatch):
+    root = parsed.fetched.root
+    with open(f"{root}/src/big.py", "w") as f:
+        f.write("x = 1\n" * 20000)
+    with open(f"{root}/src/blob.c", "wb") as f:
+        f.write(b"int\0\0")
+    monkeypatch.setattr(analysis_pipeline, "MAX_FILES_TO_READ", 1)
+    parsed = parse_repository(scan_repository(parsed.fetched))
+    assert "src/big.py" not in parsed.file_contents
+
+    sources = dict(read_sources(parsed, max_bytes=1 << 20))
+    assert sorted(sources) == ["README.md", "src/app.py", "src/big.py", "src/view.ts"]
+    assert sorted(dict(read_sources(parsed, max_bytes=1024))) == [
+        "README.md",
+        "src/app.py",
+        "src/view.ts",
+    ]
+
+
+def test_artifacts_survive_json_roundtrip(parsed):
+    restored = ParsedRepo.from_dict(json.loads(json.dumps(parsed.to_dict())))
+
+    assert restored.fetched.job == parsed.fetched.job
+    assert restored.file_contents == parsed.file_contents
+    assert restored.job_id == "job-1"
+
+    outcome = StageOutcome.from_error(
+        "overview", GenerationAborted("placeholder", tokens=12)
+    )
+    restored = StageOutcome.from_dict(json.loads(json.dumps(outcome.to_dict())))
+    assert not restored.ok
+    assert (restored.aborted_reason, restored.aborted_tokens) == ("placeholder", 12)
+
+
+def test_assemble_result_uses_fallbacks_for_failed_stages(parsed):
+    result = assemble_result(
+        parsed,
+        [
+            StageOutcome.from_error(
+                "overview", GenerationAborted("placeholder", tokens=3)
+            ),
+            StageOutcome.from_error("vulnerability", RuntimeError("boom")),
+            StageOutcome(
+                "descriptions",
+                value={"src/app.py": " Entry point. "},
+                model_path="/models/small.gguf",
+            ),
+        ],
+    )
+
+    assert result["overview"].startswith("**Project Snapshot**")
+    assert "demo" in result["overview"]
+    assert result["vulnerability_analysis"] == VULNERABILITY_UNAVAILABLE
+    assert result["model_routes"] == {
+        "overview": "tiny.gguf",
+        "vulnerability": "tiny.gguf",
+        "description": "small.gguf",
+    }
+    descriptions = {
+        node["id"]: node["description"]
+        for node in result["nodes"]
+        if "description" in node
+    }
+    assert descriptions == {
+        "src/app.py": "Entry point.",
+        "src/view.ts": "JavaScript/TypeScript component or utility module",
+    }
+
+
+def test_failed_clone_raises_fetch_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_pipeline, "get_mirror_cache", lambda: None)
+    job = JobSpec("job-2", "tiny", "/models/tiny.gguf", str(tmp_path / "missing.git"))
+    with pytest.raises(FetchError, match="Failed to clone"):
+        fetch_repository(job)
@@ -0,0 +1,118 @@
+# backend/tests/test_autotune.py
+"""
+Tests for on-host model benchmarking and autotuning.
+"""
+
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.app.services import autotune
+from backend.app.services.autotune import TuningStore
+
+
+class TimedLlama:
+    """Fake Llama whose speed depends on the thread count it was given."""
+
+    def __init__(self, model_path, n_ctx, verbose, n_threads, **kwargs):
+        if kwargs.get("use_mlock"):
+            raise RuntimeError("mlock not permitted")
+        # Fastest at 4 threads, slower with more or fewer
+        self.delay = 0.001 * (1 + abs(n_threads - 4))
+
+    def tokenize(self, data: bytes):
+        return list(range(len(data.split())))
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens):
+        time.sleep(self.delay * len(tokens) / 10)
+
+    def generate(self, tokens, temp=0.0):
+        while True:
+            time.sleep(self.delay)
+            yield 1
+
+
+def test_autotune_persists_fastest_configuration(tmp_path, mocker):
+    mocker.patch.object(autotune, "thread_candidates", return_value=[1, 4, 16])
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"GGUF")
+    store = TuningStore(path=str(tmp_path / "tuning.json"))
+
+    outcome = autotune.autotune(str(model), loader=TimedLlama, store=store)
+
+    assert outcome["params"]["n_threads"] == 4
+    assert outcome["params"]["use_mlock"] is False
+    failed = [r for r in outcome["results"] if r["error"]]
+    assert failed and all(r["config"]["use_mlock"] for r in failed)
+    assert store.get(str(model)) == outcome["params"]
+
+
+def test_tuning_is_keyed_by_model_file(tmp_path):
+    store = TuningStore(path=str(tmp_path / "tuning.json"))
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"GGUF")
+    store.record(str(model), {"n_threads": 8}, [])
+
+    assert store.get(str(model)) == {"n_threads": 8}
+
+    # A replaced model file invalidates the tuning result
+    model.write_bytes(b"GGUF v2")
+    assert store.get(str(model)) is None
+
+
+def test_get_llm_instance_loads_with_tuned_params(tmp_path, mocker):
+    from backend.app.services import llm_service
+
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"GGUF")
+    mocker.patch.object(llm_service, "LLAMA_CPP_AVAILABLE", True)
+    mocker.patch.object(
+        llm_service, "tuned_params", return_value={"n_threads": 12, "n_batch": 256}
+    )
+    registry_get = mocker.patch.object(llm_service._model_registry, "get")
+
+    llm_service.get_llm_instance(str(model))
+
+    registry_get.assert_called_once_with(
+        str(model), replica=0, n_threads=12, n_batch=256
+    )
+
+
+def test_benchmark_endpoint_rejects_missing_model():
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/models/benchmark", json={"model_path": "/nonexistent.gguf"}
+    )
+    assert response.status_code == 404
+
+
+def test_benchmark_runs_in_the_background_on_discovered_models(tmp_path, mocker):
+    model = tmp_path / "tiny.gguf"
+    model.write_bytes(b"GGUF")
+    mocker.patch("backend.app.api.models.discover_models", return_value=[str(model)])
+    tune = mocker.patch(
+        "backend.app.api.models.autotune",
+        side_effect=lambda path, quick: {"model_path": path, "params": {}},
+    )
+    client = TestClient(app)
+
+    other = tmp_path / "other.gguf"
+    other.write_bytes(b"GGUF")
+    response = client.post("/api/v1/models/benchmark", json={"model_path": str(other)})
+    assert response.status_code == 404
+
+    started = client.post("/api/v1/models/benchmark", json={"quick": True})
+    assert started.status_code == 202
+    assert started.json()["model_paths"] == [str(model)]
+
+    run = client.get(f"/api/v1/models/benchmark/{started.json()['benchmark_id']}")
+    assert run.json()["status"] == "completed"
+    assert run.json()["results"] == [
+        {"ok": True, "model_path": str(model), "params": {}}
+    ]
+    tune.assert_called_once_with(str(model), quick=True)
+    assert client.get("/api/v1/models/benchmark/missing").status_code == 404
@@ -0,0 +1,155 @@
+# backend/tests/test_batch_decoder.py
+"""
+Tests for multi-sequence batched decoding.
+"""
+
+import numpy as np
+
+from backend.app.services.batch_decoder import decode_batch, sample_token
+from backend.app.services.response_cache import ResponseCache
+
+EOG = 0
+PIECES = {1: "Hello", 2: " world", 3: "\n", 4: "STOP", 5: " x"}
+VOCAB = 8
+
+
+class ScriptedEngine:
+    """Batch engine stand-in that emits a fixed token script per sequence."""
+
+    n_seq_max = 4
+    n_batch = 16
+    seq_ctx = 256
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.emitted = {seq_id: 0 for seq_id in scripts}
+        self.decode_sizes = []
+        self.copied = []
+        self.removed = []
+
+    def decode(self, items):
+        self.decode_sizes.append(len(items))
+        rows = []
+        for token, pos, seq_id, logits in items:
+            if not logits:
+                rows.append(None)
+                continue
+            script = self.scripts[seq_id]
+            k = self.emitted[seq_id]
+            self.emitted[seq_id] += 1
+            row = np.full(VOCAB, -10.0, dtype=np.float32)
+            row[script[k] if k < len(script) else EOG] = 10.0
+            rows.append(row)
+        return rows
+
+    def copy_sequence(self, src, dst, length):
+        self.copied.append((src, dst, length))
+
+    def remove_sequence(self, seq_id):
+        self.removed.append(seq_id)
+
+    def clear(self):
+        pass
+
+    def is_eog(self, token):
+        return token == EOG
+
+    def piece(self, token):
+        return PIECES[token].encode("utf-8")
+
+
+def test_sequences_stop_independently_in_shared_steps():
+    engine = ScriptedEngine({0: [1, 2, EOG], 1: [1, 4, 5], 2: [5] * 10})
+
+    texts = decode_batch(
+        engine,
+        [[7, 7], [7, 7, 7], [7]],
+        max_tokens=3,
+        temperature=0.0,
+        stop=["STOP"],
+        prefix=[6, 6, 6],
+    )
+
+    assert texts == ["Hello world", "Hello", " x x x"]
+    # Shared prefix evaluated once and copied to the other sequences
+    assert engine.decode_sizes[0] == 3
+    assert engine.copied == [(0, 1, 3), (0, 2, 3)]
+    # One prefill step, then every generation step serves all live sequences
+    assert engine.decode_sizes[1] == 6
+    assert max(engine.decode_sizes[2:]) == 3
+    assert len(engine.decode_sizes) <= 5
+    assert sorted(engine.removed) == [0, 1, 2]
+
+
+def test_sample_token_is_seeded_and_greedy_at_zero_temperature():
+    logits = np.array([0.0, 1.0, 3.0, 0.5])
+    assert sample_token(logits, 0.0, 1.0, np.random.default_rng(0)) == 2
+
+    first = [sample_token(logits, 1.0, 0.9, np.random.default_rng(7)) for _ in range(3)]
+    again = [sample_token(logits, 1.0, 0.9, np.random.default_rng(7)) for _ in range(3)]
+    assert first == again
+
+
+def test_sample_token_applies_top_k_top_p_and_min_p():
+    logits = np.log(np.array([0.5, 0.3, 0.15, 0.04, 0.01]))
+
+    def drawn(**kwargs):
+        rng = np.random.default_rng(0)
+        return {sample_token(logits, 5.0, 1.0, rng, **kwargs) for _ in range(300)}
+
+    # A high temperature flattens whatever survives the filters
+    assert drawn(top_k=0, min_p=0.0) == {0, 1, 2, 3, 4}
+    assert drawn(top_k=2, min_p=0.0) == {0, 1}
+    assert drawn(top_k=0, min_p=0.1) == {0, 1, 2}
+    rng = np.random.default_rng(0)
+    assert {sample_token(logits, 5.0, 0.75, rng, 0, 0.0) for _ in range(300)} == {0, 1}
+
+
+class SequentialLlama:
+    """Minimal Llama stand-in for the one-by-one fallback path."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def tokenize(self, data: bytes, add_bos: bool = True):
+        return [7] * len(data.split())
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return {"choices": [{"text": f" {len(self.prompts)} "}]}
+
+
+def test_generate_batch_decodes_prompts_together(fake_local_llm):
+    engine = ScriptedEngine({0: [1, EOG], 1: [5, 5, EOG]})
+    llm = fake_local_llm(SequentialLlama(), _batch_engine=engine)
+
+    assert llm.generate_batch(
+        ["a b", "c"], max_tokens=10, temperature=0.0, cache=False
+    ) == [
+        "Hello",
+        "x x",
+    ]
+    assert llm.llm.prompts == []
+
+
+def test_generate_batch_falls_back_to_sequential_generation(fake_local_llm):
+    llm = fake_local_llm(SequentialLlama(), _batch_engine=False)
+
+    assert llm.generate_batch(["a", "b", "c"], prefix="P: ") == ["1", "2", "3"]
+    assert llm.llm.prompts == ["P: a", "P: b", "P: c"]
+
+
+def test_sampled_batch_results_are_cached_apart_from_generate(fake_local_llm, mocker):
+    keys = []
+    cache = mocker.Mock(make_key=ResponseCache.make_key, get=keys.append)
+    mocker.patch(
+        "backend.app.services.llm_service.get_response_cache", return_value=cache
+    )
+    llm = fake_local_llm(SequentialLlama(), _batch_engine=False, model_identity="fake")
+
+    for temperature in (0.0, 0.7):
+        llm.generate("a", temperature=temperature, seed=1)
+        llm.generate_batch(["a"], temperature=temperature, seed=1)
+    greedy, greedy_batch, sampled, sampled_batch = keys
+    assert greedy == greedy_batch
+    assert sampled != sampled_batch
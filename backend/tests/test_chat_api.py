@@ -0,0 +1,231 @@
+# backend/tests/test_chat_api.py
+"""
+Tests for the /api/v1/chat endpoints.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.api.chat import ChatRequest, _run_chat_turn
+from backend.app.main import app
+from backend.app.services.chat_sessions import ChatSessionStore
+from backend.app.services.inference_executor import (
+    InferenceExecutor,
+    InferenceQueueFull,
+)
+
+
+class FakeLLM:
+    """Stand-in for LocalLLM that replays a fixed token sequence."""
+
+    model_path = "fake.gguf"
+    n_ctx = 4096
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.closed = False
+        self.state_calls = []
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def count_tokens_many(self, texts):
+        return [self.count_tokens(text) for text in texts]
+
+    def generate_with_state(self, prompt, state=None, **kwargs):
+        self.state_calls.append((prompt, state))
+        return " " + "".join(self.tokens), {"turn": len(self.state_calls)}
+
+    def generate(self, prompt, **kwargs):
+        return "".join(self.tokens)
+
+    def generate_stream(self, prompt, **kwargs):
+        self.stream_kwargs = kwargs
+        try:
+            yield from self.tokens
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def fake_llm(mocker):
+    llm = FakeLLM(["Hello", ", ", "world"])
+    mocker.patch("backend.app.api.chat.get_llm_instance", return_value=llm)
+    return llm
+
+
+@pytest.fixture
+def session_store(tmp_path, mocker):
+    store = ChatSessionStore(root=str(tmp_path), ttl_seconds=60, max_bytes=10**6)
+    mocker.patch("backend.app.api.chat.get_chat_session_store", return_value=store)
+    return store
+
+
+def _parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = {"event": "message"}
+        for line in block.splitlines():
+            key, _, value = line.partition(": ")
+            event[key] = value
+        event["data"] = json.loads(event["data"])
+        events.append(event)
+    return events
+
+
+def test_stream_chat_yields_tokens_then_metrics(fake_llm):
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/chat/stream",
+        json={"job_id": "job-1", "message": "What does this repo do?"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(response.text)
+    tokens = [e["data"]["token"] for e in events if e["event"] == "message"]
+    assert "".join(tokens) == "Hello, world"
+
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["data"]["metrics"]["tokens"] == 3
+    assert done["data"]["metrics"]["time_to_first_token"] is not None
+    assert fake_llm.closed
+
+
+def test_stream_chat_stops_at_the_next_question_and_rejects_sessions(fake_llm):
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/chat/stream", json={"job_id": "job-1", "message": "Hi"}
+    )
+    assert response.status_code == 200
+    assert fake_llm.stream_kwargs["stop"] == ["\nUSER QUESTION:"]
+
+    response = client.post(
+        "/api/v1/chat/stream",
+        json={"job_id": "job-1", "message": "Hi", "session_id": "abc"},
+    )
+    assert response.status_code == 400
+
+
+def test_stream_chat_without_model_returns_503(mocker):
+    mocker.patch("backend.app.api.chat.get_llm_instance", return_value=None)
+    client = TestClient(app)
+    response = client.post(
+        "/api/v1/chat/stream", json={"job_id": "job-1", "message": "hi"}
+    )
+    assert response.status_code == 503
+
+
+def test_executor_rejects_when_workers_and_queue_are_full():
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(InferenceQueueFull) as exc_info:
+            await executor.run(lambda: "rejected")
+        assert exc_info.value.queue_position == 2
+
+        release.set()
+        assert await queued == "queued"
+        await running
+        assert executor.stats()["rejected"] == 1
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_chat_returns_429_with_queue_position_when_saturated(fake_llm, mocker):
+    class SaturatedExecutor:
+        def queue_position(self):
+            return 4
+
+        async def run(self, fn, *args, **kwargs):
+            raise InferenceQueueFull(queue_position=4, retry_after=7)
+
+    mocker.patch(
+        "backend.app.api.chat.get_inference_executor",
+        return_value=SaturatedExecutor(),
+    )
+    client = TestClient(app)
+    response = client.post("/api/v1/chat/", json={"job_id": "job-1", "message": "hi"})
+
+    assert response.status_code == 429
+    assert response.json()["queue_position"] == 4
+    assert response.headers["retry-after"] == "7"
+
+
+def test_chat_session_resumes_saved_state(fake_llm, session_store):
+    client = TestClient(app)
+    first = client.post(
+        "/api/v1/chat/",
+        json={"job_id": "job-1", "message": "What is this?", "context": "CTX"},
+    )
+    assert first.status_code == 200
+    session_id = first.json()["session_id"]
+    assert first.json()["response"] == "Hello, world"
+
+    second = client.post(
+        "/api/v1/chat/",
+        json={"job_id": "job-1", "message": "And tests?", "session_id": session_id},
+    )
+    assert second.status_code == 200
+    assert second.json()["session_id"] == session_id
+
+    (first_prompt, first_state), (second_prompt, second_state) = fake_llm.state_calls
+    assert first_state is None
+    assert second_state == {"turn": 1}
+    # The follow-up extends the previous transcript instead of rebuilding it
+    assert second_prompt.startswith(first_prompt + " Hello, world")
+    assert "And tests?" in second_prompt
+
+    session = session_store.load("job-1", session_id)
+    assert [t["question"] for t in session.turns] == ["What is this?", "And tests?"]
+
+
+def test_concurrent_turns_of_one_session_are_all_kept(fake_llm, session_store):
+    first = _run_chat_turn(fake_llm, ChatRequest(job_id="job-1", message="Hi"))
+    generate = fake_llm.generate_with_state
+
+    def slow_generate(prompt, state=None, **kwargs):
+        time.sleep(0.05)
+        return generate(prompt, state, **kwargs)
+
+    fake_llm.generate_with_state = slow_generate
+    request = ChatRequest(job_id="job-1", message="More?", session_id=first.session_id)
+    turns = [
+        threading.Thread(target=_run_chat_turn, args=(fake_llm, request))
+        for _ in range(2)
+    ]
+    for turn in turns:
+        turn.start()
+    for turn in turns:
+        turn.join(timeout=5)
+
+    # Each turn loaded the session only after the other had saved it
+    session = session_store.load("job-1", first.session_id)
+    assert [t["question"] for t in session.turns] == ["Hi", "More?", "More?"]
+
+
+def test_chat_session_store_enforces_ttl_and_quota(tmp_path):
+    store = ChatSessionStore(root=str(tmp_path), ttl_seconds=60, max_bytes=1)
+    older = store.create("job-1", "m.gguf")
+    store.save(older, state=b"x" * 100)
+    newer = store.create("job-1", "m.gguf")
+    store.save(newer, state=b"y" * 100)
+
+    # Over quota: only the session just written survives
+    assert store.load("job-1", older.session_id) is None
+    assert store.load("job-1", newer.session_id) is not None
+
+    store.ttl_seconds = -1
+    assert store.load("job-1", newer.session_id) is None
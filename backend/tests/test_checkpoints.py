@@ -0,0 +1,128 @@
+"""
+Tests for stage checkpoints and resuming analysis jobs from them.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from backend.app.services import analysis_pipeline
+from backend.app.services.analysis_pipeline import (
+    DESCRIPTION_PROGRESS,
+    FetchedRepo,
+    JobSpec,
+    ParsedRepo,
+    StageOutcome,
+    fetch_repository,
+    load_stage_outcome,
+    parse_repository,
+    resume_point,
+    run_inference_stage,
+    save_checkpoint,
+    save_stage_outcome,
+    scan_repository,
+)
+from backend.app.services.checkpoints import CheckpointStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(analysis_pipeline, "get_checkpoint_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def job(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for index in range(7):
+        (repo / f"mod{index}.py").write_text(f"def f{index}():\n    return {index}\n")
+    return JobSpec("job-1", "tiny", "/models/tiny.gguf", "upload:repo.zip", str(repo))
+
+
+class CountingBackend:
+    """Backend stand-in that fails once ``fail_after`` prompts were generated."""
+
+    def __init__(self, fail_after=None):
+        self.generated = []
+        self.fail_after = fail_after
+
+    def generate_batch(self, prompts, **kwargs):
+        if self.fail_after is not None and len(self.generated) >= self.fail_after:
+            raise MemoryError("worker killed")
+        self.generated.extend(prompts)
+        return [f"description {len(self.generated)}"] * len(prompts)
+
+
+def test_store_roundtrip_and_corrupt_checkpoints(store):
+    store.save("job-1", "scan", {"files": ["a.py"]})
+    assert store.load("job-1", "scan") == {"files": ["a.py"]}
+    assert store.load("job-1", "parse") is None
+    assert store.stages("job-1") == ["scan"]
+
+    with open(os.path.join(store.root, "job-1", "parse.json"), "w") as f:
+        f.write('{"truncated": ')
+    assert store.load("job-1", "parse") is None
+
+    with pytest.raises(ValueError):
+        store.save("../escape", "scan", {})
+
+    store.clear("job-1")
+    assert store.stages("job-1") == []
+
+    store.save("old-job", "fetch", {})
+    os.utime(os.path.join(store.root, "old-job"), (0, 0))
+    store.save("new-job", "fetch", {})
+    assert store.prune(3600) == 1
+    assert os.listdir(store.root) == ["new-job"]
+
+
+def test_resume_point_follows_checkpoints(store, job):
+    assert resume_point(job) == ("fetch", job)
+
+    fetched = fetch_repository(job)
+    save_checkpoint("fetch", fetched)
+    scanned = scan_repository(fetched)
+    save_checkpoint("scan", scanned)
+    stage, artifact = resume_point(job)
+    assert stage == "parse"
+    assert artifact.candidates == scanned.candidates
+
+    # A retry with another model keeps the checkpoints but uses the new model
+    retried = JobSpec("job-1", "big", "/models/big.gguf", job.repo_url)
+    save_checkpoint("parse", parse_repository(scanned))
+    stage, artifact = resume_point(retried)
+    assert stage == "infer"
+    assert isinstance(artifact, ParsedRepo)
+    assert artifact.fetched.job.model_path == "/models/big.gguf"
+
+
+def test_fetch_and_scan_checkpoints_need_their_checkout(store, job):
+    fetched = fetch_repository(job)
+    save_checkpoint("fetch", fetched)
+    save_checkpoint("scan", scan_repository(fetched))
+    shutil.rmtree(job.local_path)
+
+    assert resume_point(job) == ("fetch", job)
+    assert isinstance(FetchedRepo.from_dict(store.load("job-1", "fetch")), FetchedRepo)
+
+
+def test_descriptions_resume_after_a_crash(store, job):
+    parsed = parse_repository(scan_repository(fetch_repository(job)))
+
+    crashing = CountingBackend(fail_after=5)
+    with pytest.raises(MemoryError):
+        run_inference_stage("descriptions", parsed, crashing)
+    assert len(store.load("job-1", DESCRIPTION_PROGRESS)) == 5
+
+    resumed = CountingBackend()
+    descriptions = run_inference_stage("descriptions", parsed, resumed)
+    assert len(resumed.generated) == 2
+    assert len(descriptions) == 7
+
+    save_stage_outcome("job-1", StageOutcome("descriptions", value=descriptions))
+    save_stage_outcome("job-1", StageOutcome("overview", error="timed out"))
+    assert load_stage_outcome("job-1", "descriptions").value == descriptions
+    assert load_stage_outcome("job-1", "overview") is None
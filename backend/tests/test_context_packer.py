@@ -0,0 +1,109 @@
+# backend/tests/test_context_packer.py
+"""
+Tests for token-budgeted prompt context packing.
+"""
+
+from backend.app.services.context_packer import (
+    Snippet,
+    file_priority,
+    pack_snippets,
+    truncate_to_tokens,
+)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def test_pack_prefers_high_value_snippets_and_keeps_order():
+    snippets = [
+        Snippet("header line", score=float("inf"), truncatable=False),
+        Snippet("low " * 10, score=1.0, truncatable=False),
+        Snippet("high " * 10, score=10.0),
+    ]
+
+    packed = pack_snippets(snippets, budget=15, count_tokens=count_words)
+
+    assert packed.tokens <= 15
+    assert packed.text.startswith("header line\nhigh")
+    assert "low" not in packed.text
+    assert packed.included == 2
+
+
+def test_pack_truncates_the_snippet_that_only_partly_fits():
+    lines = "\n".join(f"line {i} of the readme file" for i in range(40))
+    snippets = [Snippet("header", score=100.0), Snippet(lines, score=50.0)]
+
+    packed = pack_snippets(snippets, budget=60, count_tokens=count_words)
+
+    assert packed.truncated == 1
+    assert 50 <= packed.tokens <= 60
+    assert packed.text.endswith("...")
+
+
+def test_truncate_to_tokens_respects_budget():
+    text = "word " * 500
+    truncated = truncate_to_tokens(text, 40, count_words)
+    assert count_words(truncated) <= 40
+    assert truncate_to_tokens(text, 1, count_words) is None
+
+
+def test_batch_counter_measures_snippets_in_one_call():
+    batches = []
+
+    def count_many(texts):
+        batches.append(len(texts))
+        return [count_words(text) for text in texts]
+
+    lines = "\n".join(f"line {i} of the readme file" for i in range(400))
+    snippets = [Snippet("header", score=100.0), Snippet(lines, score=50.0)]
+    snippets += [Snippet(f"note {i}", score=1.0) for i in range(20)]
+
+    batched = pack_snippets(snippets, 60, count_words, count_tokens_many=count_many)
+    plain = pack_snippets(snippets, 60, count_words)
+
+    assert batched.text == plain.text
+    # Separator and all snippets first, then truncation rounds of probes
+    assert batches[0] == 1 + len(snippets)
+    assert len(batches) < 10
+
+
+def test_file_priority_ranks_readme_and_manifests_first():
+    paths = ["src/utils/helpers.py", "README.md", "package.json", "tests/test_x.py"]
+    ranked = sorted(paths, key=file_priority, reverse=True)
+    assert ranked[:2] == ["README.md", "package.json"]
+    assert ranked[-1] == "tests/test_x.py"
+
+
+class WordLlama:
+    """Tokenizes on whitespace and reports a small context window."""
+
+    def __init__(self, n_ctx):
+        self._n_ctx = n_ctx
+        self.calls = []
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def tokenize(self, data: bytes, add_bos: bool = True):
+        return data.decode("utf-8").split()
+
+    def __call__(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return {"choices": [{"text": "ok"}]}
+
+
+def test_vulnerability_prompt_never_overflows_context_window(fake_local_llm):
+    llm = fake_local_llm(WordLlama(n_ctx=400))
+
+    snippets = [Snippet("Repository: demo", score=float("inf"), truncatable=False)]
+    snippets += [
+        Snippet(f"\nsrc/module_{i}.py:\n" + "code " * 200, score=40.0 - i)
+        for i in range(10)
+    ]
+    llm.analyze_vulnerability(snippets)
+
+    prompt, kwargs = llm.llm.calls[0]
+    assert "Repository: demo" in prompt
+    assert "src/module_0.py" in prompt
+    assert count_words(prompt) + kwargs["max_tokens"] <= 400
@@ -0,0 +1,113 @@
+"""
+Tests for code chunking and the per-job embedding index.
+"""
+
+import zlib
+
+import numpy as np
+
+from backend.app.services.code_chunker import chunk_file
+from backend.app.services.embedding_index import EmbeddingIndexStore
+
+PYTHON_SOURCE = """import os
+
+
+def load(path):
+    with open(path) as f:
+        data = f.read()
+    return data.strip()
+
+
+class Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.tokens = []
+
+    def parse(self):
+        return self.text.split()
+"""
+
+JS_SOURCE = """import x from 'y';
+
+export function render(node) {
+  const el = document.createElement('div');
+  el.textContent = node.label;
+  return el;
+}
+
+export const handler = async (event) => {
+  console.log(event);
+  await save(event);
+  return true;
+};
+"""
+
+
+def _fake_embed(texts):
+    """Bag-of-words hashing embedding, deterministic and unit length."""
+    rows = np.zeros((len(texts), 64), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            rows[i, zlib.crc32(word.encode()) % 64] += 1.0
+    return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+
+
+def test_python_chunks_follow_definitions():
+    chunks = chunk_file("pkg/io.py", PYTHON_SOURCE)
+
+    symbols = [chunk.symbol for chunk in chunks]
+    assert "load" in symbols and "Parser" in symbols
+    parser = next(chunk for chunk in chunks if chunk.symbol == "Parser")
+    assert parser.text.startswith("class Parser:")
+    assert parser.text.rstrip().endswith("return self.text.split()")
+    # Every line of the file is covered exactly once
+    covered = [n for c in chunks for n in range(c.start_line, c.end_line + 1)]
+    assert covered == sorted(set(covered))
+
+
+def test_js_chunks_and_window_split():
+    chunks = chunk_file("src/view.js", JS_SOURCE)
+    assert {"render", "handler"} <= {chunk.symbol for chunk in chunks}
+    assert chunks[0].header.startswith("# src/view.js:1-")
+
+    long_source = "\n".join(f"line_{i} = {i}" for i in range(25))
+    windows = chunk_file("notes.txt", long_source, max_lines=10)
+    assert [(c.start_line, c.end_line) for c in windows] == [
+        (1, 10),
+        (11, 20),
+        (21, 25),
+    ]
+
+
+def test_index_build_and_search_roundtrip(tmp_path):
+    store = EmbeddingIndexStore(root=str(tmp_path))
+    chunks = chunk_file("pkg/io.py", PYTHON_SOURCE) + chunk_file(
+        "src/view.js", JS_SOURCE
+    )
+
+    assert store.build("job-1", chunks, _fake_embed, batch_size=2) == len(chunks)
+    assert store.exists("job-1")
+
+    query = _fake_embed(["el.textContent = node.label; return el;"])[0]
+    results = store.search("job-1", query, k=2)
+    assert len(results) == 2
+    assert results[0][1].symbol == "render"
+    assert results[0][0] >= results[1][0]
+
+    # A rebuild replaces the index and is picked up by later searches
+    store.build("job-1", chunks[:1], _fake_embed)
+    assert len(store.search("job-1", query, k=5)) == 1
+
+
+def test_missing_or_invalid_index(tmp_path):
+    store = EmbeddingIndexStore(root=str(tmp_path))
+    query = _fake_embed(["anything"])[0]
+
+    assert store.search("unknown-job", query) == []
+    try:
+        store.search("../escape", query)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("path traversal in job id was accepted")
@@ -0,0 +1,118 @@
+"""
+Tests for GGUF header inspection.
+"""
+
+import asyncio
+import os
+import struct
+
+import pytest
+
+from backend.app.api.models import ModelTestRequest
+from backend.app.api.models import test_model as check_model
+from backend.app.services.gguf_inspector import (
+    GGUFError,
+    inspect_gguf,
+    kv_cache_bytes,
+)
+
+
+def gguf_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def write_gguf(path, metadata, version=3, tensors=201, pad_to=0):
+    """Write a GGUF header; metadata values are (type, encoded value)."""
+    body = b"GGUF" + struct.pack("<IQQ", version, tensors, len(metadata))
+    for key, (value_type, value) in metadata:
+        body += gguf_string(key) + struct.pack("<I", value_type) + value
+    with open(path, "wb") as f:
+        f.write(body)
+        if pad_to > len(body):
+            f.truncate(pad_to)
+    return str(path)
+
+
+VOCAB = struct.pack("<IQ", 8, 3) + b"".join(gguf_string(t) for t in "abc")
+LLAMA_METADATA = [
+    ("general.architecture", (8, gguf_string("llama"))),
+    ("general.name", (8, gguf_string("Tiny Llama"))),
+    ("tokenizer.ggml.tokens", (9, VOCAB)),
+    ("tokenizer.ggml.scores", (9, struct.pack("<IQ", 6, 3) + b"\0" * 12)),
+    ("llama.block_count", (4, struct.pack("<I", 16))),
+    ("llama.context_length", (4, struct.pack("<I", 131072))),
+    ("llama.embedding_length", (4, struct.pack("<I", 2048))),
+    ("general.file_type", (4, struct.pack("<I", 15))),
+]
+
+
+def test_reads_architecture_context_and_quantization(tmp_path):
+    info = inspect_gguf(write_gguf(tmp_path / "tiny.gguf", LLAMA_METADATA))
+
+    assert info.version == 3
+    assert info.tensor_count == 201
+    assert info.architecture == "llama"
+    assert info.name == "Tiny Llama"
+    assert info.context_length == 131072
+    assert info.embedding_length == 2048
+    assert info.block_count == 16
+    assert info.quantization == "Q4_K_M"
+    assert info.generative
+
+
+def test_rejects_bad_magic_version_and_truncation(tmp_path):
+    bad_magic = tmp_path / "model.bin"
+    bad_magic.write_bytes(b"GGML" + b"\0" * 64)
+    with pytest.raises(GGUFError, match="magic"):
+        inspect_gguf(str(bad_magic))
+
+    with pytest.raises(GGUFError, match="version"):
+        inspect_gguf(write_gguf(tmp_path / "v9.gguf", LLAMA_METADATA, version=9))
+
+    write_gguf(tmp_path / "full.gguf", LLAMA_METADATA)
+    full = (tmp_path / "full.gguf").read_bytes()
+    truncated = tmp_path / "truncated.gguf"
+    truncated.write_bytes(full[:60])
+    with pytest.raises(GGUFError, match="Truncated"):
+        inspect_gguf(str(truncated))
+
+
+def test_cache_follows_file_changes(tmp_path):
+    path = write_gguf(tmp_path / "m.gguf", LLAMA_METADATA)
+    first = inspect_gguf(path)
+    assert inspect_gguf(path) is first
+
+    write_gguf(path, [("general.architecture", (8, gguf_string("bert")))])
+    os.utime(path, ns=(1, 1))
+    changed = inspect_gguf(path)
+    assert changed.architecture == "bert"
+    assert not changed.generative
+
+
+def test_model_endpoint_reports_header_metadata(tmp_path):
+    path = write_gguf(tmp_path / "tiny.gguf", LLAMA_METADATA, pad_to=2 << 20)
+    result = asyncio.run(check_model(ModelTestRequest(model_id="", path=path)))
+    assert result.valid
+    assert (result.architecture, result.quantization) == ("llama", "Q4_K_M")
+    assert result.context_length == 131072
+
+    junk = tmp_path / "junk.gguf"
+    junk.write_bytes(b"\0" * (2 << 20))
+    result = asyncio.run(check_model(ModelTestRequest(model_id="", path=str(junk))))
+    assert not result.valid
+    assert "magic" in result.error
+
+
+def test_kv_cache_size_accounts_for_grouped_query_attention(tmp_path):
+    plain = write_gguf(tmp_path / "plain.gguf", LLAMA_METADATA)
+    # 2 (K and V) * 16 layers * 1024 positions * 2048 wide * 2 bytes (f16)
+    assert kv_cache_bytes(plain, 1024) == 2 * 16 * 1024 * 2048 * 2
+
+    heads = [
+        ("llama.attention.head_count", (4, struct.pack("<I", 32))),
+        ("llama.attention.head_count_kv", (4, struct.pack("<I", 8))),
+    ]
+    grouped = write_gguf(tmp_path / "gqa.gguf", LLAMA_METADATA + heads)
+    assert kv_cache_bytes(grouped, 1024) == 2 * 16 * 1024 * 512 * 2
+    assert kv_cache_bytes(str(tmp_path / "missing.gguf"), 1024) == 0
@@ -0,0 +1,220 @@
+"""
+Tests for incremental re-analysis against an earlier job of the same repository.
+"""
+
+import json
+import os
+import subprocess
+
+import pytest
+
+from backend.app.services import analysis_pipeline
+from backend.app.services.analysis_pipeline import (
+    PIPELINE_VERSION,
+    Baseline,
+    JobSpec,
+    ParsedRepo,
+    StageOutcome,
+    assemble_result,
+    carried_over,
+    cleanup_checkout,
+    diff_commits,
+    fetch_repository,
+    parse_repository,
+    run_inference_stage,
+    scan_repository,
+    select_baseline,
+    structure_shifted,
+)
+from backend.app.services.git_mirror import MirrorCache
+
+MODEL = "/models/tiny.gguf"
+
+
+def git(*args, cwd):
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def commit(repo, files):
+    for name, content in files.items():
+        path = os.path.join(repo, name)
+        if content is None:
+            os.remove(path)
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    git("add", "-A", cwd=repo)
+    git("commit", "-q", "-m", "change", cwd=repo)
+    return git("rev-parse", "HEAD", cwd=repo)
+
+
+class DescribingBackend:
+    """Describes every file it is asked about and records which."""
+
+    def __init__(self):
+        self.described = []
+
+    def generate_batch(self, prompts, **kwargs):
+        names = [prompt.split("\n")[0][len("File: ") :] for prompt in prompts]
+        self.described.extend(names)
+        return [f"Generated {name}." for name in names]
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_pipeline, "get_checkpoint_store", lambda: None)
+    cache = MirrorCache(str(tmp_path / "mirrors"))
+    monkeypatch.setattr(analysis_pipeline, "get_mirror_cache", lambda: cache)
+    repo = tmp_path / "remote"
+    repo.mkdir()
+    git("init", "-q", "-b", "main", cwd=repo)
+    files = {f"src/mod{n}.py": f"def f{n}():\n    return {n}\n" for n in range(8)}
+    files["README.md"] = "# Demo\n"
+    commit(str(repo), files)
+    return str(repo)
+
+
+def analyze(job):
+    """Run the pipeline like the worker, with a describing backend."""
+    parsed = parse_repository(scan_repository(fetch_repository(job)))
+    backend = DescribingBackend()
+    overview = carried_over("overview", parsed)
+    vulnerability = carried_over("vulnerability", parsed) or "No issues found."
+    descriptions = carried_over("descriptions", parsed)
+    if descriptions is None:
+        descriptions = run_inference_stage("descriptions", parsed, backend)
+    outcomes = [
+        StageOutcome("overview", value=overview, error=None if overview else "n/a"),
+        StageOutcome("vulnerability", value=vulnerability),
+        StageOutcome("descriptions", value=descriptions),
+    ]
+    cleanup_checkout(parsed.fetched)
+    return parsed, assemble_result(parsed, outcomes), backend
+
+
+def test_diff_commits_lists_changes_outside_skipped_dirs(remote):
+    base = git("rev-parse", "HEAD", cwd=remote)
+    head = commit(
+        remote,
+        {
+            "src/mod0.py": "def f0():\n    return -1\n",
+            "src/mod1.py": None,
+            "src/new.py": "X = 1\n",
+            "node_modules/dep.js": "module.exports = 1;\n",
+        },
+    )
+
+    changes = diff_commits(remote, base, head)
+    assert changes.base_commit == base
+    assert (changes.added, changes.modified, changes.removed) == (
+        ["src/new.py"],
+        ["src/mod0.py"],
+        ["src/mod1.py"],
+    )
+    assert diff_commits(remote, "0" * 40, head) is None
+
+
+def test_select_baseline_requires_same_models_and_version(tmp_path):
+    job = JobSpec("job-3", "tiny", MODEL, "https://example.com/repo")
+    routes = {"overview": "tiny.gguf", "vulnerability": "tiny.gguf"}
+    routes["description"] = "tiny.gguf"
+    usable = {
+        "commit": "a" * 40,
+        "pipeline_version": PIPELINE_VERSION,
+        "model_path": MODEL,
+        "model_routes": routes,
+        "overview": "Fallback text",
+        "overview_fallback": True,
+        "vulnerability_analysis": "No issues found.",
+        "files_analyzed": 2,
+        "nodes": [
+            {"id": "a.py", "type": "python", "language": "py", "description": "A."},
+            {
+                "id": "b.py",
+                "type": "python",
+                "language": "py",
+                "description": "Python module containing business logic and functions",
+            },
+        ],
+    }
+    other_model = dict(usable, model_path="/models/big.gguf")
+    old_version = dict(usable, pipeline_version="0")
+
+    baseline = select_baseline(
+        job, [("job-2", other_model), ("job-1", None), ("job-0", usable)]
+    )
+    assert baseline == Baseline(
+        "job-0",
+        "a" * 40,
+        overview=None,
+        vulnerability_analysis="No issues found.",
+        descriptions={"a.py": "A."},
+        file_count=2,
+        languages=["Python"],
+    )
+    assert select_baseline(job, [("job-2", old_version)]) is None
+
+    upload = JobSpec("job-4", "tiny", MODEL, "local:a.zip", str(tmp_path))
+    assert select_baseline(upload, [("job-0", usable)]) is None
+
+
+def test_reanalysis_describes_only_changed_files(remote):
+    url = f"file://{remote}"
+    _, first, backend = analyze(JobSpec("job-1", "tiny", MODEL, url))
+    assert len(backend.described) == 8
+    assert first["incremental"] is None
+
+    commit(remote, {"src/mod3.py": "def f3():\n    return 'changed'\n"})
+    job = JobSpec("job-2", "tiny", MODEL, url)
+    job.baseline = select_baseline(job, [("job-1", first)])
+    parsed, second, backend = analyze(job)
+
+    assert backend.described == ["mod3.py"]
+    restored = ParsedRepo.from_dict(json.loads(json.dumps(parsed.to_dict())))
+    assert restored.fetched.changes == parsed.fetched.changes
+    assert restored.fetched.job.baseline == job.baseline
+    assert not structure_shifted(parsed)
+    # A read file changed, so the vulnerability analysis is generated again
+    assert carried_over("vulnerability", parsed) is None
+    assert second["incremental"] == {
+        "base_job": "job-1",
+        "base_commit": first["commit"],
+        "added": 0,
+        "modified": 1,
+        "removed": 0,
+    }
+    descriptions = {
+        node["id"]: node["description"]
+        for node in second["nodes"]
+        if "description" in node
+    }
+    assert descriptions == {f"src/mod{n}.py": f"Generated mod{n}.py." for n in range(8)}
+
+
+def test_overview_is_carried_over_until_the_structure_shifts(remote):
+    url = f"file://{remote}"
+    _, first, _ = analyze(JobSpec("job-1", "tiny", MODEL, url))
+    first.update(overview="Generated overview", overview_fallback=False)
+
+    commit(remote, {"README.md": "# Demo\n\nMore.\n"})
+    job = JobSpec("job-2", "tiny", MODEL, url)
+    job.baseline = select_baseline(job, [("job-1", first)])
+    parsed, _, backend = analyze(job)
+    assert carried_over("overview", parsed) == "Generated overview"
+    assert carried_over("vulnerability", parsed) is None
+    assert backend.described == []
+
+    commit(remote, {"web/app.ts": "export const x = 1;\n"})
+    job = JobSpec("job-3", "tiny", MODEL, url)
+    job.baseline = select_baseline(job, [("job-1", first)])
+    parsed, _, _ = analyze(job)
+    # One added file is below the threshold, but TypeScript is new
+    assert structure_shifted(parsed)
+    assert carried_over("overview", parsed) is None
@@ -0,0 +1,105 @@
+"""
+Tests for priority scheduling of inference calls.
+"""
+
+import threading
+import time
+
+import pytest
+
+from backend.app.services.inference_scheduler import InferenceScheduler, parse_caps
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queued(scheduler, priority):
+    return scheduler.stats()["classes"][priority]["queued"]
+
+
+def start_waiter(scheduler, priority, order):
+    def run():
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_until(lambda: queued(scheduler, priority) == 1)
+    return thread
+
+
+def test_freed_slot_goes_to_highest_priority_waiter():
+    scheduler = InferenceScheduler(capacity=1)
+    order = []
+
+    with scheduler.slot("descriptions"):
+        threads = [
+            start_waiter(scheduler, priority, order)
+            for priority in ("descriptions", "overview", "chat")
+        ]
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["chat", "overview", "descriptions"]
+    stats = scheduler.stats()["classes"]
+    assert stats["chat"]["generations"] == 1
+    assert stats["descriptions"]["generations"] == 2
+    assert stats["descriptions"]["max_wait_ms"] > 0
+
+
+def test_class_cap_leaves_slots_for_other_classes():
+    scheduler = InferenceScheduler(capacity=2, caps={"descriptions": 1})
+    order = []
+
+    with scheduler.slot("descriptions"):
+        capped = start_waiter(scheduler, "descriptions", order)
+        # The capped waiter does not block a lower-ranked class behind it
+        with scheduler.slot("overview"):
+            assert order == []
+            assert queued(scheduler, "descriptions") == 1
+    capped.join(timeout=5)
+
+    assert order == ["descriptions"]
+
+
+def test_caps_parsing_and_unknown_class():
+    assert parse_caps("descriptions=2, chat=1,bogus=3,overview=0") == {
+        "descriptions": 2,
+        "chat": 1,
+    }
+    with pytest.raises(ValueError), InferenceScheduler().slot("batch"):
+        pass
+
+
+class ChattyLlama:
+    """Llama stand-in that starts a chat request during the first prompt."""
+
+    def __init__(self):
+        self.owner = None
+        self.prompts = []
+        self.chat = None
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.chat is None and prompt != "chat":
+            self.chat = threading.Thread(
+                target=lambda: self.owner.generate("chat", priority="chat", cache=False)
+            )
+            self.chat.start()
+            wait_until(lambda: queued(self.owner.scheduler, "chat") == 1)
+        return {"choices": [{"text": prompt}]}
+
+
+def test_generate_batch_yields_to_chat_between_prompts(fake_local_llm):
+    llm = fake_local_llm(ChattyLlama(), _batch_engine=False)
+    llm.llm.owner = llm
+
+    results = llm.generate_batch(["a", "b", "c"], cache=False)
+    llm.llm.chat.join(timeout=5)
+
+    assert results == ["a", "b", "c"]
+    assert llm.llm.prompts == ["a", "chat", "b", "c"]
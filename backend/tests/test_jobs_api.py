@@ -8,21 +8,34 @@ To run these tests:
 2. From the root of the project, run:
    pytest backend/tests/test_jobs_api.py
 """
+
+import io
+import os
+import shutil
+import zipfile
+from uuid import UUID
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Session, SQLModel, create_engine
 
+from backend.app.database import get_db
+
 # Adjust the import path based on how you run pytest.
 # If running from the project root, you might need to adjust PYTHONPATH
 # or use a different import strategy.
 from backend.app.main import app
-from backend.app.database import get_db
-from backend.app.models import JobStatus
+from backend.app.models import Job, JobStatus
 
 # --- Test Database Setup ---
 # Use an in-memory SQLite database for testing to ensure tests are isolated and fast.
+# Every connection to ":memory:" opens a new, empty database, so the pool keeps
+# a single connection that the tables and all requests share.
 DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
 
 
 # --- Dependency Override ---
@@ -132,3 +145,70 @@ def test_get_nonexistent_job(client: TestClient):
     response = client.get(f"/api/v1/jobs/{non_existent_job_id}")
     assert response.status_code == 404
     assert response.json()["detail"] == "Job not found"
+
+
+def _fail(job_id: str) -> None:
+    """Mark a job as failed, as the worker does when an analysis errors."""
+    with Session(engine) as db:
+        job = db.get(Job, UUID(job_id))
+        job.status = JobStatus.FAILED
+        db.add(job)
+        db.commit()
+
+
+def test_retry_url_job(client: TestClient, mocker):
+    """
+    A failed URL job is queued again with its model; only failed jobs can
+    be retried.
+    """
+    mock_delay = mocker.MagicMock()
+    mocker.patch("backend.app.worker.analyze_repository_task.delay", mock_delay)
+    response = client.post(
+        "/api/v1/jobs/",
+        json={"repo_url": "https://github.com/owner/repo", "model_path": "m.gguf"},
+    )
+    job_id = response.json()["id"]
+
+    response = client.post(f"/api/v1/jobs/{job_id}/retry")
+    assert response.status_code == 400
+
+    _fail(job_id)
+    mock_delay.reset_mock()
+    response = client.post(f"/api/v1/jobs/{job_id}/retry")
+    assert response.status_code == 200
+    assert response.json()["status"] == JobStatus.QUEUED.value
+    mock_delay.assert_called_once_with(
+        job_id, "llama-3.2-1b", "m.gguf", local_path=None, content_id=None
+    )
+
+
+def test_retry_upload_job_reuses_the_extracted_archive(client: TestClient, mocker):
+    """
+    A failed upload is retried from its extracted archive and content id,
+    not as a clone of its "local:" URL; once the archive is gone the retry
+    is refused.
+    """
+    mock_delay = mocker.MagicMock()
+    mocker.patch("backend.app.worker.analyze_repository_task.delay", mock_delay)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("app.py", "print('hi')\n")
+    response = client.post(
+        "/api/v1/jobs/upload",
+        files={"file": ("demo.zip", archive.getvalue(), "application/zip")},
+    )
+    assert response.status_code == 201
+    job_id = response.json()["id"]
+    uploaded = mock_delay.call_args.kwargs
+    assert uploaded["content_id"].startswith("archive:")
+
+    _fail(job_id)
+    mock_delay.reset_mock()
+    response = client.post(f"/api/v1/jobs/{job_id}/retry")
+    assert response.status_code == 200
+    assert mock_delay.call_args.kwargs == uploaded
+
+    _fail(job_id)
+    shutil.rmtree(os.path.dirname(uploaded["local_path"]))
+    response = client.post(f"/api/v1/jobs/{job_id}/retry")
+    assert response.status_code == 409
@@ -0,0 +1,152 @@
+# backend/tests/test_llm_client.py
+"""
+Tests for the pooled llama.cpp server client against local stand-in servers.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.app.services.llm_client import LLMClient
+
+
+class FakeLlamaServer:
+    """Minimal llama.cpp server: /health, /props, /tokenize and /completion."""
+
+    def __init__(self, health_delay: float = 0.0):
+        self.health_delay = health_delay
+        self.model_path = "/models/tiny.gguf"
+        self.requests = []
+        self.client_ports = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/props":
+                    props = {
+                        "model_path": server.model_path,
+                        "default_generation_settings": {"n_ctx": 512},
+                    }
+                    self._send(200, json.dumps(props))
+                    return
+                time.sleep(server.health_delay)
+                self._send(200, json.dumps({"status": "ok"}))
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                payload = json.loads(self.rfile.read(length))
+                if self.path == "/tokenize":
+                    tokens = list(range(len(payload["content"].split())))
+                    self._send(200, json.dumps({"tokens": tokens}))
+                    return
+                server.requests.append(payload)
+                server.client_ports.add(self.client_address[1])
+                if payload.get("stream"):
+                    events = [{"content": c, "stop": False} for c in ["He", "llo"]]
+                    events.append({"content": "", "stop": True})
+                    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events)
+                    self._send(200, body, "text/event-stream")
+                else:
+                    self._send(
+                        200, json.dumps({"content": f"echo:{payload['prompt']}"})
+                    )
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def servers():
+    started = [FakeLlamaServer(), FakeLlamaServer()]
+    yield started
+    for server in started:
+        server.close()
+
+
+def test_completion_reuses_connection_and_requests_prompt_cache(servers):
+    async def scenario():
+        async with LLMClient([servers[0].url], health_interval=0) as client:
+            for i in range(3):
+                assert await client.complete(f"q{i}") == f"echo:q{i}"
+
+    asyncio.run(scenario())
+    assert len(servers[0].requests) == 3
+    assert all(r["cache_prompt"] for r in servers[0].requests)
+    # Keep-alive: all calls went over one pooled connection
+    assert len(servers[0].client_ports) == 1
+
+
+def test_stream_yields_chunks_until_stop(servers):
+    async def scenario():
+        async with LLMClient([servers[0].url], health_interval=0) as client:
+            return [chunk async for chunk in client.stream("hi")]
+
+    assert asyncio.run(scenario()) == ["He", "llo"]
+
+
+def test_cache_key_pins_replica_and_slot(servers):
+    async def scenario():
+        urls = [s.url for s in servers]
+        async with LLMClient(urls, slots_per_server=4, health_interval=0) as client:
+            for _ in range(4):
+                await client.complete("suffix", cache_key="brief-prefix")
+
+    asyncio.run(scenario())
+    used = [s for s in servers if s.requests]
+    assert len(used) == 1
+    assert len({r["id_slot"] for r in used[0].requests}) == 1
+
+
+def test_least_outstanding_replica_is_picked():
+    client = LLMClient(["http://a", "http://b"], health_interval=0)
+    client.replicas[0].outstanding = 3
+    assert client._pick().url == "http://b"
+
+    # Affinity yields to load once the pinned replica is far busier
+    pinned = client._pick(cache_key="prefix")
+    pinned.outstanding = 10
+    assert client._pick(cache_key="prefix") is not pinned
+    asyncio.run(client.aclose())
+
+
+def test_slow_replica_is_ejected_by_health_check():
+    fast, slow = FakeLlamaServer(), FakeLlamaServer(health_delay=0.3)
+    try:
+
+        async def scenario():
+            async with LLMClient(
+                [fast.url, slow.url], health_interval=0, max_health_latency=0.1
+            ) as client:
+                health = await client.check_health()
+                for _ in range(3):
+                    await client.complete("q")
+                return health
+
+        assert asyncio.run(scenario()) == {fast.url: True, slow.url: False}
+        assert len(fast.requests) == 3
+        assert slow.requests == []
+    finally:
+        fast.close()
+        slow.close()
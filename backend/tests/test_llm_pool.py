@@ -0,0 +1,129 @@
+# backend/tests/test_llm_pool.py
+"""
+Tests for concurrent dispatch of independent LLM stages.
+"""
+
+import threading
+import time
+
+from backend.app.services.llm_pool import LLMPool, ServerLLM, run_concurrently
+from backend.app.services.response_cache import ResponseCache
+from backend.tests.test_llm_client import FakeLlamaServer
+
+
+class SlowBackend:
+    """Stand-in for a model instance that takes a fixed time per call."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def generate(self, prompt, **kwargs):
+        # Each instance serializes its calls, like LocalLLM
+        with self.lock:
+            time.sleep(0.2)
+            return prompt.upper()
+
+
+def test_stages_run_concurrently_across_backends():
+    pool = LLMPool([SlowBackend() for _ in range(4)])
+    stages = {
+        name: (lambda backend, name=name: backend.generate(name))
+        for name in ["overview", "a", "b", "vulnerability"]
+    }
+
+    start = time.perf_counter()
+    results = run_concurrently(pool, stages)
+    elapsed = time.perf_counter() - start
+
+    assert [r.value for r in results.values()] == [
+        "OVERVIEW",
+        "A",
+        "B",
+        "VULNERABILITY",
+    ]
+    # Close to the longest single stage rather than the sum of all four
+    assert elapsed < 0.6
+
+
+def test_failed_stage_does_not_affect_others():
+    def fail(backend):
+        raise RuntimeError("context overflow")
+
+    pool = LLMPool([SlowBackend(), SlowBackend()])
+    results = run_concurrently(
+        pool, {"overview": fail, "describe": lambda b: b.generate("x")}
+    )
+
+    assert not results["overview"].ok
+    assert isinstance(results["overview"].error, RuntimeError)
+    assert results["describe"].value == "X"
+
+
+def test_server_backend_packs_context_and_pins_prefix_slot(mocker):
+    mocker.patch(
+        "backend.app.services.llm_service.get_response_cache", return_value=None
+    )
+    server = FakeLlamaServer()
+    llm = ServerLLM([server.url], slots_per_server=4, health_interval=0)
+    try:
+        assert llm.n_ctx == 512
+        assert llm.count_tokens("three word text") == 3
+        assert llm.count_tokens_many(["a b", "c", "d e f"]) == [2, 1, 3]
+
+        answer = llm.analyze_vulnerability("Repository: demo\\n" + "code " * 2000)
+        assert answer.startswith("echo:")
+
+        (request,) = server.requests
+        assert request["cache_prompt"] is True
+        assert request["id_slot"] >= 0
+        # The oversized context was truncated to fit the slot's window
+        assert len(request["prompt"].split()) + request["n_predict"] <= 512
+    finally:
+        llm.close()
+        server.close()
+
+
+def test_server_backend_caches_streams_and_chats_without_state(tmp_path, mocker):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"))
+    for module in ("llm_service", "llm_pool"):
+        mocker.patch(
+            f"backend.app.services.{module}.get_response_cache", return_value=cache
+        )
+    server = FakeLlamaServer()
+    llm = ServerLLM([server.url], slots_per_server=4, health_interval=0)
+    try:
+        assert list(llm.generate_stream("hi", temperature=0.0)) == ["He", "llo"]
+        assert list(llm.generate_stream("hi", temperature=0.0)) == ["Hello"]
+        # The second stream was served from the cache
+        assert len(server.requests) == 1
+
+        text, state = llm.generate_with_state("transcript", {"ignored": True})
+        assert (text, state) == ("echo:transcript", None)
+    finally:
+        llm.close()
+        server.close()
+
+
+def test_server_cache_identity_follows_the_served_model(tmp_path, mocker):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"))
+    for module in ("llm_service", "llm_pool"):
+        mocker.patch(
+            f"backend.app.services.{module}.get_response_cache", return_value=cache
+        )
+    mocker.patch("backend.app.services.llm_pool.SERVER_IDENTITY_TTL_SECONDS", 0)
+    server = FakeLlamaServer()
+    llm = ServerLLM([server.url], slots_per_server=4, health_interval=0)
+    try:
+        assert llm.model_identity == "server:tiny.gguf"
+        llm.generate("hi", temperature=0.0)
+        llm.generate("hi", temperature=0.0)
+        assert len(server.requests) == 1
+
+        # Restarted with another model behind the same URL
+        server.model_path = "/models/big.gguf"
+        llm.generate("hi", temperature=0.0)
+        assert llm.model_identity == "server:big.gguf"
+        assert len(server.requests) == 2
+    finally:
+        llm.close()
+        server.close()
@@ -0,0 +1,145 @@
+"""
+Tests for the shared model daemon and its RemoteLLM proxy.
+"""
+
+import runpy
+import threading
+import time
+
+import pytest
+
+from backend.app.services import llm_service, model_daemon
+from backend.app.services.llm_service import LocalLLM
+from backend.app.services.model_daemon import (
+    DaemonClient,
+    DaemonError,
+    ModelDaemon,
+    RemoteLLM,
+)
+from backend.app.services.stream_validators import (
+    GenerationAborted,
+    placeholder_validator,
+)
+
+
+class WordLlama:
+    """Llama stand-in that echoes the prompt back one word per chunk."""
+
+    def __init__(self):
+        self.yielded = 0
+        self.closed = threading.Event()
+
+    def n_ctx(self):
+        return 2048
+
+    def tokenize(self, data: bytes, add_bos: bool = True):
+        return data.split()
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        words = prompt.split()
+        if not stream:
+            return {"choices": [{"text": " ".join(reversed(words))}]}
+
+        def run():
+            try:
+                for word in words:
+                    self.yielded += 1
+                    yield {"choices": [{"text": word + " "}]}
+            finally:
+                self.closed.set()
+
+        return run()
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch, fake_local_llm):
+    llm = fake_local_llm(WordLlama(), _batch_engine=False)
+    monkeypatch.setattr(ModelDaemon, "_model", lambda self, request: llm)
+
+    server = ModelDaemon(str(tmp_path / "llm.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    remote = RemoteLLM("fake.gguf", client=DaemonClient(server.socket_path, 10))
+    yield remote, llm
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_calls_run_on_the_daemon_model(daemon):
+    remote, _ = daemon
+
+    assert remote.n_ctx == 2048
+    assert remote.count_tokens("one two three") == 3
+    assert remote.count_tokens_many(["one two", "", "three"]) == [2, 0, 1]
+    assert remote.generate("a b c", cache=False) == "c b a"
+    assert remote.generate_batch(["x y", "z"], cache=False) == ["y x", "z"]
+    assert "".join(remote.generate_stream("hello there", cache=False)) == (
+        "hello there "
+    )
+    stats = remote.scheduler.stats()["classes"]
+    assert stats["overview"]["generations"] == 2
+    assert stats["descriptions"]["generations"] >= 2
+
+
+def test_closing_a_remote_stream_stops_daemon_generation(daemon):
+    remote, llm = daemon
+    stream = remote.generate_stream(" ".join(["w"] * 10000), cache=False)
+
+    assert next(stream) == "w "
+    stream.close()
+    assert llm.llm.closed.wait(5)
+    assert llm.llm.yielded < 10000
+
+    # Validators run client-side on the relayed stream
+    with pytest.raises(GenerationAborted):
+        remote.generate("fine <PLACEHOLDER> text", validators=[placeholder_validator])
+
+
+def test_errors_and_unreachable_daemon(daemon, tmp_path):
+    remote, _ = daemon
+    with pytest.raises(DaemonError) as failed:
+        remote._call("bogus")
+    assert failed.value.kind == "ValueError"
+
+    offline = RemoteLLM("fake.gguf", client=DaemonClient(str(tmp_path / "none"), 1))
+    start = time.monotonic()
+    with pytest.raises(DaemonError, match="unreachable"):
+        offline.generate("a")
+    assert time.monotonic() - start < 1
+
+
+def test_chat_state_stays_in_the_daemon_between_turns(daemon, monkeypatch):
+    remote, llm = daemon
+    restored = []
+    monkeypatch.setattr(llm.llm, "save_state", lambda: object(), raising=False)
+    monkeypatch.setattr(llm.llm, "load_state", restored.append, raising=False)
+
+    text, first = remote.generate_with_state("a b", cache=False)
+    assert (text, restored) == ("b a", [])
+    text, second = remote.generate_with_state("a b c", first, cache=False)
+    assert text == "c b a" and len(restored) == 1
+    assert isinstance(second, str) and second != first
+
+    # A superseded handle starts from the transcript alone
+    remote.generate_with_state("a b c d", first, cache=False)
+    assert len(restored) == 1
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_daemon_setup_loads_models_in_process(tmp_path, monkeypatch, fake_local_llm):
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"GGUF")
+    llm = fake_local_llm(WordLlama(), model_path=str(model))
+    monkeypatch.setattr(model_daemon, "LLM_DAEMON_SOCKET", str(tmp_path / "llm.sock"))
+    monkeypatch.setattr(model_daemon, "_serving", False)
+    monkeypatch.setattr(llm_service, "LLAMA_CPP_AVAILABLE", True)
+    monkeypatch.setattr(llm_service, "tuned_params", lambda path: {})
+    monkeypatch.setattr(llm_service._model_registry, "get", lambda path, **params: llm)
+    assert isinstance(llm_service.get_llm_instance(str(model)), RemoteLLM)
+
+    # Under ``python -m`` the daemon runs from a second copy of the module
+    script = runpy.run_module(model_daemon.__name__, run_name="daemon_main")
+    script["start_serving"]([str(model)])
+
+    assert llm_service.get_llm_instance(str(model)) is llm
+    assert isinstance(llm, LocalLLM)
@@ -0,0 +1,127 @@
+# backend/tests/test_model_registry.py
+"""
+Tests for the process-wide model registry.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from backend.app.services.model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, path, **params):
+        self.path = path
+        self.params = params
+
+
+@pytest.fixture
+def model_files(tmp_path):
+    paths = []
+    for name, size in [("a.gguf", 100), ("b.gguf", 200), ("c.gguf", 300)]:
+        path = tmp_path / name
+        path.write_bytes(b"\0" * size)
+        paths.append(str(path))
+    return paths
+
+
+def test_shares_instance_and_counts_hits(model_files):
+    registry = ModelRegistry(loader=FakeModel)
+
+    first = registry.get(model_files[0])
+    second = registry.get(model_files[0])
+
+    assert first is second
+    stats = registry.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["loads"] == 1
+
+
+def test_load_params_and_mtime_are_part_of_key(model_files):
+    registry = ModelRegistry(loader=FakeModel)
+
+    base = registry.get(model_files[0])
+    assert registry.get(model_files[0], n_ctx=4096) is not base
+
+    stat = os.stat(model_files[0])
+    os.utime(model_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert registry.get(model_files[0]) is not base
+
+
+def test_single_flight_loading(model_files):
+    calls = []
+
+    def slow_loader(path, **params):
+        calls.append(path)
+        time.sleep(0.1)
+        return FakeModel(path)
+
+    registry = ModelRegistry(loader=slow_loader)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get(model_files[0])))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_failed_load_propagates_and_is_retried(model_files):
+    attempts = []
+
+    def flaky_loader(path, **params):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise RuntimeError("corrupt model")
+        return FakeModel(path)
+
+    registry = ModelRegistry(loader=flaky_loader)
+    with pytest.raises(RuntimeError):
+        registry.get(model_files[0])
+
+    assert registry.get(model_files[0]) is not None
+    assert registry.stats()["load_failures"] == 1
+
+
+def test_evicts_least_recently_used_over_budget(model_files):
+    a, b, c = model_files
+    registry = ModelRegistry(loader=FakeModel, max_bytes=500)
+
+    registry.get(a)
+    registry.get(b)
+    registry.get(a)  # a is now most recently used
+    registry.get(c)  # 600 bytes > 500: b must go
+
+    resident = {m["path"] for m in registry.stats()["models"]}
+    assert resident == {os.path.realpath(a), os.path.realpath(c)}
+    assert registry.stats()["evictions"] == 1
+
+
+def test_replicas_of_one_file_share_the_weight_budget(model_files):
+    registry = ModelRegistry(
+        loader=FakeModel, max_bytes=450, context_size_of=lambda path, model: 50
+    )
+
+    first = registry.get(model_files[2])
+    second = registry.get(model_files[2], replica=1)
+    # 300 bytes of weights once plus two 50 byte contexts fit the budget
+    assert registry.stats()["resident_bytes"] == 400
+    assert registry.get(model_files[2]) is first
+    assert registry.get(model_files[2], replica=1) is second
+    assert registry.stats()["evictions"] == 0
+
+    # Another file does not fit next to them; dropping one replica frees
+    # only its context, so both go
+    registry.get(model_files[0])
+    stats = registry.stats()
+    assert [m["path"] for m in stats["models"]] == [model_files[0]]
+    assert (stats["resident_bytes"], stats["evictions"]) == (150, 2)
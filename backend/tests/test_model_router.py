@@ -0,0 +1,54 @@
+# backend/tests/test_model_router.py
+"""
+Tests for task-based model routing.
+"""
+
+from backend.app.services.llm_pool import LLMPool, run_concurrently
+from backend.app.services.model_catalog import find_model_file
+from backend.app.services.model_router import ModelRouter, parse_routes
+
+
+def test_parse_routes_ignores_unknown_tasks():
+    routes = parse_routes("description=llama-3.2-1b, overview = phi-3-mini,bogus=x,")
+    assert routes == {"description": "llama-3.2-1b", "overview": "phi-3-mini"}
+
+
+def test_catalog_ids_resolve_to_local_files():
+    candidates = [
+        "/models/Llama-3.2-1B-Instruct-Q4_K_M.gguf",
+        "/models/Phi-3-mini-4k-instruct-q4.gguf",
+    ]
+    assert find_model_file("phi-3-mini", candidates) == candidates[1]
+    assert find_model_file("llama-3.2-1b", candidates) == candidates[0]
+    assert find_model_file("qwen2.5-coder-1.5b", candidates) is None
+    assert find_model_file("custom-model", candidates) is None
+
+
+def test_router_falls_back_to_the_job_model(tmp_path):
+    small = tmp_path / "small.gguf"
+    small.write_bytes(b"GGUF")
+    lookups = []
+
+    def locate(model_id):
+        lookups.append(model_id)
+
+    router = ModelRouter(
+        {"description": str(small), "overview": "phi-3-mini"}, locate=locate
+    )
+
+    assert router.route("description", "/job.gguf") == str(small)
+    assert router.route("overview", "/job.gguf") == "/job.gguf"
+    assert router.route("chat", "/job.gguf") == "/job.gguf"
+    # Resolution is cached
+    router.route("overview", "/other.gguf")
+    assert lookups == ["phi-3-mini"]
+
+
+def test_stages_run_on_their_routed_pool():
+    results = run_concurrently(
+        LLMPool(["big"]),
+        {"overview": lambda b: b, "descriptions": lambda b: b},
+        stage_pools={"descriptions": LLMPool(["small"])},
+    )
+    assert results["overview"].value == "big"
+    assert results["descriptions"].value == "small"
@@ -0,0 +1,61 @@
+# backend/tests/test_overview_grammar.py
+"""
+Tests for the grammar-constrained repository overview.
+"""
+
+import re
+
+from backend.app.services.overview_grammar import (
+    CHARS_PER_TOKEN,
+    HEADER_TOKENS,
+    LINE_CHARS,
+    REQUIRED_OVERVIEW_SECTIONS,
+    build_overview_grammar,
+    section_line_caps,
+)
+
+
+def test_grammar_emits_every_section_in_order():
+    grammar = build_overview_grammar(1500)
+    root = next(line for line in grammar.splitlines() if line.startswith("root ::="))
+    rules = dict(line.split(" ::= ", 1) for line in grammar.strip().splitlines())
+
+    names = root.split(" ::= ", 1)[1].split(' "\\n" ')
+    assert len(names) == len(REQUIRED_OVERVIEW_SECTIONS)
+    for name, header in zip(names, REQUIRED_OVERVIEW_SECTIONS):
+        assert rules[name].startswith(f'"{header}\\n" line{{1,')
+    # Body lines can neither fake a header nor carry placeholder markers
+    assert rules["line"].startswith("[^\\n<*] [^\\n<]")
+
+
+def test_section_caps_fit_the_token_budget():
+    for max_tokens in (400, 900, 1500, 3000):
+        caps = section_line_caps(max_tokens)
+        assert all(cap >= 1 for cap in caps)
+        header_tokens = HEADER_TOKENS * len(REQUIRED_OVERVIEW_SECTIONS)
+        worst_case = sum(caps) * LINE_CHARS / CHARS_PER_TOKEN + header_tokens
+        assert worst_case <= max_tokens
+
+    grammar = build_overview_grammar(1500)
+    caps = [int(n) for n in re.findall(r"line\{1,(\d+)\}", grammar)]
+    assert caps == section_line_caps(1500)
+
+
+class TokenizingLlama:
+    def n_ctx(self):
+        return 4096
+
+    def tokenize(self, data: bytes, add_bos: bool = True):
+        return [7] * len(data.split())
+
+
+def test_explain_repository_decodes_under_the_grammar(fake_local_llm):
+    llm = fake_local_llm(TokenizingLlama())
+    calls = []
+    llm.generate = lambda prompt, **kwargs: calls.append(kwargs) or "overview"
+
+    llm.explain_repository({"name": "demo"}, context="README\nA demo app")
+    llm.explain_repository({"name": "demo"}, context="README", constrained=False)
+
+    assert calls[0]["grammar"] == build_overview_grammar(calls[0]["max_tokens"])
+    assert calls[1].get("grammar") is None
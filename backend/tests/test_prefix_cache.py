@@ -0,0 +1,61 @@
+# backend/tests/test_prefix_cache.py
+"""
+Tests for prompt-prefix state reuse in LocalLLM.
+"""
+
+from backend.app.services.prefix_cache import PrefixCache
+
+
+class FakeLlama:
+    """Records evaluated tokens and state save/restore calls."""
+
+    def __init__(self):
+        self.evaluated = []
+        self.loaded_states = []
+        self.prompts = []
+
+    def tokenize(self, data: bytes):
+        return list(data.decode("utf-8").split(" "))
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens):
+        self.evaluated.append(list(tokens))
+
+    def save_state(self):
+        return {"tokens": len(self.evaluated[-1])}
+
+    def load_state(self, state):
+        self.loaded_states.append(state)
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return {"choices": [{"text": " answer "}]}
+
+
+def test_prefix_evaluated_once_then_restored(fake_local_llm):
+    llm = fake_local_llm(FakeLlama(), prefix_cache_size=2)
+    prefix = "You are a security expert. "
+
+    assert llm.generate("first context", prefix=prefix) == "answer"
+    assert llm.generate("second context", prefix=prefix) == "answer"
+
+    assert len(llm.llm.evaluated) == 1
+    assert len(llm.llm.loaded_states) == 1
+    assert llm.llm.prompts == [prefix + "first context", prefix + "second context"]
+
+    stats = llm.prefix_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["tokens_reused"] > 0
+
+
+def test_prefix_cache_is_lru_bounded():
+    cache = PrefixCache(max_entries=2)
+    for prefix in ["a", "b", "c"]:
+        cache.put(prefix, state=prefix, tokens=[1, 2], eval_seconds=0.1)
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
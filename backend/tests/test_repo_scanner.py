@@ -0,0 +1,117 @@
+"""
+Tests for the scandir repository scanner and its .gitignore handling.
+"""
+
+import os
+
+from backend.app.services.analysis_pipeline import (
+    SKIP_DIRS,
+    FetchedRepo,
+    JobSpec,
+    parse_repository,
+    scan_repository,
+)
+from backend.app.services.repo_scanner import (
+    FileEntry,
+    PathFilter,
+    benchmark_scan,
+    make_synthetic_tree,
+    scan_tree,
+)
+
+
+def write(root, path, content="x\n"):
+    full = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, "w") as f:
+        f.write(content)
+
+
+def test_gitignore_patterns():
+    rules = PathFilter().extend(
+        "",
+        "# comment\n*.log\n!keep.log\nbuild/\n/top.txt\ndocs/**/*.tmp\n",
+        "",
+    )
+    rules = rules.extend("pkg", "local/\n", "")
+
+    assert rules.excluded("a/b/debug.log", False)
+    assert not rules.excluded("a/keep.log", False)
+    assert rules.excluded("src/build", True)
+    # Directory-only patterns do not match files
+    assert not rules.excluded("src/build", False)
+    assert rules.excluded("top.txt", False)
+    assert not rules.excluded("sub/top.txt", False)
+    assert rules.excluded("docs/x.tmp", False)
+    assert rules.excluded("docs/a/b/x.tmp", False)
+    assert rules.excluded("pkg/local", True)
+    assert not rules.excluded("other/local", True)
+
+
+def test_scan_honours_ignores_attributes_and_skip_dirs(tmp_path):
+    root = str(tmp_path)
+    write(root, ".gitignore", "*.log\ngenerated/\n")
+    write(root, ".gitattributes", "third_party/** linguist-vendored\n")
+    write(root, "src/app.py", "print(1)\n")
+    write(root, "src/debug.log")
+    write(root, "src/generated/out.py")
+    write(root, "third_party/lib.js")
+    write(root, "third_party/.gitattributes", "keep.js -linguist-vendored\n")
+    write(root, "third_party/keep.js")
+    write(root, "node_modules/dep/index.js")
+    write(root, ".git", "gitdir: /elsewhere\n")
+    os.symlink(os.path.join(root, "src"), os.path.join(root, "linked"))
+
+    inventory = scan_tree(root, SKIP_DIRS)
+    assert [entry.path for entry in inventory.files] == [
+        ".gitattributes",
+        ".gitignore",
+        "src/app.py",
+        # Its own .gitattributes is vendored code by the root's pattern
+        "third_party/keep.js",
+    ]
+    assert inventory.files[2] == FileEntry("src/app.py", 9)
+    assert inventory.directories == ["src", "third_party"]
+    assert inventory.ignored == 4
+
+    everything = scan_tree(root, SKIP_DIRS, respect_gitignore=False)
+    assert len(everything.files) == 8
+
+
+def test_threaded_scan_matches_sequential_scan(tmp_path):
+    make_synthetic_tree(str(tmp_path), 1200, per_dir=7, fanout=3)
+    write(str(tmp_path), "d1/leaf1/skip.log")
+
+    sequential = scan_tree(str(tmp_path), workers=1)
+    threaded = scan_tree(str(tmp_path), workers=8)
+    assert sequential.files == threaded.files
+    assert sequential.directories == threaded.directories
+    assert len(threaded.files) == 1201  # the tree's .gitignore is listed
+
+    reports = benchmark_scan(str(tmp_path), [1, 4])
+    assert [report["files"] for report in reports] == [1202, 1201, 1201]
+
+
+def test_pipeline_scan_builds_graph_from_inventory(tmp_path):
+    root = str(tmp_path)
+    write(root, ".gitignore", "dist.py\n")
+    write(root, "dist.py")
+    write(root, "pkg/sub/mod.py", "def f():\n    return 1\n")
+    write(root, "pkg/big.py", "x" * (60 * 1024))
+
+    job = JobSpec("job-1", "tiny", "/m.gguf", "upload:demo.zip", root)
+    scanned = scan_repository(FetchedRepo(job, "demo", root))
+    assert [node["id"] for node in scanned.nodes] == [
+        "demo",
+        ".gitignore",
+        "pkg",
+        "pkg/big.py",
+        "pkg/sub",
+        "pkg/sub/mod.py",
+    ]
+    assert {"from": "pkg", "to": "pkg/sub", "label": "contains"} in scanned.edges
+    assert {"from": "demo", "to": "pkg", "label": "contains"} in scanned.edges
+
+    parsed = parse_repository(scanned)
+    # Too large to read, judged by the size the scan recorded
+    assert sorted(parsed.file_contents) == ["pkg/sub/mod.py"]
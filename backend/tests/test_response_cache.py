@@ -0,0 +1,69 @@
+# backend/tests/test_response_cache.py
+"""
+Tests for the persistent LLM response cache.
+"""
+
+from backend.app.services.response_cache import ResponseCache
+
+
+class CountingLlama:
+    """Returns a fixed completion and counts how often it was called."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, prompt, **kwargs):
+        self.calls += 1
+        return {"choices": [{"text": f" answer {self.calls} "}]}
+
+
+def make_llm(tmp_path, mocker, fake_local_llm):
+    model = tmp_path / "model.gguf"
+    model.write_bytes(b"GGUF")
+    cache = ResponseCache(path=str(tmp_path / "cache.db"))
+    mocker.patch(
+        "backend.app.services.llm_service.get_response_cache", return_value=cache
+    )
+    return fake_local_llm(CountingLlama(), model_path=str(model)), cache
+
+
+def test_deterministic_generation_is_served_from_cache(
+    tmp_path, mocker, fake_local_llm
+):
+    llm, cache = make_llm(tmp_path, mocker, fake_local_llm)
+
+    first = llm.generate("explain", temperature=0.7, seed=42)
+    second = llm.generate("explain", temperature=0.7, seed=42)
+
+    assert first == second == "answer 1"
+    assert llm.llm.calls == 1
+    assert cache.stats()["hits"] == 1
+
+    # Different sampling parameters are a different key
+    assert llm.generate("explain", temperature=0.7, seed=7) == "answer 2"
+
+
+def test_sampled_generation_bypasses_cache(tmp_path, mocker, fake_local_llm):
+    llm, cache = make_llm(tmp_path, mocker, fake_local_llm)
+
+    llm.generate("explain", temperature=0.7)
+    llm.generate("explain", temperature=0.7)
+
+    assert llm.llm.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_expires_and_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+
+    # "b" was the least recently used entry when "c" pushed the table over
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["evictions"] == 1
+
+    cache.ttl_seconds = -1
+    assert cache.get("c") is None
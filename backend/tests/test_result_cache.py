@@ -0,0 +1,146 @@
+"""
+Tests for the analysis result cache and how jobs are matched against it.
+"""
+
+import subprocess
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.app.services import analysis_pipeline
+from backend.app.services.analysis_pipeline import (
+    FetchedRepo,
+    JobSpec,
+    ParsedRepo,
+    cached_result,
+    git_content_id,
+    resolve_content_id,
+    store_result,
+)
+from backend.app.services.result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResultCache(path=str(tmp_path / "results.db"))
+    monkeypatch.setattr(analysis_pipeline, "get_result_cache", lambda: cache)
+    return cache
+
+
+def parsed_for(job, commit=None):
+    fetched = FetchedRepo(job, "demo", "/tmp/demo", commit=commit)
+    return ParsedRepo(fetched, [], [], [], {}, [], [], [])
+
+
+def test_put_get_expiry_and_invalidate(tmp_path):
+    cache = ResultCache(path=str(tmp_path / "results.db"), ttl_seconds=60)
+    key = ResultCache.make_key("git:x@1", ["tiny.gguf"], "1")
+    assert cache.get(key) is None
+
+    cache.put(key, "git:x@1", "job-1", {"overview": "text"})
+    assert cache.get(key) == ("job-1", {"overview": "text"})
+
+    cache.put("other", "git:x@2", "job-2", {})
+    assert cache.invalidate("git:x@1") == 1
+    assert cache.get(key) is None
+
+    cache.ttl_seconds = -1
+    assert cache.get("other") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 3, 2)
+    assert stats["entries"] == 0
+
+
+def test_key_depends_on_content_models_and_version():
+    key = ResultCache.make_key("git:x@1", ["a.gguf", "b.gguf"], "1")
+    assert key == ResultCache.make_key("git:x@1", ["b.gguf", "a.gguf"], "1")
+    assert key != ResultCache.make_key("git:x@2", ["a.gguf", "b.gguf"], "1")
+    assert key != ResultCache.make_key("git:x@1", ["a.gguf"], "1")
+    assert key != ResultCache.make_key("git:x@1", ["a.gguf", "b.gguf"], "2")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(path=str(tmp_path / "results.db"), max_entries=2)
+    cache.put("a", "c1", "job-a", {})
+    time.sleep(0.01)
+    cache.put("b", "c2", "job-b", {})
+    time.sleep(0.01)
+    cache.get("a")
+    cache.put("c", "c3", "job-c", {})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_result_is_stored_under_the_checked_out_commit(cache):
+    url = "https://github.com/owner/repo"
+    job = JobSpec("job-1", "tiny", "/models/tiny.gguf", url)
+    job.content_id = git_content_id(url, "a" * 40)
+    store_result(parsed_for(job, commit="b" * 40), {"overview": "text"})
+
+    # HEAD moved between resolving and cloning: the old id is not a hit
+    assert cached_result(job) is None
+
+    again = JobSpec("job-2", "tiny", "/models/tiny.gguf", url + ".git")
+    again.content_id = git_content_id(again.repo_url, "b" * 40)
+    result = cached_result(again)
+    assert result["overview"] == "text"
+    assert result["cache"] == {
+        "hit": True,
+        "source_job": "job-1",
+        "content_id": again.content_id,
+    }
+
+    other_model = JobSpec("job-3", "big", "/models/big.gguf", url)
+    other_model.content_id = again.content_id
+    assert cached_result(other_model) is None
+
+
+def test_content_id_of_uploads_and_remotes(tmp_path):
+    upload = JobSpec("job-1", "tiny", "/m.gguf", "local:a.zip", str(tmp_path))
+    upload.content_id = "archive:abc"
+    assert resolve_content_id(upload) == "archive:abc"
+
+    repo = tmp_path / "remote"
+    repo.mkdir()
+    for args in (
+        ["init", "-q"],
+        ["-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q"]
+        + ["--allow-empty", "-m", "init"],
+    ):
+        subprocess.run(["git", *args], cwd=repo, check=True)
+    head = (
+        subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo, check=True, capture_output=True
+        )
+        .stdout.decode()
+        .strip()
+    )
+
+    remote = JobSpec("job-2", "tiny", "/m.gguf", f"file://{repo}")
+    assert resolve_content_id(remote) == git_content_id(f"file://{repo}", head)
+
+    missing = JobSpec("job-3", "tiny", "/m.gguf", f"file://{tmp_path}/missing")
+    assert resolve_content_id(missing) is None
+
+
+def test_admin_endpoint_invalidates_cached_results(cache, mocker):
+    mocker.patch("backend.app.api.health.get_result_cache", return_value=cache)
+    cache.put("a", "git:x@1", "job-1", {})
+    cache.put("b", "git:x@2", "job-2", {})
+    cache.put("c", "git:x@3", "job-3", {})
+    client = TestClient(app)
+
+    response = client.delete(
+        "/api/v1/health/system/analysis-cache", params={"content_id": "git:x@1"}
+    )
+    assert response.json() == {"invalidated": 1}
+    assert cache.get("a") is None and cache.get("b") is not None
+
+    response = client.delete("/api/v1/health/system/analysis-cache")
+    assert response.json() == {"invalidated": 2}
+    metrics = client.get("/api/v1/health/system/metrics").json()
+    assert metrics["analysis_cache"]["entries"] == 0
@@ -0,0 +1,82 @@
+# backend/tests/test_speculative.py
+"""
+Tests for speculative (prompt-lookup) decoding.
+"""
+
+import numpy as np
+
+from backend.app.services.speculative import (
+    PromptLookupDraft,
+    SpeculativeDrafter,
+    prompt_lookup,
+    sample_prompts,
+)
+
+
+def test_prompt_lookup_copies_the_latest_continuation():
+    ids = np.array([5, 6, 7, 8, 9, 1, 5, 6, 7, 2, 3, 5, 6, 7], dtype=np.intc)
+    # The trailing "5 6 7" last appeared before "2 3"
+    assert prompt_lookup(ids, max_ngram=3, num_pred_tokens=2).tolist() == [2, 3]
+    drafted = prompt_lookup(ids, max_ngram=3, num_pred_tokens=10)
+    assert drafted.tolist() == [2, 3, 5, 6, 7]
+    assert prompt_lookup(np.array([1, 2, 3], dtype=np.intc)).tolist() == []
+
+
+class DraftingLlama:
+    """Llama stand-in that drafts like llama.cpp when a draft model is set."""
+
+    def __init__(self):
+        self.draft_model = None
+        self.drafted_during_call = []
+
+    def __call__(self, prompt, **kwargs):
+        self.drafted_during_call.append(self.draft_model is not None)
+        if self.draft_model is not None:
+            # Three verification passes after the prompt, 12 tokens in total
+            for _ in range(3):
+                self.draft_model(np.array([1, 2, 3, 4, 1, 2], dtype=np.intc))
+        return {"choices": [{"text": "x"}], "usage": {"completion_tokens": 12}}
+
+
+def test_speculation_is_opt_in_per_call_and_accounted(fake_local_llm):
+    drafter = SpeculativeDrafter(PromptLookupDraft(num_pred_tokens=4))
+    llm = fake_local_llm(DraftingLlama(), drafter=drafter)
+
+    llm.generate("a", cache=False)
+    llm.generate("b", cache=False, speculative=True)
+
+    assert llm.llm.drafted_during_call == [False, True]
+    assert llm.llm.draft_model is None
+    stats = llm.drafter.stats
+    # Each draft proposes "3 4 1 2"; 4 passes produced 12 tokens, so 8 of
+    # the 12 drafted tokens were accepted
+    assert (stats.drafted, stats.accepted, stats.passes) == (12, 8, 4)
+    assert stats.acceptance_rate == 8 / 12
+    assert stats.tokens_per_pass == 3
+
+
+def test_overlapping_generations_count_their_own_drafts():
+    drafter = SpeculativeDrafter(PromptLookupDraft(num_pred_tokens=4))
+    tokens = np.array([1, 2, 3, 4, 1, 2], dtype=np.intc)
+    first, second = drafter.start(), drafter.start()
+    first(tokens)
+    second(tokens)
+    first(tokens)
+
+    # 2 drafts before 3 passes; the other call's draft is not counted
+    assert first.finish(10) == 7
+    assert second.finish(1) == 0
+    assert (drafter.stats.generations, drafter.stats.drafted) == (2, 12)
+    assert drafter.stats.accepted == 7
+
+
+def test_sample_prompts_reads_source_files(tmp_path):
+    (tmp_path / "app.py").write_text("def main():\n    return 1\n")
+    (tmp_path / "README.md").write_text("# Demo\n")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "dep.js").write_text("module.exports = 1\n")
+
+    prompts = sample_prompts(str(tmp_path))
+
+    assert len(prompts) == 1
+    assert "File: app.py" in prompts[0] and "def main()" in prompts[0]
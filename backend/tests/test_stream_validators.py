@@ -0,0 +1,84 @@
+# backend/tests/test_stream_validators.py
+"""
+Tests for early-abort validation of streamed generations.
+"""
+
+import pytest
+
+from backend.app.services.stream_validators import (
+    GenerationAborted,
+    SectionBudget,
+    placeholder_validator,
+    repetition_validator,
+)
+
+
+def test_placeholder_and_repetition_validators():
+    assert placeholder_validator("**Project Snapshot**\n- Purpose: API", 8) is None
+    assert "<SECTION_NAME>" in placeholder_validator("**<SECTION_NAME>**", 5)
+
+    prose = "- Structure: FastAPI backend with Celery workers and a Next.js UI.\n" + (
+        "- Data flow: requests enter through the API, jobs run in workers.\n"
+    )
+    assert repetition_validator(prose * 2, 60) is None
+    assert "line repeated" in repetition_validator(prose + "- same\n" * 3, 40)
+    assert "pattern" in repetition_validator("intro " + "the the " * 40, 90)
+
+
+def test_section_budget_counts_tokens_from_each_header():
+    budget = SectionBudget(["**A**", "**B**"], [5, 100])
+    text = "thinking " * 20
+    assert budget(text, 20) is None
+
+    text += "**A**\n"
+    assert budget(text, 21) is None
+    assert budget(text + "x " * 5, 26) is None
+    assert "**A**" in budget(text + "x " * 6, 27)
+
+    # A new section starts a fresh count
+    text += "x " * 4 + "**B**\n"
+    assert budget(text, 27) is None
+    assert budget(text + "y " * 50, 77) is None
+
+
+class StreamingLlama:
+    """Llama stand-in that streams one chunk per token and records progress."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.yielded = 0
+        self.closed = False
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        def run():
+            try:
+                for chunk in self.chunks:
+                    self.yielded += 1
+                    yield {"choices": [{"text": chunk}]}
+            finally:
+                self.closed = True
+
+        return run()
+
+
+def test_generate_stops_as_soon_as_a_validator_rejects(fake_local_llm):
+    llm = fake_local_llm(
+        StreamingLlama(["**Project", " Snapshot**\n", "- <SECTION_NAME>", " more"] * 50)
+    )
+
+    with pytest.raises(GenerationAborted) as aborted:
+        llm.generate("prompt", cache=False, validators=[placeholder_validator])
+
+    assert aborted.value.tokens == 3
+    assert llm.llm.yielded == 3
+    assert llm.llm.closed
+    # The instance is usable again once the aborted stream is closed
+    assert llm.scheduler.stats()["classes"]["overview"]["running"] == 0
+
+
+def test_generate_with_validators_returns_complete_text(fake_local_llm):
+    llm = fake_local_llm(StreamingLlama(["Hello", " world", "\n"]))
+
+    assert llm.generate("prompt", cache=False, validators=[placeholder_validator]) == (
+        "Hello world"
+    )
@@ -77,5 +77,24 @@ def download(job_id):
     except requests.exceptions.RequestException as e:
         click.echo(f"Error downloading graph: {e}", err=True)
 
+@cli.command()
+@click.option('--model-path', default=None, help="Model file on the server (default: all local models).")
+@click.option('--quick', is_flag=True, help="Only tune the thread count.")
+def benchmark(model_path, quick):
+    """Benchmark local models on the server and persist the fastest settings."""
+    click.echo("Benchmarking models (this can take several minutes)...")
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    payload = {"model_path": model_path, "quick": quick}
+    try:
+        response = requests.post(f"{API_URL}/api/v1/models/benchmark", json=payload, headers=headers)
+        response.raise_for_status()
+        for result in response.json():
+            if result['ok']:
+                click.echo(f"{result['model_path']}: {result['params']}")
+            else:
+                click.echo(f"{result['model_path']}: failed ({result['error']})", err=True)
+    except requests.exceptions.RequestException as e:
+        click.echo(f"Error running benchmark: {e}", err=True)
+
 if __name__ == '__main__':
     cli()